@@ -0,0 +1,83 @@
+"""
+GUI responsiveness benchmark
+
+Runs the Qt/asyncio loop offscreen with a LatencyProbe and reports how late
+Qt timers fire (what an operator would feel as input lag) while idle, while
+simulated OPC DA connections publish changes, and while password hashes
+(PBKDF2) run on the GUI thread versus in an executor.
+
+Usage: QT_QPA_PLATFORM=offscreen python benchmarks/gui_latency.py [seconds]
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+
+from core.connections import ConnectionManager
+from gui.event_loop import LatencyProbe, QtEventLoop
+
+
+def pbkdf2():
+    return hashlib.pbkdf2_hmac('sha256', b'password', b'salt' * 4, 100000)
+
+
+async def hash_passwords(seconds, in_executor):
+    loop = asyncio.get_running_loop()
+    end = loop.time() + seconds
+    while loop.time() < end:
+        if in_executor:
+            await loop.run_in_executor(None, pbkdf2)
+        else:
+            pbkdf2()
+        await asyncio.sleep(0.2)
+
+
+async def simulated_load(seconds, connections=8, tags=5000):
+    manager = ConnectionManager()
+    for number in range(connections):
+        manager.add("OPC DA", config={
+            "server_name": "Simulation",
+            "host": "localhost",
+            "update_rate": 100,
+            "simulation_change_ratio": 0.2,
+            "groups": [{"name": "Group1", "update_rate": 100, "active": True, "deadband": 0.0,
+                        "items": [f"Server{number}.Tag{tag}" for tag in range(tags)]}]
+        })
+    manager.start_all()
+    await asyncio.sleep(seconds)
+    await manager.stop_all()
+
+
+def measure(loop, probe, coroutine):
+    probe.reset()
+    loop.run_until_complete(coroutine)
+    return probe.stats()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    app = QApplication(sys.argv[:1])
+    loop = QtEventLoop()
+    asyncio.set_event_loop(loop)
+    probe = LatencyProbe(interval_ms=20)
+    probe.start()
+    scenarios = {
+        'idle': lambda: asyncio.sleep(seconds),
+        'opc da load': lambda: simulated_load(seconds),
+        'pbkdf2 on gui thread': lambda: hash_passwords(seconds, False),
+        'pbkdf2 in executor': lambda: hash_passwords(seconds, True),
+    }
+    for name, scenario in scenarios.items():
+        stats = measure(loop, probe, scenario())
+        print(f"{name:24s} p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms  max {stats['max_ms']:7.2f} ms")
+    loop.close()
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Protocol import-time benchmark
+
+Starts a fresh interpreter per run and measures how long it takes to get
+ready with only Modbus enabled, against creating every handler (the old
+eager startup). Reports the median of the runs in milliseconds.
+
+Usage: python benchmarks/protocol_import.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    'interpreter': "pass",
+    'import core.protocols': "import core.protocols",
+    'modbus only': (
+        "from core.protocols import initialize_protocols, registry\n"
+        "settings = {'protocols': {registry.settings_keys[n]: {'enabled': n == 'Modbus'} for n in registry.names()}}\n"
+        "initialize_protocols(settings)['Modbus']"
+    ),
+    'all protocols': (
+        "from core.protocols import initialize_protocols\n"
+        "initialize_protocols().values()"
+    ),
+}
+
+
+def measure(code, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for name, code in SCENARIOS.items():
+        print(f"{name:24s} {measure(code, runs):8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
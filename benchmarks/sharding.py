@@ -0,0 +1,74 @@
+"""
+Sharded runtime throughput benchmark
+
+Runs simulated OPC DA connections in 1, 2, 4 ... worker processes (up to
+the CPU count) and reports how many value changes per second reach the
+router process through the shared memory table.
+
+Usage: python benchmarks/sharding.py [connections] [tags per connection] [seconds]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.sharding import ShardedRuntime
+
+
+def connections(count, tags):
+    return [
+        {
+            "id": f"opcda-{number}",
+            "protocol": "OPC DA",
+            "name": f"Simulated server {number}",
+            "config": {
+                "server_name": "Simulation",
+                "host": "localhost",
+                "update_rate": 100,
+                "simulation_change_ratio": 0.5,
+                "groups": [{
+                    "name": "Group1",
+                    "update_rate": 100,
+                    "active": True,
+                    "deadband": 0.0,
+                    "items": [f"Server{number}.Tag{tag}" for tag in range(tags)]
+                }]
+            }
+        }
+        for number in range(count)
+    ]
+
+
+def measure(entries, workers, seconds):
+    runtime = ShardedRuntime(entries, workers)
+    runtime.start()
+    try:
+        # Let every worker connect before counting
+        while len(runtime.poll()) == 0 or runtime.get_status()["points"] < sum(
+                len(entry["config"]["groups"][0]["items"]) for entry in entries):
+            time.sleep(0.05)
+        changes = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            changes += len(runtime.poll())
+            time.sleep(0.005)
+        return changes / (time.perf_counter() - start)
+    finally:
+        runtime.stop()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    tags = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+    entries = connections(count, tags)
+    workers = 1
+    while workers <= min(os.cpu_count() or 1, count):
+        print(f"{workers:3d} workers {measure(entries, workers, seconds):12.0f} changes/s")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
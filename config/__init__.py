@@ -31,8 +31,12 @@ def get_default_config():
         },
         "security": {
             "enable_encryption": True,
+            "key_file": "secret.key",
             "token_expiry_hours": 8,
-            "max_login_attempts": 3
+            "max_login_attempts": 3,
+            "max_source_attempts": 10,
+            "lockout_minutes": 15,
+            "hash_workers": 2
         },
         "protocols": {
             "modbus": {
@@ -68,5 +72,30 @@ def get_default_config():
                 "default_port": 1883,
                 "keep_alive": 60
             }
+        },
+        "reconnect": {
+            "initial_delay_s": 1.0,
+            "max_delay_s": 60.0,
+            "multiplier": 2.0,
+            "jitter": 0.5,
+            "health_check_interval_s": 5.0
+        },
+        "runtime": {
+            "connections_file": "connections.json",
+            "mappings_file": "mappings.json",
+            "scan_interval_ms": 1000,
+            "use_uvloop": True,
+            "mode": "single"
+        },
+        "sharding": {
+            "workers": 0,
+            "slots_per_worker": 65536,
+            "ring_size": 16384,
+            "poll_interval_ms": 10
+        },
+        "metrics": {
+            "http_enabled": True,
+            "host": "127.0.0.1",
+            "port": 9108
         }
     }
\ No newline at end of file
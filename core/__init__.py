@@ -1,12 +1,27 @@
 """
 Core module for SCADA Data Gateway Tool
 Contains protocol handlers, data mapping, and security components
+
+Exports are resolved on first access so that importing one submodule (a
+protocol codec, say) does not pull in the security stack.
 """
 
-from .data_mapping import DataMapping, DataPoint
-from .security import SecurityManager
-from .protocols import initialize_protocols
+import importlib
 
 __version__ = "1.0.0"
 __author__ = "dat007a"
-__date__ = "2025-05-20"
\ No newline at end of file
+__date__ = "2025-05-20"
+
+_EXPORTS = {
+    'DataMapping': '.data_mapping',
+    'DataPoint': '.data_mapping',
+    'SecurityManager': '.security',
+    'initialize_protocols': '.protocols'
+}
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module, __name__), name)
\ No newline at end of file
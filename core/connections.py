@@ -0,0 +1,489 @@
+"""
+Connection manager for SCADA Data Gateway
+Any number of named connections per protocol, each with its own handler,
+configuration, supervisor and metrics
+
+Mappings refer to connections by ID (DataPoint.connection_id), so two
+Modbus devices are just two connections of the same protocol.
+"""
+
+import json
+import logging
+import os
+import time
+
+from cryptography.fernet import InvalidToken
+
+from .metrics import Histogram, MetricsRegistry
+from .protocols import registry as protocol_registry
+from .protocols.base_handler import ConnectionStatus, point_key
+from .protocols.supervisor import ConnectionSupervisor
+
+# Config fields holding secrets; save_to_file encrypts them (or leaves them out)
+SECRET_FIELDS = ('password', 'passphrase', 'secret')
+ENCRYPTED_PREFIX = 'encrypted:'
+
+
+def map_secrets(config, function):
+    """Copy of a config with function applied to every non-empty secret field, at any depth"""
+    if isinstance(config, dict):
+        return {
+            key: function(value) if key in SECRET_FIELDS and isinstance(value, str) and value
+            else map_secrets(value, function)
+            for key, value in config.items()
+        }
+    if isinstance(config, list):
+        return [map_secrets(item, function) for item in config]
+    return config
+
+
+def connect_config(config):
+    """Copy of a config to connect with: secrets that could not be decrypted on load are left empty"""
+    return map_secrets(config, lambda value: "" if value.startswith(ENCRYPTED_PREFIX) else value)
+
+
+class ConnectionMetrics:
+    """
+    Per connection counters and latency histograms in the gateway's metrics registry
+
+    Operations are "read", "write" and "connect". Values are counted by
+    source: "read" (returned by reads), "pushed" (sent by the device) and
+    "write". The series are looked up once here, so recording an operation
+    costs no label lookups.
+    """
+
+    OPERATIONS = ('read', 'write', 'connect')
+    SOURCES = ('read', 'pushed', 'write')
+
+    def __init__(self, registry, connection_id, protocol):
+        self.labels = (connection_id, protocol)
+        self.families = (
+            registry.counter('scada_operations_total', "Completed operations", ('connection', 'protocol', 'operation')),
+            registry.counter('scada_operation_errors_total', "Failed operations", ('connection', 'protocol', 'operation')),
+            registry.histogram('scada_operation_seconds', "Operation duration", ('connection', 'protocol', 'operation'))
+        )
+        operations, failures, latency = self.families
+        self.operations = {operation: operations.labels(*self.labels, operation) for operation in self.OPERATIONS}
+        self.failures = {operation: failures.labels(*self.labels, operation) for operation in self.OPERATIONS}
+        self.latency = {operation: latency.labels(*self.labels, operation) for operation in self.OPERATIONS}
+        self.values_family = registry.counter(
+            'scada_values_total', "Values read, pushed by devices and written", ('connection', 'protocol', 'source')
+        )
+        self.values = {source: self.values_family.labels(*self.labels, source) for source in self.SOURCES}
+        self.up_family = registry.gauge('scada_connection_up', "1 while connected", ('connection', 'protocol'))
+        self.up = self.up_family.labels(*self.labels)
+        self.last_error = None
+        self.last_activity = None
+
+    def observe(self, operation, seconds, values=0, error=None):
+        """Record one operation: its duration, how many values it moved and whether it failed"""
+        self.latency[operation].observe(seconds)
+        if error is not None:
+            self.failures[operation].inc()
+            self.last_error = str(error)
+            return
+        self.operations[operation].inc()
+        if values:
+            self.values[operation].inc(values)
+        self.last_activity = time.time()
+
+    def received(self, count):
+        self.values['pushed'].inc(count)
+        self.last_activity = time.time()
+
+    @property
+    def reads(self):
+        return self.operations['read'].get()
+
+    @property
+    def writes(self):
+        return self.operations['write'].get()
+
+    @property
+    def values_read(self):
+        return self.values['read'].get()
+
+    @property
+    def values_received(self):
+        return self.values['pushed'].get()
+
+    @property
+    def errors(self):
+        return sum(counter.get() for counter in self.failures.values())
+
+    def unregister(self):
+        """Drop this connection's series from the registry"""
+        for family in self.families:
+            for operation in self.OPERATIONS:
+                family.remove(*self.labels, operation)
+        for source in self.SOURCES:
+            self.values_family.remove(*self.labels, source)
+        self.up_family.remove(*self.labels)
+
+    def to_dict(self):
+        result = {
+            "reads": self.reads,
+            "writes": self.writes,
+            "values_read": self.values_read,
+            "values_received": self.values_received,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_activity": self.last_activity
+        }
+        for operation in self.OPERATIONS:
+            result[f"{operation}_latency"] = self.latency[operation].summary()
+        return result
+
+
+class Connection:
+    """One configured device or server connection"""
+
+    def __init__(self, connection_id, protocol, name, config, handler, listeners=(), metrics_registry=None):
+        self.id = connection_id
+        self.protocol = protocol
+        self.name = name
+        self.config = config
+        self.handler = handler
+        self.listeners = listeners
+        self.metrics = ConnectionMetrics(metrics_registry or MetricsRegistry(), connection_id, protocol)
+        self.metrics.up.set_function(
+            lambda: int(self.status == ConnectionStatus.CONNECTED)
+        )
+        handler.metrics = self.metrics
+        self.supervisor = None
+        handler.add_data_callback(self._data_received)
+
+    @property
+    def status(self):
+        return self.handler.status
+
+    @property
+    def address(self):
+        """Host and port from the usual config keys, for display"""
+        config = self.config
+        section = config.get('master', config)
+        host = section.get('host') or section.get('ip') or section.get('broker') \
+            or section.get('endpoint') or config.get('server_name', '')
+        return host, section.get('port')
+
+    def _data_received(self, updates):
+        self.metrics.received(len(updates))
+        for listener in self.listeners:
+            listener(self.id, updates)
+
+    def to_dict(self):
+        return {"id": self.id, "protocol": self.protocol, "name": self.name, "config": self.config}
+
+    def get_status(self):
+        host, port = self.address
+        return {
+            "id": self.id,
+            "protocol": self.protocol,
+            "name": self.name,
+            "status": self.status.value,
+            "host": host,
+            "port": port,
+            "supervisor": self.supervisor.get_status() if self.supervisor else None,
+            "metrics": self.metrics.to_dict()
+        }
+
+
+class ConnectionManager:
+    """
+    Owns every connection of the gateway
+
+    Args:
+        settings (dict): Application settings (max_connections, protocol
+                         enabled flags and reconnect policy are used)
+        registry (ProtocolRegistry): Where handler classes come from
+        metrics (MetricsRegistry): Where connection metrics are recorded
+        security (SecurityManager): Encrypts the passwords of saved connections
+    """
+
+    def __init__(self, settings=None, registry=None, metrics=None, security=None):
+        self.logger = logging.getLogger('SCADA_Gateway')
+        self.settings = settings or {}
+        self.security = security
+        self.registry = registry or protocol_registry
+        self.metrics = metrics or MetricsRegistry()
+        self.metrics.gauge('scada_connections', "Configured connections").labels().set_function(self.__len__)
+        self.metrics.gauge('scada_connections_connected', "Connected connections").labels().set_function(
+            self.connected_count
+        )
+        self.max_connections = self.settings.get('application', {}).get('max_connections', 0)
+        self.connections = {}
+        self.data_listeners = []
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __iter__(self):
+        return iter(self.connections.values())
+
+    def __contains__(self, connection_id):
+        return connection_id in self.connections
+
+    def protocols(self):
+        """Protocol names connections can be created for"""
+        self.registry.load_entry_points()
+        return self.registry.enabled(self.settings)
+
+    def config_template(self, protocol):
+        return self.registry.create(protocol).get_config_template()
+
+    # Connections
+
+    def _new_id(self, protocol):
+        prefix = self.registry.settings_keys.get(protocol, protocol.lower().replace(' ', ''))
+        number = 1
+        while f"{prefix}-{number}" in self.connections:
+            number += 1
+        return f"{prefix}-{number}"
+
+    def add(self, protocol, name=None, config=None, connection_id=None):
+        """
+        Create a connection (not yet connected)
+
+        Returns:
+            Connection
+        """
+        if self.max_connections and len(self.connections) >= self.max_connections:
+            raise ValueError(f"Connection limit of {self.max_connections} reached")
+        if protocol not in self.protocols():
+            raise ValueError(f"Protocol {protocol} is not enabled")
+        if connection_id is None:
+            connection_id = self._new_id(protocol)
+        elif connection_id in self.connections:
+            raise ValueError(f"Connection {connection_id} already exists")
+        handler = self.registry.create(protocol)
+        config = config if config is not None else handler.get_config_template()
+        connection = Connection(
+            connection_id, protocol, name or connection_id, config, handler, self.data_listeners, self.metrics
+        )
+        self.connections[connection_id] = connection
+        return connection
+
+    def get(self, connection_id):
+        connection = self.connections.get(connection_id)
+        if connection is None:
+            raise KeyError(f"Unknown connection: {connection_id}")
+        return connection
+
+    def by_protocol(self, protocol):
+        return [connection for connection in self if connection.protocol == protocol]
+
+    def configure(self, connection_id, name=None, config=None):
+        """Change name and/or config of a stopped connection"""
+        connection = self.get(connection_id)
+        if config is not None and connection.supervisor is not None:
+            raise ValueError(f"Connection {connection.name} is running; stop it before changing its config")
+        if name is not None:
+            connection.name = name
+        if config is not None:
+            connection.config = config
+        return connection
+
+    async def update(self, connection_id, name=None, config=None):
+        """Change name and/or config; a running connection is restarted with the new config"""
+        running = self.get(connection_id).supervisor is not None
+        if running and config is not None:
+            await self.stop(connection_id)
+        connection = self.configure(connection_id, name, config)
+        if running and config is not None:
+            self.start(connection_id)
+        return connection
+
+    def delete(self, connection_id):
+        """Forget a stopped connection"""
+        connection = self.get(connection_id)
+        if connection.supervisor is not None:
+            raise ValueError(f"Connection {connection.name} is running; stop it before deleting it")
+        del self.connections[connection_id]
+        connection.handler.remove_data_callback(connection._data_received)
+        connection.metrics.unregister()
+
+    async def remove(self, connection_id):
+        """Stop and forget a connection"""
+        await self.stop(connection_id)
+        self.delete(connection_id)
+
+    # Lifecycle
+
+    def start(self, connection_id):
+        """Connect under supervision (reconnects until stopped)"""
+        connection = self.get(connection_id)
+        if connection.supervisor is None:
+            connection.supervisor = ConnectionSupervisor(
+                connection.handler, connect_config(connection.config), connection.name, self.settings.get('reconnect'),
+                connection.metrics
+            )
+        connection.supervisor.start()
+        return connection.supervisor
+
+    async def stop(self, connection_id):
+        connection = self.get(connection_id)
+        if connection.supervisor is not None:
+            supervisor, connection.supervisor = connection.supervisor, None
+            await supervisor.stop()
+
+    def start_all(self):
+        for connection_id in self.connections:
+            self.start(connection_id)
+
+    async def stop_all(self):
+        """Stop every connection, last started first"""
+        for connection_id in reversed(list(self.connections)):
+            await self.stop(connection_id)
+
+    # Data access
+
+    def add_data_listener(self, listener):
+        """
+        Receive every value of every connection as listener(connection_id, updates)
+
+        Updates pushed by handlers and the results of read() are both
+        delivered. Listeners run on the thread that produced the values
+        (handlers such as paho-mqtt publish from their own thread) and must
+        return quickly.
+        """
+        self.data_listeners.append(listener)
+
+    def remove_data_listener(self, listener):
+        if listener in self.data_listeners:
+            self.data_listeners.remove(listener)
+
+    def _notify_read(self, connection_id, tags, results):
+        updates = []
+        for tag, result in zip(tags, results):
+            update = dict(result) if isinstance(result, dict) else {'value': result, 'quality': 'GOOD'}
+            if point_key(update) is None:
+                update['tag'] = tag if isinstance(tag, str) else (point_key(tag) or json.dumps(tag, sort_keys=True))
+            updates.append(update)
+        for listener in self.data_listeners:
+            listener(connection_id, updates)
+
+    async def read(self, connection_id, tags):
+        connection = self.get(connection_id)
+        started = time.perf_counter()
+        try:
+            results = await connection.handler.read_data(tags)
+        except Exception as e:
+            connection.metrics.observe('read', time.perf_counter() - started, error=e)
+            raise
+        connection.metrics.observe('read', time.perf_counter() - started, len(results))
+        if self.data_listeners:
+            self._notify_read(connection_id, tags, results)
+        return results
+
+    async def read_batch(self, connection_id, tags, batch=None):
+        """read() into a DataBatch, reusing batch when given (see BaseProtocolHandler.read_batch)"""
+        connection = self.get(connection_id)
+        started = time.perf_counter()
+        try:
+            batch = await connection.handler.read_batch(tags, batch)
+        except Exception as e:
+            connection.metrics.observe('read', time.perf_counter() - started, error=e)
+            raise
+        connection.metrics.observe('read', time.perf_counter() - started, len(batch))
+        if self.data_listeners:
+            self._notify_read(connection_id, tags, batch.to_dicts())
+        return batch
+
+    async def write(self, connection_id, tags, values):
+        connection = self.get(connection_id)
+        started = time.perf_counter()
+        try:
+            results = await connection.handler.write_data(tags, values)
+        except Exception as e:
+            connection.metrics.observe('write', time.perf_counter() - started, error=e)
+            raise
+        connection.metrics.observe('write', time.perf_counter() - started, len(tags))
+        return results
+
+    def get_status(self):
+        return [connection.get_status() for connection in self]
+
+    def connected_count(self):
+        return sum(1 for connection in list(self) if connection.status == ConnectionStatus.CONNECTED)
+
+    def statistics(self):
+        """
+        Totals over all connections, for the status bar and the Logs tab
+
+        Returns:
+            dict: connections, connected, values (read and pushed), reads,
+                  writes, errors and read latency percentiles (ms)
+        """
+        read_latency = Histogram()
+        totals = {"values": 0, "reads": 0, "writes": 0, "errors": 0}
+        for connection in list(self):
+            metrics = connection.metrics
+            totals["values"] += metrics.values_read + metrics.values_received
+            totals["reads"] += metrics.reads
+            totals["writes"] += metrics.writes
+            totals["errors"] += metrics.errors
+            read_latency.merge(metrics.latency['read'])
+        latency = read_latency.summary()
+        return {
+            "connections": len(self),
+            "connected": self.connected_count(),
+            **totals,
+            "read_p50_ms": latency["p50_ms"],
+            "read_p99_ms": latency["p99_ms"]
+        }
+
+    # Persistence
+
+    def save_to_file(self, filename):
+        """
+        Write the connections to a JSON file
+
+        Secret fields (SECRET_FIELDS) are encrypted with the security
+        manager's key; without a security manager they are left out.
+        Secrets load_from_file could not decrypt are written back as they
+        were. The file is replaced atomically.
+        """
+        dropped = []
+
+        def protect(value):
+            if value.startswith(ENCRYPTED_PREFIX):
+                return value
+            if self.security is None:
+                dropped.append(value)
+                return ""
+            return ENCRYPTED_PREFIX + self.security.encrypt_secret(value)
+
+        data = [{**connection.to_dict(), "config": map_secrets(connection.config, protect)} for connection in self]
+        temporary = f"{filename}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(temporary, filename)
+        if dropped:
+            self.logger.warning(f"{len(dropped)} passwords not saved to {filename}: no key to encrypt them")
+
+    def load_from_file(self, filename):
+        """Add the connections of a file saved by save_to_file"""
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        unreadable = []
+
+        def reveal(value):
+            # Plain text from older files is kept, and encrypted on the next save
+            if not value.startswith(ENCRYPTED_PREFIX):
+                return value
+            try:
+                if self.security is not None:
+                    return self.security.decrypt_secret(value[len(ENCRYPTED_PREFIX):])
+            except InvalidToken:
+                pass
+            # Kept encrypted, so saving does not lose it (connect_config leaves it empty)
+            unreadable.append(value)
+            return value
+
+        for item in data:
+            self.add(item["protocol"], item.get("name"), map_secrets(item.get("config"), reveal), item.get("id"))
+        if unreadable:
+            self.logger.error(
+                f"{len(unreadable)} passwords in {filename} could not be decrypted (different key?); "
+                f"connecting without them"
+            )
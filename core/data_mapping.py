@@ -2,14 +2,29 @@ from typing import Dict, List, Any
 import json
 
 class DataPoint:
-    def __init__(self, protocol: str, tag: Dict[str, Any], name: str = ""):
+    def __init__(self, protocol: str, tag: Dict[str, Any], name: str = "", connection_id: str = None):
         self.protocol = protocol
         self.tag = tag
-        self.name = name or f"{protocol}_{tag.get('address', '')}"
+        self.connection_id = connection_id
+        self.name = name or f"{connection_id or protocol}_{tag.get('address', '')}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "protocol": self.protocol,
+            "connection_id": self.connection_id,
+            "tag": self.tag,
+            "name": self.name
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DataPoint":
+        return cls(data["protocol"], data["tag"], data["name"], data.get("connection_id"))
 
 class DataMapping:
     def __init__(self):
         self.mappings: List[Dict[str, DataPoint]] = []
+        # Bumped when mappings are added, removed or loaded
+        self.version = 0
 
     def add_mapping(self, source: DataPoint, destination: DataPoint):
         self.mappings.append({
@@ -18,10 +33,20 @@ class DataMapping:
             "enabled": True,
             "transformation": None
         })
+        self.version += 1
 
     def remove_mapping(self, index: int):
         if 0 <= index < len(self.mappings):
             self.mappings.pop(index)
+            self.version += 1
+
+    def for_connection(self, connection_id: str) -> List[Dict[str, Any]]:
+        """Mappings whose source or destination is the given connection"""
+        return [
+            mapping for mapping in self.mappings
+            if mapping["source"].connection_id == connection_id
+            or mapping["destination"].connection_id == connection_id
+        ]
 
     def set_transformation(self, index: int, transform_function: str):
         if 0 <= index < len(self.mappings):
@@ -31,16 +56,8 @@ class DataMapping:
         data = []
         for mapping in self.mappings:
             data.append({
-                "source": {
-                    "protocol": mapping["source"].protocol,
-                    "tag": mapping["source"].tag,
-                    "name": mapping["source"].name
-                },
-                "destination": {
-                    "protocol": mapping["destination"].protocol,
-                    "tag": mapping["destination"].tag,
-                    "name": mapping["destination"].name
-                },
+                "source": mapping["source"].to_dict(),
+                "destination": mapping["destination"].to_dict(),
                 "enabled": mapping["enabled"],
                 "transformation": mapping["transformation"]
             })
@@ -54,19 +71,12 @@ class DataMapping:
         
         self.mappings = []
         for item in data:
-            source = DataPoint(
-                item["source"]["protocol"],
-                item["source"]["tag"],
-                item["source"]["name"]
-            )
-            destination = DataPoint(
-                item["destination"]["protocol"],
-                item["destination"]["tag"],
-                item["destination"]["name"]
-            )
+            source = DataPoint.from_dict(item["source"])
+            destination = DataPoint.from_dict(item["destination"])
             self.mappings.append({
                 "source": source,
                 "destination": destination,
                 "enabled": item["enabled"],
                 "transformation": item["transformation"]
-            })
\ No newline at end of file
+            })
+        self.version += 1
\ No newline at end of file
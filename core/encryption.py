@@ -0,0 +1,257 @@
+"""
+Streaming encryption for SCADA Data Gateway
+Encrypts files and streams of any size in fixed-size chunks with constant
+memory, each chunk authenticated on its own
+
+Format: a header (magic, version, chunk size, 16 byte salt), then chunks of
+AES-256-GCM ciphertext plus 16 byte tag. Every file gets its own key,
+derived from the master key and the salt with HKDF. Chunk nonces are the
+chunk number and a final-chunk flag, and the header is authenticated with
+every chunk, so reordered, dropped, truncated or appended chunks are
+detected, not only modified bytes (the STREAM construction).
+
+    with open('export.enc', 'wb') as f, EncryptedWriter(f, key) as writer:
+        writer.write(data)
+    with open('export.enc', 'rb') as f:
+        data = EncryptedReader(f, key).read()
+"""
+
+import io
+import os
+import struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+MAGIC = b'SGWE'
+VERSION = 1
+HEADER = struct.Struct('>4sBI16s')
+TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+MAX_CHUNKS = 1 << 32
+
+
+def load_key(path):
+    """
+    The master key stored in path, created (readable by the owner only) if missing
+
+    The key is a Fernet key, so the same file serves
+    SecurityManager.encrypt_data as well.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    key = Fernet.generate_key()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Created by another process meanwhile
+        return load_key(path)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def derive_key(master_key, purpose, salt=None):
+    """32 byte key for one purpose (and file, by salt) from the master key"""
+    if isinstance(master_key, str):
+        master_key = master_key.encode()
+    return HKDF(hashes.SHA256(), 32, salt, purpose).derive(master_key)
+
+
+def _nonce(number, last):
+    if number >= MAX_CHUNKS:
+        raise OverflowError("Encrypted stream has too many chunks")
+    return struct.pack('>7xIB', number, last)
+
+
+class EncryptedWriter(io.RawIOBase):
+    """
+    Writable stream encrypting into a binary file object
+
+    Only close() writes the final chunk, so the stream must be closed
+    (or used as a context manager).
+
+    Args:
+        raw: Binary file object to write the encrypted stream to
+        key (bytes): Master key (see load_key)
+        chunk_size (int): Plaintext bytes per chunk
+        closefd (bool): Close raw as well when closed
+    """
+
+    def __init__(self, raw, key, chunk_size=DEFAULT_CHUNK_SIZE, closefd=False):
+        super().__init__()
+        self.closefd = closefd
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"Chunk size must be 1 to {MAX_CHUNK_SIZE} bytes")
+        self.raw = raw
+        self.chunk_size = chunk_size
+        salt = os.urandom(16)
+        self.header = HEADER.pack(MAGIC, VERSION, chunk_size, salt)
+        self.cipher = AESGCM(derive_key(key, b'stream', salt))
+        self.buffer = bytearray()
+        self.chunks = 0
+        self.raw.write(self.header)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed encrypted stream")
+        buffer = self.buffer
+        buffer += data
+        size = self.chunk_size
+        offset = 0
+        # Keep at least one byte back: the last chunk is only known at close()
+        with memoryview(buffer) as view:
+            while len(buffer) - offset > size:
+                self._seal(view[offset:offset + size], 0)
+                offset += size
+        if offset:
+            del buffer[:offset]
+        return len(data)
+
+    def _seal(self, chunk, last):
+        self.raw.write(self.cipher.encrypt(_nonce(self.chunks, last), chunk, self.header))
+        self.chunks += 1
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._seal(bytes(self.buffer), 1)
+                self.buffer = bytearray()
+                if hasattr(self.raw, 'flush'):
+                    self.raw.flush()
+            finally:
+                super().close()
+                if self.closefd:
+                    self.raw.close()
+
+
+class EncryptedReader(io.RawIOBase):
+    """
+    Readable stream decrypting a binary file object written by EncryptedWriter
+
+    Each chunk is authenticated before any of it is returned. Tampering
+    or truncation raises cryptography.fernet.InvalidToken, as
+    SecurityManager.decrypt_data does. Wrap in io.BufferedReader and
+    io.TextIOWrapper to read lines.
+
+    Args:
+        raw: Binary file object positioned at the encrypted stream
+        key (bytes): Master key (see load_key)
+        closefd (bool): Close raw as well when closed
+    """
+
+    def __init__(self, raw, key, closefd=False):
+        super().__init__()
+        self.closefd = closefd
+        self.raw = raw
+        self.header = self._read_exactly(HEADER.size)
+        if len(self.header) < HEADER.size:
+            raise InvalidToken("Encrypted stream header is truncated")
+        magic, version, chunk_size, salt = HEADER.unpack(self.header)
+        if magic != MAGIC or version != VERSION or not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise InvalidToken("Not an encrypted stream of a supported version")
+        self.cipher = AESGCM(derive_key(key, b'stream', salt))
+        self.sealed_size = chunk_size + TAG_SIZE
+        self.next_sealed = self._read_exactly(self.sealed_size)
+        self.plain = b''
+        self.position = 0
+        self.chunks = 0
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            if self.closefd:
+                self.raw.close()
+
+    def _read_exactly(self, size):
+        parts = []
+        while size:
+            part = self.raw.read(size)
+            if not part:
+                break
+            parts.append(part)
+            size -= len(part)
+        return b''.join(parts)
+
+    def _open_next(self):
+        sealed = self.next_sealed
+        if len(sealed) < TAG_SIZE:
+            raise InvalidToken("Encrypted stream is truncated")
+        # A short chunk is the last one; a full one is last only if nothing follows
+        self.next_sealed = self._read_exactly(self.sealed_size) if len(sealed) == self.sealed_size else b''
+        last = not self.next_sealed
+        try:
+            self.plain = self.cipher.decrypt(_nonce(self.chunks, last), sealed, self.header)
+        except InvalidTag:
+            raise InvalidToken("Encrypted stream is corrupt or truncated") from None
+        self.position = 0
+        self.chunks += 1
+        self.finished = last
+
+    def readinto(self, buffer):
+        while self.position >= len(self.plain):
+            if self.finished:
+                return 0
+            self._open_next()
+        count = min(len(buffer), len(self.plain) - self.position)
+        buffer[:count] = self.plain[self.position:self.position + count]
+        self.position += count
+        return count
+
+    def readall(self):
+        parts = [self.plain[self.position:]]
+        self.position = len(self.plain)
+        while not self.finished:
+            self._open_next()
+            parts.append(self.plain)
+            self.position = len(self.plain)
+        return b''.join(parts)
+
+
+def encrypt_stream(source, destination, key, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encrypt binary file object source into destination; returns the plaintext size"""
+    total = 0
+    buffer = bytearray(chunk_size)
+    with memoryview(buffer) as view, EncryptedWriter(destination, key, chunk_size) as writer:
+        while True:
+            count = source.readinto(buffer) if hasattr(source, 'readinto') else None
+            if count is None:
+                data = source.read(chunk_size)
+                count = len(data)
+                view[:count] = data
+            if not count:
+                break
+            writer.write(view[:count])
+            total += count
+    return total
+
+
+def decrypt_stream(source, destination, key):
+    """Decrypt binary file object source into destination; returns the plaintext size"""
+    reader = EncryptedReader(source, key)
+    buffer = bytearray(DEFAULT_CHUNK_SIZE)
+    total = 0
+    with memoryview(buffer) as view:
+        while True:
+            count = reader.readinto(view)
+            if not count:
+                break
+            destination.write(view[:count])
+            total += count
+    return total
+
@@ -0,0 +1,193 @@
+"""
+Logging pipeline for SCADA Data Gateway
+Configures the SCADA_Gateway logger tree from the "logging" settings section
+
+Loggers only put records on a queue; a listener thread formats them and
+writes them to a size-rotated file (and optionally the console). The
+listener takes whatever is queued at once and flushes each handler once
+per batch, so neither the event loop nor the GUI thread waits for disk.
+"""
+
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+from config import CONFIG_PATH
+
+ROOT_LOGGER = 'SCADA_Gateway'
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(CONFIG_PATH)))
+
+DEFAULT_LOGGING = {
+    "file_path": "logs/scada_gateway.log",
+    "max_size_mb": 10,
+    "backup_count": 5,
+    "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+}
+
+# Most records the listener handles before flushing
+MAX_BATCH = 512
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that leaves flushing to its caller
+
+    The file size is tracked from what was written instead of formatting
+    every record twice and asking the file for its position, as
+    RotatingFileHandler.shouldRollover does.
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, encoding='utf-8'):
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True)
+        self.size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+
+    def emit(self, record):
+        try:
+            message = self.format(record) + self.terminator
+            length = len(message.encode(self.encoding or 'utf-8', 'replace'))
+            if self.maxBytes and self.size and self.size + length > self.maxBytes:
+                self.doRollover()
+                self.size = 0
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(message)
+            self.size += length
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener
+
+    Only the message arguments are merged on the logging thread (so later
+    changes to mutable arguments cannot alter the record); timestamps,
+    format strings and tracebacks are formatted by the listener.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class BatchingQueueListener:
+    """Thread that handles queued records in batches, flushing each handler once per batch"""
+
+    _sentinel = None
+
+    def __init__(self, record_queue, *handlers):
+        self.queue = record_queue
+        self.handlers = handlers
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._monitor, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Write everything queued so far, then stop the thread"""
+        if self.thread is not None:
+            self.queue.put(self._sentinel)
+            self.thread.join()
+            self.thread = None
+
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _monitor(self):
+        get, get_nowait = self.queue.get, self.queue.get_nowait
+        while True:
+            record = get()
+            stopping = record is self._sentinel
+            count = 0
+            while not stopping:
+                self._handle(record)
+                count += 1
+                if count >= MAX_BATCH:
+                    break
+                try:
+                    record = get_nowait()
+                except queue.Empty:
+                    break
+                stopping = record is self._sentinel
+            for handler in self.handlers:
+                handler.flush()
+            if stopping:
+                return
+
+
+class LoggingPipeline:
+    """The queue handler on the SCADA_Gateway logger and the listener writing its records"""
+
+    def __init__(self, logger, queue_handler, listener):
+        self.logger = logger
+        self.queue_handler = queue_handler
+        self.listener = listener
+
+    def stop(self):
+        self.logger.removeHandler(self.queue_handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+_pipeline = None
+
+
+def setup_logging(settings=None, console=False):
+    """
+    Send SCADA_Gateway.* records to the rotating log file through a queue
+
+    Args:
+        settings (dict): Application settings; "logging" gives file_path
+                         (relative to the project directory), max_size_mb,
+                         backup_count and format, application.log_level the level
+        console (bool): Also write to stderr (headless mode)
+
+    Returns:
+        LoggingPipeline: stop() it at shutdown to write the remaining records
+    """
+    global _pipeline
+    settings = settings or {}
+    config = {**DEFAULT_LOGGING, **settings.get('logging', {})}
+    level = settings.get('application', {}).get('log_level', 'INFO')
+
+    if _pipeline is not None:
+        _pipeline.stop()
+
+    formatter = logging.Formatter(config["format"])
+    handlers = []
+    if config["file_path"]:
+        path = config["file_path"]
+        if not os.path.isabs(path):
+            path = os.path.join(PROJECT_DIR, path)
+        file_handler = BufferedRotatingFileHandler(
+            path, int(config["max_size_mb"] * 1024 * 1024), config["backup_count"]
+        )
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    record_queue = queue.SimpleQueue()
+    listener = BatchingQueueListener(record_queue, *handlers)
+    queue_handler = DeferredQueueHandler(record_queue)
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    listener.start()
+    _pipeline = LoggingPipeline(logger, queue_handler, listener)
+    return _pipeline
@@ -0,0 +1,368 @@
+"""
+Metrics registry for SCADA Data Gateway
+Counters, gauges and latency histograms per connection and operation,
+exported in the Prometheus text format over a local HTTP endpoint
+
+    registry = MetricsRegistry()
+    reads = registry.counter('scada_reads_total', "Reads", ('connection',))
+    reads.labels('modbus-1').inc()
+    latency = registry.histogram('scada_read_seconds', "Read latency", ('connection',))
+    latency.labels('modbus-1').observe(0.0042)
+
+Recording is a few integer operations under a lock; nothing is formatted
+until the registry is collected. Histograms keep log-linear buckets (as
+HdrHistogram does) with a bounded relative error, so percentiles of any
+range of latencies are available without configuring bucket limits.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+
+DEFAULT_METRICS = {
+    "http_enabled": True,
+    "host": "127.0.0.1",
+    "port": 9108
+}
+
+# Histogram resolution: 2**(SUB_BUCKET_BITS - 1) buckets per power of two,
+# i.e. about 3% relative error
+SUB_BUCKET_BITS = 5
+# Histogram unit and range: microseconds up to about 12 days
+UNIT = 1e-6
+MAX_VALUE = 1 << 40
+
+# Bucket limits (seconds) written for Prometheus, which needs fixed "le" labels
+EXPORT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def bucket_index(value):
+    """Histogram bucket of a non-negative integer"""
+    exponent = value.bit_length() - SUB_BUCKET_BITS
+    if exponent <= 0:
+        return value
+    return (exponent << (SUB_BUCKET_BITS - 1)) + (value >> exponent)
+
+
+def bucket_upper(index):
+    """Largest integer counted in a histogram bucket"""
+    if index < 1 << SUB_BUCKET_BITS:
+        return index
+    exponent = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    top = index - (exponent << (SUB_BUCKET_BITS - 1))
+    return ((top + 1) << exponent) - 1
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Monotonically increasing count"""
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class Gauge:
+    """Value that goes up and down, or is read from a function when collected"""
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set_function(self, function):
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class Histogram:
+    """
+    Distribution of durations in log-linear buckets
+
+    Values are recorded in microseconds; quantiles are the upper limit of
+    the bucket they fall in, so they are never under-reported.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (bucket_index(MAX_VALUE) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        value = min(MAX_VALUE, max(0, int(seconds / UNIT)))
+        index = bucket_index(value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if value > self.max:
+                self.max = value
+
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+    def merge(self, other):
+        with self.lock:
+            for index, count in enumerate(other.counts):
+                if count:
+                    self.counts[index] += count
+            self.count += other.count
+            self.sum += other.sum
+            self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Duration (seconds) at or below which a fraction q of the observations lie"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_upper(index), self.max) * UNIT
+        return self.max * UNIT
+
+    def cumulative(self, limits=EXPORT_BUCKETS):
+        """Observation counts at or below each limit (seconds, to within a bucket), for export"""
+        result = []
+        seen = 0
+        index = 0
+        counts = self.counts
+        for limit in limits:
+            top = bucket_index(min(MAX_VALUE, int(limit / UNIT)))
+            while index <= top:
+                seen += counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def summary(self):
+        """Count and millisecond percentiles, for status displays"""
+        return {
+            "count": self.count,
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "max_ms": round(self.max * UNIT * 1000, 3)
+        }
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class MetricFamily:
+    """All metrics of one name, one per combination of label values"""
+
+    TYPES = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+
+    def __init__(self, name, help_text, kind, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        """The metric for these label values, created on first use"""
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}, got {values}")
+            with self.lock:
+                child = self.children.setdefault(values, self.TYPES[self.kind]())
+        return child
+
+    def remove(self, *values):
+        with self.lock:
+            self.children.pop(tuple(str(value) for value in values), None)
+
+    def collect(self):
+        """Prometheus text exposition lines"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = self.label_names
+        for values, child in list(self.children.items()):
+            if self.kind != 'histogram':
+                try:
+                    value = child.get()
+                except Exception:
+                    continue
+                lines.append(f"{self.name}{_label_text(names, values)} {_number(float(value))}")
+                continue
+            for limit, count in zip(EXPORT_BUCKETS + (math.inf,), child.cumulative() + [child.count]):
+                bucket = _label_text(names, values, 'le="%s"' % _number(limit))
+                lines.append(f"{self.name}_bucket{bucket} {count}")
+            lines.append(f"{self.name}_sum{_label_text(names, values)} {_number(child.sum)}")
+            lines.append(f"{self.name}_count{_label_text(names, values)} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Named metric families of the gateway
+
+    counter(), gauge() and histogram() return the existing family when the
+    name is already registered, so components can declare what they use.
+    """
+
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def _family(self, name, help_text, kind, label_names):
+        family = self.families.get(name)
+        if family is None:
+            with self.lock:
+                family = self.families.setdefault(name, MetricFamily(name, help_text, kind, label_names))
+        if family.kind != kind or family.label_names != tuple(label_names):
+            raise ValueError(f"Metric {name} is already registered as a {family.kind} with labels {family.label_names}")
+        return family
+
+    def counter(self, name, help_text, label_names=()):
+        return self._family(name, help_text, 'counter', label_names)
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._family(name, help_text, 'gauge', label_names)
+
+    def histogram(self, name, help_text, label_names=()):
+        return self._family(name, help_text, 'histogram', label_names)
+
+    def get(self, name):
+        return self.families.get(name)
+
+    def to_prometheus(self):
+        """Every family in the Prometheus text exposition format"""
+        lines = []
+        for family in list(self.families.values()):
+            lines.extend(family.collect())
+        return '\n'.join(lines) + '\n'
+
+
+class RateMeter:
+    """Per second rate of a growing total between successive update() calls"""
+
+    def __init__(self):
+        self.last_total = None
+        self.last_time = None
+
+    def update(self, total):
+        now = time.monotonic()
+        if self.last_time is None:
+            rate = 0.0
+        else:
+            rate = (total - self.last_total) / max(now - self.last_time, 1e-3)
+        self.last_total, self.last_time = total, now
+        return rate
+
+
+class MetricsServer:
+    """
+    Serves GET /metrics in the Prometheus text format
+
+    Args:
+        registry (MetricsRegistry): What to export
+        host (str): Listen address; keep it local unless the network is trusted
+        port (int): Listen port (0 picks a free one)
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, registry, host='127.0.0.1', port=9108):
+        self.logger = logging.getLogger('SCADA_Gateway.Metrics')
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    @classmethod
+    def from_settings(cls, registry, settings=None):
+        """Server configured by the "metrics" settings section; None if disabled"""
+        config = {**DEFAULT_METRICS, **(settings or {}).get('metrics', {})}
+        if not config["http_enabled"]:
+            return None
+        return cls(registry, config["host"], config["port"])
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.logger.info("Metrics at http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self.server is not None:
+            server, self.server = self.server, None
+            server.close()
+            await server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] in ('GET', 'HEAD') and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.registry.to_prometheus().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            head = (
+                f"HTTP/1.1 {status}\r\nContent-Type: {self.CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+            )
+            writer.write(head.encode('latin-1'))
+            if parts[:1] != ['HEAD']:
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            self.logger.error(f"Metrics request failed: {str(e)}")
+        finally:
+            writer.close()
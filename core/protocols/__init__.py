@@ -1,20 +1,155 @@
-from .modbus_handler import ModbusHandler
-from .opcua_handler import OPCUAHandler
-from .dnp3_handler import DNP3Handler
-from .iec104_handler import IEC104Handler
-from .iec61850_handler import IEC61850Handler
-from .opcda_handler import OPCDAHandler
-from .mqtt_handler import MQTTHandler
-
-def initialize_protocols():
-    """Initialize all protocol handlers"""
-    protocols = {
-        'Modbus': ModbusHandler(),
-        'OPC UA': OPCUAHandler(),
-        'DNP3': DNP3Handler(),
-        'IEC 60870-5-104': IEC104Handler(),
-        'IEC 61850': IEC61850Handler(),
-        'OPC DA': OPCDAHandler(),
-        'MQTT': MQTTHandler()
-    }
-    return protocols
\ No newline at end of file
+"""
+Protocol handlers for SCADA Data Gateway
+
+Handlers are plugins resolved by name: nothing protocol specific (pymodbus,
+asyncua, paho-mqtt, ...) is imported until a handler is actually used, and
+disabled protocols are never imported. Third party handlers can register
+through the 'scada_gateway.protocols' entry point group, e.g.
+
+    [project.entry-points."scada_gateway.protocols"]
+    "BACnet" = "my_package.bacnet:BACnetHandler"
+"""
+
+import importlib
+import logging
+
+ENTRY_POINT_GROUP = 'scada_gateway.protocols'
+
+# Display name -> (settings key under "protocols", "module:Class")
+BUILTIN_PROTOCOLS = {
+    'Modbus': ('modbus', 'core.protocols.modbus_handler:ModbusHandler'),
+    'OPC UA': ('opcua', 'core.protocols.opcua_handler:OPCUAHandler'),
+    'DNP3': ('dnp3', 'core.protocols.dnp3_handler:DNP3Handler'),
+    'IEC 60870-5-104': ('iec104', 'core.protocols.iec104_handler:IEC104Handler'),
+    'IEC 61850': ('iec61850', 'core.protocols.iec61850_handler:IEC61850Handler'),
+    'OPC DA': ('opcda', 'core.protocols.opcda_handler:OPCDAHandler'),
+    'MQTT': ('mqtt', 'core.protocols.mqtt_handler:MQTTHandler')
+}
+
+# Handler class names importable from this package, resolved on first access
+_HANDLER_CLASSES = {target.rpartition(':')[2]: target for _, target in BUILTIN_PROTOCOLS.values()}
+
+
+def _resolve(target):
+    module_name, _, attribute = target.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class ProtocolRegistry:
+    """Protocol names mapped to handler classes that are imported on first use"""
+
+    def __init__(self):
+        self.logger = logging.getLogger('SCADA_Gateway')
+        self.targets = {}
+        self.settings_keys = {}
+        self.classes = {}
+        self.entry_points_loaded = False
+
+    def register(self, name, target, settings_key=None):
+        """
+        Register a handler
+
+        Args:
+            name (str): Protocol display name
+            target (str or type): 'module:Class' or the handler class itself
+            settings_key (str): Key under "protocols" in settings.json
+        """
+        self.targets[name] = target
+        self.settings_keys[name] = settings_key or name.lower().replace(' ', '')
+        if not isinstance(target, str):
+            self.classes[name] = target
+        else:
+            self.classes.pop(name, None)
+
+    def load_entry_points(self):
+        """Register the handlers advertised by installed packages"""
+        if self.entry_points_loaded:
+            return
+        self.entry_points_loaded = True
+        # importlib.metadata is slow to import; only pay for it here
+        from importlib.metadata import entry_points
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            if entry_point.name in self.targets:
+                self.logger.warning(f"Protocol plugin {entry_point.name} shadows an existing protocol")
+            self.register(entry_point.name, entry_point.value)
+
+    def names(self):
+        return list(self.targets)
+
+    def is_enabled(self, name, settings=None):
+        """Whether settings["protocols"][key]["enabled"] allows the protocol (default True)"""
+        protocols = (settings or {}).get('protocols', {})
+        return protocols.get(self.settings_keys[name], {}).get('enabled', True)
+
+    def enabled(self, settings=None):
+        return [name for name in self.targets if self.is_enabled(name, settings)]
+
+    def handler_class(self, name):
+        handler_class = self.classes.get(name)
+        if handler_class is None:
+            if name not in self.targets:
+                raise KeyError(f"Unknown protocol: {name}")
+            handler_class = self.classes[name] = _resolve(self.targets[name])
+        return handler_class
+
+    def create(self, name):
+        """Import the protocol if needed and return a new handler"""
+        return self.handler_class(name)()
+
+
+registry = ProtocolRegistry()
+for _name, (_key, _target) in BUILTIN_PROTOCOLS.items():
+    registry.register(_name, _target, _key)
+
+
+class LazyProtocols(dict):
+    """
+    Protocol name -> handler mapping whose handlers are created on first access
+
+    Keys are known up front (for protocol pickers); the handler module is
+    only imported when a value is requested.
+    """
+
+    def __init__(self, names, registry):
+        super().__init__((name, None) for name in names)
+        self.registry = registry
+
+    def __getitem__(self, name):
+        handler = super().__getitem__(name)
+        if handler is None:
+            handler = self.registry.create(name)
+            super().__setitem__(name, handler)
+        return handler
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def values(self):
+        return [self[name] for name in self]
+
+    def items(self):
+        return [(name, self[name]) for name in self]
+
+    def loaded(self):
+        """Handlers created so far"""
+        return {name: handler for name, handler in super().items() if handler is not None}
+
+
+def initialize_protocols(settings=None):
+    """
+    Return the enabled protocol handlers, created lazily
+
+    Args:
+        settings (dict): Application settings; protocols whose
+                         protocols.<key>.enabled is false are left out
+    """
+    registry.load_entry_points()
+    return LazyProtocols(registry.enabled(settings), registry)
+
+
+def __getattr__(name):
+    # Keep 'from core.protocols import ModbusHandler' working without eager imports
+    target = _HANDLER_CLASSES.get(name)
+    if target is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _resolve(target)
@@ -1,6 +1,10 @@
+import logging
+import time
 from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime
 from enum import Enum
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List
 
 class ConnectionStatus(Enum):
     DISCONNECTED = "Disconnected"
@@ -8,11 +12,197 @@ class ConnectionStatus(Enum):
     CONNECTED = "Connected"
     ERROR = "Error"
 
+# Quality codes of DataBatch
+QUALITY_GOOD = 0
+QUALITY_UNCERTAIN = 1
+QUALITY_BAD = 2
+QUALITY_UNKNOWN = 3
+QUALITY_NAMES = ('GOOD', 'UNCERTAIN', 'BAD', 'UNKNOWN')
+
+# Quality strings used by the handlers' dict results
+QUALITY_CODES = {
+    'GOOD': QUALITY_GOOD,
+    'ONLINE': QUALITY_GOOD,
+    'valid': QUALITY_GOOD,
+    'UNCERTAIN': QUALITY_UNCERTAIN,
+    'questionable': QUALITY_UNCERTAIN,
+    'NOT_TOPICAL': QUALITY_UNCERTAIN,
+    'SUBSTITUTED': QUALITY_UNCERTAIN,
+    'BLOCKED': QUALITY_UNCERTAIN,
+    'BAD': QUALITY_BAD,
+    'OFFLINE': QUALITY_BAD,
+    'INVALID': QUALITY_BAD,
+    'invalid': QUALITY_BAD,
+    'UNKNOWN': QUALITY_UNKNOWN,
+    'unknown': QUALITY_UNKNOWN
+}
+
+# Error codes of DataBatch
+ERROR_NONE = 0
+ERROR_NO_DATA = 1        # nothing known for the tag (not received, not found)
+ERROR_READ_FAILED = 2    # the device rejected or failed the read
+ERROR_ACCESS_DENIED = 3
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def now_ms():
+    """Current time as epoch milliseconds"""
+    return time.time_ns() // 1000000
+
+
+def timestamp_ms(timestamp):
+    """Epoch milliseconds of an ISO string (UTC) or datetime; 0 for None"""
+    if not timestamp:
+        return 0
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        return int((timestamp - _EPOCH).total_seconds() * 1000)
+    return int(timestamp.timestamp() * 1000)
+
+
+def timestamp_iso(timestamp):
+    """ISO string of epoch milliseconds; None for 0"""
+    if not timestamp:
+        return None
+    return datetime.utcfromtimestamp(timestamp / 1000.0).isoformat()
+
+
+def typed_address(text, default_type):
+    """Split "type:number" (or just "number") tag text into (type, number)"""
+    kind, _, number = text.strip().rpartition(':')
+    try:
+        return kind or default_type, int(number, 0)
+    except ValueError:
+        raise ValueError(f"Invalid tag {text!r}: expected [type:]number") from None
+
+
+# Keys of handler update dictionaries that identify the point
+POINT_KEYS = ('tag', 'reference', 'ioa', 'id', 'node_id', 'topic')
+
+
+def point_key(update):
+    """Identify the point of a handler update dictionary"""
+    for key in POINT_KEYS:
+        value = update.get(key)
+        if value is not None:
+            return str(value)
+    return None
+
+
+class DataBatch:
+    """
+    Read results of a list of tags as parallel columns
+
+    values holds the Python values; qualities, timestamps (epoch ms, 0 when
+    unknown) and errors are typed arrays. A batch is reused across polls:
+    reset() sizes it for the next tag list without reallocating when the
+    capacity suffices, and handlers fill the rows in place with set() and
+    fail().
+    """
+
+    __slots__ = ('tags', 'values', 'qualities', 'timestamps', 'errors', 'size')
+
+    def __init__(self, tags=None):
+        self.tags = []
+        self.values = []
+        self.qualities = array('B')
+        self.timestamps = array('q')
+        self.errors = array('H')
+        self.size = 0
+        if tags is not None:
+            self.reset(tags)
+
+    def __len__(self):
+        return self.size
+
+    def reset(self, tags):
+        """Size the batch for tags with every row unknown (ERROR_NO_DATA)"""
+        size = len(tags)
+        grow = size - len(self.values)
+        if grow > 0:
+            self.values.extend([None] * grow)
+            self.qualities.extend(array('B', (0,)) * grow)
+            self.timestamps.extend(array('q', (0,)) * grow)
+            self.errors.extend(array('H', (0,)) * grow)
+        self.tags = tags
+        self.size = size
+        self.values[:size] = [None] * size
+        self.qualities[:size] = array('B', (QUALITY_UNKNOWN,)) * size
+        self.timestamps[:size] = array('q', (0,)) * size
+        self.errors[:size] = array('H', (ERROR_NO_DATA,)) * size
+        return self
+
+    def set(self, index, value, quality=QUALITY_GOOD, timestamp=0, error=ERROR_NONE):
+        self.values[index] = value
+        self.qualities[index] = quality
+        self.timestamps[index] = timestamp
+        self.errors[index] = error
+
+    def fail(self, index, error=ERROR_READ_FAILED, timestamp=0):
+        self.values[index] = None
+        self.qualities[index] = QUALITY_BAD
+        self.timestamps[index] = timestamp
+        self.errors[index] = error
+
+    def rows(self):
+        """Iterate over (tag, value, quality, timestamp, error)"""
+        return zip(self.tags, self.values[:self.size], self.qualities[:self.size],
+                   self.timestamps[:self.size], self.errors[:self.size])
+
+    def to_dicts(self):
+        """Per-point dictionaries in the shape of the handlers' read_data results"""
+        return [
+            {
+                'value': value,
+                'quality': QUALITY_NAMES[quality],
+                'timestamp': timestamp_iso(timestamp)
+            }
+            for _, value, quality, timestamp, _ in self.rows()
+        ]
+
+    def fill_from_results(self, results):
+        """Fill the rows from read_data results (dicts or raw values) in tag order"""
+        for index, result in enumerate(results[:self.size]):
+            if result is None:
+                continue
+            if isinstance(result, dict):
+                if result.get('value') is None and result.get('quality') in (None, 'UNKNOWN', 'unknown'):
+                    continue
+                quality = result.get('quality', 'GOOD')
+                self.set(index, result.get('value'),
+                         QUALITY_CODES.get(quality.split(',', 1)[0], QUALITY_UNCERTAIN),
+                         timestamp_ms(result.get('timestamp')))
+            else:
+                self.set(index, result, QUALITY_GOOD, now_ms())
+        return self
+
+
 class BaseProtocolHandler(ABC):
     def __init__(self):
-        self.status = ConnectionStatus.DISCONNECTED
+        self.status_callbacks: List[Callable] = []
+        self._status = ConnectionStatus.DISCONNECTED
         self.config = {}
         self.connection = None
+        self.data_callbacks: List[Callable] = []
+        # ConnectionMetrics of the connection using this handler, if any
+        self.metrics = None
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, status):
+        if status == self._status:
+            return
+        self._status = status
+        for callback in list(self.status_callbacks):
+            try:
+                callback(status)
+            except Exception as e:
+                logging.getLogger('SCADA_Gateway').error(f"Status callback error: {str(e)}")
 
     @abstractmethod
     async def connect(self, config: Dict[str, Any]):
@@ -34,10 +224,81 @@ class BaseProtocolHandler(ABC):
         """Write data to the device/server"""
         pass
 
+    async def check_connection(self) -> bool:
+        """Health check used by the connection supervisor"""
+        return self.status == ConnectionStatus.CONNECTED
+
+    async def restore_subscriptions(self):
+        """Re-establish subscriptions after a reconnect (connect() restores them where possible)"""
+        pass
+
+    async def read_batch(self, tags: list, batch: DataBatch = None) -> DataBatch:
+        """
+        Read tags into a DataBatch, reusing batch when given
+
+        The default converts the read_data results; handlers that hold
+        their values natively override this to fill the columns directly.
+        """
+        batch = (batch or DataBatch()).reset(tags)
+        return batch.fill_from_results(await self.read_data(tags))
+
+    def add_status_callback(self, callback: Callable):
+        """Register a callback called with the new ConnectionStatus on every change"""
+        if callback not in self.status_callbacks:
+            self.status_callbacks.append(callback)
+
+    def remove_status_callback(self, callback: Callable):
+        """Unregister a status callback"""
+        if callback in self.status_callbacks:
+            self.status_callbacks.remove(callback)
+
+    def add_data_callback(self, callback: Callable):
+        """Register a callback for values pushed by the device (unsolicited, spontaneous or report data)"""
+        if callback not in self.data_callbacks:
+            self.data_callbacks.append(callback)
+
+    def remove_data_callback(self, callback: Callable):
+        """Unregister a data callback"""
+        if callback in self.data_callbacks:
+            self.data_callbacks.remove(callback)
+
+    def _publish_data(self, updates: list):
+        """Hand a list of changed values to every registered data callback"""
+        for callback in list(self.data_callbacks):
+            try:
+                callback(updates)
+            except Exception as e:
+                logging.getLogger('SCADA_Gateway').error(f"Data callback error: {str(e)}")
+
+    def normalize_tag(self, tag):
+        """
+        The tag as read_data/write_data expect it
+
+        Mappings made in the GUI hold {"tag": text}; the text is parsed by
+        parse_tag. Any other tag is already in the handler's format.
+        """
+        if isinstance(tag, dict) and len(tag) == 1 and isinstance(tag.get("tag"), str):
+            return self.parse_tag(tag["tag"])
+        return tag
+
+    def parse_tag(self, text):
+        """Tag from its text form in a mapping (see normalize_tag)"""
+        return {"tag": text}
+
     def get_status(self):
         """Get current connection status"""
         return self.status
 
+    def activity_status(self):
+        """Time of the last successful operation and the operation metrics, for get_status()"""
+        metrics = self.metrics
+        if metrics is None:
+            return {"last_update": None, "metrics": None}
+        return {
+            "last_update": datetime.utcfromtimestamp(metrics.last_activity).isoformat() if metrics.last_activity else None,
+            "metrics": metrics.to_dict()
+        }
+
     def get_config_template(self):
         """Return configuration template for this protocol"""
         return {}
\ No newline at end of file
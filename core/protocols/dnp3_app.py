@@ -0,0 +1,439 @@
+"""
+DNP3 application layer for SCADA Data Gateway
+Request/response headers and the data objects used by our devices
+"""
+
+import struct
+from datetime import datetime, timezone
+
+# Application control field
+APP_FIR = 0x80
+APP_FIN = 0x40
+APP_CON = 0x20
+APP_UNS = 0x10
+APP_SEQ = 0x0F
+
+# Function codes
+FC_CONFIRM = 0x00
+FC_READ = 0x01
+FC_WRITE = 0x02
+FC_SELECT = 0x03
+FC_OPERATE = 0x04
+FC_DIRECT_OPERATE = 0x05
+FC_ENABLE_UNSOLICITED = 0x14
+FC_DISABLE_UNSOLICITED = 0x15
+FC_RESPONSE = 0x81
+FC_UNSOLICITED_RESPONSE = 0x82
+
+# Qualifier codes
+QUAL_START_STOP_8 = 0x00
+QUAL_START_STOP_16 = 0x01
+QUAL_ALL_OBJECTS = 0x06
+QUAL_COUNT_8 = 0x07
+QUAL_COUNT_16 = 0x08
+QUAL_COUNT_8_INDEX_8 = 0x17
+QUAL_COUNT_16_INDEX_16 = 0x28
+
+# Internal indications (IIN1 in the low byte, IIN2 in the high byte)
+IIN_CLASS1_EVENTS = 0x0002
+IIN_CLASS2_EVENTS = 0x0004
+IIN_CLASS3_EVENTS = 0x0008
+IIN_DEVICE_RESTART = 0x0080
+IIN_NO_FUNC_CODE_SUPPORT = 0x0100
+IIN_OBJECT_UNKNOWN = 0x0200
+IIN_PARAMETER_ERROR = 0x0400
+IIN_EVENT_BUFFER_OVERFLOW = 0x0800
+
+# Point flags
+FLAG_ONLINE = 0x01
+FLAG_STATE = 0x80
+
+# CROB control codes
+CONTROL_LATCH_ON = 0x03
+CONTROL_LATCH_OFF = 0x04
+
+CLASS_GROUP = 60
+# Group 60 variation for class 0 (static data) and event classes 1-3
+CLASS_VARIATIONS = {0: 1, 1: 2, 2: 3, 3: 4}
+
+_HEADER = struct.Struct('<BB')
+_RESPONSE_HEADER = struct.Struct('<BBH')
+_OBJECT_HEADER = struct.Struct('<BBB')
+_RANGE_8 = struct.Struct('<BB')
+_RANGE_16 = struct.Struct('<HH')
+_COUNT_8 = struct.Struct('<B')
+_COUNT_16 = struct.Struct('<H')
+
+# (group, variation) -> (point type, event, layout, field order)
+# Field order names the unpacked fields: f=flags, v=value, t=48-bit time (low, high)
+OBJECTS = {
+    (1, 2): ('binary', False, struct.Struct('<B'), 'f'),
+    (2, 1): ('binary', True, struct.Struct('<B'), 'f'),
+    (2, 2): ('binary', True, struct.Struct('<BIH'), 'ftt'),
+    (20, 1): ('counter', False, struct.Struct('<BI'), 'fv'),
+    (20, 5): ('counter', False, struct.Struct('<I'), 'v'),
+    (22, 1): ('counter', True, struct.Struct('<BI'), 'fv'),
+    (30, 1): ('analog', False, struct.Struct('<Bi'), 'fv'),
+    (30, 3): ('analog', False, struct.Struct('<i'), 'v'),
+    (30, 5): ('analog', False, struct.Struct('<Bf'), 'fv'),
+    (30, 6): ('analog', False, struct.Struct('<Bd'), 'fv'),
+    (32, 1): ('analog', True, struct.Struct('<Bi'), 'fv'),
+    (32, 5): ('analog', True, struct.Struct('<Bf'), 'fv'),
+    (32, 7): ('analog', True, struct.Struct('<BfIH'), 'fvtt'),
+    (12, 1): ('crob', False, struct.Struct('<BBIIB'), None),
+    (41, 1): ('analog_output', False, struct.Struct('<iB'), None),
+    (41, 3): ('analog_output', False, struct.Struct('<fB'), None),
+}
+
+# Object variations reported by our outstations, per point type
+STATIC_VARIATIONS = {'binary': (1, 2), 'analog': (30, 5), 'counter': (20, 1)}
+EVENT_VARIATIONS = {'binary': (2, 1), 'analog': (32, 5), 'counter': (22, 1)}
+
+_CROB = OBJECTS[(12, 1)][2]
+
+
+class DNP3ParseError(ValueError):
+    """Raised when an application fragment cannot be decoded"""
+
+
+def iin_classes(iin):
+    """Return the event classes flagged as pending in an IIN field"""
+    return [cls for cls, bit in ((1, IIN_CLASS1_EVENTS), (2, IIN_CLASS2_EVENTS),
+                                 (3, IIN_CLASS3_EVENTS)) if iin & bit]
+
+
+def dnp3_time_to_iso(low, high):
+    """Convert a 48-bit DNP3 timestamp (ms since epoch) to an ISO string"""
+    milliseconds = (high << 32) | low
+    return datetime.fromtimestamp(milliseconds / 1000.0, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def build_request(sequence, function, body=b'', confirm=False, unsolicited=False):
+    """
+    Build a single-fragment application request or confirm
+
+    Args:
+        sequence (int): Application sequence number
+        function (int): Function code
+        body (bytes-like): Encoded object headers and objects
+
+    Returns:
+        bytearray: The application fragment
+    """
+    control = APP_FIR | APP_FIN | (sequence & APP_SEQ)
+    if confirm:
+        control |= APP_CON
+    if unsolicited:
+        control |= APP_UNS
+    fragment = bytearray(_HEADER.pack(control, function))
+    fragment += body
+    return fragment
+
+
+def class_objects(classes):
+    """Encode group 60 'all objects' headers for the given classes (0 = static data)"""
+    body = bytearray()
+    for cls in classes:
+        body += _OBJECT_HEADER.pack(CLASS_GROUP, CLASS_VARIATIONS[cls], QUAL_ALL_OBJECTS)
+    return body
+
+
+def range_objects(group, variation, start, stop):
+    """Encode a ranged object header, as used by range reads"""
+    if stop <= 0xFF:
+        return _OBJECT_HEADER.pack(group, variation, QUAL_START_STOP_8) + _RANGE_8.pack(start, stop)
+    return _OBJECT_HEADER.pack(group, variation, QUAL_START_STOP_16) + _RANGE_16.pack(start, stop)
+
+
+def crob_objects(index, state, on_time=0, off_time=0):
+    """Encode a single CROB (g12v1) latching a binary output on or off"""
+    code = CONTROL_LATCH_ON if state else CONTROL_LATCH_OFF
+    return (_OBJECT_HEADER.pack(12, 1, QUAL_COUNT_16_INDEX_16) + _COUNT_16.pack(1)
+            + _COUNT_16.pack(index) + _CROB.pack(code, 1, on_time, off_time, 0))
+
+
+def analog_output_objects(index, value):
+    """Encode a single analog output block, as a float (g41v3) or 32-bit integer (g41v1)"""
+    variation = 1 if isinstance(value, int) else 3
+    layout = OBJECTS[(41, variation)][2]
+    return (_OBJECT_HEADER.pack(41, variation, QUAL_COUNT_16_INDEX_16) + _COUNT_16.pack(1)
+            + _COUNT_16.pack(index) + layout.pack(value, 0))
+
+
+def parse_header(fragment):
+    """
+    Decode the application header of a fragment
+
+    Returns:
+        tuple: (control, function, iin, offset of the first object header);
+               iin is None for requests
+    """
+    if len(fragment) < 2:
+        raise DNP3ParseError("Fragment too short")
+    control, function = _HEADER.unpack_from(fragment, 0)
+    if function in (FC_RESPONSE, FC_UNSOLICITED_RESPONSE):
+        if len(fragment) < 4:
+            raise DNP3ParseError("Response too short")
+        return control, function, _RESPONSE_HEADER.unpack_from(fragment, 0)[2], 4
+    return control, function, None, 2
+
+
+def iter_object_headers(fragment, offset):
+    """
+    Walk the object headers of a fragment
+
+    Yields:
+        tuple: (group, variation, qualifier, indices, data offset) where indices
+               is None for 'all objects' headers and otherwise a list of point
+               indices; the object data for each index starts at the data offset
+               (index prefixed qualifiers interleave the prefixes with the data)
+    """
+    view = memoryview(fragment)
+    end = len(view)
+    while offset < end:
+        if end - offset < 3:
+            raise DNP3ParseError("Truncated object header")
+        group, variation, qualifier = _OBJECT_HEADER.unpack_from(view, offset)
+        offset += 3
+        layout = OBJECTS.get((group, variation))
+        size = layout[2].size if layout else 0
+
+        if qualifier == QUAL_ALL_OBJECTS:
+            yield group, variation, qualifier, None, offset
+            continue
+        if qualifier in (QUAL_START_STOP_8, QUAL_START_STOP_16):
+            range_layout = _RANGE_8 if qualifier == QUAL_START_STOP_8 else _RANGE_16
+            start, stop = range_layout.unpack_from(view, offset)
+            offset += range_layout.size
+            indices = range(start, stop + 1)
+            prefix = 0
+        elif qualifier in (QUAL_COUNT_8, QUAL_COUNT_16, QUAL_COUNT_8_INDEX_8, QUAL_COUNT_16_INDEX_16):
+            count_layout = _COUNT_8 if qualifier in (QUAL_COUNT_8, QUAL_COUNT_8_INDEX_8) else _COUNT_16
+            count = count_layout.unpack_from(view, offset)[0]
+            offset += count_layout.size
+            prefix = {QUAL_COUNT_8_INDEX_8: 1, QUAL_COUNT_16_INDEX_16: 2}.get(qualifier, 0)
+            indices = range(count) if not prefix else None
+            if prefix:
+                indices = []
+                position = offset
+                for _ in range(count):
+                    if position + prefix > end:
+                        raise DNP3ParseError("Truncated object index")
+                    indices.append(view[position] if prefix == 1 else _COUNT_16.unpack_from(view, position)[0])
+                    position += prefix + size
+        else:
+            raise DNP3ParseError(f"Unsupported qualifier 0x{qualifier:02X}")
+
+        if group == 1 and variation == 1:
+            # Packed binary inputs: one bit per point
+            size_bytes = (len(indices) + 7) // 8
+            yield group, variation, qualifier, indices, offset
+            offset += size_bytes
+            continue
+        if layout is None:
+            raise DNP3ParseError(f"Unsupported object g{group}v{variation}")
+        yield group, variation, qualifier, indices, offset
+        offset += len(indices) * (size + prefix)
+        if offset > end:
+            raise DNP3ParseError(f"Truncated g{group}v{variation} objects")
+
+
+def parse_points(fragment, offset):
+    """
+    Decode the measurement objects of a response
+
+    Args:
+        fragment (bytes-like): Application fragment
+        offset (int): Offset of the first object header
+
+    Returns:
+        list: (point type, index, value, flags, event, timestamp) tuples;
+              timestamp is an ISO string for time-tagged events, else None
+    """
+    points = []
+    append = points.append
+    view = memoryview(fragment)
+    for group, variation, qualifier, indices, data in iter_object_headers(view, offset):
+        if indices is None:
+            continue
+        if group == 1 and variation == 1:
+            for bit, index in enumerate(indices):
+                state = (view[data + (bit >> 3)] >> (bit & 7)) & 1
+                append(('binary', index, state, FLAG_ONLINE, False, None))
+            continue
+        point_type, event, layout, fields = OBJECTS[(group, variation)]
+        if fields is None:
+            continue
+        prefix = {QUAL_COUNT_8_INDEX_8: 1, QUAL_COUNT_16_INDEX_16: 2}.get(qualifier, 0)
+        step = layout.size + prefix
+        unpack_from = layout.unpack_from
+        position = data + prefix
+        for index in indices:
+            unpacked = unpack_from(view, position)
+            position += step
+            if fields == 'f':
+                flags = unpacked[0]
+                append((point_type, index, (flags & FLAG_STATE) >> 7, flags, event, None))
+            elif fields == 'fv':
+                append((point_type, index, unpacked[1], unpacked[0], event, None))
+            elif fields == 'v':
+                append((point_type, index, unpacked[0], FLAG_ONLINE, event, None))
+            elif fields == 'ftt':
+                flags = unpacked[0]
+                append((point_type, index, (flags & FLAG_STATE) >> 7, flags, event,
+                        dnp3_time_to_iso(unpacked[1], unpacked[2])))
+            else:
+                append((point_type, index, unpacked[1], unpacked[0], event,
+                        dnp3_time_to_iso(unpacked[2], unpacked[3])))
+    return points
+
+
+def parse_control_status(fragment, offset):
+    """Return the status byte of every control object (CROB/analog output) echoed in a response"""
+    view = memoryview(fragment)
+    statuses = []
+    for group, variation, qualifier, indices, data in iter_object_headers(view, offset):
+        if indices is None or (group, variation) not in OBJECTS:
+            continue
+        point_type, _, layout, _ = OBJECTS[(group, variation)]
+        if point_type not in ('crob', 'analog_output'):
+            continue
+        prefix = {QUAL_COUNT_8_INDEX_8: 1, QUAL_COUNT_16_INDEX_16: 2}.get(qualifier, 0)
+        position = data + prefix
+        for _ in indices:
+            statuses.append(layout.unpack_from(view, position)[-1])
+            position += layout.size + prefix
+    return statuses
+
+
+def parse_control_values(fragment, group, variation, indices, data, prefix=2):
+    """Decode (index, value) pairs from index prefixed control objects (g12v1, g41)"""
+    layout = OBJECTS[(group, variation)][2]
+    view = memoryview(fragment)
+    position = data + prefix
+    values = []
+    for index in indices:
+        unpacked = layout.unpack_from(view, position)
+        position += layout.size + prefix
+        if group == 12:
+            values.append((index, (unpacked[0] & 0x0F) == CONTROL_LATCH_ON))
+        else:
+            values.append((index, unpacked[0]))
+    return values
+
+
+class ResponseWriter:
+    """
+    Encodes outstation responses into application fragments
+
+    Objects are appended to one reusable buffer; a new fragment is started
+    whenever the next object header would exceed the fragment size.
+    """
+
+    def __init__(self, max_fragment_size=2048):
+        self.max_fragment_size = max_fragment_size
+        self.fragments = []
+        self.buffer = bytearray()
+
+    def begin(self):
+        """Start a new response"""
+        self.fragments = []
+        self.buffer.clear()
+        self.buffer += b'\x00\x00\x00\x00'
+
+    def _flush(self):
+        self.fragments.append(bytes(self.buffer))
+        self.buffer.clear()
+        self.buffer += b'\x00\x00\x00\x00'
+
+    def add_static(self, point_type, points):
+        """
+        Encode static values as ranged headers over contiguous indices
+
+        Args:
+            point_type (str): 'binary', 'analog' or 'counter'
+            points (list): (index, value, flags) tuples sorted by index
+        """
+        group, variation = STATIC_VARIATIONS[point_type]
+        layout = OBJECTS[(group, variation)][2]
+        run = []
+        for point in points:
+            if run and point[0] != run[-1][0] + 1:
+                self._add_range(group, variation, layout, run)
+                run = []
+            run.append(point)
+        if run:
+            self._add_range(group, variation, layout, run)
+
+    def _add_range(self, group, variation, layout, run):
+        room = (self.max_fragment_size - 3 - 4 - 4) // layout.size
+        for offset in range(0, len(run), room):
+            chunk = run[offset:offset + room]
+            needed = 3 + 4 + len(chunk) * layout.size
+            if len(self.buffer) + needed > self.max_fragment_size:
+                self._flush()
+            self.buffer += range_objects(group, variation, chunk[0][0], chunk[-1][0])
+            if variation == 2 and group == 1:
+                for index, value, flags in chunk:
+                    self.buffer += layout.pack((flags & ~FLAG_STATE) | (FLAG_STATE if value else 0))
+            else:
+                for index, value, flags in chunk:
+                    self.buffer += layout.pack(flags, value)
+
+    def add_events(self, point_type, events):
+        """
+        Encode events with 16-bit index prefixes
+
+        Args:
+            point_type (str): 'binary', 'analog' or 'counter'
+            events (list): (index, value, flags) tuples in reporting order
+        """
+        group, variation = EVENT_VARIATIONS[point_type]
+        layout = OBJECTS[(group, variation)][2]
+        room = (self.max_fragment_size - 3 - 2 - 4) // (layout.size + 2)
+        for offset in range(0, len(events), room):
+            chunk = events[offset:offset + room]
+            needed = 3 + 2 + len(chunk) * (layout.size + 2)
+            if len(self.buffer) + needed > self.max_fragment_size:
+                self._flush()
+            self.buffer += _OBJECT_HEADER.pack(group, variation, QUAL_COUNT_16_INDEX_16)
+            self.buffer += _COUNT_16.pack(len(chunk))
+            for index, value, flags in chunk:
+                self.buffer += _COUNT_16.pack(index)
+                if group == 2:
+                    self.buffer += layout.pack((flags & ~FLAG_STATE) | (FLAG_STATE if value else 0))
+                else:
+                    self.buffer += layout.pack(flags, value)
+
+    def add_raw(self, body):
+        """Append already encoded object headers and objects"""
+        if len(self.buffer) + len(body) > self.max_fragment_size:
+            self._flush()
+        self.buffer += body
+
+    def finish(self, sequence, iin, function=FC_RESPONSE, confirm=False):
+        """
+        Complete the response and fill in the application headers
+
+        Returns:
+            list: Application fragments in transmission order
+        """
+        self.fragments.append(bytes(self.buffer))
+        self.buffer.clear()
+        fragments = []
+        last = len(self.fragments) - 1
+        for number, body in enumerate(self.fragments):
+            control = (sequence + number) & APP_SEQ
+            if number == 0:
+                control |= APP_FIR
+            if number == last:
+                control |= APP_FIN
+            if confirm or number != last:
+                control |= APP_CON
+            if function == FC_UNSOLICITED_RESPONSE:
+                control |= APP_UNS
+            fragment = bytearray(body)
+            _RESPONSE_HEADER.pack_into(fragment, 0, control, function, iin)
+            fragments.append(fragment)
+        self.fragments = []
+        return fragments
@@ -0,0 +1,146 @@
+"""
+DNP3 event buffering for SCADA Data Gateway
+Per-point change detection feeding Class 1/2/3 event buffers
+"""
+
+from collections import deque
+from datetime import datetime
+
+# Default event class per point type, as assigned by most outstation profiles
+DEFAULT_EVENT_CLASS = {
+    'binary': 1,
+    'analog': 2,
+    'counter': 3
+}
+
+EVENT_CLASSES = (1, 2, 3)
+
+
+class DNP3EventBuffers:
+    """
+    Change detection and Class 1/2/3 event buffers
+
+    Every value update goes through `update()`, which compares it against the
+    last reported value of the point and only queues an event when the point
+    changed (beyond its deadband for analogs). Polls drain the buffers, so
+    their cost depends on the number of changes, not the number of points.
+    """
+
+    def __init__(self, buffer_size=1000):
+        self.buffer_size = buffer_size
+        self.buffers = {cls: deque(maxlen=buffer_size) for cls in EVENT_CLASSES}
+        self.overflow = {cls: False for cls in EVENT_CLASSES}
+        self.points = {}
+        self.values = {}
+        self.qualities = {}
+        self.reported = {}
+
+    def configure_point(self, point_id, point_type='analog', event_class=None, deadband=0.0):
+        """
+        Register a point for change detection
+
+        Args:
+            point_id (int): Point index
+            point_type (str): 'binary', 'analog' or 'counter'
+            event_class (int): 0 (static only), 1, 2 or 3; defaults by type
+            deadband (float): Minimum analog change that produces an event
+        """
+        if event_class is None:
+            event_class = DEFAULT_EVENT_CLASS.get(point_type, 2)
+        if event_class not in (0,) + EVENT_CLASSES:
+            raise ValueError(f"Invalid DNP3 event class: {event_class}")
+        self.points[point_id] = (point_type, event_class, deadband)
+
+    def update(self, point_id, value, quality='ONLINE', timestamp=None):
+        """
+        Apply a new value to the static table and queue an event if it changed
+
+        Returns:
+            bool: True if an event was queued
+        """
+        point = self.points.get(point_id)
+        if point is None:
+            self.configure_point(point_id)
+            point = self.points[point_id]
+        point_type, event_class, deadband = point
+
+        previous = self.reported.get(point_id)
+        previous_quality = self.qualities.get(point_id)
+        self.values[point_id] = value
+        self.qualities[point_id] = quality
+
+        if previous is None:
+            # First value is part of the static image, not an event
+            self.reported[point_id] = value
+            return False
+        if quality == previous_quality:
+            # Analogs compare against the last reported value so slow drifts
+            # still cross the deadband eventually
+            if point_type == 'analog':
+                if abs(value - previous) <= deadband:
+                    return False
+            elif value == previous:
+                return False
+        self.reported[point_id] = value
+        if event_class == 0:
+            return False
+
+        buffer = self.buffers[event_class]
+        if len(buffer) == self.buffer_size:
+            self.overflow[event_class] = True
+        buffer.append((point_id, value, quality, timestamp or datetime.utcnow().isoformat()))
+        return True
+
+    def drain(self, classes=EVENT_CLASSES, point_ids=None):
+        """
+        Remove and return queued events, oldest first per class
+
+        Args:
+            classes (iterable): Event classes to read
+            point_ids (set): Only return events for these points; events of
+                             other points stay queued
+
+        Returns:
+            list: Event dictionaries with id, value, quality, timestamp and class
+        """
+        events = []
+        for cls in classes:
+            buffer = self.buffers[cls]
+            if not buffer:
+                continue
+            kept = []
+            while buffer:
+                event = buffer.popleft()
+                if point_ids is not None and event[0] not in point_ids:
+                    kept.append(event)
+                    continue
+                events.append({
+                    'id': event[0],
+                    'value': event[1],
+                    'quality': event[2],
+                    'timestamp': event[3],
+                    'class': cls
+                })
+            buffer.extend(kept)
+            if not kept:
+                # Events were lost while the buffer was full; that stays reported until all is read
+                self.overflow[cls] = False
+        return events
+
+    def clear(self, classes=EVENT_CLASSES):
+        """Discard queued events, as done after an integrity poll"""
+        for cls in classes:
+            self.buffers[cls].clear()
+            self.overflow[cls] = False
+
+    def reset(self):
+        """Forget all points, values and events"""
+        self.clear()
+        self.points.clear()
+        self.values.clear()
+        self.qualities.clear()
+        self.reported.clear()
+
+    def pending(self):
+        """Return the number of queued events per class"""
+        return {cls: len(self.buffers[cls]) for cls in EVENT_CLASSES}
@@ -1,12 +1,29 @@
 """
-DNP3 Protocol Handler for SCADA Data Gateway (Simulation Mode)
-This is a simulated version since pydnp3 is not supported on Windows
+DNP3 Protocol Handler for SCADA Data Gateway
+Talks DNP3 over TCP with the pure-Python stack in dnp3_tcp (pydnp3 is not
+supported on Windows); the 'simulation' transport keeps the simulated device
 """
 
+import asyncio
 import logging
+import time
 from datetime import datetime
 import random
-from .base_handler import BaseProtocolHandler, ConnectionStatus
+from collections import deque
+from .base_handler import BaseProtocolHandler, ConnectionStatus, typed_address
+from .dnp3_events import DNP3EventBuffers, EVENT_CLASSES
+from .dnp3_tcp import DNP3Master
+
+# Read modes accepted by DNP3Handler.read_data
+READ_STATIC = 'static'
+READ_EVENTS = 'events'
+READ_INTEGRITY = 'integrity'
+READ_MODES = (READ_STATIC, READ_EVENTS, READ_INTEGRITY)
+
+TRANSPORT_TCP = 'tcp'
+TRANSPORT_SIMULATION = 'simulation'
+# Transport of configs without a "transport" key, written when the handler only simulated
+DEFAULT_TRANSPORT = TRANSPORT_SIMULATION
 
 class DNP3Handler(BaseProtocolHandler):
     def __init__(self):
@@ -15,17 +32,40 @@ class DNP3Handler(BaseProtocolHandler):
         self.client = None
         self.connected = False
         self.points = {}
+        self.point_ids = []
         self.sim_data = {}
+        self.events = DNP3EventBuffers()
+        self.last_integrity = 0.0
+        self.unsolicited_task = None
+        self.transport = DEFAULT_TRANSPORT
+        self.values = {}
+        self.held_events = deque(maxlen=1000)  # TCP events polled but not read yet
+
+    def parse_tag(self, text):
+        """"counter:3" or "3" (an analog point)"""
+        point_type, point_id = typed_address(text, 'analog')
+        return {"type": point_type, "id": point_id}
 
     def get_config_template(self):
         """Return configuration template for DNP3 connection"""
         return {
+            "transport": TRANSPORT_TCP,  # or "simulation"
             "master": {
                 "local_address": 1,
                 "remote_address": 1024,
                 "host": "localhost",
                 "port": 20000,
-                "timeout_ms": 5000
+                "timeout_ms": 5000,
+                "integrity_interval_s": 3600,
+                "event_classes": [1, 2, 3],
+                "event_buffer_size": 1000,
+                "analog_deadband": 0.0,
+                "unsolicited": {
+                    "enabled": False,
+                    "classes": [1, 2, 3],
+                    "interval_ms": 1000
+                },
+                "simulation_change_ratio": 0.05
             },
             "outstation": {
                 "local_address": 1024,
@@ -37,18 +77,20 @@ class DNP3Handler(BaseProtocolHandler):
 
     async def connect(self, config):
         """
-        Simulate connection to DNP3 device
+        Connect to DNP3 outstation, or simulate the connection
         
         Args:
             config (dict): Connection configuration
         """
+        self.transport = config.get('transport', DEFAULT_TRANSPORT)
+        if self.transport == TRANSPORT_TCP:
+            return await self._connect_tcp(config)
         try:
             self.logger.info(f"[SIMULATION] Connecting to DNP3 device at {config['master']['host']}:{config['master']['port']}")
             self.status = ConnectionStatus.CONNECTING
             self.config = config
             
             # Simulate connection delay
-            import asyncio
             await asyncio.sleep(0.5)
             
             self.connected = True
@@ -56,55 +98,323 @@ class DNP3Handler(BaseProtocolHandler):
             self.logger.info("[SIMULATION] Successfully connected to DNP3 device")
             
             # Initialize simulation data
+            master = config['master']
+            self.events = DNP3EventBuffers(master.get('event_buffer_size', 1000))
             self._init_sim_data()
+            self.last_integrity = time.monotonic()
+
+            if master.get('unsolicited', {}).get('enabled'):
+                self.start_unsolicited()
             
         except Exception as e:
             self.status = ConnectionStatus.ERROR
             self.logger.error(f"[SIMULATION] Connection error: {str(e)}")
             raise ConnectionError(f"Failed to connect: {str(e)}")
 
+    async def _connect_tcp(self, config):
+        """Open a DNP3 master session to the configured outstation"""
+        master = config['master']
+        try:
+            self.logger.info(f"Connecting to DNP3 outstation at {master['host']}:{master['port']}")
+            self.status = ConnectionStatus.CONNECTING
+            self.config = config
+            self.held_events = deque(maxlen=master.get('event_buffer_size', 1000))
+            self.client = await DNP3Master.open(
+                master['host'],
+                master['port'],
+                local_address=master.get('local_address', 1),
+                remote_address=master.get('remote_address', 1024),
+                timeout=master.get('timeout_ms', 5000) / 1000.0,
+                on_unsolicited=self._on_unsolicited
+            )
+            self.client.closed.add_done_callback(self._client_closed)
+            self.connected = True
+            self.status = ConnectionStatus.CONNECTED
+            self.logger.info("Successfully connected to DNP3 outstation")
+
+            # Startup integrity poll builds the local value table
+            await self._read_tcp([], READ_INTEGRITY)
+
+            if master.get('unsolicited', {}).get('enabled'):
+                self.start_unsolicited()
+                await self.unsolicited_task
+
+        except Exception as e:
+            if self.client:
+                self.client.close()
+                self.client = None
+            self.connected = False
+            self.status = ConnectionStatus.ERROR
+            self.logger.error(f"Connection error: {str(e)}")
+            raise ConnectionError(f"Failed to connect: {str(e)}")
+
     async def disconnect(self):
-        """Simulate disconnection from DNP3 device"""
+        """Disconnect from DNP3 device"""
+        if self.transport == TRANSPORT_TCP:
+            if self.client:
+                self.logger.info("Disconnecting from DNP3 outstation")
+                try:
+                    await self.stop_unsolicited()
+                except (ConnectionError, asyncio.TimeoutError) as e:
+                    self.logger.warning(f"Could not disable unsolicited responses: {str(e)}")
+                self.client.close()
+                self.client = None
+            self.connected = False
+            self.status = ConnectionStatus.DISCONNECTED
+            self.values.clear()
+            self.held_events.clear()
+            return
         try:
             if self.connected:
                 self.logger.info("[SIMULATION] Disconnecting from DNP3 device")
+                await self.stop_unsolicited()
                 self.connected = False
                 self.status = ConnectionStatus.DISCONNECTED
                 self.sim_data.clear()
+                self.points.clear()
+                self.point_ids.clear()
+                self.events.reset()
         except Exception as e:
             self.logger.error(f"[SIMULATION] Disconnect error: {str(e)}")
             raise
 
-    async def read_data(self, points):
+    async def read_data(self, points, mode=READ_STATIC, classes=None):
         """
         Simulate reading data from DNP3 device
         
         Args:
             points (list): List of point definitions to read
+            mode (str): 'static' reads the current value of every point,
+                        'events' returns only points that changed since the
+                        last poll, 'integrity' returns a full static image and
+                        clears the event buffers
+            classes (list): Event classes to poll in 'events' mode
+                            (defaults to the configured event_classes)
             
         Returns:
             list: List of simulated values
         """
         if not self.connected:
             raise ConnectionError("Not connected to DNP3 device")
+        if mode not in READ_MODES:
+            raise ValueError(f"Invalid DNP3 read mode: {mode}")
+
+        if self.transport == TRANSPORT_TCP:
+            return await self._read_tcp(points, mode, classes)
+        if mode == READ_EVENTS:
+            return self._read_events(points, classes)
+        if mode == READ_INTEGRITY:
+            return self._read_integrity(points)
 
         results = []
+        debug = self.logger.isEnabledFor(logging.DEBUG)
         try:
             for point in points:
                 point_id = point.get('id', 0)
                 value = self._get_simulated_value(point)
                 results.append({
+                    'id': point_id,
                     'value': value,
                     'quality': 'ONLINE',
                     'timestamp': datetime.utcnow().isoformat()
                 })
-                self.logger.debug(f"[SIMULATION] Read point {point_id}: {value}")
+                if debug:
+                    self.logger.debug("[SIMULATION] Read point %s: %s", point_id, value)
         except Exception as e:
             self.logger.error(f"[SIMULATION] Read error: {str(e)}")
             raise
 
         return results
 
+    async def poll(self, points=None):
+        """
+        Run the master's scheduled poll: an integrity poll when the integrity
+        interval has elapsed, otherwise an event poll
+
+        Args:
+            points (list): Point definitions of interest, None for all points
+
+        Returns:
+            list: Changed points, or the full static image after an integrity poll
+        """
+        interval = self.config.get('master', {}).get('integrity_interval_s', 3600)
+        if time.monotonic() - self.last_integrity >= interval:
+            return await self.read_data(points or [], mode=READ_INTEGRITY)
+        return await self.read_data(points or [], mode=READ_EVENTS)
+
+    async def _read_tcp(self, points, mode, classes=None):
+        """
+        Poll the outstation and return results in the same shape as the simulation
+
+        Static reads use a class 0 poll, event reads a class 1/2/3 poll and
+        integrity polls both; points are keyed by (type, index) since every
+        DNP3 point type has its own index space.
+        """
+        if classes is None:
+            classes = self.config.get('master', {}).get('event_classes', EVENT_CLASSES)
+        if mode == READ_EVENTS:
+            request = list(classes)
+        elif mode == READ_INTEGRITY:
+            request = list(EVENT_CLASSES) + [0]
+        else:
+            request = [0]
+        try:
+            _, decoded, _ = await self.client.read_classes(request)
+        except ConnectionError:
+            self.connected = False
+            self.status = ConnectionStatus.ERROR
+            raise
+        except asyncio.TimeoutError:
+            self.logger.error("DNP3 read timed out")
+            raise
+
+        timestamp = datetime.utcnow().isoformat()
+        for point_type, index, value, flags, event, event_time in decoded:
+            self.values[(point_type, index)] = (value, flags)
+            if event:
+                self.held_events.append(self._point_result(point_type, index, value, flags, event_time or timestamp))
+        if mode == READ_EVENTS:
+            return self._take_events(points)
+        if mode == READ_INTEGRITY:
+            # The static image supersedes the events polled so far
+            self.held_events.clear()
+            self.last_integrity = time.monotonic()
+
+        if points:
+            keys = [(point.get('type', 'analog'), point.get('id', 0)) for point in points]
+        else:
+            keys = list(self.values)
+        missing = (None, 0)
+        return [
+            self._point_result(key[0], key[1], *self.values.get(key, missing), timestamp)
+            for key in keys
+        ]
+
+    def _take_events(self, points):
+        """
+        Remove and return the held events of the requested points (all if none)
+
+        The outstation forgets events once they are polled, so events of
+        other points stay held for the reads that ask for them.
+        """
+        if not points:
+            events = list(self.held_events)
+            self.held_events.clear()
+            return events
+        wanted = {(point.get('type', 'analog'), point.get('id', 0)) for point in points}
+        events, held = [], []
+        for event in self.held_events:
+            (events if (event['type'], event['id']) in wanted else held).append(event)
+        self.held_events.clear()
+        self.held_events.extend(held)
+        return events
+
+    @staticmethod
+    def _point_result(point_type, index, value, flags, timestamp):
+        return {
+            'id': index,
+            'type': point_type,
+            'value': value,
+            'quality': 'ONLINE' if flags & 0x01 else 'OFFLINE',
+            'timestamp': timestamp
+        }
+
+    def _on_unsolicited(self, decoded):
+        """Forward unsolicited events from the outstation to the data callbacks"""
+        timestamp = datetime.utcnow().isoformat()
+        updates = []
+        for point_type, index, value, flags, event, event_time in decoded:
+            self.values[(point_type, index)] = (value, flags)
+            updates.append(self._point_result(point_type, index, value, flags, event_time or timestamp))
+        self._publish_data(updates)
+
+    def _read_events(self, points, classes=None):
+        """Return queued events of the requested classes since the last poll"""
+        if classes is None:
+            classes = self.config.get('master', {}).get('event_classes', EVENT_CLASSES)
+        try:
+            self._simulate_changes()
+            point_ids = {point.get('id', 0) for point in points} if points else None
+            results = self.events.drain(classes, point_ids)
+            self.logger.debug("[SIMULATION] Event poll returned %d events", len(results))
+        except Exception as e:
+            self.logger.error(f"[SIMULATION] Read error: {str(e)}")
+            raise
+        return results
+
+    def _read_integrity(self, points):
+        """Return the static image of the requested points and clear pending events"""
+        try:
+            self._simulate_changes()
+            self.events.clear()
+            self.last_integrity = time.monotonic()
+            timestamp = datetime.utcnow().isoformat()
+            if points:
+                point_ids = [point.get('id', 0) for point in points]
+                for point in points:
+                    if point.get('id', 0) not in self.sim_data:
+                        self._get_simulated_value(point)
+            else:
+                point_ids = list(self.sim_data)
+            results = [
+                {
+                    'id': point_id,
+                    'value': self.sim_data[point_id],
+                    'quality': self.events.qualities.get(point_id, 'ONLINE'),
+                    'timestamp': timestamp
+                }
+                for point_id in point_ids
+            ]
+            self.logger.debug("[SIMULATION] Integrity poll returned %d points", len(results))
+        except Exception as e:
+            self.logger.error(f"[SIMULATION] Read error: {str(e)}")
+            raise
+        return results
+
+    def start_unsolicited(self, classes=None):
+        """
+        Start pushing changed points to the data callbacks as unsolicited responses
+
+        Args:
+            classes (list): Event classes to report (defaults to the unsolicited config)
+        """
+        if not self.connected:
+            raise ConnectionError("Not connected to DNP3 device")
+        if self.unsolicited_task and not self.unsolicited_task.done():
+            return
+        settings = self.config.get('master', {}).get('unsolicited', {})
+        classes = classes or settings.get('classes', EVENT_CLASSES)
+        if self.transport == TRANSPORT_TCP:
+            self.unsolicited_task = asyncio.ensure_future(self.client.enable_unsolicited(classes))
+            return
+        interval = settings.get('interval_ms', 1000) / 1000.0
+        self.unsolicited_task = asyncio.ensure_future(self._unsolicited_loop(classes, interval))
+        self.logger.info(f"[SIMULATION] Unsolicited responses enabled for classes {list(classes)}")
+
+    async def stop_unsolicited(self):
+        """Stop unsolicited responses (disabling them in the outstation while the link is up)"""
+        task, self.unsolicited_task = self.unsolicited_task, None
+        try:
+            if task and self.transport == TRANSPORT_TCP and self.client and self.client.connected:
+                await self.client.disable_unsolicited()
+        finally:
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    async def _unsolicited_loop(self, classes, interval):
+        """Emit only changed points, one batch per unsolicited response"""
+        while self.connected:
+            await asyncio.sleep(interval)
+            self._simulate_changes()
+            events = self.events.drain(classes)
+            if events:
+                self.logger.debug("[SIMULATION] Unsolicited response with %d events", len(events))
+                self._publish_data(events)
+
     async def write_data(self, points, values):
         """
         Simulate writing data to DNP3 device
@@ -118,30 +428,95 @@ class DNP3Handler(BaseProtocolHandler):
         """
         if not self.connected:
             raise ConnectionError("Not connected to DNP3 device")
+        if self.transport == TRANSPORT_TCP:
+            return await self._write_tcp(points, values)
 
         results = []
+        debug = self.logger.isEnabledFor(logging.DEBUG)
         try:
             for point, value in zip(points, values):
                 point_id = point.get('id', 0)
-                self.sim_data[point_id] = value
+                self._configure_point(point)
+                self._set_value(point_id, value)
                 results.append(True)
-                self.logger.debug(f"[SIMULATION] Write point {point_id}: {value}")
+                if debug:
+                    self.logger.debug("[SIMULATION] Write point %s: %s", point_id, value)
         except Exception as e:
             self.logger.error(f"[SIMULATION] Write error: {str(e)}")
             raise
 
         return results
 
+    async def _write_tcp(self, points, values):
+        """Write binary points with a latching CROB and analog points with an analog output block"""
+        results = []
+        try:
+            for point, value in zip(points, values):
+                point_id = point.get('id', 0)
+                if point.get('type', 'analog') == 'binary':
+                    success = await self.client.operate_binary(point_id, bool(value))
+                else:
+                    success = await self.client.operate_analog(point_id, value)
+                results.append(success)
+                self.logger.debug("Write point %s: %s (%s)", point_id, value, 'ok' if success else 'failed')
+        except Exception as e:
+            self.logger.error(f"Write error: {str(e)}")
+            raise
+
+        return results
+
     def _init_sim_data(self):
         """Initialize simulation data with random values"""
-        self.sim_data = {
-            # Binary Input points (1-100)
-            **{i: random.choice([0, 1]) for i in range(1, 101)},
-            # Analog Input points (101-200)
-            **{i: random.uniform(0, 100) for i in range(101, 201)},
-            # Counter points (201-300)
-            **{i: random.randint(0, 1000) for i in range(201, 301)}
-        }
+        self.sim_data = {}
+        # Binary Input points (1-100)
+        for i in range(1, 101):
+            self._configure_point({'id': i, 'type': 'binary'})
+            self._set_value(i, random.choice([0, 1]))
+        # Analog Input points (101-200)
+        for i in range(101, 201):
+            self._configure_point({'id': i, 'type': 'analog'})
+            self._set_value(i, random.uniform(0, 100))
+        # Counter points (201-300)
+        for i in range(201, 301):
+            self._configure_point({'id': i, 'type': 'counter'})
+            self._set_value(i, random.randint(0, 1000))
+
+    def _configure_point(self, point):
+        """Register a point definition for change detection"""
+        point_id = point.get('id', 0)
+        if point_id in self.points and 'type' not in point:
+            return
+        point_type = point.get('type', 'analog')
+        deadband = point.get(
+            'deadband',
+            self.config.get('master', {}).get('analog_deadband', 0.0)
+        )
+        if point_id not in self.points:
+            self.point_ids.append(point_id)
+        self.points[point_id] = point_type
+        self.events.configure_point(point_id, point_type, point.get('event_class'), deadband)
+
+    def _set_value(self, point_id, value, quality='ONLINE'):
+        """Update the outstation value table, queueing an event on change"""
+        self.sim_data[point_id] = value
+        self.events.update(point_id, value, quality)
+
+    def _simulate_changes(self):
+        """Change a random subset of points, as a field device would between polls"""
+        if not self.sim_data:
+            return
+        ratio = self.config.get('master', {}).get('simulation_change_ratio', 0.05)
+        count = min(len(self.point_ids), int(len(self.point_ids) * ratio))
+        for point_id in random.sample(self.point_ids, count):
+            point_type = self.points[point_id]
+            value = self.sim_data[point_id]
+            if point_type == 'binary':
+                value = 1 - value
+            elif point_type == 'counter':
+                value += random.randint(1, 10)
+            else:
+                value += random.uniform(-0.5, 0.5)
+            self._set_value(point_id, value)
 
     def _get_simulated_value(self, point):
         """
@@ -157,16 +532,17 @@ class DNP3Handler(BaseProtocolHandler):
         point_type = point.get('type', 'analog')
 
         if point_id not in self.sim_data:
+            self._configure_point(point)
             if point_type == 'binary':
-                self.sim_data[point_id] = random.choice([0, 1])
+                self._set_value(point_id, random.choice([0, 1]))
             elif point_type == 'counter':
-                self.sim_data[point_id] = random.randint(0, 1000)
+                self._set_value(point_id, random.randint(0, 1000))
             else:  # analog
-                self.sim_data[point_id] = random.uniform(0, 100)
+                self._set_value(point_id, random.uniform(0, 100))
 
         # Add some random variation to analog values
         if point_type == 'analog':
-            self.sim_data[point_id] += random.uniform(-0.5, 0.5)
+            self._set_value(point_id, self.sim_data[point_id] + random.uniform(-0.5, 0.5))
 
         return self.sim_data[point_id]
 
@@ -175,16 +551,16 @@ class DNP3Handler(BaseProtocolHandler):
         return {
             "connected": self.connected,
             "status": self.status.value,
-            "mode": "SIMULATION",
-            "points_count": len(self.sim_data),
-            "last_update": datetime.utcnow().isoformat()
+            "mode": "SIMULATION" if self.transport == TRANSPORT_SIMULATION else "TCP",
+            "points_count": len(self.sim_data) if self.transport == TRANSPORT_SIMULATION else len(self.values),
+            "pending_events": self.events.pending(),
+            "unsolicited": self.unsolicited_task is not None,
+            **self.activity_status()
         }
 
-    def __del__(self):
-        """Cleanup when object is destroyed"""
-        try:
-            if self.connected:
-                import asyncio
-                asyncio.run(self.disconnect())
-        except:
-            pass
+    def _client_closed(self, closed):
+        """Mark the connection failed when the outstation drops the TCP connection"""
+        if self.client is not None and self.client.closed is closed:
+            self.logger.error("DNP3 connection lost")
+            self.connected = False
+            self.status = ConnectionStatus.ERROR
@@ -0,0 +1,246 @@
+"""
+DNP3 data link and transport layers for SCADA Data Gateway
+Link-layer framing with table-driven CRC-16/DNP and transport segmentation
+"""
+
+import struct
+
+START_BYTES = b'\x05\x64'
+HEADER_SIZE = 10
+BLOCK_SIZE = 16
+MAX_LINK_DATA = 250
+MAX_SEGMENT_DATA = MAX_LINK_DATA - 1
+# Largest possible frame: header plus 250 user bytes in 16 byte blocks, each with a CRC
+MAX_FRAME_SIZE = HEADER_SIZE + MAX_LINK_DATA + 2 * ((MAX_LINK_DATA + BLOCK_SIZE - 1) // BLOCK_SIZE)
+
+# Link control field
+CTRL_DIR = 0x80
+CTRL_PRM = 0x40
+CTRL_FCB = 0x20
+CTRL_FCV = 0x10
+CTRL_FUNC = 0x0F
+
+# Primary (PRM=1) link function codes
+LINK_RESET_LINK_STATES = 0
+LINK_TEST_LINK_STATES = 2
+LINK_CONFIRMED_USER_DATA = 3
+LINK_UNCONFIRMED_USER_DATA = 4
+LINK_REQUEST_LINK_STATUS = 9
+
+# Secondary (PRM=0) link function codes
+LINK_ACK = 0
+LINK_NACK = 1
+LINK_STATUS = 11
+
+# Transport header
+TRANSPORT_FIN = 0x80
+TRANSPORT_FIR = 0x40
+TRANSPORT_SEQ = 0x3F
+
+_HEADER = struct.Struct('<2sBBHH')
+_CRC = struct.Struct('<H')
+
+
+def _make_crc_table():
+    """Build the 256 entry lookup table for the reflected DNP polynomial 0x3D65"""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA6BC if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _make_crc_table()
+
+
+def crc16_dnp(data, start=0, end=None):
+    """
+    Compute the CRC-16/DNP of data[start:end]
+
+    Args:
+        data (bytes-like): Buffer holding the block
+        start (int): First byte of the block
+        end (int): End of the block, defaults to the end of the buffer
+
+    Returns:
+        int: CRC value, transmitted little-endian after the block
+    """
+    table = CRC_TABLE
+    crc = 0
+    if end is None:
+        end = len(data)
+    for i in range(start, end):
+        crc = (crc >> 8) ^ table[(crc ^ data[i]) & 0xFF]
+    return ~crc & 0xFFFF
+
+
+def encode_frame(out, control, destination, source, data=b''):
+    """
+    Append one link frame to a buffer
+
+    Args:
+        out (bytearray): Output buffer, typically reused by the channel
+        control (int): Link control byte
+        destination (int): Destination link address
+        source (int): Source link address
+        data (bytes-like): Up to 250 bytes of user data
+    """
+    length = len(data)
+    if length > MAX_LINK_DATA:
+        raise ValueError(f"Link frame user data too long: {length} bytes")
+    start = len(out)
+    out += _HEADER.pack(START_BYTES, length + 5, control, destination, source)
+    out += _CRC.pack(crc16_dnp(out, start, start + 8))
+    for offset in range(0, length, BLOCK_SIZE):
+        block_start = len(out)
+        out += data[offset:offset + BLOCK_SIZE]
+        out += _CRC.pack(crc16_dnp(out, block_start, len(out)))
+
+
+def encode_user_data(out, apdu, destination, source, master, sequence=0):
+    """
+    Segment an application fragment and append the resulting link frames
+
+    Args:
+        out (bytearray): Output buffer
+        apdu (bytes-like): Application layer fragment
+        destination (int): Destination link address
+        source (int): Source link address
+        master (bool): True when sent by the master (sets the DIR bit)
+        sequence (int): Transport sequence number of the first segment
+
+    Returns:
+        int: Transport sequence number for the next fragment
+    """
+    control = (CTRL_DIR if master else 0) | CTRL_PRM | LINK_UNCONFIRMED_USER_DATA
+    view = memoryview(apdu)
+    total = len(view)
+    offset = 0
+    segment = bytearray(MAX_LINK_DATA)
+    while True:
+        chunk = view[offset:offset + MAX_SEGMENT_DATA]
+        header = sequence & TRANSPORT_SEQ
+        if offset == 0:
+            header |= TRANSPORT_FIR
+        offset += len(chunk)
+        if offset >= total:
+            header |= TRANSPORT_FIN
+        segment[0] = header
+        segment[1:] = chunk
+        encode_frame(out, control, destination, source, segment)
+        sequence = (sequence + 1) & TRANSPORT_SEQ
+        if offset >= total:
+            return sequence
+
+
+class LinkParser:
+    """
+    Incremental link frame decoder
+
+    Received bytes accumulate in one buffer that is compacted once per
+    `feed()` call. User data is stripped of its block CRCs into a scratch
+    buffer reused for every frame, so the payload handed to the callback is
+    only valid for the duration of the call.
+    """
+
+    def __init__(self, on_frame):
+        """
+        Args:
+            on_frame (callable): Called as on_frame(control, destination, source, payload)
+        """
+        self.on_frame = on_frame
+        self.buffer = bytearray()
+        self.scratch = bytearray(MAX_LINK_DATA)
+        self.crc_errors = 0
+
+    def feed(self, data):
+        """Consume received bytes and dispatch every complete frame"""
+        buffer = self.buffer
+        buffer += data
+        offset = 0
+        size = len(buffer)
+        while size - offset >= HEADER_SIZE:
+            if buffer[offset] != 0x05 or buffer[offset + 1] != 0x64:
+                sync = buffer.find(START_BYTES, offset + 1)
+                offset = sync if sync >= 0 else size - 1
+                continue
+            _, length, control, destination, source = _HEADER.unpack_from(buffer, offset)
+            if length < 5 or _CRC.unpack_from(buffer, offset + 8)[0] != crc16_dnp(buffer, offset, offset + 8):
+                self.crc_errors += 1
+                offset += 2
+                continue
+            data_length = length - 5
+            frame_size = HEADER_SIZE + data_length + 2 * ((data_length + BLOCK_SIZE - 1) // BLOCK_SIZE)
+            if size - offset < frame_size:
+                break
+            if self._strip_blocks(offset + HEADER_SIZE, data_length):
+                self.on_frame(control, destination, source, memoryview(self.scratch)[:data_length])
+            else:
+                self.crc_errors += 1
+            offset += frame_size
+        if offset:
+            del buffer[:offset]
+
+    def _strip_blocks(self, position, data_length):
+        """Copy user data blocks into the scratch buffer, checking each block CRC"""
+        buffer = self.buffer
+        scratch = self.scratch
+        written = 0
+        while written < data_length:
+            block = min(BLOCK_SIZE, data_length - written)
+            end = position + block
+            if _CRC.unpack_from(buffer, end)[0] != crc16_dnp(buffer, position, end):
+                return False
+            scratch[written:written + block] = buffer[position:end]
+            written += block
+            position = end + 2
+        return True
+
+    def reset(self):
+        """Drop any partially received frame"""
+        self.buffer.clear()
+
+
+class TransportReassembler:
+    """Rebuild application fragments from transport segments"""
+
+    def __init__(self, max_fragment_size=65536):
+        self.max_fragment_size = max_fragment_size
+        self.fragment = bytearray()
+        self.expected = None
+
+    def feed(self, segment):
+        """
+        Add one transport segment
+
+        Args:
+            segment (bytes-like): Link user data (transport header plus payload)
+
+        Returns:
+            bytes: The complete fragment when FIN is received, otherwise None
+        """
+        if not segment:
+            return None
+        header = segment[0]
+        sequence = header & TRANSPORT_SEQ
+        if header & TRANSPORT_FIR:
+            self.fragment.clear()
+        elif self.expected is None or sequence != self.expected:
+            # Out of sequence segment: discard the fragment in progress
+            self.fragment.clear()
+            self.expected = None
+            return None
+        if len(self.fragment) + len(segment) - 1 > self.max_fragment_size:
+            self.fragment.clear()
+            self.expected = None
+            return None
+        self.fragment += segment[1:]
+        if header & TRANSPORT_FIN:
+            self.expected = None
+            fragment = bytes(self.fragment)
+            self.fragment.clear()
+            return fragment
+        self.expected = (sequence + 1) & TRANSPORT_SEQ
+        return None
@@ -0,0 +1,416 @@
+"""
+DNP3 over TCP for SCADA Data Gateway
+asyncio master channel and a minimal outstation used as a local stand-in
+"""
+
+import asyncio
+import logging
+
+from .dnp3_app import (
+    APP_CON, APP_FIN, APP_SEQ, APP_UNS, CLASS_GROUP, CLASS_VARIATIONS,
+    FC_CONFIRM, FC_DIRECT_OPERATE, FC_DISABLE_UNSOLICITED, FC_ENABLE_UNSOLICITED,
+    FC_OPERATE, FC_READ, FC_SELECT, FC_UNSOLICITED_RESPONSE, FLAG_ONLINE,
+    IIN_CLASS1_EVENTS, IIN_CLASS2_EVENTS, IIN_CLASS3_EVENTS, IIN_DEVICE_RESTART,
+    IIN_EVENT_BUFFER_OVERFLOW, IIN_NO_FUNC_CODE_SUPPORT, IIN_OBJECT_UNKNOWN,
+    QUAL_ALL_OBJECTS, STATIC_VARIATIONS, DNP3ParseError, ResponseWriter,
+    analog_output_objects, build_request, class_objects, crob_objects,
+    iter_object_headers, parse_control_status, parse_control_values,
+    parse_header, parse_points, range_objects,
+)
+from .dnp3_events import DNP3EventBuffers, EVENT_CLASSES
+from .dnp3_link import (
+    CTRL_DIR, CTRL_FUNC, CTRL_PRM, LINK_ACK, LINK_CONFIRMED_USER_DATA,
+    LINK_REQUEST_LINK_STATUS, LINK_RESET_LINK_STATES, LINK_STATUS,
+    LINK_TEST_LINK_STATES, LINK_UNCONFIRMED_USER_DATA, LinkParser,
+    TransportReassembler, encode_frame, encode_user_data,
+)
+
+_CLASS_FOR_VARIATION = {variation: cls for cls, variation in CLASS_VARIATIONS.items()}
+_CLASS_IIN = {1: IIN_CLASS1_EVENTS, 2: IIN_CLASS2_EVENTS, 3: IIN_CLASS3_EVENTS}
+_STATIC_TYPES = {object_type: point_type for point_type, object_type in STATIC_VARIATIONS.items()}
+
+
+class _DNP3Channel(asyncio.Protocol):
+    """
+    Link and transport layer shared by the master and outstation sessions
+
+    Each channel owns one receive parser, one reassembler and one transmit
+    buffer for its whole lifetime, so steady-state traffic does not allocate
+    per frame.
+    """
+
+    def __init__(self, local_address, remote_address, master):
+        self.local_address = local_address
+        self.remote_address = remote_address
+        self.master = master
+        self.transport = None
+        self.parser = LinkParser(self._on_frame)
+        self.reassembler = TransportReassembler()
+        self.tx_buffer = bytearray()
+        self.tx_sequence = 0
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def data_received(self, data):
+        self.parser.feed(data)
+
+    def _on_frame(self, control, destination, source, payload):
+        if destination != self.local_address:
+            return
+        function = control & CTRL_FUNC
+        if not control & CTRL_PRM:
+            return
+        if function in (LINK_UNCONFIRMED_USER_DATA, LINK_CONFIRMED_USER_DATA):
+            if function == LINK_CONFIRMED_USER_DATA:
+                self._send_link(LINK_ACK)
+            fragment = self.reassembler.feed(payload)
+            if fragment is not None:
+                try:
+                    self.fragment_received(fragment)
+                except DNP3ParseError as e:
+                    logging.getLogger('SCADA_Gateway.DNP3').warning(f"Malformed fragment from {source}: {str(e)}")
+        elif function in (LINK_RESET_LINK_STATES, LINK_TEST_LINK_STATES):
+            self._send_link(LINK_ACK)
+        elif function == LINK_REQUEST_LINK_STATUS:
+            self._send_link(LINK_STATUS)
+
+    def _send_link(self, function):
+        if self.transport is None:
+            return
+        buffer = self.tx_buffer
+        buffer.clear()
+        encode_frame(buffer, (CTRL_DIR if self.master else 0) | function, self.remote_address, self.local_address)
+        self.transport.write(bytes(buffer))
+
+    def send_fragments(self, fragments):
+        """Segment and transmit application fragments in a single socket write"""
+        if self.transport is None:
+            raise ConnectionError("DNP3 channel is closed")
+        buffer = self.tx_buffer
+        buffer.clear()
+        for fragment in fragments:
+            self.tx_sequence = encode_user_data(
+                buffer, fragment, self.remote_address, self.local_address, self.master, self.tx_sequence
+            )
+        self.transport.write(bytes(buffer))
+
+    def fragment_received(self, fragment):
+        """Handle one reassembled application fragment (the channel alone drops it)"""
+        logging.getLogger('SCADA_Gateway.DNP3').debug("Dropping %d byte fragment", len(fragment))
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+class DNP3Master(_DNP3Channel):
+    """
+    Master station session with one outstation
+
+    Requests are serialized, as DNP3 allows one outstanding request per
+    association. Unsolicited responses are confirmed and handed to
+    `on_unsolicited` as decoded points.
+    """
+
+    def __init__(self, local_address=1, remote_address=1024, timeout=5.0, on_unsolicited=None):
+        super().__init__(local_address, remote_address, master=True)
+        self.timeout = timeout
+        self.on_unsolicited = on_unsolicited
+        self.sequence = 0
+        self.iin = 0
+        self.lock = asyncio.Lock()
+        self.pending = None
+        self.response_points = []
+        self.response_raw = []
+
+    @classmethod
+    async def open(cls, host, port, local_address=1, remote_address=1024, timeout=5.0, on_unsolicited=None):
+        """Connect to an outstation and return the master session"""
+        loop = asyncio.get_running_loop()
+        _, master = await asyncio.wait_for(
+            loop.create_connection(
+                lambda: cls(local_address, remote_address, timeout, on_unsolicited), host, port
+            ),
+            timeout
+        )
+        return master
+
+    @property
+    def connected(self):
+        return self.transport is not None
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        if self.pending and not self.pending.done():
+            self.pending.set_exception(ConnectionError("DNP3 connection lost"))
+
+    async def request(self, function, body=b''):
+        """
+        Send a request and wait for the complete (possibly multi-fragment) response
+
+        Returns:
+            tuple: (iin, decoded points, raw response fragments)
+        """
+        async with self.lock:
+            sequence = self.sequence
+            self.sequence = (self.sequence + 1) & APP_SEQ
+            self.pending = asyncio.get_running_loop().create_future()
+            self.response_points = []
+            self.response_raw = []
+            self.send_fragments([build_request(sequence, function, body)])
+            try:
+                return await asyncio.wait_for(self.pending, self.timeout)
+            finally:
+                self.pending = None
+
+    async def read_classes(self, classes):
+        """Poll the given classes (0 = static data)"""
+        return await self.request(FC_READ, class_objects(classes))
+
+    async def read_range(self, group, variation, start, stop):
+        """Read a range of points of one object type"""
+        return await self.request(FC_READ, range_objects(group, variation, start, stop))
+
+    async def operate_binary(self, index, state):
+        """Latch a binary output with a direct operate CROB; returns True on success"""
+        _, _, raw = await self.request(FC_DIRECT_OPERATE, crob_objects(index, state))
+        return self._control_ok(raw)
+
+    async def operate_analog(self, index, value):
+        """Direct operate an analog output; returns True on success"""
+        _, _, raw = await self.request(FC_DIRECT_OPERATE, analog_output_objects(index, value))
+        return self._control_ok(raw)
+
+    async def enable_unsolicited(self, classes=EVENT_CLASSES):
+        return await self.request(FC_ENABLE_UNSOLICITED, class_objects(classes))
+
+    async def disable_unsolicited(self, classes=EVENT_CLASSES):
+        return await self.request(FC_DISABLE_UNSOLICITED, class_objects(classes))
+
+    @staticmethod
+    def _control_ok(raw):
+        for fragment in raw:
+            _, _, _, offset = parse_header(fragment)
+            statuses = parse_control_status(fragment, offset)
+            if statuses and all(status == 0 for status in statuses):
+                return True
+        return False
+
+    def fragment_received(self, fragment):
+        control, function, iin, offset = parse_header(fragment)
+        if iin is None:
+            return
+        self.iin = iin
+        if control & APP_CON:
+            self.send_fragments([build_request(control & APP_SEQ, FC_CONFIRM, unsolicited=bool(control & APP_UNS))])
+
+        if function == FC_UNSOLICITED_RESPONSE:
+            points = parse_points(fragment, offset)
+            if points and self.on_unsolicited:
+                self.on_unsolicited(points)
+            return
+
+        if self.pending is None or self.pending.done():
+            return
+        self.response_points.extend(parse_points(fragment, offset))
+        self.response_raw.append(fragment)
+        if control & APP_FIN:
+            self.pending.set_result((iin, self.response_points, self.response_raw))
+
+
+class _OutstationSession(_DNP3Channel):
+    """Outstation side of one master connection"""
+
+    def __init__(self, outstation):
+        super().__init__(outstation.local_address, outstation.remote_address, master=False)
+        self.outstation = outstation
+        self.unsolicited_classes = set()
+        self.unsolicited_sequence = 0
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        self.outstation.sessions.add(self)
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        self.outstation.sessions.discard(self)
+
+    def fragment_received(self, fragment):
+        control, function, _, offset = parse_header(fragment)
+        if function == FC_CONFIRM:
+            return
+        sequence = control & APP_SEQ
+        outstation = self.outstation
+        writer = outstation.writer
+        writer.begin()
+        iin = 0
+        confirm = False
+
+        if function == FC_READ:
+            classes = []
+            for group, variation, qualifier, indices, _ in iter_object_headers(fragment, offset):
+                if group == CLASS_GROUP and qualifier == QUAL_ALL_OBJECTS:
+                    classes.append(_CLASS_FOR_VARIATION.get(variation, 0))
+                elif (group, variation) in _STATIC_TYPES:
+                    point_type = _STATIC_TYPES[(group, variation)]
+                    outstation.write_static(writer, point_type, None if indices is None else set(indices))
+                else:
+                    iin |= IIN_OBJECT_UNKNOWN
+            event_classes = [cls for cls in classes if cls]
+            if event_classes:
+                iin |= outstation.overflow_iin(event_classes)
+                confirm = outstation.write_events(writer, event_classes)
+            if 0 in classes:
+                outstation.write_static(writer)
+        elif function in (FC_SELECT, FC_OPERATE, FC_DIRECT_OPERATE):
+            body = outstation.operate(fragment, offset)
+            if body is None:
+                iin |= IIN_OBJECT_UNKNOWN
+            else:
+                writer.add_raw(body)
+        elif function in (FC_ENABLE_UNSOLICITED, FC_DISABLE_UNSOLICITED):
+            classes = {
+                _CLASS_FOR_VARIATION.get(variation, 0)
+                for group, variation, _, _, _ in iter_object_headers(fragment, offset)
+                if group == CLASS_GROUP
+            }
+            if function == FC_ENABLE_UNSOLICITED:
+                self.unsolicited_classes |= classes
+            else:
+                self.unsolicited_classes -= classes
+        else:
+            iin |= IIN_NO_FUNC_CODE_SUPPORT
+
+        iin |= outstation.iin()
+        self.send_fragments(writer.finish(sequence, iin, confirm=confirm))
+
+    def send_unsolicited(self, events_by_type):
+        """Push queued events of the enabled classes as an unsolicited response"""
+        writer = self.outstation.writer
+        writer.begin()
+        for point_type, events in events_by_type.items():
+            writer.add_events(point_type, events)
+        fragments = writer.finish(self.unsolicited_sequence, self.outstation.iin(),
+                                  function=FC_UNSOLICITED_RESPONSE, confirm=True)
+        self.unsolicited_sequence = (self.unsolicited_sequence + len(fragments)) & APP_SEQ
+        self.send_fragments(fragments)
+
+
+class DNP3Outstation:
+    """
+    Minimal DNP3 outstation for tests and simulation
+
+    Holds a static table and Class 1/2/3 event buffers per point type and
+    answers class polls, range reads, direct operate controls and unsolicited
+    enable/disable from any number of masters.
+    """
+
+    def __init__(self, local_address=1024, remote_address=1, buffer_size=1000, max_fragment_size=2048):
+        self.local_address = local_address
+        self.remote_address = remote_address
+        self.events = DNP3EventBuffers(buffer_size)
+        self.writer = ResponseWriter(max_fragment_size)
+        self.sessions = set()
+        self.server = None
+        self.restart = True
+        self.flush_handle = None
+
+    async def start(self, host='127.0.0.1', port=20000):
+        """Start listening; returns the bound port (useful with port 0)"""
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(lambda: _OutstationSession(self), host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for session in list(self.sessions):
+            session.close()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def configure_point(self, point_type, index, event_class=None, deadband=0.0):
+        self.events.configure_point((point_type, index), point_type, event_class, deadband)
+
+    def update(self, point_type, index, value, online=True):
+        """Change a point value; queues an event and schedules unsolicited responses"""
+        queued = self.events.update((point_type, index), value, FLAG_ONLINE if online else 0)
+        if queued and self.flush_handle is None and any(s.unsolicited_classes for s in self.sessions):
+            # Coalesce every update made in this loop iteration into one response
+            self.flush_handle = asyncio.get_event_loop().call_soon(self._flush_unsolicited)
+
+    def _flush_unsolicited(self):
+        self.flush_handle = None
+        classes = set()
+        for session in self.sessions:
+            classes |= session.unsolicited_classes
+        if not classes:
+            return
+        events_by_type = self._drain(sorted(classes))
+        if not events_by_type:
+            return
+        for session in list(self.sessions):
+            if session.unsolicited_classes:
+                session.send_unsolicited(events_by_type)
+
+    def _drain(self, classes):
+        events_by_type = {}
+        for event in self.events.drain(classes):
+            point_type, index = event['id']
+            events_by_type.setdefault(point_type, []).append((index, event['value'], event['quality']))
+        return events_by_type
+
+    def iin(self):
+        iin = IIN_DEVICE_RESTART if self.restart else 0
+        for cls, count in self.events.pending().items():
+            if count:
+                iin |= _CLASS_IIN[cls]
+        return iin
+
+    def overflow_iin(self, classes):
+        return IIN_EVENT_BUFFER_OVERFLOW if any(self.events.overflow[cls] for cls in classes) else 0
+
+    def write_static(self, writer, point_type=None, indices=None):
+        """Encode the static image of one or every point type"""
+        self.restart = False
+        types = [point_type] if point_type else list(STATIC_VARIATIONS)
+        values, qualities = self.events.values, self.events.qualities
+        for current_type in types:
+            points = []
+            for key, value in values.items():
+                key_type, index = key
+                if key_type == current_type and (indices is None or index in indices):
+                    points.append((index, value, qualities[key]))
+            if points:
+                points.sort()
+                writer.add_static(current_type, points)
+
+    def write_events(self, writer, classes):
+        events_by_type = self._drain(classes)
+        for point_type, events in events_by_type.items():
+            writer.add_events(point_type, events)
+        return bool(events_by_type)
+
+    def operate(self, fragment, offset):
+        """Apply control objects and return them echoed with their status"""
+        body = bytearray()
+        for group, variation, _, indices, data in iter_object_headers(fragment, offset):
+            if indices is None or group not in (12, 41):
+                return None
+            points = parse_control_values(fragment, group, variation, indices, data)
+            for index, value in points:
+                if group == 12:
+                    self.update('binary', index, 1 if value else 0)
+                    body += crob_objects(index, value)
+                else:
+                    self.update('analog', index, value)
+                    body += analog_output_objects(index, value)
+        return body
+
@@ -0,0 +1,324 @@
+"""
+IEC 60870-5-104 APCI layer for SCADA Data Gateway
+I/S/U framing, sequence numbering, k/w flow control and t1/t2/t3 timers
+"""
+
+import asyncio
+import logging
+import struct
+from collections import deque
+
+START_BYTE = 0x68
+APCI_SIZE = 6
+MAX_ASDU_SIZE = 249
+
+# U-frame functions (first control octet)
+U_STARTDT_ACT = 0x07
+U_STARTDT_CON = 0x0B
+U_STOPDT_ACT = 0x13
+U_STOPDT_CON = 0x23
+U_TESTFR_ACT = 0x43
+U_TESTFR_CON = 0x83
+
+SEQ_MODULO = 32768
+
+DEFAULT_PARAMETERS = {
+    "k": 12,
+    "w": 8,
+    "t0": 30,
+    "t1": 15,
+    "t2": 10,
+    "t3": 20
+}
+
+_CONTROL = struct.Struct('<BBHH')
+
+
+def u_frame(function):
+    """Encode an unnumbered control frame"""
+    return bytes((START_BYTE, 4, function, 0, 0, 0))
+
+
+def s_frame(receive_sequence):
+    """Encode a supervisory frame acknowledging up to receive_sequence"""
+    return _CONTROL.pack(START_BYTE, 4, 0x01, receive_sequence << 1)
+
+
+def append_i_frame(out, asdu, send_sequence, receive_sequence):
+    """Append an information frame carrying one ASDU to a buffer"""
+    size = len(asdu)
+    if size > MAX_ASDU_SIZE:
+        raise ValueError(f"ASDU too long: {size} bytes")
+    out += _CONTROL.pack(START_BYTE, size + 4, send_sequence << 1, receive_sequence << 1)
+    out += asdu
+
+
+class IEC104Link(asyncio.Protocol):
+    """
+    One IEC 104 connection, either controlling (master) or controlled (slave)
+
+    Outgoing ASDUs wait in a queue while k frames are unacknowledged; incoming
+    I-frames are acknowledged after w frames or t2 seconds, whichever first.
+    Subclasses implement `asdu_received()`, which gets a memoryview into the
+    receive buffer that is only valid for the duration of the call.
+    """
+
+    def __init__(self, parameters=None, controlling=True):
+        self.parameters = dict(DEFAULT_PARAMETERS)
+        self.parameters.update(parameters or {})
+        self.controlling = controlling
+        self.logger = logging.getLogger('SCADA_Gateway.IEC104')
+        self.transport = None
+        self.loop = asyncio.get_running_loop()
+        self.buffer = bytearray()
+        self.tx_buffer = bytearray()
+        self.send_sequence = 0
+        self.receive_sequence = 0
+        self.acknowledged = 0
+        self.unacknowledged_received = 0
+        self.pending = deque()
+        self.sent_times = deque()
+        self.started = False
+        self.started_event = asyncio.Event()
+        self.closed = self.loop.create_future()
+        self.t1_handle = None
+        self.t2_handle = None
+        self.t3_handle = None
+        self.last_activity = self.loop.time()
+        self.test_pending = False
+        self.frames_sent = 0
+        self.frames_received = 0
+
+    # asyncio.Protocol interface
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._restart_t3()
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.started = False
+        self.started_event.clear()
+        for handle in (self.t1_handle, self.t2_handle, self.t3_handle):
+            if handle:
+                handle.cancel()
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def data_received(self, data):
+        buffer = self.buffer
+        buffer += data
+        offset = 0
+        size = len(buffer)
+        view = memoryview(buffer)
+        try:
+            while size - offset >= 2:
+                if buffer[offset] != START_BYTE:
+                    self.logger.error("IEC 104 framing error, closing connection")
+                    self.close()
+                    return
+                length = buffer[offset + 1]
+                if length < 4:
+                    self.logger.error(f"Invalid APDU length {length}, closing connection")
+                    self.close()
+                    return
+                end = offset + 2 + length
+                if end > size:
+                    break
+                self._frame_received(view, offset, end)
+                offset = end
+                if self._closing():
+                    # The frame closed the connection; what follows it is not processed
+                    break
+        finally:
+            view.release()
+        if offset:
+            del buffer[:offset]
+        self.last_activity = self.loop.time()
+
+    # Frame handling
+
+    def _frame_received(self, view, offset, end):
+        control = view[offset + 2]
+        if not control & 0x01:
+            _, _, send_sequence, receive_sequence = _CONTROL.unpack_from(view, offset)
+            send_sequence >>= 1
+            if send_sequence != self.receive_sequence:
+                self.logger.error(
+                    f"Sequence error: expected {self.receive_sequence}, got {send_sequence}; closing connection"
+                )
+                self.close()
+                return
+            self.receive_sequence = (self.receive_sequence + 1) % SEQ_MODULO
+            self.frames_received += 1
+            if not self._acknowledge(receive_sequence >> 1):
+                return
+            self.unacknowledged_received += 1
+            if self.unacknowledged_received >= self.parameters["w"]:
+                self._send_s_frame()
+            elif self.t2_handle is None:
+                self.t2_handle = self.loop.call_later(self.parameters["t2"], self._send_s_frame)
+            self.asdu_received(view[offset + APCI_SIZE:end])
+        elif control & 0x03 == 0x01:
+            receive_sequence = _CONTROL.unpack_from(view, offset)[3] >> 1
+            self._acknowledge(receive_sequence)
+        else:
+            self._u_frame_received(control)
+
+    def _u_frame_received(self, function):
+        if function == U_STARTDT_ACT:
+            self._write(u_frame(U_STARTDT_CON))
+            self._set_started(True)
+        elif function == U_STARTDT_CON:
+            self._set_started(True)
+        elif function == U_STOPDT_ACT:
+            self._send_s_frame()
+            self._write(u_frame(U_STOPDT_CON))
+            self._set_started(False)
+        elif function == U_STOPDT_CON:
+            self._set_started(False)
+        elif function == U_TESTFR_ACT:
+            self._write(u_frame(U_TESTFR_CON))
+        elif function == U_TESTFR_CON:
+            self.test_pending = False
+            self._restart_t1()
+
+    def _set_started(self, started):
+        self.started = started
+        if started:
+            self.started_event.set()
+            self._flush_pending()
+        else:
+            self.started_event.clear()
+        self.data_transfer_changed(started)
+
+    def _acknowledge(self, receive_sequence):
+        """Process a peer acknowledgement (N(R)) and release window slots; False if it closed the connection"""
+        outstanding = (self.send_sequence - self.acknowledged) % SEQ_MODULO
+        acked = (receive_sequence - self.acknowledged) % SEQ_MODULO
+        if acked > outstanding:
+            self.logger.error(f"Invalid acknowledgement {receive_sequence}, closing connection")
+            self.close()
+            return False
+        if acked:
+            for _ in range(acked):
+                self.sent_times.popleft()
+            self.acknowledged = receive_sequence
+            self._restart_t1()
+        if self.pending:
+            self._flush_pending()
+        return True
+
+    def _send_s_frame(self):
+        if self.t2_handle:
+            self.t2_handle.cancel()
+            self.t2_handle = None
+        if self.unacknowledged_received:
+            self.unacknowledged_received = 0
+            self._write(s_frame(self.receive_sequence))
+
+    # Sending
+
+    @property
+    def window_available(self):
+        """Number of I-frames that may be sent before the k window closes"""
+        outstanding = (self.send_sequence - self.acknowledged) % SEQ_MODULO
+        return max(0, self.parameters["k"] - outstanding)
+
+    def send_asdu(self, asdu):
+        """Queue one ASDU; it is sent as soon as the k window allows"""
+        self.pending.append(asdu)
+        self._flush_pending()
+
+    def send_asdus(self, asdus):
+        """Queue several ASDUs, sent in as few socket writes as the window allows"""
+        self.pending.extend(asdus)
+        self._flush_pending()
+
+    def _flush_pending(self):
+        if self.transport is None or not self.started:
+            return
+        count = min(len(self.pending), self.window_available)
+        if not count:
+            return
+        buffer = self.tx_buffer
+        buffer.clear()
+        now = self.loop.time()
+        # Every I-frame carries N(R), so pending acknowledgements piggyback here
+        for _ in range(count):
+            append_i_frame(buffer, self.pending.popleft(), self.send_sequence, self.receive_sequence)
+            self.send_sequence = (self.send_sequence + 1) % SEQ_MODULO
+            self.sent_times.append(now)
+        self.frames_sent += count
+        self.unacknowledged_received = 0
+        if self.t2_handle:
+            self.t2_handle.cancel()
+            self.t2_handle = None
+        self.transport.write(bytes(buffer))
+        if self.t1_handle is None:
+            self._restart_t1()
+
+    def _write(self, frame):
+        if self.transport is not None:
+            self.transport.write(frame)
+
+    def start_data_transfer(self):
+        """Send STARTDT act (controlling station)"""
+        self._write(u_frame(U_STARTDT_ACT))
+
+    def stop_data_transfer(self):
+        """Send STOPDT act (controlling station)"""
+        self._write(u_frame(U_STOPDT_ACT))
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def _closing(self):
+        return self.transport is None or self.transport.is_closing()
+
+    # Timers
+
+    def _restart_t1(self):
+        if self.t1_handle:
+            self.t1_handle.cancel()
+            self.t1_handle = None
+        if self.sent_times:
+            delay = self.sent_times[0] + self.parameters["t1"] - self.loop.time()
+            self.t1_handle = self.loop.call_later(max(0.0, delay), self._t1_expired)
+        elif self.test_pending:
+            self.t1_handle = self.loop.call_later(self.parameters["t1"], self._t1_expired)
+
+    def _t1_expired(self):
+        self.t1_handle = None
+        self.logger.error("IEC 104 t1 timeout, closing connection")
+        self.close()
+
+    def _restart_t3(self):
+        if self.t3_handle:
+            self.t3_handle.cancel()
+        self.t3_handle = self.loop.call_later(self.parameters["t3"], self._t3_expired)
+
+    def _t3_expired(self):
+        self.t3_handle = None
+        if self.transport is None:
+            return
+        idle = self.loop.time() - self.last_activity
+        if idle < self.parameters["t3"]:
+            # Traffic arrived since the timer was armed; wait for the remainder
+            self.t3_handle = self.loop.call_later(self.parameters["t3"] - idle, self._t3_expired)
+            return
+        self.last_activity = self.loop.time()
+        self.test_pending = True
+        self._write(u_frame(U_TESTFR_ACT))
+        self._restart_t1()
+        self._restart_t3()
+
+    # Subclass hooks
+
+    def asdu_received(self, asdu):
+        """Handle one received ASDU (memoryview valid only during the call); the link alone drops it"""
+        self.logger.debug("Dropping %d byte ASDU", len(asdu))
+
+    def data_transfer_changed(self, started):
+        """Called when STARTDT/STOPDT takes effect"""
@@ -0,0 +1,460 @@
+"""
+IEC 60870-5-104 ASDU encoding and decoding for SCADA Data Gateway
+
+Every supported type identification has precompiled struct layouts for its
+information element, with and without the leading object address. Decoding
+unpacks all objects of an ASDU in one pass straight from a memoryview of the
+receive buffer; encoding packs into a preallocated buffer.
+"""
+
+import calendar
+import struct
+from datetime import datetime
+from .iec104_apci import MAX_ASDU_SIZE
+
+# Type identifications
+M_SP_NA_1 = 1
+M_DP_NA_1 = 3
+M_ST_NA_1 = 5
+M_ME_NA_1 = 9
+M_ME_NB_1 = 11
+M_ME_NC_1 = 13
+M_IT_NA_1 = 15
+M_SP_TB_1 = 30
+M_DP_TB_1 = 31
+M_ST_TB_1 = 32
+M_ME_TD_1 = 34
+M_ME_TE_1 = 35
+M_ME_TF_1 = 36
+M_IT_TB_1 = 37
+C_SC_NA_1 = 45
+C_DC_NA_1 = 46
+C_SE_NA_1 = 48
+C_SE_NB_1 = 49
+C_SE_NC_1 = 50
+M_EI_NA_1 = 70
+C_IC_NA_1 = 100
+C_CI_NA_1 = 101
+C_CS_NA_1 = 103
+
+# Causes of transmission
+COT_PERIODIC = 1
+COT_BACKGROUND = 2
+COT_SPONTANEOUS = 3
+COT_INITIALIZED = 4
+COT_REQUEST = 5
+COT_ACTIVATION = 6
+COT_ACTIVATION_CON = 7
+COT_DEACTIVATION = 8
+COT_DEACTIVATION_CON = 9
+COT_ACTIVATION_TERMINATION = 10
+COT_INTERROGATED_BY_STATION = 20
+COT_REQUESTED_BY_GENERAL_COUNTER = 37
+COT_UNKNOWN_TYPE = 44
+COT_UNKNOWN_CAUSE = 45
+COT_UNKNOWN_COMMON_ADDRESS = 46
+COT_UNKNOWN_IOA = 47
+
+# Qualifiers
+QOI_STATION = 20
+QCC_GENERAL_REQUEST = 5
+
+# Quality descriptor bits
+QUALITY_OVERFLOW = 0x01
+QUALITY_BLOCKED = 0x10
+QUALITY_SUBSTITUTED = 0x20
+QUALITY_NOT_TOPICAL = 0x40
+QUALITY_INVALID = 0x80
+
+COT_NEGATIVE = 0x40
+COT_TEST = 0x80
+SQ_BIT = 0x80
+
+ASDU_HEADER_SIZE = 6
+IOA_SIZE = 3
+MAX_OBJECTS = 127
+CP56_FORMAT = 'HBBBBB'
+
+# type id -> (element format, value kind, carries CP56Time2a)
+# Value kinds: 'siq'/'diq' status with quality in the same octet, 'vti' step
+# position, 'nva' normalized, 'sva' scaled, 'float', 'bcr' binary counter,
+# 'sco'/'dco' commands, 'qualifier' single qualifier octet, 'time' clock sync
+TYPES = {
+    M_SP_NA_1: ('B', 'siq', False),
+    M_DP_NA_1: ('B', 'diq', False),
+    M_ST_NA_1: ('BB', 'vti', False),
+    M_ME_NA_1: ('hB', 'nva', False),
+    M_ME_NB_1: ('hB', 'sva', False),
+    M_ME_NC_1: ('fB', 'float', False),
+    M_IT_NA_1: ('iB', 'bcr', False),
+    M_SP_TB_1: ('B', 'siq', True),
+    M_DP_TB_1: ('B', 'diq', True),
+    M_ST_TB_1: ('BB', 'vti', True),
+    M_ME_TD_1: ('hB', 'nva', True),
+    M_ME_TE_1: ('hB', 'sva', True),
+    M_ME_TF_1: ('fB', 'float', True),
+    M_IT_TB_1: ('iB', 'bcr', True),
+    C_SC_NA_1: ('B', 'sco', False),
+    C_DC_NA_1: ('B', 'dco', False),
+    C_SE_NA_1: ('hB', 'nva', False),
+    C_SE_NB_1: ('hB', 'sva', False),
+    C_SE_NC_1: ('fB', 'float', False),
+    M_EI_NA_1: ('B', 'qualifier', False),
+    C_IC_NA_1: ('B', 'qualifier', False),
+    C_CI_NA_1: ('B', 'qualifier', False),
+    C_CS_NA_1: ('', 'time', True),
+}
+
+# Monitor type used when reporting a value kind, without and with time tag
+MONITOR_TYPES = {
+    'single': (M_SP_NA_1, M_SP_TB_1),
+    'double': (M_DP_NA_1, M_DP_TB_1),
+    'step': (M_ST_NA_1, M_ST_TB_1),
+    'normalized': (M_ME_NA_1, M_ME_TD_1),
+    'scaled': (M_ME_NB_1, M_ME_TE_1),
+    'float': (M_ME_NC_1, M_ME_TF_1),
+    'counter': (M_IT_NA_1, M_IT_TB_1),
+}
+
+_HEADER = struct.Struct('<BBBBH')
+_IOA = struct.Struct('<HB')
+
+
+class ASDUError(ValueError):
+    """Raised when an ASDU cannot be decoded or encoded"""
+
+
+class Layout:
+    """Precompiled element layouts of one type identification"""
+
+    __slots__ = ('type_id', 'kind', 'timed', 'value_fields', 'element', 'addressed',
+                 'size', 'per_sequence', 'per_single')
+
+    def __init__(self, type_id, element_format, kind, timed):
+        self.type_id = type_id
+        self.kind = kind
+        self.timed = timed
+        self.value_fields = len(element_format)
+        time_format = CP56_FORMAT if timed else ''
+        self.element = struct.Struct('<' + element_format + time_format)
+        self.addressed = struct.Struct('<HB' + element_format + time_format)
+        self.size = self.element.size
+        room = MAX_ASDU_SIZE - ASDU_HEADER_SIZE
+        self.per_sequence = min(MAX_OBJECTS, (room - IOA_SIZE) // max(1, self.size))
+        self.per_single = min(MAX_OBJECTS, room // (IOA_SIZE + self.size))
+
+
+LAYOUTS = {type_id: Layout(type_id, *info) for type_id, info in TYPES.items()}
+
+
+class ASDU:
+    """
+    Application service data unit
+
+    objects holds (ioa, value, quality, timestamp) tuples. Decoded timestamps
+    are milliseconds since the Unix epoch (UTC); for encoding a timestamp may
+    be epoch milliseconds, a datetime, or None for the current time.
+    """
+
+    __slots__ = ('type_id', 'sequence', 'cot', 'negative', 'test',
+                 'originator', 'common_address', 'objects')
+
+    def __init__(self, type_id, cot, common_address, objects=None, originator=0,
+                 sequence=False, negative=False, test=False):
+        self.type_id = type_id
+        self.cot = cot
+        self.common_address = common_address
+        self.objects = objects if objects is not None else []
+        self.originator = originator
+        self.sequence = sequence
+        self.negative = negative
+        self.test = test
+
+    def __repr__(self):
+        return (f"ASDU(type={self.type_id}, cot={self.cot}, ca={self.common_address}, "
+                f"objects={len(self.objects)})")
+
+
+# CP56Time2a
+
+_day_cache = {}
+
+
+def cp56_to_ms(milliseconds, minute, hour, day, month, year):
+    """Convert unpacked CP56Time2a fields to epoch milliseconds (UTC)"""
+    key = (year & 0x7F, month & 0x0F, day & 0x1F)
+    base = _day_cache.get(key)
+    if base is None:
+        try:
+            base = calendar.timegm((2000 + key[0], key[1], key[2], 0, 0, 0)) * 1000
+        except (ValueError, OverflowError):
+            return None
+        if len(_day_cache) > 4096:
+            _day_cache.clear()
+        _day_cache[key] = base
+    return base + (hour & 0x1F) * 3600000 + (minute & 0x3F) * 60000 + milliseconds
+
+
+def ms_to_cp56(timestamp):
+    """Return CP56Time2a fields for epoch milliseconds, a datetime or None (now)"""
+    if timestamp is None:
+        stamp = datetime.utcnow()
+    elif isinstance(timestamp, datetime):
+        stamp = timestamp
+    else:
+        stamp = datetime.utcfromtimestamp(timestamp / 1000.0)
+    return (
+        stamp.second * 1000 + stamp.microsecond // 1000,
+        stamp.minute,
+        stamp.hour,
+        stamp.day | (stamp.isoweekday() << 5),
+        stamp.month,
+        stamp.year % 100
+    )
+
+
+def ms_to_iso(timestamp):
+    """Format epoch milliseconds as the gateway's ISO timestamp string"""
+    return datetime.utcfromtimestamp(timestamp / 1000.0).isoformat()
+
+
+# Element conversion
+
+def _value_quality(kind, fields):
+    """Split the value fields of one element into (value, quality)"""
+    if kind == 'siq':
+        return fields[0] & 0x01, fields[0] & 0xF0
+    if kind == 'diq':
+        return fields[0] & 0x03, fields[0] & 0xF0
+    if kind == 'vti':
+        vti = fields[0] & 0x7F
+        return (vti - 128 if vti & 0x40 else vti), fields[1]
+    if kind == 'nva':
+        return fields[0] / 32768.0, fields[1]
+    if kind in ('sva', 'float', 'bcr'):
+        return fields[0], fields[1]
+    if kind == 'sco':
+        return fields[0] & 0x01, fields[0] & 0xFE
+    if kind == 'dco':
+        return fields[0] & 0x03, fields[0] & 0xFC
+    if kind == 'time':
+        return None, 0
+    return fields[0], 0
+
+
+def _element_fields(kind, value, quality):
+    """Inverse of _value_quality: return the value fields to pack"""
+    if kind in ('float', 'sva', 'bcr'):
+        return (value, quality)
+    if kind == 'siq':
+        return ((1 if value else 0) | (quality & 0xF0),)
+    if kind == 'diq':
+        return ((int(value) & 0x03) | (quality & 0xF0),)
+    if kind == 'vti':
+        return (int(value) & 0x7F, quality)
+    if kind == 'nva':
+        return (max(-32768, min(32767, int(round(value * 32768)))), quality)
+    if kind == 'sco':
+        return ((1 if value else 0) | (quality & 0xFE),)
+    if kind == 'dco':
+        return ((int(value) & 0x03) | (quality & 0xFC),)
+    if kind == 'time':
+        return ()
+    return (int(value),)
+
+
+def _decode_rows(layout, rows, first_ioa):
+    """
+    Turn unpacked rows into object tuples
+
+    first_ioa is the address of the first object for SQ=1 rows; for SQ=0 it
+    is None and every row starts with its own two address fields.
+    """
+    kind = layout.kind
+    addressed = first_ioa is None
+    # Fast paths for the bulk of monitor traffic
+    if not layout.timed and kind in ('float', 'sva', 'bcr'):
+        if addressed:
+            return [(r[0] | (r[1] << 16), r[2], r[3], None) for r in rows]
+        return [(first_ioa + i, r[0], r[1], None) for i, r in enumerate(rows)]
+    if kind in ('float', 'sva', 'bcr'):
+        if addressed:
+            return [(r[0] | (r[1] << 16), r[2], r[3], cp56_to_ms(*r[4:])) for r in rows]
+        return [(first_ioa + i, r[0], r[1], cp56_to_ms(*r[2:])) for i, r in enumerate(rows)]
+    if not layout.timed and kind == 'siq':
+        if addressed:
+            return [(r[0] | (r[1] << 16), r[2] & 0x01, r[2] & 0xF0, None) for r in rows]
+        return [(first_ioa + i, r[0] & 0x01, r[0] & 0xF0, None) for i, r in enumerate(rows)]
+
+    objects = []
+    append = objects.append
+    start = 2 if addressed else 0
+    stop = start + layout.value_fields
+    timed = layout.timed
+    for i, row in enumerate(rows):
+        ioa = row[0] | (row[1] << 16) if addressed else first_ioa + i
+        value, quality = _value_quality(kind, row[start:stop])
+        append((ioa, value, quality, cp56_to_ms(*row[stop:]) if timed else None))
+    return objects
+
+
+def decode_asdu(data):
+    """
+    Decode an ASDU without copying it
+
+    Args:
+        data (bytes-like): ASDU octets (without APCI), typically a memoryview
+                           slice of the receive buffer
+
+    Returns:
+        ASDU: objects is a list of (ioa, value, quality, timestamp) tuples
+    """
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    length = len(view)
+    if length < ASDU_HEADER_SIZE:
+        raise ASDUError("ASDU too short")
+    type_id, vsq, cot, originator, common_address = _HEADER.unpack_from(view, 0)
+    layout = LAYOUTS.get(type_id)
+    if layout is None:
+        raise ASDUError(f"Unsupported type identification {type_id}")
+    count = vsq & 0x7F
+    sequence = bool(vsq & SQ_BIT)
+
+    if sequence and count:
+        end = ASDU_HEADER_SIZE + IOA_SIZE + count * layout.size
+        if end > length:
+            raise ASDUError("Truncated information objects")
+        low, high = _IOA.unpack_from(view, ASDU_HEADER_SIZE)
+        region = view[ASDU_HEADER_SIZE + IOA_SIZE:end]
+        first_ioa = low | (high << 16)
+        rows = layout.element.iter_unpack(region) if layout.size else [()] * count
+    else:
+        end = ASDU_HEADER_SIZE + count * (IOA_SIZE + layout.size)
+        if end > length:
+            raise ASDUError("Truncated information objects")
+        rows = layout.addressed.iter_unpack(view[ASDU_HEADER_SIZE:end])
+        first_ioa = None
+
+    return ASDU(type_id, cot & 0x3F, common_address, _decode_rows(layout, rows, first_ioa),
+                originator, sequence, bool(cot & COT_NEGATIVE), bool(cot & COT_TEST))
+
+
+class ASDUEncoder:
+    """
+    Encodes ASDUs into one preallocated buffer
+
+    Each call packs header and objects in place and returns the finished
+    ASDU as bytes, so the result can be queued and shared between
+    connections while the buffer is reused.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray(MAX_ASDU_SIZE)
+        self.view = memoryview(self.buffer)
+
+    def encode(self, type_id, cot, common_address, objects, originator=0,
+               sequence=False, negative=False, test=False):
+        """
+        Encode one ASDU
+
+        With sequence set, the objects must have contiguous addresses and only
+        the first address is transmitted (SQ=1).
+
+        Returns:
+            bytes: ASDU octets
+        """
+        layout = LAYOUTS.get(type_id)
+        if layout is None:
+            raise ASDUError(f"Unsupported type identification {type_id}")
+        count = len(objects)
+        limit = layout.per_sequence if sequence else layout.per_single
+        if count > limit:
+            raise ASDUError(f"Too many information objects for one ASDU: {count}")
+        buffer = self.buffer
+        kind = layout.kind
+        timed = layout.timed
+        cot |= (COT_NEGATIVE if negative else 0) | (COT_TEST if test else 0)
+        _HEADER.pack_into(buffer, 0, type_id, count | (SQ_BIT if sequence and count else 0),
+                          cot, originator, common_address)
+        offset = ASDU_HEADER_SIZE
+        # Objects of one burst usually share a timestamp object
+        last_timestamp = time_fields = None
+        if sequence and count:
+            first = objects[0][0]
+            _IOA.pack_into(buffer, offset, first & 0xFFFF, first >> 16)
+            offset += IOA_SIZE
+            pack_into = layout.element.pack_into
+            size = layout.size
+            for ioa, value, quality, timestamp in objects:
+                if timed:
+                    if time_fields is None or timestamp is not last_timestamp:
+                        last_timestamp, time_fields = timestamp, ms_to_cp56(timestamp)
+                    pack_into(buffer, offset, *_element_fields(kind, value, quality), *time_fields)
+                else:
+                    pack_into(buffer, offset, *_element_fields(kind, value, quality))
+                offset += size
+        else:
+            pack_into = layout.addressed.pack_into
+            size = IOA_SIZE + layout.size
+            for ioa, value, quality, timestamp in objects:
+                if timed:
+                    if time_fields is None or timestamp is not last_timestamp:
+                        last_timestamp, time_fields = timestamp, ms_to_cp56(timestamp)
+                    pack_into(buffer, offset, ioa & 0xFFFF, ioa >> 16,
+                              *_element_fields(kind, value, quality), *time_fields)
+                else:
+                    pack_into(buffer, offset, ioa & 0xFFFF, ioa >> 16,
+                              *_element_fields(kind, value, quality))
+                offset += size
+        return bytes(self.view[:offset])
+
+    def encode_batch(self, type_id, cot, common_address, objects, originator=0):
+        """
+        Pack (ioa, value, quality, timestamp) tuples sorted by address into as
+        few ASDUs as possible
+
+        Runs of contiguous addresses are sent with SQ=1 so only the first
+        address is transmitted; isolated objects share SQ=0 ASDUs.
+
+        Returns:
+            list: Encoded ASDUs
+        """
+        layout = LAYOUTS[type_id]
+        per_sequence = layout.per_sequence
+        per_single = layout.per_single
+        asdus = []
+        singles = []
+        count = len(objects)
+        start = 0
+        while start < count:
+            end = start + 1
+            while end < count and objects[end][0] == objects[end - 1][0] + 1:
+                end += 1
+            if end - start > 1:
+                for chunk_start in range(start, end, per_sequence):
+                    chunk = objects[chunk_start:min(end, chunk_start + per_sequence)]
+                    if len(chunk) == 1:
+                        singles.append(chunk[0])
+                    else:
+                        asdus.append(self.encode(type_id, cot, common_address, chunk, originator, True))
+            else:
+                singles.append(objects[start])
+            start = end
+        for chunk_start in range(0, len(singles), per_single):
+            asdus.append(self.encode(type_id, cot, common_address,
+                                     singles[chunk_start:chunk_start + per_single], originator))
+        return asdus
+
+
+_encoder = ASDUEncoder()
+
+
+def encode_asdu(asdu):
+    """Encode an ASDU object with the module's shared encoder"""
+    return _encoder.encode(asdu.type_id, asdu.cot, asdu.common_address, asdu.objects,
+                           asdu.originator, asdu.sequence, asdu.negative, asdu.test)
+
+
+def pack_objects(type_id, cot, common_address, objects, originator=0):
+    """Pack sorted objects into SQ=1/SQ=0 ASDUs with the module's shared encoder"""
+    return _encoder.encode_batch(type_id, cot, common_address, objects, originator)
@@ -1,52 +1,409 @@
-from .base_handler import BaseProtocolHandler, ConnectionStatus
+"""
+IEC 60870-5-104 Protocol Handler for SCADA Data Gateway
+Native asyncio controlling station (master) with spontaneous data handling,
+or controlled station (server) serving gateway values to control centers
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from .base_handler import BaseProtocolHandler, ConnectionStatus, typed_address
+from .iec104_apci import IEC104Link
+from .iec104_server import IEC104Server, points_from_mapping
+from .iec104_asdu import (
+    ASDU, ASDUError, decode_asdu, encode_asdu, ms_to_iso,
+    C_CI_NA_1, C_DC_NA_1, C_IC_NA_1, C_SC_NA_1, C_SE_NA_1, C_SE_NB_1, C_SE_NC_1,
+    COT_ACTIVATION, COT_ACTIVATION_CON, COT_ACTIVATION_TERMINATION,
+    M_EI_NA_1, QCC_GENERAL_REQUEST, QOI_STATION,
+    QUALITY_BLOCKED, QUALITY_INVALID, QUALITY_NOT_TOPICAL, QUALITY_SUBSTITUTED,
+)
+
+# Command type used by write_data, per tag type
+COMMAND_TYPES = {
+    'single': C_SC_NA_1,
+    'double': C_DC_NA_1,
+    'normalized': C_SE_NA_1,
+    'scaled': C_SE_NB_1,
+    'float': C_SE_NC_1
+}
+
+
+def quality_text(quality):
+    """Map an IEC 104 quality descriptor to the gateway's quality strings"""
+    if not quality & (QUALITY_INVALID | QUALITY_NOT_TOPICAL | QUALITY_BLOCKED | QUALITY_SUBSTITUTED):
+        return 'GOOD'
+    if quality & QUALITY_INVALID:
+        return 'INVALID'
+    if quality & QUALITY_NOT_TOPICAL:
+        return 'NOT_TOPICAL'
+    if quality & QUALITY_BLOCKED:
+        return 'BLOCKED'
+    return 'SUBSTITUTED'
+
+
+class _IEC104ClientLink(IEC104Link):
+    """Controlling station side of the connection, dispatching ASDUs to the handler"""
+
+    def __init__(self, handler, parameters):
+        super().__init__(parameters, controlling=True)
+        self.handler = handler
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        self.handler._connection_lost(exc)
+
+    def asdu_received(self, asdu):
+        try:
+            self.handler._asdu_received(decode_asdu(asdu))
+        except ASDUError as e:
+            self.logger.warning(f"Discarding ASDU: {str(e)}")
+
 
 class IEC104Handler(BaseProtocolHandler):
     def __init__(self):
         super().__init__()
+        self.logger = logging.getLogger('SCADA_Gateway.IEC104')
         self.connection = None
+        self.server = None
+        self.mode = 'client'
+        self.values = {}
+        self.pending_commands = {}
+        self.interrogations = {}
+        self.counter_task = None
+        self.disconnecting = False
+        self.served_points = {}  # ioa -> point type declared whenever the server starts
+
+    def parse_tag(self, text):
+        """"1001" or, for commands, "single:1001" (float set point by default)"""
+        command_type, ioa = typed_address(text, 'float')
+        return {"ioa": ioa, "type": command_type}
 
     def get_config_template(self):
         return {
+            "mode": "client",  # or "server"
             "ip": "",
             "port": 2404,
             "common_address": 1,
             "asdu_address": 1,
-            "originator_address": 0
+            "originator_address": 0,
+            "k": 12,
+            "w": 8,
+            "t0": 30,
+            "t1": 15,
+            "t2": 10,
+            "t3": 20,
+            "interrogation_on_connect": True,
+            "counter_interrogation_interval_s": 0,
+            "command_timeout": 5,
+            "time_tagged": False,
+            "max_pending": 10000
         }
 
     async def connect(self, config):
+        """
+        Connect to an IEC 104 controlled station and start data transfer
+
+        Args:
+            config (dict): Connection configuration
+        """
         try:
             self.status = ConnectionStatus.CONNECTING
             self.config = config
-            # Implementation would require a specific IEC 60870-5-104 library
-            # This is a placeholder for the actual implementation
+            self.mode = config.get("mode", "client")
+            self.disconnecting = False
+            parameters = {key: config[key] for key in ("k", "w", "t0", "t1", "t2", "t3") if key in config}
+            if self.mode == "server":
+                await self._start_server(parameters)
+                return
+            t0 = config.get("t0", 30)
+            self.logger.info(f"Connecting to IEC 104 station at {config['ip']}:{config['port']}")
+
+            loop = asyncio.get_running_loop()
+            _, self.connection = await asyncio.wait_for(
+                loop.create_connection(
+                    lambda: _IEC104ClientLink(self, parameters), config["ip"], config["port"]
+                ),
+                t0
+            )
+            self.connection.start_data_transfer()
+            await asyncio.wait_for(self.connection.started_event.wait(), self.connection.parameters["t1"])
             self.status = ConnectionStatus.CONNECTED
+            self.logger.info("IEC 104 data transfer started")
+
+            if config.get("interrogation_on_connect", True):
+                await self.interrogate()
+            if config.get("counter_interrogation_interval_s", 0) > 0:
+                self.counter_task = asyncio.ensure_future(
+                    self._counter_loop(config["counter_interrogation_interval_s"])
+                )
         except Exception as e:
+            if self.connection:
+                self.connection.close()
+                self.connection = None
             self.status = ConnectionStatus.ERROR
+            self.logger.error(f"Connection error: {str(e)}")
             raise ConnectionError(f"Failed to connect: {str(e)}")
 
+    async def _start_server(self, parameters):
+        """Listen for control center connections as a controlled station"""
+        config = self.config
+        self.server = IEC104Server(
+            common_address=config.get("common_address", 1),
+            parameters=parameters,
+            time_tagged=config.get("time_tagged", False),
+            max_pending=config.get("max_pending", 10000),
+            command_handler=self._on_command
+        )
+        for ioa, kind in self.served_points.items():
+            self.server.add_point(ioa, kind)
+        port = await self.server.start(config.get("ip") or "0.0.0.0", config["port"])
+        self.status = ConnectionStatus.CONNECTED
+        self.logger.info(f"IEC 104 server listening on port {port}")
+
+    def load_mapping(self, data_mapping, connection_id=None):
+        """
+        Declare every DataMapping destination on this protocol as a served point
+
+        Args:
+            data_mapping (DataMapping): Gateway mappings
+            connection_id (str): Only take destinations on this connection
+        """
+        self.serve_points(points_from_mapping(data_mapping, connection_id=connection_id))
+
+    def serve_points(self, points):
+        """
+        Set the points served in server mode, so interrogations report them before their first value
+
+        They are declared now if the server is running and again whenever it
+        starts. Points no longer in the set stay served until the next start.
+
+        Args:
+            points (dict): ioa -> point type
+        """
+        self.served_points = dict(points)
+        if self.server:
+            for ioa, kind in self.served_points.items():
+                if ioa not in self.server.points:
+                    self.server.add_point(ioa, kind)
+
+    def _on_command(self, ioa, value):
+        """Forward a control center command to the data callbacks"""
+        self._publish_data([{
+            'ioa': ioa,
+            'value': value,
+            'quality': 'GOOD',
+            'timestamp': datetime.utcnow().isoformat(),
+            'cot': COT_ACTIVATION
+        }])
+        return bool(self.data_callbacks)
+
     async def disconnect(self):
+        self.disconnecting = True
+        if self.server:
+            await self.server.stop()
+            self.server = None
+        if self.counter_task:
+            self.counter_task.cancel()
+            self.counter_task = None
         if self.connection:
-            # Implement disconnect logic
-            pass
+            connection, self.connection = self.connection, None
+            if connection.started:
+                connection.stop_data_transfer()
+            connection.close()
+            try:
+                await asyncio.wait_for(asyncio.shield(connection.closed), 1.0)
+            except asyncio.TimeoutError:
+                pass
         self.status = ConnectionStatus.DISCONNECTED
 
     async def read_data(self, tags):
+        """
+        Return the latest values of the given information objects
+
+        Values arrive by exception (spontaneous transmission and interrogation
+        responses) and are kept in a local table, so reads do not touch the
+        network.
+
+        Args:
+            tags (list): Tag dictionaries with an 'ioa' and optional 'common_address'
+
+        Returns:
+            list: Value dictionaries in tag order
+        """
+        if self.server:
+            return self._read_server(tags)
         if not self.connection:
             raise ConnectionError("Not connected")
-        
+
+        default_ca = self.config.get("common_address", 1)
         results = []
         for tag in tags:
-            # Implement IEC 104 read logic
-            pass
+            key = (tag.get("common_address", default_ca), tag["ioa"])
+            value = self.values.get(key)
+            if value is None:
+                value = {'ioa': tag["ioa"], 'value': None, 'quality': 'UNKNOWN', 'timestamp': None}
+            results.append(value)
         return results
 
     async def write_data(self, tags, values):
+        """
+        Send direct-execute commands and wait for their activation confirmation
+
+        Args:
+            tags (list): Tag dictionaries with 'ioa' and 'type' (single, double,
+                         normalized, scaled or float)
+            values (list): Values to command
+
+        Returns:
+            list: True for each positively confirmed command
+        """
+        if self.server:
+            return self._write_server(tags, values)
         if not self.connection:
             raise ConnectionError("Not connected")
-        
+
         results = []
         for tag, value in zip(tags, values):
-            # Implement IEC 104 write logic
-            pass
-        return results
\ No newline at end of file
+            type_id = COMMAND_TYPES.get(tag.get("type", "float"))
+            if type_id is None:
+                raise ValueError(f"Unsupported IEC 104 command type: {tag.get('type')}")
+            common_address = tag.get("common_address", self.config.get("common_address", 1))
+            confirmation = await self._activate(type_id, common_address, tag["ioa"], value)
+            results.append(confirmation)
+        return results
+
+    def _read_server(self, tags):
+        results = []
+        for tag in tags:
+            point = self.server.points.get(tag["ioa"])
+            if point is None:
+                results.append({'ioa': tag["ioa"], 'value': None, 'quality': 'UNKNOWN', 'timestamp': None})
+                continue
+            kind, value, quality, timestamp = point
+            results.append({
+                'ioa': tag["ioa"],
+                'value': value,
+                'quality': quality_text(quality),
+                'timestamp': timestamp.isoformat() if timestamp else None
+            })
+        return results
+
+    def _write_server(self, tags, values):
+        """Update served points; changes are sent spontaneously to the control centers"""
+        results = []
+        for tag, value in zip(tags, values):
+            ioa = tag["ioa"]
+            if ioa not in self.server.points:
+                self.server.add_point(ioa, tag.get("type", "float"))
+            self.server.update(ioa, value, tag.get("quality", 0))
+            results.append(True)
+        return results
+
+    async def interrogate(self, common_address=None, qoi=QOI_STATION):
+        """Run a general interrogation and wait for its activation termination"""
+        return await self._activate(C_IC_NA_1, common_address, 0, qoi, until_termination=True)
+
+    async def counter_interrogate(self, common_address=None, qcc=QCC_GENERAL_REQUEST):
+        """Run a counter interrogation and wait for its activation termination"""
+        return await self._activate(C_CI_NA_1, common_address, 0, qcc, until_termination=True)
+
+    async def _activate(self, type_id, common_address, ioa, value, until_termination=False):
+        if common_address is None:
+            common_address = self.config.get("common_address", 1)
+        key = (type_id, common_address, ioa)
+        registry = self.interrogations if until_termination else self.pending_commands
+        if key in registry:
+            raise RuntimeError(f"Activation of type {type_id} for IOA {ioa} already in progress")
+
+        future = asyncio.get_running_loop().create_future()
+        registry[key] = future
+        try:
+            self.connection.send_asdu(encode_asdu(ASDU(
+                type_id, COT_ACTIVATION, common_address, [(ioa, value, 0, None)],
+                originator=self.config.get("originator_address", 0)
+            )))
+            timeout = self.config.get("command_timeout", 5)
+            if until_termination:
+                timeout = max(timeout, self.connection.parameters["t1"])
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            registry.pop(key, None)
+
+    async def _counter_loop(self, interval):
+        while self.connection:
+            await asyncio.sleep(interval)
+            try:
+                await self.counter_interrogate()
+            except (asyncio.TimeoutError, RuntimeError) as e:
+                self.logger.warning(f"Counter interrogation failed: {str(e)}")
+
+    def _asdu_received(self, asdu):
+        """Route a decoded ASDU: monitor data to the value table, confirmations to waiters"""
+        type_id = asdu.type_id
+        if type_id < C_SC_NA_1:
+            self._monitor_data(asdu)
+            return
+        if type_id == M_EI_NA_1:
+            self.logger.info(f"Station {asdu.common_address} initialized")
+            return
+
+        key = (type_id, asdu.common_address, asdu.objects[0][0] if asdu.objects else 0)
+        if type_id in (C_IC_NA_1, C_CI_NA_1):
+            future = self.interrogations.get(key)
+            if future is None or future.done():
+                return
+            if asdu.negative:
+                future.set_result(False)
+            elif asdu.cot == COT_ACTIVATION_TERMINATION:
+                future.set_result(True)
+            return
+
+        future = self.pending_commands.get(key)
+        if future is not None and not future.done() and asdu.cot == COT_ACTIVATION_CON:
+            future.set_result(not asdu.negative)
+
+    def _monitor_data(self, asdu):
+        """Store monitor direction objects and push them to the data callbacks"""
+        received = datetime.utcnow().isoformat()
+        common_address = asdu.common_address
+        updates = []
+        for ioa, value, quality, timestamp in asdu.objects:
+            entry = {
+                'ioa': ioa,
+                'value': value,
+                'quality': quality_text(quality),
+                'timestamp': ms_to_iso(timestamp) if timestamp is not None else received,
+                'type_id': asdu.type_id,
+                'cot': asdu.cot
+            }
+            self.values[(common_address, ioa)] = entry
+            updates.append(entry)
+        self._publish_data(updates)
+
+    def _connection_lost(self, exc):
+        for registry in (self.pending_commands, self.interrogations):
+            for future in registry.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("IEC 104 connection lost"))
+        if not self.disconnecting:
+            self.logger.error(f"IEC 104 connection lost: {exc}")
+            self.status = ConnectionStatus.ERROR
+            self.connection = None
+
+    def get_status(self):
+        """Get connection status"""
+        if self.server:
+            status = {"status": self.status.value, "mode": "server"}
+            status.update(self.server.get_stats())
+            status.update(self.activity_status())
+            return status
+        connection = self.connection
+        return {
+            "status": self.status.value,
+            "data_transfer": bool(connection and connection.started),
+            "values_count": len(self.values),
+            "frames_sent": connection.frames_sent if connection else 0,
+            "frames_received": connection.frames_received if connection else 0,
+            "send_queue": len(connection.pending) if connection else 0,
+            **self.activity_status()
+        }
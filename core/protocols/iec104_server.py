@@ -0,0 +1,284 @@
+"""
+IEC 60870-5-104 controlled station (slave) for SCADA Data Gateway
+Serves gateway values to control centers as spontaneous and interrogated data
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from .iec104_apci import IEC104Link
+from .iec104_asdu import (
+    ASDU, ASDU_HEADER_SIZE, ASDUEncoder, ASDUError, MONITOR_TYPES, decode_asdu, encode_asdu,
+    C_CI_NA_1, C_CS_NA_1, C_DC_NA_1, C_IC_NA_1, C_SC_NA_1, C_SE_NA_1, C_SE_NB_1, C_SE_NC_1,
+    COT_ACTIVATION, COT_ACTIVATION_CON, COT_ACTIVATION_TERMINATION,
+    COT_INTERROGATED_BY_STATION, COT_REQUESTED_BY_GENERAL_COUNTER, COT_SPONTANEOUS,
+    COT_UNKNOWN_CAUSE, COT_UNKNOWN_COMMON_ADDRESS, COT_UNKNOWN_IOA, COT_UNKNOWN_TYPE,
+    QOI_STATION,
+)
+
+COMMAND_TYPES = (C_SC_NA_1, C_DC_NA_1, C_SE_NA_1, C_SE_NB_1, C_SE_NC_1)
+
+
+class _IEC104ServerLink(IEC104Link):
+    """Controlled station side of one control center connection"""
+
+    def __init__(self, server, parameters):
+        super().__init__(parameters, controlling=False)
+        self.server = server
+        self.dropped = 0
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        self.server.sessions.add(self)
+        peer = transport.get_extra_info('peername')
+        self.logger.info(f"IEC 104 master connected from {peer}")
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        self.server.sessions.discard(self)
+
+    def asdu_received(self, data):
+        try:
+            asdu = decode_asdu(data)
+        except ASDUError:
+            # Reflect the header with 'unknown type' as required by the standard
+            reply = bytearray(data[:ASDU_HEADER_SIZE])
+            if len(reply) == ASDU_HEADER_SIZE:
+                reply[2] = COT_UNKNOWN_TYPE | 0x40
+                self.send_asdu(bytes(reply) + bytes(data[ASDU_HEADER_SIZE:]))
+            return
+        self.server.request_received(self, asdu)
+
+    def queue(self, asdus):
+        """
+        Queue shared, already encoded ASDUs, bounded by the server's max_pending
+
+        On overflow the oldest spontaneous data is discarded. Confirmations,
+        terminations and interrogation answers are always sent, so a queue
+        holding mostly those can exceed max_pending.
+        """
+        pending = self.pending
+        overflow = len(pending) + len(asdus) - self.server.max_pending
+        dropped = 0
+        while dropped < overflow and pending and _spontaneous(pending[0]):
+            pending.popleft()
+            dropped += 1
+        if dropped < overflow:
+            # Spontaneous frames behind others, or among the new ones
+            kept = []
+            for asdu in list(pending) + list(asdus):
+                if dropped < overflow and _spontaneous(asdu):
+                    dropped += 1
+                else:
+                    kept.append(asdu)
+            pending.clear()
+            asdus = kept
+        self.dropped += dropped
+        self.send_asdus(asdus)
+
+
+def _spontaneous(asdu):
+    """Whether an encoded ASDU carries spontaneous data (the only kind dropped on overflow)"""
+    return len(asdu) > 2 and asdu[2] & 0x3F == COT_SPONTANEOUS
+
+
+class IEC104Server:
+    """
+    Controlled station serving a table of information objects
+
+    Value updates mark objects dirty; all updates made in one loop iteration
+    are packed into multi-object ASDUs once and the same encoded frames are
+    queued to every started connection, each of which drains them within its
+    own k window. General interrogation answers come from the current table
+    and are cached until the table changes.
+    """
+
+    def __init__(self, common_address=1, parameters=None, time_tagged=False, max_pending=10000,
+                 command_handler=None):
+        self.logger = logging.getLogger('SCADA_Gateway.IEC104')
+        self.common_address = common_address
+        self.parameters = parameters or {}
+        self.time_tagged = time_tagged
+        self.max_pending = max_pending
+        self.command_handler = command_handler
+        self.server = None
+        self.sessions = set()
+        self.points = {}
+        self.dirty = set()
+        self.version = 0
+        self.flush_handle = None
+        self.gi_cache = (None, [])
+        self.encoder = ASDUEncoder()
+        self.asdus_encoded = 0
+
+    async def start(self, host='0.0.0.0', port=2404):
+        """Start listening; returns the bound port (useful with port 0)"""
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(
+            lambda: _IEC104ServerLink(self, self.parameters), host or '0.0.0.0', port
+        )
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for session in list(self.sessions):
+            session.close()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def add_point(self, ioa, kind='float', value=None, quality=0):
+        """
+        Declare an information object
+
+        Args:
+            ioa (int): Information object address
+            kind (str): single, double, step, normalized, scaled, float or counter
+        """
+        if kind not in MONITOR_TYPES:
+            raise ValueError(f"Unsupported IEC 104 point type: {kind}")
+        self.points[ioa] = [kind, value, quality, None]
+        self.version += 1
+
+    def update(self, ioa, value, quality=0, timestamp=None):
+        """Set a point value; the change is sent spontaneously on the next flush"""
+        point = self.points.get(ioa)
+        if point is None:
+            raise KeyError(f"Unknown IOA {ioa}")
+        point[1] = value
+        point[2] = quality
+        point[3] = timestamp or datetime.utcnow()
+        self.version += 1
+        self.dirty.add(ioa)
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_event_loop().call_soon(self.flush)
+
+    def flush(self):
+        """Send every dirty object as spontaneous data to the started connections"""
+        self.flush_handle = None
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, set()
+        targets = [session for session in self.sessions if session.started]
+        if not targets:
+            return
+        asdus = self._encode(sorted(dirty), COT_SPONTANEOUS, self.time_tagged)
+        for session in targets:
+            session.queue(asdus)
+
+    def _encode(self, addresses, cot, time_tagged, kinds=None):
+        """Group addresses by monitor type and pack each group into ASDUs"""
+        groups = {}
+        points = self.points
+        for ioa in addresses:
+            kind, value, quality, timestamp = points[ioa]
+            if value is None or (kinds is not None and kind not in kinds):
+                continue
+            type_id = MONITOR_TYPES[kind][1 if time_tagged else 0]
+            groups.setdefault(type_id, []).append((ioa, value, quality, timestamp))
+        asdus = []
+        for type_id, objects in groups.items():
+            asdus.extend(self.encoder.encode_batch(type_id, cot, self.common_address, objects))
+        self.asdus_encoded += len(asdus)
+        return asdus
+
+    def _interrogation_asdus(self):
+        version, asdus = self.gi_cache
+        if version != self.version:
+            kinds = set(MONITOR_TYPES) - {'counter'}
+            asdus = self._encode(sorted(self.points), COT_INTERROGATED_BY_STATION, False, kinds)
+            self.gi_cache = (self.version, asdus)
+        return asdus
+
+    def request_received(self, session, asdu):
+        """Answer a request from a control center"""
+        if asdu.common_address not in (self.common_address, 0xFFFF):
+            session.send_asdu(self._mirror(asdu, COT_UNKNOWN_COMMON_ADDRESS, negative=True))
+            return
+        if asdu.cot != COT_ACTIVATION:
+            session.send_asdu(self._mirror(asdu, COT_UNKNOWN_CAUSE, negative=True))
+            return
+
+        if asdu.type_id == C_IC_NA_1:
+            qoi = asdu.objects[0][1] if asdu.objects else QOI_STATION
+            if qoi != QOI_STATION:
+                session.send_asdu(self._mirror(asdu, COT_ACTIVATION_CON, negative=True))
+                return
+            # Pending spontaneous changes go out first so the image is not older than them
+            self.flush()
+            session.queue(
+                [self._mirror(asdu, COT_ACTIVATION_CON)]
+                + self._interrogation_asdus()
+                + [self._mirror(asdu, COT_ACTIVATION_TERMINATION)]
+            )
+        elif asdu.type_id == C_CI_NA_1:
+            counters = self._encode(sorted(self.points), COT_REQUESTED_BY_GENERAL_COUNTER, False, {'counter'})
+            session.queue(
+                [self._mirror(asdu, COT_ACTIVATION_CON)]
+                + counters
+                + [self._mirror(asdu, COT_ACTIVATION_TERMINATION)]
+            )
+        elif asdu.type_id == C_CS_NA_1:
+            session.send_asdu(self._mirror(asdu, COT_ACTIVATION_CON))
+        elif asdu.type_id in COMMAND_TYPES:
+            self._command(session, asdu)
+        else:
+            session.send_asdu(self._mirror(asdu, COT_UNKNOWN_TYPE, negative=True))
+
+    def _command(self, session, asdu):
+        ioa, value, _, _ = asdu.objects[0]
+        if ioa not in self.points:
+            session.send_asdu(self._mirror(asdu, COT_UNKNOWN_IOA, negative=True))
+            return
+        accepted = False
+        if self.command_handler is not None:
+            try:
+                accepted = bool(self.command_handler(ioa, value))
+            except Exception as e:
+                self.logger.error(f"Command handler error for IOA {ioa}: {str(e)}")
+        session.send_asdu(self._mirror(asdu, COT_ACTIVATION_CON, negative=not accepted))
+        if accepted:
+            session.send_asdu(self._mirror(asdu, COT_ACTIVATION_TERMINATION))
+
+    @staticmethod
+    def _mirror(asdu, cot, negative=False):
+        return encode_asdu(ASDU(asdu.type_id, cot, asdu.common_address, asdu.objects,
+                                asdu.originator, asdu.sequence, negative))
+
+    def get_stats(self):
+        return {
+            "points": len(self.points),
+            "connections": len(self.sessions),
+            "active_connections": sum(1 for session in self.sessions if session.started),
+            "queued": sum(len(session.pending) for session in self.sessions),
+            "dropped": sum(session.dropped for session in self.sessions),
+            "asdus_encoded": self.asdus_encoded
+        }
+
+
+def points_from_mapping(data_mapping, protocol='IEC 60870-5-104', connection_id=None):
+    """
+    Collect IEC 104 points from the destinations of a DataMapping
+
+    A destination tag may give the address as 'ioa' or as a numeric 'tag'
+    string and the point type as 'type' (float by default). With a
+    connection_id only destinations on that connection are collected.
+
+    Returns:
+        dict: ioa -> point type
+    """
+    points = {}
+    for mapping in data_mapping.mappings:
+        destination = mapping["destination"]
+        if destination.protocol != protocol:
+            continue
+        if connection_id is not None and destination.connection_id != connection_id:
+            continue
+        tag = destination.tag
+        ioa = tag.get("ioa", tag.get("tag"))
+        try:
+            ioa = int(ioa)
+        except (TypeError, ValueError):
+            continue
+        points[ioa] = tag.get("type", "float")
+    return points
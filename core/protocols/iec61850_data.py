@@ -0,0 +1,487 @@
+"""
+IEC 61850 data model helpers for SCADA Data Gateway
+Object references, quality, datasets and report control blocks (IEC 61850-8-1)
+
+Values are handled in the form the MMS layer produces them: bit strings as
+BitString, UtcTime and BinaryTime as epoch seconds (float), structures as
+lists and everything else as plain Python values. Unsigned and UtcTime mark
+values that must be written with those MMS types.
+"""
+
+from datetime import datetime
+
+# Reported OptFlds bit positions
+OPT_SEQUENCE_NUMBER = 1
+OPT_REPORT_TIMESTAMP = 2
+OPT_REASON_FOR_INCLUSION = 3
+OPT_DATA_SET_NAME = 4
+OPT_DATA_REFERENCE = 5
+OPT_BUFFER_OVERFLOW = 6
+OPT_ENTRY_ID = 7
+OPT_CONF_REVISION = 8
+OPT_SEGMENTATION = 9
+OPT_FIELDS_LENGTH = 10
+
+# TrgOps bit positions
+TRIGGER_OPTIONS = {
+    'data_change': 1,
+    'quality_change': 2,
+    'data_update': 3,
+    'integrity': 4,
+    'general_interrogation': 5
+}
+TRIGGER_OPTIONS_LENGTH = 6
+
+# ReasonCode bit positions
+REASONS = ('reserved', 'data_change', 'quality_change', 'data_update', 'integrity', 'general_interrogation')
+
+DEFAULT_TRIGGER_OPTIONS = ('data_change', 'quality_change', 'integrity', 'general_interrogation')
+DEFAULT_OPTIONAL_FIELDS = (
+    OPT_SEQUENCE_NUMBER, OPT_REPORT_TIMESTAMP, OPT_REASON_FOR_INCLUSION, OPT_DATA_SET_NAME,
+    OPT_BUFFER_OVERFLOW, OPT_ENTRY_ID, OPT_CONF_REVISION
+)
+
+QUALITY_VALIDITY = {0: 'valid', 1: 'invalid', 2: 'reserved', 3: 'questionable'}
+
+# Days between 1970-01-01 and 1984-01-01, the BinaryTime epoch
+BINARY_TIME_EPOCH_DAYS = 5113
+
+FUNCTIONAL_CONSTRAINTS = frozenset((
+    'ST', 'MX', 'CO', 'CF', 'DC', 'SP', 'SG', 'SE', 'SV', 'EX', 'SR', 'OR', 'BL',
+    'BR', 'RP', 'LG', 'GO', 'GS', 'MS', 'US'
+))
+
+# Functional constraint assumed for references given without one
+DEFAULT_FUNCTIONAL_CONSTRAINTS = {
+    'stVal': 'ST', 'q': 'ST', 't': 'ST', 'mag': 'MX', 'cVal': 'MX', 'instMag': 'MX',
+    'instCVal': 'MX', 'range': 'MX', 'ctlModel': 'CF', 'sboTimeout': 'CF', 'setMag': 'SP',
+    'setVal': 'SP', 'd': 'DC', 'dU': 'DC', 'Oper': 'CO', 'SBOw': 'CO', 'Cancel': 'CO'
+}
+
+
+class DataAccessError(Exception):
+    """A single read or write refused by the server (MMS DataAccessError)"""
+
+    def __init__(self, code, reference=None):
+        self.code = code
+        self.reference = reference
+        super().__init__(f"Data access error {code}" + (f" for {reference}" if reference else ""))
+
+
+class ReportError(ValueError):
+    """Raised when an information report does not follow the report format"""
+
+
+class Unsigned(int):
+    """Integer written as MMS unsigned"""
+
+
+class UtcTime(float):
+    """Epoch seconds written as MMS UtcTime"""
+
+
+class BitString:
+    """ASN.1 bit string; bit 0 is the most significant bit of the first octet"""
+
+    __slots__ = ('data', 'length')
+
+    def __init__(self, data=b'', length=None):
+        self.data = bytes(data)
+        self.length = len(self.data) * 8 if length is None else length
+
+    @classmethod
+    def from_bits(cls, length, bits):
+        data = bytearray((length + 7) // 8)
+        for bit in bits:
+            data[bit >> 3] |= 0x80 >> (bit & 7)
+        return cls(data, length)
+
+    def __getitem__(self, index):
+        if index >= self.length:
+            return False
+        return bool(self.data[index >> 3] & (0x80 >> (index & 7)))
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        return isinstance(other, BitString) and self.data == other.data and self.length == other.length
+
+    def __hash__(self):
+        return hash((self.data, self.length))
+
+    def __repr__(self):
+        return f"BitString('{''.join('1' if self[i] else '0' for i in range(self.length))}')"
+
+    def bits(self):
+        """Positions of the set bits"""
+        return [i for i in range(self.length) if self[i]]
+
+
+# References
+
+def object_reference(tag):
+    """Build 'LD/LN.DO.DA' from a tag dict (data_attribute may be nested, e.g. 'mag.f')"""
+    reference = f"{tag['logical_device']}/{tag['logical_node']}.{tag['data_object']}"
+    if tag.get('data_attribute'):
+        reference += f".{tag['data_attribute']}"
+    return reference
+
+
+def split_functional_constraint(reference):
+    """Split 'LD/LN.DO.DA[FC]' into ('LD/LN.DO.DA', 'FC'); FC is None when absent"""
+    if reference.endswith(']') and '[' in reference:
+        base, fc = reference[:-1].split('[', 1)
+        return base, fc
+    return reference, None
+
+
+def mms_address(reference):
+    """
+    Map an object reference to its MMS (domain, item) name
+
+    'LD/LN.DO.DA[FC]' becomes ('LD', 'LN$FC$DO$DA'). References that already
+    carry the FC after the LN (like RCB attributes 'LD/LLN0.BR.brcb01.RptEna')
+    are kept as they are; without any FC it is derived from the first
+    attribute name, ST if nothing matches.
+    """
+    reference, fc = split_functional_constraint(reference)
+    domain, _, rest = reference.partition('/')
+    parts = rest.split('.')
+    if fc is None:
+        if len(parts) > 1 and parts[1] in FUNCTIONAL_CONSTRAINTS:
+            return domain, '$'.join(parts)
+        fc = DEFAULT_FUNCTIONAL_CONSTRAINTS.get(parts[2] if len(parts) > 2 else '', 'ST')
+    return domain, '$'.join([parts[0], fc] + parts[1:])
+
+
+def dataset_address(reference):
+    """Map a dataset reference 'LD/LN.Name' to its MMS (domain, item) name"""
+    domain, _, rest = normalize_reference(reference).partition('/')
+    return domain, rest.replace('.', '$')
+
+
+def reference_from_mms(domain, item):
+    """Inverse of mms_address: ('LD', 'LN$FC$DO$DA') -> 'LD/LN.DO.DA[FC]'"""
+    parts = item.split('$')
+    if len(parts) > 2 and parts[1] in FUNCTIONAL_CONSTRAINTS:
+        fc = parts.pop(1)
+        return f"{domain}/{'.'.join(parts)}[{fc}]"
+    return f"{domain}/{'.'.join(parts)}"
+
+
+def normalize_reference(reference):
+    """Turn an MMS style name ('LD/LN$FC$DO$DA') into an object reference ('LD/LN.DO.DA')"""
+    if '$' not in reference:
+        return reference
+    parts = reference.split('$')
+    if len(parts) > 2 and len(parts[1]) == 2 and parts[1].isupper():
+        del parts[1]
+    return '.'.join(parts)
+
+
+# Values
+
+def quality_text(quality):
+    """Validity of an IEC 61850 quality bit string, plus 'test'/'blocked' flags"""
+    if not isinstance(quality, BitString):
+        return 'unknown'
+    text = QUALITY_VALIDITY[(quality[0] << 1) | quality[1]]
+    if quality[11]:
+        text += ',test'
+    if quality[12]:
+        text += ',blocked'
+    return text
+
+
+def timestamp_text(timestamp):
+    """ISO string for an epoch seconds timestamp (None passes through)"""
+    if timestamp is None:
+        return None
+    return datetime.utcfromtimestamp(timestamp).isoformat()
+
+
+def utc_time_to_epoch(octets):
+    """Decode an 8 octet UtcTime (seconds, 24 bit fraction, quality) to epoch seconds"""
+    seconds = int.from_bytes(octets[0:4], 'big')
+    fraction = int.from_bytes(octets[4:7], 'big')
+    return seconds + fraction / 16777216.0
+
+
+def epoch_to_utc_time(timestamp, quality=0x0A):
+    """Encode epoch seconds as UtcTime; the default quality announces 10 bit accuracy"""
+    seconds = int(timestamp)
+    fraction = int((timestamp - seconds) * 16777216)
+    return seconds.to_bytes(4, 'big') + fraction.to_bytes(3, 'big') + bytes((quality,))
+
+
+def binary_time_to_epoch(octets):
+    """Decode a 4 or 6 octet BinaryTime (TimeOfDay) to epoch seconds"""
+    milliseconds = int.from_bytes(octets[0:4], 'big') & 0x0FFFFFFF
+    days = int.from_bytes(octets[4:6], 'big') if len(octets) >= 6 else 0
+    return (days + BINARY_TIME_EPOCH_DAYS) * 86400 + milliseconds / 1000.0
+
+
+# Datasets
+
+class Dataset:
+    """
+    Ordered members of a named dataset
+
+    A member is a functionally constrained reference; members that are whole
+    data objects may name their components (e.g. stVal, q, t) so structured
+    values can be split into attributes.
+    """
+
+    __slots__ = ('reference', 'members')
+
+    def __init__(self, reference, members):
+        self.reference = reference
+        self.members = []
+        for member in members:
+            if isinstance(member, dict):
+                member_ref, fc = split_functional_constraint(member['reference'])
+                attributes = list(member.get('attributes') or [])
+                fc = member.get('fc', fc)
+            else:
+                member_ref, fc = split_functional_constraint(normalize_reference(member))
+                attributes = []
+            self.members.append((member_ref, fc, attributes))
+
+    def expand(self, position, value):
+        """
+        Split the value of one member into (reference, value, quality, timestamp)
+
+        Structured members with named attributes are flattened; their 'q' and
+        't' components become the quality and timestamp of every attribute.
+        """
+        reference, _, attributes = self.members[position]
+        if not attributes or not isinstance(value, list):
+            return [(reference, value, None, None)]
+        components = dict(zip(attributes, value))
+        quality = components.pop('q', None)
+        timestamp = components.pop('t', None)
+        return [(f"{reference}.{name}", component, quality, timestamp)
+                for name, component in components.items()]
+
+
+class DatasetIndex:
+    """Datasets by reference plus a reverse index from data references to members"""
+
+    def __init__(self):
+        self.datasets = {}
+        self.members = {}
+
+    def __len__(self):
+        return len(self.datasets)
+
+    def __contains__(self, reference):
+        return reference in self.datasets
+
+    def get(self, reference):
+        return self.datasets.get(reference)
+
+    def add(self, reference, members):
+        """Register or replace a dataset"""
+        reference = normalize_reference(reference)
+        self.remove(reference)
+        dataset = Dataset(reference, members)
+        self.datasets[reference] = dataset
+        for position, (member_ref, _, attributes) in enumerate(dataset.members):
+            self.members.setdefault(member_ref, (reference, position))
+            for name in attributes:
+                self.members.setdefault(f"{member_ref}.{name}", (reference, position))
+        return dataset
+
+    def remove(self, reference):
+        if self.datasets.pop(reference, None) is not None:
+            self.members = {ref: entry for ref, entry in self.members.items() if entry[0] != reference}
+
+    def clear(self):
+        self.datasets.clear()
+        self.members.clear()
+
+    def group(self, references):
+        """
+        Split references into dataset reads and individual reads
+
+        Returns:
+            tuple: ({dataset reference: [request position, ...]}, [request position, ...])
+        """
+        by_dataset = {}
+        singles = []
+        for position, reference in enumerate(references):
+            entry = self.members.get(reference)
+            if entry is None:
+                singles.append(position)
+            else:
+                by_dataset.setdefault(entry[0], []).append(position)
+        return by_dataset, singles
+
+
+# Reports
+
+class Report:
+    """One decoded information report"""
+
+    __slots__ = ('rpt_id', 'sequence_number', 'time_of_entry', 'dataset', 'buffer_overflow',
+                 'entry_id', 'conf_rev', 'sub_sequence_number', 'more_segments', 'entries')
+
+    def __init__(self, rpt_id):
+        self.rpt_id = rpt_id
+        self.sequence_number = None
+        self.time_of_entry = None
+        self.dataset = None
+        self.buffer_overflow = False
+        self.entry_id = None
+        self.conf_rev = None
+        self.sub_sequence_number = None
+        self.more_segments = False
+        self.entries = []  # (member position, data reference or None, value, reason codes)
+
+
+def decode_report(values):
+    """
+    Decode the variable list of an 'RPT' information report
+
+    Args:
+        values (list): Report variables in transmission order
+
+    Returns:
+        Report
+    """
+    try:
+        report = Report(values[0])
+        options = values[1]
+        if not isinstance(options, BitString):
+            raise ReportError("OptFlds is not a bit string")
+        position = 2
+        if options[OPT_SEQUENCE_NUMBER]:
+            report.sequence_number = values[position]
+            position += 1
+        if options[OPT_REPORT_TIMESTAMP]:
+            report.time_of_entry = values[position]
+            position += 1
+        if options[OPT_DATA_SET_NAME]:
+            report.dataset = normalize_reference(values[position])
+            position += 1
+        if options[OPT_BUFFER_OVERFLOW]:
+            report.buffer_overflow = bool(values[position])
+            position += 1
+        if options[OPT_ENTRY_ID]:
+            report.entry_id = values[position]
+            position += 1
+        if options[OPT_CONF_REVISION]:
+            report.conf_rev = values[position]
+            position += 1
+        if options[OPT_SEGMENTATION]:
+            report.sub_sequence_number = values[position]
+            report.more_segments = bool(values[position + 1])
+            position += 2
+        inclusion = values[position]
+        position += 1
+        if not isinstance(inclusion, BitString):
+            raise ReportError("Inclusion is not a bit string")
+        members = inclusion.bits()
+        count = len(members)
+        references = [None] * count
+        if options[OPT_DATA_REFERENCE]:
+            references = [normalize_reference(ref) for ref in values[position:position + count]]
+            position += count
+        member_values = values[position:position + count]
+        position += count
+        if len(member_values) != count:
+            raise ReportError("Report holds fewer values than its inclusion bit string")
+        reasons = [None] * count
+        if options[OPT_REASON_FOR_INCLUSION]:
+            reasons = [
+                [REASONS[bit] for bit in code.bits() if bit < len(REASONS)] if isinstance(code, BitString) else []
+                for code in values[position:position + count]
+            ]
+        report.entries = list(zip(members, references, member_values, reasons))
+    except IndexError:
+        raise ReportError("Truncated information report")
+    return report
+
+
+class ReportControlBlock:
+    """
+    Client side state of one buffered (BR) or unbuffered (RP) report control block
+
+    The last received entry ID survives disconnects, so a buffered RCB can
+    be resumed from where the previous association stopped.
+    """
+
+    def __init__(self, reference, buffered=None, trigger_options=DEFAULT_TRIGGER_OPTIONS,
+                 integrity_period_ms=0, general_interrogation=True):
+        self.reference = reference
+        self.buffered = ('.BR.' in reference or '$BR$' in reference) if buffered is None else buffered
+        self.trigger_options = tuple(trigger_options)
+        self.integrity_period_ms = integrity_period_ms
+        self.general_interrogation = general_interrogation
+        self.rpt_id = None
+        self.dataset = None
+        self.conf_rev = None
+        self.entry_id = None
+        self.sequence_number = None
+        self.enabled = False
+        self.resumed = False
+        self.reports = 0
+        self.overflows = 0
+        self.last_report = None
+
+    @classmethod
+    def from_config(cls, entry):
+        """Build from a config entry: an RCB reference string or a dict"""
+        if isinstance(entry, str):
+            return cls(entry)
+        return cls(
+            entry['reference'],
+            buffered=entry.get('buffered'),
+            trigger_options=entry.get('trigger_options', DEFAULT_TRIGGER_OPTIONS),
+            integrity_period_ms=entry.get('integrity_period_ms', 0),
+            general_interrogation=entry.get('general_interrogation', True)
+        )
+
+    def attribute(self, name):
+        """Reference of an RCB attribute, e.g. RptEna"""
+        return f"{self.reference}.{name}"
+
+    def settings(self):
+        """(attribute, value) pairs written before RptEna"""
+        settings = [
+            ('OptFlds', BitString.from_bits(OPT_FIELDS_LENGTH, DEFAULT_OPTIONAL_FIELDS)),
+            ('TrgOps', BitString.from_bits(
+                TRIGGER_OPTIONS_LENGTH, [TRIGGER_OPTIONS[name] for name in self.trigger_options]
+            )),
+        ]
+        if self.integrity_period_ms:
+            settings.append(('IntgPd', Unsigned(self.integrity_period_ms)))
+        return settings
+
+    def report_received(self, report):
+        """Track entry ID and sequence number; returns False for a duplicate or stale report"""
+        if report.entry_id is not None:
+            if self.buffered and report.entry_id == self.entry_id and report.sub_sequence_number in (None, 0):
+                return False
+            self.entry_id = report.entry_id
+        if report.sequence_number is not None:
+            self.sequence_number = report.sequence_number
+        if report.buffer_overflow:
+            self.overflows += 1
+        self.reports += 1
+        self.last_report = datetime.utcnow()
+        return True
+
+    def get_status(self):
+        return {
+            "reference": self.reference,
+            "buffered": self.buffered,
+            "enabled": self.enabled,
+            "resumed": self.resumed,
+            "dataset": self.dataset,
+            "entry_id": self.entry_id.hex() if isinstance(self.entry_id, (bytes, bytearray)) else None,
+            "reports": self.reports,
+            "overflows": self.overflows,
+            "last_report": self.last_report.isoformat() if self.last_report else None
+        }
@@ -1,20 +1,58 @@
 """
 IEC 61850 Protocol Handler for SCADA Data Gateway
-Implements client functionality for IEC 61850 protocol using libiec61850
+Implements client functionality for IEC 61850 protocol over MMS (iec61850_mms)
+
+The MMS client is created by the coroutine `client_factory(config)`
+(MMSClient.from_config by default) and provides these coroutines:
+    read(references) -> list of values or DataAccessError
+    read_dataset(reference) -> list of member values
+    read_dataset_directory(reference) -> list of member references
+    get_name_list(object_class, domain=None) -> list of names
+    define_dataset(reference, members)
+    write(references, values) -> list of True or DataAccessError
+    close()
+and an `on_report` attribute, called with the variables of every 'RPT' report
 """
 
+import asyncio
 import logging
 from datetime import datetime
 from .base_handler import BaseProtocolHandler, ConnectionStatus
+from .iec61850_data import (
+    DataAccessError, DatasetIndex, ReportControlBlock, ReportError,
+    decode_report, normalize_reference, object_reference, quality_text, timestamp_text,
+)
+from .iec61850_mms import CLASS_DOMAIN, CLASS_NAMED_VARIABLE, CLASS_NAMED_VARIABLE_LIST, MMSClient
+from .iec61850_scl import load_scl
+
+# Functional constraints of control blocks, which are not data of the model
+CONTROL_BLOCK_FCS = ('BR', 'RP', 'LG', 'GO', 'GS', 'MS', 'US', 'SV')
 
 class IEC61850Handler(BaseProtocolHandler):
     def __init__(self):
         super().__init__()
         self.logger = logging.getLogger('SCADA_Gateway.IEC61850')
         self.client = None
+        self.client_factory = MMSClient.from_config
         self.connected_time = None
         self.reports = {}
-        self.datasets = {}
+        self.report_ids = {}
+        self.datasets = DatasetIndex()
+        self.values = {}
+        self.tasks = set()
+        self.model = None
+        self.ied_name = None
+
+    def parse_tag(self, text):
+        """Object reference text: LD/LN.DO or LD/LN.DO.DA"""
+        device, _, path = text.strip().partition('/')
+        parts = path.split('.', 2)
+        if not device or len(parts) < 2:
+            raise ValueError(f"Invalid IEC 61850 tag {text!r}: expected LD/LN.DO[.DA]")
+        tag = {"logical_device": device, "logical_node": parts[0], "data_object": parts[1]}
+        if len(parts) == 3:
+            tag["data_attribute"] = parts[2]
+        return tag
 
     def get_config_template(self):
         """Return configuration template for IEC 61850 connection"""
@@ -37,14 +75,22 @@ class IEC61850Handler(BaseProtocolHandler):
                 "local_ae_qualifier": 3,
                 "remote_ae_qualifier": 3
             },
+            # [{"reference": "LD0/LLN0.Meas", "members": ["LD0/MMXU1.TotW.mag.f[MX]",
+            #   {"reference": "LD0/XCBR1.Pos[ST]", "attributes": ["stVal", "q", "t"]}]}]
+            "datasets": [],
+            # "LD0/LLN0.BR.brcbMeas01" or {"reference": ..., "trigger_options": [...],
+            #   "integrity_period_ms": 0, "general_interrogation": true}
             "report_control_blocks": [],
+            # Offline model from an SCD/CID/ICD file; ied_name selects the IED in an SCD
+            "scl_file": "",
+            "ied_name": "",
             "polling_interval_ms": 1000
         }
 
     async def connect(self, config):
         """
         Connect to IEC 61850 server
-        
+
         Args:
             config (dict): Connection configuration containing host, port,
                          authentication details, and TLS settings
@@ -54,12 +100,31 @@ class IEC61850Handler(BaseProtocolHandler):
             self.status = ConnectionStatus.CONNECTING
             self.config = config
 
-            # TODO: Implement actual connection using libiec61850 or similar library
-            # For now, this is a placeholder implementation
+            if config.get("scl_file") and self.model is None:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.load_model, config["scl_file"], config.get("ied_name") or None
+                )
+            if self.client_factory is not None:
+                self.client = await self.client_factory(config)
+                self.client.on_report = self._on_report
+                closed = getattr(self.client, 'closed', None)
+                if closed is not None:
+                    closed.add_done_callback(self._client_closed)
+            for dataset in config.get("datasets", []):
+                self.datasets.add(dataset["reference"], dataset["members"])
+
             self.status = ConnectionStatus.CONNECTED
             self.connected_time = datetime.utcnow()
             self.logger.info("Successfully connected to IEC 61850 server")
 
+            # Previously enabled RCBs keep their entry IDs and resume from there
+            if self.client:
+                for entry in config.get("report_control_blocks", []):
+                    rcb = ReportControlBlock.from_config(entry)
+                    self.reports.setdefault(rcb.reference, rcb)
+                if self.reports:
+                    await self.subscribe_to_reports(list(self.reports.values()))
+
         except Exception as e:
             self.status = ConnectionStatus.ERROR
             self.logger.error(f"Failed to connect to IEC 61850 server: {str(e)}")
@@ -70,14 +135,16 @@ class IEC61850Handler(BaseProtocolHandler):
         try:
             if self.client:
                 self.logger.info("Disconnecting from IEC 61850 server")
-                # TODO: Implement actual disconnection
-                self.client = None
-                
+                for rcb in self.reports.values():
+                    rcb.enabled = False
+                client, self.client = self.client, None
+                await client.close()
+
+            for task in list(self.tasks):
+                task.cancel()
             self.status = ConnectionStatus.DISCONNECTED
             self.connected_time = None
-            self.reports.clear()
-            self.datasets.clear()
-            
+
         except Exception as e:
             self.logger.error(f"Error during disconnect: {str(e)}")
             raise
@@ -85,104 +152,217 @@ class IEC61850Handler(BaseProtocolHandler):
     async def read_data(self, tags):
         """
         Read data from IEC 61850 server
-        
+
+        Tags that belong to a known dataset are read with one dataset read per
+        dataset; all remaining tags share one multi-variable read.
+
         Args:
             tags (list): List of tag dictionaries containing:
                 - logical_device: Logical device name
                 - logical_node: Logical node name
                 - data_object: Data object name
                 - data_attribute: Data attribute name
-        
+
         Returns:
             list: List of read values
         """
         if not self.client or self.status != ConnectionStatus.CONNECTED:
             raise ConnectionError("Not connected to IEC 61850 server")
 
-        results = []
+        references = [object_reference(tag) for tag in tags]
+        results = [None] * len(tags)
         try:
-            for tag in tags:
-                # Construct object reference
-                object_ref = (
-                    f"{tag['logical_device']}/{tag['logical_node']}."
-                    f"{tag['data_object']}.{tag['data_attribute']}"
-                )
-                
-                # TODO: Implement actual read using libiec61850
-                # For now, return placeholder value
-                value = {"value": 0, "quality": "valid", "timestamp": datetime.utcnow()}
-                results.append(value)
-                
-                self.logger.debug(f"Read value from {object_ref}: {value}")
-                
+            by_dataset, singles = self.datasets.group(references)
+
+            for dataset_ref, positions in by_dataset.items():
+                dataset = self.datasets.get(dataset_ref)
+                values = await self.client.read_dataset(dataset_ref)
+                if isinstance(values, DataAccessError):
+                    for position in positions:
+                        results[position] = self._result(None, None, None, values)
+                    continue
+                expanded = {}
+                for member, value in enumerate(values):
+                    for reference, item, quality, timestamp in dataset.expand(member, value):
+                        expanded[reference] = (item, quality, timestamp)
+                for position in positions:
+                    item = expanded.get(references[position])
+                    results[position] = self._result(*item) if item else self._result(None, None, None)
+                self.logger.debug("Read dataset %s for %d tags", dataset_ref, len(positions))
+
+            if singles:
+                values = await self.client.read([references[position] for position in singles])
+                for position, value in zip(singles, values):
+                    if isinstance(value, DataAccessError):
+                        results[position] = self._result(None, None, None, value)
+                    else:
+                        results[position] = self._result(value, None, None)
+
         except Exception as e:
             self.logger.error(f"Error reading data: {str(e)}")
             raise
 
         return results
 
+    @staticmethod
+    def _result(value, quality, timestamp, error=None):
+        result = {
+            "value": value,
+            "quality": 'invalid' if error else quality_text(quality),
+            "timestamp": timestamp_text(timestamp) or datetime.utcnow().isoformat()
+        }
+        if error:
+            result["error"] = str(error)
+        return result
+
     async def write_data(self, tags, values):
         """
         Write data to IEC 61850 server
-        
+
         Args:
             tags (list): List of tag dictionaries (same format as read_data)
             values (list): List of values to write
-        
+
         Returns:
             list: List of boolean success indicators
         """
         if not self.client or self.status != ConnectionStatus.CONNECTED:
             raise ConnectionError("Not connected to IEC 61850 server")
 
-        results = []
         try:
-            for tag, value in zip(tags, values):
-                # Construct object reference
-                object_ref = (
-                    f"{tag['logical_device']}/{tag['logical_node']}."
-                    f"{tag['data_object']}.{tag['data_attribute']}"
-                )
-                
-                # TODO: Implement actual write using libiec61850
-                # For now, return success placeholder
-                success = True
-                results.append(success)
-                
-                self.logger.debug(f"Write value to {object_ref}: {value}")
-                
+            references = [object_reference(tag) for tag in tags]
+            results = await self.client.write(references, list(values))
+            for reference, result in zip(references, results):
+                if isinstance(result, DataAccessError):
+                    self.logger.warning(f"Write to {reference} refused: {str(result)}")
+            return [result is True for result in results]
         except Exception as e:
             self.logger.error(f"Error writing data: {str(e)}")
             raise
 
-        return results
-
     async def subscribe_to_reports(self, report_control_blocks):
         """
-        Subscribe to report control blocks
-        
+        Enable report control blocks
+
+        Buffered RCBs with a known entry ID are resumed from that entry; any
+        other RCB is enabled fresh and followed by a general interrogation.
+
         Args:
-            report_control_blocks (list): List of RCB references to subscribe to
+            report_control_blocks (list): RCB references, config dicts or
+                                          ReportControlBlock objects
         """
         if not self.client or self.status != ConnectionStatus.CONNECTED:
             raise ConnectionError("Not connected to IEC 61850 server")
 
         try:
-            for rcb in report_control_blocks:
-                # TODO: Implement actual report subscription using libiec61850
-                self.logger.info(f"Subscribed to report control block: {rcb}")
-                self.reports[rcb] = {
-                    "enabled": True,
-                    "last_report": None
-                }
+            for entry in report_control_blocks:
+                if not isinstance(entry, ReportControlBlock):
+                    entry = ReportControlBlock.from_config(entry)
+                rcb = self.reports.setdefault(entry.reference, entry)
+                await self._enable_report(rcb)
+                self.logger.info(
+                    f"Subscribed to report control block: {rcb.reference}"
+                    + (" (resumed)" if rcb.resumed else "")
+                )
         except Exception as e:
             self.logger.error(f"Error subscribing to reports: {str(e)}")
             raise
 
+    async def _enable_report(self, rcb):
+        client = self.client
+        rpt_id, dataset_ref, conf_rev = await client.read(
+            [rcb.attribute('RptID'), rcb.attribute('DatSet'), rcb.attribute('ConfRev')]
+        )
+        for value in (rpt_id, dataset_ref, conf_rev):
+            if isinstance(value, DataAccessError):
+                raise value
+        if rcb.conf_rev is not None and conf_rev != rcb.conf_rev:
+            # The dataset definition changed; old entry IDs are meaningless
+            rcb.entry_id = None
+        rcb.conf_rev = conf_rev
+        rcb.dataset = normalize_reference(dataset_ref) if dataset_ref else None
+        if rcb.rpt_id:
+            self.report_ids.pop(rcb.rpt_id, None)
+        rcb.rpt_id = rpt_id or rcb.reference
+        self.report_ids[rcb.rpt_id] = rcb
+
+        if rcb.dataset and rcb.dataset not in self.datasets:
+            members = await client.read_dataset_directory(rcb.dataset)
+            self.datasets.add(rcb.dataset, members)
+
+        rcb.resumed = False
+        if not rcb.buffered:
+            await client.write([rcb.attribute('Resv')], [True])
+        elif rcb.entry_id is not None:
+            result, = await client.write([rcb.attribute('EntryID')], [rcb.entry_id])
+            rcb.resumed = result is True
+            if not rcb.resumed:
+                self.logger.warning(f"Cannot resume {rcb.reference} from its last entry; re-reading")
+
+        settings = rcb.settings() + [('RptEna', True)]
+        results = await client.write([rcb.attribute(name) for name, _ in settings],
+                                     [value for _, value in settings])
+        if results[-1] is not True:
+            raise RuntimeError(f"Enabling {rcb.reference} refused: {results[-1]}")
+        rcb.enabled = True
+
+        if not rcb.resumed and rcb.general_interrogation:
+            await client.write([rcb.attribute('GI')], [True])
+
+    def _on_report(self, values):
+        """Decode one information report and push all of its values at once"""
+        try:
+            report = decode_report(values)
+        except ReportError as e:
+            self.logger.error(f"Invalid report: {str(e)}")
+            return
+        rcb = self.report_ids.get(report.rpt_id)
+        if rcb is None:
+            self.logger.debug("Report for unknown RptID %s", report.rpt_id)
+            return
+        if not rcb.report_received(report):
+            return
+        if report.buffer_overflow:
+            self.logger.warning(f"Report buffer overflow on {rcb.reference}, requesting interrogation")
+            self._spawn(self._interrogate(rcb))
+
+        dataset = self.datasets.get(report.dataset or rcb.dataset)
+        timestamp = timestamp_text(report.time_of_entry) or datetime.utcnow().isoformat()
+        updates = []
+        for member, reference, value, reasons in report.entries:
+            if dataset is not None and member < len(dataset.members):
+                items = dataset.expand(member, value)
+            else:
+                items = [(reference, value, None, None)]
+            for item_ref, item, quality, item_time in items:
+                entry = {
+                    'reference': item_ref,
+                    'value': item,
+                    'quality': quality_text(quality),
+                    'timestamp': timestamp_text(item_time) or timestamp,
+                    'reason': reasons,
+                    'report': rcb.reference
+                }
+                self.values[item_ref] = entry
+                updates.append(entry)
+        if updates:
+            self._publish_data(updates)
+
+    async def _interrogate(self, rcb):
+        try:
+            await self.client.write([rcb.attribute('GI')], [True])
+        except Exception as e:
+            self.logger.error(f"General interrogation of {rcb.reference} failed: {str(e)}")
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
     async def create_dataset(self, dataset_name, members):
         """
         Create a new dataset
-        
+
         Args:
             dataset_name (str): Name of the dataset to create
             members (list): List of dataset member references
@@ -191,60 +371,152 @@ class IEC61850Handler(BaseProtocolHandler):
             raise ConnectionError("Not connected to IEC 61850 server")
 
         try:
-            # TODO: Implement actual dataset creation using libiec61850
-            self.datasets[dataset_name] = {
-                "members": members,
-                "created_at": datetime.utcnow()
-            }
+            await self.client.define_dataset(
+                dataset_name, [member['reference'] if isinstance(member, dict) else member for member in members]
+            )
+            self.datasets.add(dataset_name, members)
             self.logger.info(f"Created dataset: {dataset_name}")
         except Exception as e:
             self.logger.error(f"Error creating dataset: {str(e)}")
             raise
 
-    def get_server_model(self):
+    def load_model(self, scl_file, ied_name=None):
+        """
+        Load the IED model from an SCL file (or its cached index)
+
+        The model's datasets are registered so reads and reports can use them
+        without browsing the server.
+
+        Args:
+            scl_file (str): SCD, CID or ICD file
+            ied_name (str): IED to use; may be omitted when the file has one IED
+        """
+        model = load_scl(scl_file)
+        names = model.ied_names()
+        if ied_name is None:
+            if len(names) != 1:
+                raise ValueError(f"SCL file describes {len(names)} IEDs; set ied_name")
+            ied_name = names[0]
+        elif ied_name not in names:
+            raise ValueError(f"IED {ied_name} not found in {scl_file}")
+        self.model = model
+        self.ied_name = ied_name
+        for dataset in model.dataset_definitions(ied_name):
+            self.datasets.add(dataset["reference"], dataset["members"])
+        self.logger.info(f"Loaded IEC 61850 model of {ied_name} from {scl_file}")
+        return model
+
+    async def get_server_model(self):
         """
         Get the server's IEC 61850 model
-        
+
+        Comes from the loaded SCL model, which needs no connection, or else
+        from the server's name lists. Those carry no attribute types, so
+        "type" is None in the attributes of an online model.
+
         Returns:
             dict: Server model structure
         """
+        if self.model is not None:
+            return self.model.server_model(self.ied_name)
         if not self.client or self.status != ConnectionStatus.CONNECTED:
             raise ConnectionError("Not connected to IEC 61850 server")
 
         try:
-            # TODO: Implement actual model retrieval using libiec61850
-            model = {
-                "logical_devices": [],
-                "logical_nodes": [],
-                "data_objects": [],
-                "data_attributes": []
-            }
-            return model
+            return await self._read_server_model()
         except Exception as e:
             self.logger.error(f"Error getting server model: {str(e)}")
             raise
 
+    async def _read_server_model(self):
+        """The model in the shape of SCLModel.server_model, from GetNameList"""
+        model = {
+            "logical_devices": [],
+            "logical_nodes": [],
+            "data_objects": [],
+            "data_attributes": [],
+            "datasets": [],
+            "report_control_blocks": []
+        }
+        control_blocks = []
+        for device in await self.client.get_name_list(CLASS_DOMAIN):
+            model["logical_devices"].append(device)
+            # Variables are listed with every component: LN, LN$FC, LN$FC$DO, LN$FC$DO$DA...
+            names = sorted(await self.client.get_name_list(CLASS_NAMED_VARIABLE, device))
+            seen_objects = set()
+            for position, name in enumerate(names):
+                parts = name.split('$')
+                if len(parts) == 1:
+                    model["logical_nodes"].append(f"{device}/{name}")
+                    continue
+                if len(parts) < 3:
+                    continue
+                node, fc, data_object = parts[:3]
+                if fc in CONTROL_BLOCK_FCS:
+                    if len(parts) == 3 and fc in ('BR', 'RP'):
+                        control_blocks.append((f"{device}/{node}.{fc}.{data_object}", fc == 'BR'))
+                    continue
+                object_ref = f"{device}/{node}.{data_object}"
+                if object_ref not in seen_objects:
+                    seen_objects.add(object_ref)
+                    model["data_objects"].append(object_ref)
+                # Only leaves are attributes; their components follow them in sorted order
+                leaf = position + 1 == len(names) or not names[position + 1].startswith(name + '$')
+                if len(parts) > 3 and leaf:
+                    model["data_attributes"].append({
+                        "logical_device": device,
+                        "logical_node": node,
+                        "data_object": data_object,
+                        "data_attribute": '.'.join(parts[3:]),
+                        "fc": fc,
+                        "type": None
+                    })
+            for name in await self.client.get_name_list(CLASS_NAMED_VARIABLE_LIST, device):
+                reference = f"{device}/{name.replace('$', '.')}"
+                model["datasets"].append({
+                    "reference": reference,
+                    "members": await self.client.read_dataset_directory(reference)
+                })
+
+        if control_blocks:
+            attributes = ("RptID", "DatSet", "ConfRev")
+            values = await self.client.read([f"{reference}.{name}" for reference, _ in control_blocks
+                                             for name in attributes])
+            values = [None if isinstance(value, DataAccessError) else value for value in values]
+            for position, (reference, buffered) in enumerate(control_blocks):
+                rpt_id, dataset, conf_rev = values[position * 3:position * 3 + 3]
+                model["report_control_blocks"].append({
+                    "reference": reference,
+                    "dataset": normalize_reference(dataset) if dataset else None,
+                    "buffered": buffered,
+                    "rpt_id": rpt_id,
+                    "conf_rev": conf_rev
+                })
+        return model
+
     def get_connection_stats(self):
         """
         Get connection statistics
-        
+
         Returns:
             dict: Connection statistics
         """
         stats = {
             "status": self.status.value,
             "connected_since": self.connected_time.isoformat() if self.connected_time else None,
-            "active_reports": len(self.reports),
+            "active_reports": sum(1 for rcb in self.reports.values() if rcb.enabled),
             "active_datasets": len(self.datasets),
-            "last_communication": datetime.utcnow().isoformat()
+            "reports": [rcb.get_status() for rcb in self.reports.values()]
         }
+        activity = self.activity_status()
+        stats["last_communication"] = activity["last_update"]
+        stats["metrics"] = activity["metrics"]
         return stats
 
-    def __del__(self):
-        """Cleanup when object is destroyed"""
-        try:
-            if self.status == ConnectionStatus.CONNECTED:
-                import asyncio
-                asyncio.run(self.disconnect())
-        except:
-            pass
\ No newline at end of file
+    def _client_closed(self, closed):
+        """Mark the connection failed when the MMS association drops under us"""
+        if self.client is not None and self.client.closed is closed:
+            self.logger.error("IEC 61850 connection lost")
+            for rcb in self.reports.values():
+                rcb.enabled = False
+            self.status = ConnectionStatus.ERROR
@@ -0,0 +1,851 @@
+"""
+MMS over ISO-on-TCP for SCADA Data Gateway
+asyncio TPKT/COTP transport, minimal session/presentation/ACSE association,
+an MMS client for IEC 61850 and a small MMS server used as a local stand-in
+
+Only the kernel needed by IEC 61850 clients is implemented: the normal mode
+presentation context with BER, the MMS Initiate/Conclude exchange and the
+Read, Write, GetNameList, GetNamedVariableListAttributes,
+DefineNamedVariableList and InformationReport services.
+"""
+
+import asyncio
+import logging
+import ssl
+
+from .iec61850_data import (
+    DataAccessError, dataset_address, mms_address, reference_from_mms,
+)
+from .mms_ber import (
+    BERError, TAG_EXTERNAL, TAG_SEQUENCE, TAG_SET, TAG_VISIBLE_STRING,
+    child_map, children, decode_data_list, decode_integer, decode_string, decode_unsigned,
+    encode_data, encode_integer, encode_integer_content, encode_oid, encode_oid_content, read_tlv, tlv,
+)
+
+TPKT_VERSION = 3
+TPKT_HEADER_SIZE = 4
+
+COTP_CR = 0xE0
+COTP_CC = 0xD0
+COTP_DR = 0x80
+COTP_DT = 0xF0
+COTP_EOT = 0x80
+COTP_TPDU_SIZE_CODES = {0x07: 128, 0x08: 256, 0x09: 512, 0x0A: 1024, 0x0B: 2048}
+
+SPDU_DATA = 0x01
+SPDU_FINISH = 0x09
+SPDU_DISCONNECT = 0x0A
+SPDU_REFUSE = 0x0C
+SPDU_CONNECT = 0x0D
+SPDU_ACCEPT = 0x0E
+SPDU_ABORT = 0x19
+SESSION_USER_DATA = 0xC1
+
+ACSE_OID = '2.2.1.0.1'
+BER_OID = '2.1.1'
+MMS_ABSTRACT_SYNTAX_OID = '1.0.9506.2.1'
+MMS_CONTEXT_OID = '1.0.9506.2.3'
+PASSWORD_MECHANISM_OID = '2.2.3.1'
+ACSE_CONTEXT = 1
+MMS_CONTEXT = 3
+
+# MMS PDUs
+MMS_CONFIRMED_REQUEST = 0xA0
+MMS_CONFIRMED_RESPONSE = 0xA1
+MMS_CONFIRMED_ERROR = 0xA2
+MMS_UNCONFIRMED = 0xA3
+MMS_REJECT = 0xA4
+MMS_INITIATE_REQUEST = 0xA8
+MMS_INITIATE_RESPONSE = 0xA9
+MMS_INITIATE_ERROR = 0xAA
+MMS_CONCLUDE_REQUEST = 0x8B
+MMS_CONCLUDE_RESPONSE = 0x8C
+
+# Confirmed services
+SERVICE_GET_NAME_LIST = 0xA1
+SERVICE_READ = 0xA4
+SERVICE_WRITE = 0xA5
+SERVICE_DEFINE_VARIABLE_LIST = 0xAB
+SERVICE_GET_VARIABLE_LIST = 0xAC
+
+# DataAccessError codes
+# GetNameList object classes
+CLASS_NAMED_VARIABLE = 0
+CLASS_NAMED_VARIABLE_LIST = 2
+CLASS_DOMAIN = 9
+
+# Names per GetNameList response of the stand-in server
+NAME_LIST_LIMIT = 100
+
+ACCESS_OBJECT_ACCESS_DENIED = 3
+ACCESS_TYPE_INCONSISTENT = 7
+ACCESS_OBJECT_NON_EXISTENT = 10
+
+REPORT_NAME = 'RPT'
+
+# Services supported (read, write, getNamedVariableListAttributes,
+# defineNamedVariableList, informationReport, ...) and parameter CBB
+SERVICES_SUPPORTED = bytes.fromhex('03ee1c00000408000079ef18')
+PARAMETER_CBB = bytes.fromhex('05f100')
+
+_SESSION_ITEMS = b'\x05\x06\x13\x01\x00\x16\x01\x02' + b'\x14\x02\x00\x02'
+_SESSION_DATA = b'\x01\x00\x01\x00'
+_CONTEXT_LIST = (
+    tlv(TAG_SEQUENCE, encode_integer(ACSE_CONTEXT) + encode_oid(ACSE_OID) + tlv(TAG_SEQUENCE, encode_oid(BER_OID)))
+    + tlv(TAG_SEQUENCE, encode_integer(MMS_CONTEXT) + encode_oid(MMS_ABSTRACT_SYNTAX_OID)
+          + tlv(TAG_SEQUENCE, encode_oid(BER_OID)))
+)
+_CONTEXT_RESULTS = tlv(TAG_SEQUENCE, b'\x80\x01\x00' + tlv(0x81, encode_oid_content(BER_OID))) * 2
+_PRESENTATION_SELECTOR = b'\x00\x00\x00\x01'
+_NORMAL_MODE = tlv(0xA0, b'\x80\x01\x01')
+
+
+class MMSError(Exception):
+    """An MMS service refused with a ServiceError or Reject"""
+
+    def __init__(self, message, error_class=None, code=None):
+        self.error_class = error_class
+        self.code = code
+        super().__init__(message)
+
+
+# Session, presentation and ACSE encoding
+
+def _session_parameter(code, value):
+    if len(value) < 255:
+        return bytes((code, len(value))) + value
+    return bytes((code, 0xFF)) + len(value).to_bytes(2, 'big') + value
+
+
+def _iter_session_parameters(data, offset, end):
+    while offset + 2 <= end:
+        code = data[offset]
+        length = data[offset + 1]
+        offset += 2
+        if length == 0xFF:
+            length = int.from_bytes(data[offset:offset + 2], 'big')
+            offset += 2
+        yield code, offset, offset + length
+        offset += length
+
+
+def _session_user_data(data):
+    """Locate the user data of a CONNECT/ACCEPT SPDU"""
+    _, start, end = next(_iter_session_parameters(data, 0, len(data)))
+    for code, value_start, value_end in _iter_session_parameters(data, start, end):
+        if code == SESSION_USER_DATA:
+            return value_start, value_end
+    raise BERError("SPDU without user data")
+
+
+def _fully_encoded_data(context, pdu):
+    return tlv(0x61, tlv(TAG_SEQUENCE, encode_integer(context) + tlv(0xA0, pdu)))
+
+
+def _acse_external(pdu):
+    return tlv(0xBE, tlv(TAG_EXTERNAL, encode_oid(BER_OID) + encode_integer(MMS_CONTEXT) + tlv(0xA0, pdu)))
+
+
+def build_initiate(tag, max_outstanding=10, nesting=10, local_detail=65000):
+    """Initiate-Request (0xA8) or Initiate-Response (0xA9)"""
+    return tlv(tag, tlv(0x80, encode_integer_content(local_detail)) + tlv(0x81, encode_integer_content(max_outstanding))
+               + tlv(0x82, encode_integer_content(max_outstanding)) + tlv(0x83, encode_integer_content(nesting))
+               + tlv(0xA4, b'\x80\x01\x01' + tlv(0x81, PARAMETER_CBB) + tlv(0x82, SERVICES_SUPPORTED)))
+
+
+def build_aarq(initiate, mms_config=None, password=None):
+    mms_config = mms_config or {}
+    body = tlv(0xA1, encode_oid(MMS_CONTEXT_OID))
+    if mms_config.get("remote_ap_title"):
+        body += tlv(0xA2, encode_oid(mms_config["remote_ap_title"]))
+        body += tlv(0xA3, encode_integer(mms_config.get("remote_ae_qualifier", 3)))
+    if mms_config.get("local_ap_title"):
+        body += tlv(0xA6, encode_oid(mms_config["local_ap_title"]))
+        body += tlv(0xA7, encode_integer(mms_config.get("local_ae_qualifier", 3)))
+    if password:
+        body += tlv(0x8A, b'\x07\x80') + tlv(0x8B, encode_oid_content(PASSWORD_MECHANISM_OID))
+        body += tlv(0xAC, tlv(0x80, password.encode('utf-8')))
+    return tlv(0x60, body + _acse_external(initiate))
+
+
+def build_aare(initiate, result=0):
+    return tlv(0x61, tlv(0xA1, encode_oid(MMS_CONTEXT_OID)) + tlv(0xA2, encode_integer(result))
+               + tlv(0xA3, tlv(0xA1, encode_integer(0))) + (_acse_external(initiate) if initiate else b''))
+
+
+def build_connect(aarq):
+    cp = tlv(TAG_SET, _NORMAL_MODE + tlv(0xA2, tlv(0x81, _PRESENTATION_SELECTOR) + tlv(0x82, _PRESENTATION_SELECTOR)
+                                          + tlv(0xA4, _CONTEXT_LIST) + _fully_encoded_data(ACSE_CONTEXT, aarq)))
+    return _session_parameter(SPDU_CONNECT, _SESSION_ITEMS + b'\x33\x02\x00\x01\x34\x02\x00\x01'
+                              + _session_parameter(SESSION_USER_DATA, cp))
+
+
+def build_accept(aare):
+    cpa = tlv(TAG_SET, _NORMAL_MODE + tlv(0xA2, tlv(0x83, _PRESENTATION_SELECTOR) + tlv(0xA5, _CONTEXT_RESULTS)
+                                           + _fully_encoded_data(ACSE_CONTEXT, aare)))
+    return _session_parameter(SPDU_ACCEPT, _SESSION_ITEMS + _session_parameter(SESSION_USER_DATA, cpa))
+
+
+def _descend(data, start, end, path):
+    """Follow a path of tags through nested TLVs; returns the content range"""
+    for wanted in path:
+        for tag, content, stop in children(data, start, end):
+            if tag == wanted:
+                start, end = content, stop
+                break
+        else:
+            raise BERError(f"Missing element 0x{wanted:02X}")
+    return start, end
+
+
+def _association_pdus(data):
+    """
+    Unwrap CP/CPA user data: returns the ACSE PDU tag, the ACSE content range
+    and the MMS PDU range inside its user information
+    """
+    start, end = _session_user_data(data)
+    start, end = _descend(data, start, end, (TAG_SET, 0xA2, 0x61, TAG_SEQUENCE, 0xA0))
+    acse_tag, acse_start, acse_end = read_tlv(data, start, end)
+    mms_start, mms_end = _descend(data, acse_start, acse_end, (0xBE, TAG_EXTERNAL, 0xA0))
+    return acse_tag, acse_start, acse_end, mms_start, mms_end
+
+
+# MMS encoding
+
+def _object_name(domain, item):
+    return tlv(0xA1, tlv(TAG_VISIBLE_STRING, domain.encode()) + tlv(TAG_VISIBLE_STRING, item.encode()))
+
+
+def _variable_list(addresses, tag=0xA0):
+    return tlv(tag, b''.join(tlv(TAG_SEQUENCE, tlv(0xA0, _object_name(domain, item))) for domain, item in addresses))
+
+
+def _confirmed_request(invoke_id, service):
+    return tlv(MMS_CONFIRMED_REQUEST, encode_integer(invoke_id) + service)
+
+
+def _confirmed_response(invoke_id, service):
+    return tlv(MMS_CONFIRMED_RESPONSE, encode_integer(invoke_id) + service)
+
+
+def information_report(values, name=REPORT_NAME):
+    """Unconfirmed InformationReport PDU for a named variable list"""
+    return tlv(MMS_UNCONFIRMED, tlv(0xA0, tlv(0xA1, tlv(0x80, name.encode()))
+                                    + tlv(0xA0, b''.join(encode_data(value) for value in values))))
+
+
+def _decode_object_name(data, start, end):
+    tag, content, stop = read_tlv(data, start, end)
+    if tag == 0xA1:
+        (_, d0, d1), (_, i0, i1) = list(children(data, content, stop))[:2]
+        return decode_string(data, d0, d1), decode_string(data, i0, i1)
+    return None, decode_string(data, content, stop)
+
+
+def _decode_variable_list(data, start, end):
+    """Object names of a listOfVariable: [(domain, item), ...]"""
+    names = []
+    for _, content, stop in children(data, start, end):
+        spec_start, spec_end = _descend(data, content, stop, (0xA0,))
+        names.append(_decode_object_name(data, spec_start, spec_end))
+    return names
+
+
+def _service_error(data, start, end):
+    for tag, content, stop in children(data, start, end):
+        if tag == 0xA2:
+            error_class, (code_start, code_end) = 0, (content, content)
+            for inner_tag, inner_start, inner_end in children(data, content, stop):
+                if inner_tag == 0xA0:
+                    class_tag, code_start, code_end = read_tlv(data, inner_start, inner_end)
+                    error_class = class_tag & 0x1F
+            code = decode_unsigned(data, code_start, code_end) if code_end > code_start else 0
+            return MMSError(f"MMS service error class {error_class} code {code}", error_class, code)
+    return MMSError("MMS service error")
+
+
+# Transport
+
+class _ISOConnection(asyncio.Protocol):
+    """
+    TPKT/COTP class 0 transport with session data transfer
+
+    Single-segment TSDUs are handed to `spdu_received()` as a memoryview of
+    the receive buffer, valid only during the call.
+    """
+
+    def __init__(self, tpdu_size=2048):
+        self.logger = logging.getLogger('SCADA_Gateway.IEC61850')
+        self.transport = None
+        self.buffer = bytearray()
+        self.segments = []
+        self.tpdu_size = tpdu_size
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def data_received(self, data):
+        buffer = self.buffer
+        buffer += data
+        size = len(buffer)
+        offset = 0
+        view = memoryview(buffer)
+        try:
+            while size - offset >= TPKT_HEADER_SIZE:
+                if buffer[offset] != TPKT_VERSION:
+                    self.logger.error("TPKT framing error, closing connection")
+                    self.abort()
+                    return
+                end = offset + ((buffer[offset + 2] << 8) | buffer[offset + 3])
+                if end > size:
+                    break
+                if end - offset < TPKT_HEADER_SIZE + 2:
+                    self.logger.error("Invalid TPKT length, closing connection")
+                    self.abort()
+                    return
+                try:
+                    self._tpdu_received(view[offset + TPKT_HEADER_SIZE:end])
+                except (BERError, IndexError, ValueError) as e:
+                    self.logger.error(f"Malformed MMS message: {str(e)}")
+                offset = end
+        finally:
+            view.release()
+        if offset:
+            del buffer[:offset]
+
+    def _tpdu_received(self, tpdu):
+        header_length = tpdu[0]
+        code = tpdu[1] & 0xF0
+        if code == COTP_DT:
+            user_data = tpdu[header_length + 1:]
+            if not tpdu[2] & COTP_EOT:
+                self.segments.append(bytes(user_data))
+            elif self.segments:
+                self.segments.append(bytes(user_data))
+                data, self.segments = b''.join(self.segments), []
+                self.spdu_received(memoryview(data))
+            else:
+                self.spdu_received(user_data)
+        elif code == COTP_CR:
+            self.cotp_connect_request(tpdu, header_length)
+        elif code == COTP_CC:
+            self.cotp_connected(tpdu, header_length)
+        elif code == COTP_DR:
+            self.abort()
+
+    def _tpdu_size(self, tpdu, header_length):
+        for code, start, end in _iter_session_parameters(tpdu, 7, header_length + 1):
+            if code == 0xC0 and end > start:
+                return COTP_TPDU_SIZE_CODES.get(tpdu[start], 128)
+        return 128
+
+    def send_cotp(self, code, parameters=b''):
+        header = bytes((6 + len(parameters), code, 0, 0, 0, 1, 0)) + parameters
+        self._write(bytes((TPKT_VERSION, 0)) + (len(header) + TPKT_HEADER_SIZE).to_bytes(2, 'big') + header)
+
+    def send_spdu(self, payload):
+        """Send one TSDU, segmented into DT TPDUs, in a single write"""
+        chunk = self.tpdu_size - 3
+        out = bytearray()
+        count = len(payload)
+        for start in range(0, max(count, 1), chunk):
+            segment = payload[start:start + chunk]
+            last = start + chunk >= count
+            out += bytes((TPKT_VERSION, 0)) + (len(segment) + 7).to_bytes(2, 'big')
+            out += bytes((2, COTP_DT, COTP_EOT if last else 0))
+            out += segment
+        self._write(bytes(out))
+
+    def send_mms(self, pdu):
+        self.send_spdu(_SESSION_DATA + _fully_encoded_data(MMS_CONTEXT, pdu))
+
+    def spdu_received(self, data):
+        spdu_type = data[0]
+        if spdu_type == SPDU_DATA:
+            # Give tokens + data transfer, then P-DATA fully encoded data
+            offset = 2 + data[1]
+            offset += 2 + data[offset + 1]
+            _, start, end = read_tlv(data, offset)
+            _, start, end = read_tlv(data, start, end)
+            for tag, content, stop in children(data, start, end):
+                if tag == 0xA0:
+                    pdu_tag, pdu_start, pdu_end = read_tlv(data, content, stop)
+                    self.mms_received(pdu_tag, data, pdu_start, pdu_end)
+        elif spdu_type in (SPDU_ABORT, SPDU_FINISH, SPDU_DISCONNECT, SPDU_REFUSE):
+            self.session_closed(spdu_type)
+        else:
+            self.session_received(spdu_type, data)
+
+    def _write(self, data):
+        if self.transport is not None:
+            self.transport.write(data)
+
+    def abort(self):
+        """Close the transport without concluding the association"""
+        if self.transport is not None:
+            self.transport.close()
+
+    # Hooks
+
+    def cotp_connect_request(self, tpdu, header_length):
+        self.abort()
+
+    def cotp_connected(self, tpdu, header_length):
+        pass
+
+    def session_received(self, spdu_type, data):
+        pass
+
+    def session_closed(self, spdu_type):
+        self.abort()
+
+    def mms_received(self, tag, data, start, end):
+        self.logger.debug("Dropping MMS PDU with tag 0x%02X", tag)
+
+
+# Client
+
+class MMSClient(_ISOConnection):
+    """
+    One MMS association with an IEC 61850 server
+
+    Requests are pipelined up to the negotiated number of outstanding
+    services; responses are decoded inside the receive callback and handed
+    to the waiting coroutine as Python values.
+    """
+
+    def __init__(self, config=None, timeout=10.0):
+        super().__init__()
+        self.config = config or {}
+        self.timeout = timeout
+        self.associated = asyncio.get_running_loop().create_future()
+        self.pending = {}
+        self.invoke_id = 0
+        self.max_outstanding = 10
+        self.slots = None
+        self.on_report = None
+        self.reports_received = 0
+
+    @classmethod
+    async def open(cls, host, port=102, config=None, timeout=10.0, ssl_context=None):
+        """Connect and associate; returns the client"""
+        loop = asyncio.get_running_loop()
+        _, client = await asyncio.wait_for(
+            loop.create_connection(lambda: cls(config, timeout), host, port, ssl=ssl_context), timeout
+        )
+        try:
+            await asyncio.wait_for(asyncio.shield(client.associated), timeout)
+        except Exception:
+            client.abort()
+            raise
+        return client
+
+    @classmethod
+    async def from_config(cls, config):
+        """client_factory for IEC61850Handler: uses host, port, tls and authentication"""
+        tls = config.get("tls", {})
+        ssl_context = None
+        if tls.get("enabled"):
+            ssl_context = ssl.create_default_context(cafile=tls.get("ca_path") or None)
+            if tls.get("certificate_path"):
+                ssl_context.load_cert_chain(tls["certificate_path"], tls.get("private_key_path") or None)
+        return await cls.open(config["host"], config.get("port", 102), config,
+                              config.get("timeout_ms", 10000) / 1000.0, ssl_context)
+
+    # Association
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        self.send_cotp(COTP_CR, b'\xC0\x01\x0B\xC1\x02\x00\x01\xC2\x02\x00\x01')
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        error = ConnectionError("MMS connection lost")
+        if not self.associated.done():
+            self.associated.set_exception(error)
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+    def cotp_connected(self, tpdu, header_length):
+        self.tpdu_size = min(self.tpdu_size, self._tpdu_size(tpdu, header_length))
+        initiate = build_initiate(MMS_INITIATE_REQUEST, self.max_outstanding)
+        password = self.config.get("authentication", {}).get("password")
+        self.send_spdu(build_connect(build_aarq(initiate, self.config.get("mms"), password)))
+
+    def session_received(self, spdu_type, data):
+        if spdu_type != SPDU_ACCEPT or self.associated.done():
+            return
+        try:
+            _, acse_start, acse_end, mms_start, mms_end = _association_pdus(data)
+            result_start, result_end = _descend(data, acse_start, acse_end, (0xA2, 0x02))
+            if decode_integer(data, result_start, result_end) != 0:
+                raise ConnectionError("Association rejected by server")
+            tag, start, end = read_tlv(data, mms_start, mms_end)
+            if tag != MMS_INITIATE_RESPONSE:
+                raise ConnectionError("MMS initiate refused")
+            fields = child_map(data, start, end)
+            if 0x81 in fields:
+                self.max_outstanding = max(1, decode_unsigned(data, *fields[0x81]))
+        except (BERError, ConnectionError) as e:
+            self.associated.set_exception(ConnectionError(str(e)))
+            self.abort()
+            return
+        self.slots = asyncio.Semaphore(self.max_outstanding)
+        self.associated.set_result(True)
+
+    def session_closed(self, spdu_type):
+        if not self.associated.done():
+            self.associated.set_exception(ConnectionError("Association refused or aborted"))
+        self.abort()
+
+    # Services
+
+    async def _request(self, service, decoder):
+        if self.transport is None:
+            raise ConnectionError("MMS connection closed")
+        async with self.slots:
+            self.invoke_id = (self.invoke_id + 1) & 0x7FFFFFFF
+            invoke_id = self.invoke_id
+            future = asyncio.get_running_loop().create_future()
+            self.pending[invoke_id] = (future, decoder)
+            try:
+                self.send_mms(_confirmed_request(invoke_id, service))
+                return await asyncio.wait_for(future, self.timeout)
+            finally:
+                self.pending.pop(invoke_id, None)
+
+    async def get_name_list(self, object_class, domain=None):
+        """
+        Names of an object class (CLASS_*) in a domain, or of the server
+        without one, in as many requests as the server needs to send them
+        """
+        scope = tlv(0x81, domain.encode()) if domain is not None else b'\x80\x00'
+        request = tlv(0xA0, tlv(0x80, encode_integer_content(object_class))) + tlv(0xA1, scope)
+        names = []
+        while True:
+            # Continue after the last name received
+            after = tlv(0x82, names[-1].encode()) if names else b''
+            part, more = await self._request(tlv(SERVICE_GET_NAME_LIST, request + after), _name_list_result)
+            names.extend(part)
+            if not more or not part:
+                return names
+
+    async def read(self, references):
+        """Read variables; returns values or DataAccessError per reference"""
+        addresses = [mms_address(reference) for reference in references]
+        values = await self._request(tlv(SERVICE_READ, tlv(0xA1, _variable_list(addresses))), _read_result)
+        for reference, value in zip(references, values):
+            if isinstance(value, DataAccessError):
+                value.reference = reference
+        return values
+
+    async def read_dataset(self, reference):
+        """Read all members of a named variable list in one request"""
+        name = tlv(0xA1, _object_name(*dataset_address(reference)))
+        return await self._request(tlv(SERVICE_READ, tlv(0xA1, name)), _read_result)
+
+    async def read_dataset_directory(self, reference):
+        """Member references of a named variable list, with FC"""
+        return await self._request(tlv(SERVICE_GET_VARIABLE_LIST, _object_name(*dataset_address(reference))),
+                                   _directory_result)
+
+    async def define_dataset(self, reference, members):
+        service = tlv(SERVICE_DEFINE_VARIABLE_LIST, _object_name(*dataset_address(reference))
+                      + _variable_list([mms_address(member) for member in members]))
+        await self._request(service, None)
+
+    async def write(self, references, values):
+        """Write variables; returns True or DataAccessError per reference"""
+        addresses = [mms_address(reference) for reference in references]
+        service = tlv(SERVICE_WRITE, _variable_list(addresses)
+                      + tlv(0xA0, b''.join(encode_data(value) for value in values)))
+        results = await self._request(service, _write_result)
+        for reference, result in zip(references, results):
+            if isinstance(result, DataAccessError):
+                result.reference = reference
+        return results
+
+    async def close(self):
+        """Conclude the association and close the connection"""
+        if self.transport is None:
+            return
+        if self.associated.done() and not self.associated.exception():
+            future = asyncio.get_running_loop().create_future()
+            self.pending[0] = (future, None)
+            self.send_mms(bytes((MMS_CONCLUDE_REQUEST, 0)))
+            try:
+                await asyncio.wait_for(future, min(self.timeout, 2.0))
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+        self.abort()
+        await asyncio.shield(self.closed)
+
+    def mms_received(self, tag, data, start, end):
+        if tag == MMS_UNCONFIRMED:
+            self._unconfirmed(data, start, end)
+            return
+        if tag == MMS_CONCLUDE_RESPONSE:
+            entry = self.pending.pop(0, None)
+            if entry and not entry[0].done():
+                entry[0].set_result(None)
+            return
+        if tag not in (MMS_CONFIRMED_RESPONSE, MMS_CONFIRMED_ERROR, MMS_REJECT):
+            return
+        id_tag, id_start, id_end = read_tlv(data, start, end)
+        entry = self.pending.get(decode_unsigned(data, id_start, id_end))
+        if entry is None or entry[0].done():
+            return
+        future, decoder = entry
+        if tag == MMS_CONFIRMED_RESPONSE:
+            service_tag, service_start, service_end = read_tlv(data, id_end, end)
+            try:
+                future.set_result(decoder(data, service_start, service_end) if decoder else None)
+            except (BERError, IndexError, ValueError) as e:
+                future.set_exception(MMSError(f"Malformed response: {str(e)}"))
+        elif tag == MMS_CONFIRMED_ERROR:
+            future.set_exception(_service_error(data, start, end))
+        else:
+            future.set_exception(MMSError("Request rejected by server"))
+
+    def _unconfirmed(self, data, start, end):
+        _, report_start, report_end = read_tlv(data, start, end)
+        elements = list(children(data, report_start, report_end))
+        if len(elements) < 2:
+            return
+        spec_tag, spec_start, spec_end = elements[0]
+        if spec_tag == 0xA1:
+            _, name = _decode_object_name(data, spec_start, spec_end)
+            if name != REPORT_NAME:
+                return
+        _, values_start, values_end = elements[1]
+        values = decode_data_list(data, values_start, values_end)
+        self.reports_received += 1
+        if self.on_report is not None:
+            try:
+                self.on_report(values)
+            except Exception as e:
+                self.logger.error(f"Report callback error: {str(e)}")
+
+
+def _name_list_result(data, start, end):
+    names, more = [], True
+    for tag, content, stop in children(data, start, end):
+        if tag == 0xA0:
+            names = [decode_string(data, name_start, name_end)
+                     for _, name_start, name_end in children(data, content, stop)]
+        elif tag == 0x81:
+            more = stop > content and data[content] != 0
+    return names, more
+
+
+def _read_result(data, start, end):
+    for tag, content, stop in children(data, start, end):
+        if tag == 0xA1:
+            return decode_data_list(data, content, stop)
+    return []
+
+
+def _write_result(data, start, end):
+    return [DataAccessError(decode_unsigned(data, content, stop)) if tag == 0x80 else True
+            for tag, content, stop in children(data, start, end)]
+
+
+def _directory_result(data, start, end):
+    for tag, content, stop in children(data, start, end):
+        if tag == 0xA1:
+            return [reference_from_mms(domain, item) for domain, item in _decode_variable_list(data, content, stop)]
+    return []
+
+
+# Stand-in server
+
+class _MMSServerSession(_ISOConnection):
+    def __init__(self, server):
+        super().__init__()
+        self.server = server
+        self.associated = False
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        self.server.sessions.add(self)
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        self.server.sessions.discard(self)
+
+    def cotp_connect_request(self, tpdu, header_length):
+        self.tpdu_size = min(self.tpdu_size, self._tpdu_size(tpdu, header_length))
+        self.send_cotp(COTP_CC, b'\xC0\x01\x0B')
+
+    def session_received(self, spdu_type, data):
+        if spdu_type != SPDU_CONNECT:
+            return
+        acse_tag, acse_start, acse_end, mms_start, mms_end = _association_pdus(data)
+        accepted = acse_tag == 0x60 and read_tlv(data, mms_start, mms_end)[0] == MMS_INITIATE_REQUEST
+        if accepted and self.server.password is not None:
+            fields = child_map(data, acse_start, acse_end)
+            password = None
+            if 0xAC in fields:
+                _, pw_start, pw_end = read_tlv(data, *fields[0xAC])
+                password = decode_string(data, pw_start, pw_end)
+            accepted = password == self.server.password
+        if not accepted:
+            self.send_spdu(build_accept(build_aare(None, result=1)))
+            self.abort()
+            return
+        self.associated = True
+        self.send_spdu(build_accept(build_aare(build_initiate(MMS_INITIATE_RESPONSE, self.server.max_outstanding))))
+
+    def mms_received(self, tag, data, start, end):
+        if tag == MMS_CONCLUDE_REQUEST:
+            self.send_mms(bytes((MMS_CONCLUDE_RESPONSE, 0)))
+            return
+        if tag != MMS_CONFIRMED_REQUEST:
+            return
+        id_tag, id_start, id_end = read_tlv(data, start, end)
+        invoke_id = decode_unsigned(data, id_start, id_end)
+        service_tag, service_start, service_end = read_tlv(data, id_end, end)
+        server = self.server
+        if service_tag == SERVICE_READ:
+            spec_start, spec_end = _descend(data, service_start, service_end, (0xA1,))
+            spec_tag, list_start, list_end = read_tlv(data, spec_start, spec_end)
+            if spec_tag == 0xA0:
+                values = [server.read(name) for name in _decode_variable_list(data, list_start, list_end)]
+            else:
+                values = server.read_dataset(_decode_object_name(data, list_start, list_end))
+            if isinstance(values, DataAccessError):
+                values = [values]
+            response = tlv(SERVICE_READ, tlv(0xA1, b''.join(encode_data(value) for value in values)))
+        elif service_tag == SERVICE_WRITE:
+            elements = list(children(data, service_start, service_end))
+            names = _decode_variable_list(data, elements[0][1], elements[0][2])
+            values = decode_data_list(data, elements[1][1], elements[1][2])
+            results = [server.write(name, value) for name, value in zip(names, values)]
+            response = tlv(SERVICE_WRITE, b''.join(
+                b'\x81\x00' if result is True else tlv(0x80, encode_integer_content(result)) for result in results
+            ))
+        elif service_tag == SERVICE_GET_NAME_LIST:
+            fields = child_map(data, service_start, service_end)
+            _, class_start, class_end = read_tlv(data, *fields[0xA0])
+            scope_tag, scope_start, scope_end = read_tlv(data, *fields[0xA1])
+            names = server.name_list(decode_unsigned(data, class_start, class_end),
+                                     decode_string(data, scope_start, scope_end) if scope_tag == 0x81 else None)
+            if 0x82 in fields:
+                after = decode_string(data, *fields[0x82])
+                names = [name for name in names if name > after]
+            more = len(names) > NAME_LIST_LIMIT
+            response = tlv(SERVICE_GET_NAME_LIST, tlv(0xA0, b''.join(
+                tlv(TAG_VISIBLE_STRING, name.encode()) for name in names[:NAME_LIST_LIMIT]
+            )) + tlv(0x81, b'\xff' if more else b'\x00'))
+        elif service_tag == SERVICE_GET_VARIABLE_LIST:
+            name = _decode_object_name(data, service_start, service_end)
+            members = server.datasets.get(name)
+            if members is None:
+                self.send_mms(tlv(MMS_CONFIRMED_ERROR, tlv(0x80, encode_integer_content(invoke_id))
+                                  + tlv(0xA2, tlv(0xA0, b'\x87\x01\x02'))))
+                return
+            response = tlv(SERVICE_GET_VARIABLE_LIST, b'\x80\x01\x00' + _variable_list(members, 0xA1))
+        elif service_tag == SERVICE_DEFINE_VARIABLE_LIST:
+            elements = list(children(data, service_start, service_end))
+            name = _decode_object_name(data, service_start, service_end)
+            server.datasets[name] = _decode_variable_list(data, elements[1][1], elements[1][2])
+            response = bytes((0x8B, 0))
+        else:
+            self.send_mms(tlv(MMS_REJECT, tlv(0x80, encode_integer_content(invoke_id)) + b'\x81\x01\x01'))
+            return
+        self.send_mms(_confirmed_response(invoke_id, response))
+
+
+class MMSServer:
+    """
+    Minimal MMS server holding a flat variable table
+
+    Serves reads, writes and named variable lists and sends information
+    reports; it stands in for an IED in tests and simulations. Variables
+    are keyed by their MMS (domain, item) name.
+    """
+
+    def __init__(self, max_outstanding=10, password=None):
+        self.max_outstanding = max_outstanding
+        self.password = password
+        self.variables = {}
+        self.datasets = {}
+        self.sessions = set()
+        self.server = None
+        self.write_handler = None
+
+    async def start(self, host='127.0.0.1', port=102):
+        """Start listening; returns the bound port (useful with port 0)"""
+        self.server = await asyncio.get_running_loop().create_server(
+            lambda: _MMSServerSession(self), host, port
+        )
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for session in list(self.sessions):
+            session.abort()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def set_value(self, reference, value):
+        """Set a variable by object reference ('LD/LN.DO.DA[FC]')"""
+        self.variables[mms_address(reference)] = value
+
+    def add_dataset(self, reference, members):
+        self.datasets[dataset_address(reference)] = [mms_address(member) for member in members]
+
+    def name_list(self, object_class, domain=None):
+        """
+        Sorted names of an object class, as GetNameList reports them
+
+        Variables are listed with every component (LN, LN$FC, LN$FC$DO, ...)
+        as IEC 61850 servers do.
+        """
+        if object_class == CLASS_DOMAIN:
+            return sorted({name[0] for name in self.variables} | {name[0] for name in self.datasets})
+        if object_class == CLASS_NAMED_VARIABLE_LIST:
+            return sorted(item for name_domain, item in self.datasets if name_domain == domain)
+        if object_class != CLASS_NAMED_VARIABLE:
+            return []
+        names = set()
+        for name_domain, item in self.variables:
+            if name_domain == domain:
+                parts = item.split('$')
+                names.update('$'.join(parts[:count]) for count in range(1, len(parts) + 1))
+        return sorted(names)
+
+    def read(self, name):
+        value = self.variables.get(name)
+        return DataAccessError(ACCESS_OBJECT_NON_EXISTENT) if value is None else value
+
+    def read_dataset(self, name):
+        members = self.datasets.get(name)
+        if members is None:
+            return DataAccessError(ACCESS_OBJECT_NON_EXISTENT)
+        return [self.read(member) for member in members]
+
+    def write(self, name, value):
+        """Apply a write; returns True or a DataAccessError code"""
+        if self.write_handler is not None:
+            return self.write_handler(name, value)
+        if name not in self.variables:
+            return ACCESS_OBJECT_NON_EXISTENT
+        self.variables[name] = value
+        return True
+
+    def send_report(self, values):
+        """Send an 'RPT' information report to every associated client"""
+        pdu = information_report(values)
+        for session in self.sessions:
+            if session.associated:
+                session.send_mms(pdu)
@@ -0,0 +1,340 @@
+"""
+SCL (ICD/CID/SCD) importer for SCADA Data Gateway
+Builds the IEC 61850 model of every IED offline from a substation configuration file
+
+Files are read with iterparse and every element is discarded as soon as it
+ends, so memory stays flat however large the SCD is. Data type templates
+are expanded once per LN type; IEDs only keep their LN instances, which
+keeps the model compact enough to be cached as a small JSON index.
+"""
+
+import json
+import os
+import xml.etree.ElementTree as ET
+
+INDEX_VERSION = 1
+
+
+class SCLError(ValueError):
+    """Raised when an SCL file cannot be parsed"""
+
+
+def _local(tag):
+    return tag.rpartition('}')[2]
+
+
+class SCLModel:
+    """
+    Indexed IEC 61850 model of the IEDs of one SCL file
+
+    References use the logical device name (IED name + LD inst unless the
+    LDevice sets ldName), e.g. 'IED1LD0/XCBR1.Pos.stVal'.
+    """
+
+    def __init__(self):
+        # ied -> {ld name: {ln name: ln type id}}
+        self.ieds = {}
+        # ied -> IP address from the Communication section
+        self.addresses = {}
+        # ln type id -> [[data object, data attribute, fc, basic type], ...]
+        self.ln_types = {}
+        # ied -> {dataset reference: [member reference with [FC], ...]}
+        self.datasets = {}
+        # ied -> [{"reference", "dataset", "buffered", "rpt_id", "conf_rev"}, ...]
+        self.report_controls = {}
+
+    # Serialization
+
+    def to_dict(self):
+        return {
+            "version": INDEX_VERSION,
+            "ieds": self.ieds,
+            "addresses": self.addresses,
+            "ln_types": self.ln_types,
+            "datasets": self.datasets,
+            "report_controls": self.report_controls
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls()
+        model.ieds = data["ieds"]
+        model.addresses = data["addresses"]
+        model.ln_types = data["ln_types"]
+        model.datasets = data["datasets"]
+        model.report_controls = data["report_controls"]
+        return model
+
+    # Queries
+
+    def ied_names(self):
+        return list(self.ieds)
+
+    def _select(self, ied):
+        if ied is None:
+            return self.ieds.items()
+        if ied not in self.ieds:
+            raise KeyError(f"IED {ied} not in SCL model")
+        return [(ied, self.ieds[ied])]
+
+    def data_attributes(self, ied=None, logical_device=None, logical_node=None, fc=None):
+        """
+        Iterate over data attributes as tag dictionaries
+
+        Yields:
+            dict: logical_device, logical_node, data_object, data_attribute, fc, type
+        """
+        for _, devices in self._select(ied):
+            for ld_name, nodes in devices.items():
+                if logical_device is not None and ld_name != logical_device:
+                    continue
+                for ln_name, ln_type in nodes.items():
+                    if logical_node is not None and ln_name != logical_node:
+                        continue
+                    for do_name, da_name, da_fc, basic_type in self.ln_types.get(ln_type, ()):
+                        if fc is not None and da_fc != fc:
+                            continue
+                        yield {
+                            "logical_device": ld_name,
+                            "logical_node": ln_name,
+                            "data_object": do_name,
+                            "data_attribute": da_name,
+                            "fc": da_fc,
+                            "type": basic_type
+                        }
+
+    def member_attributes(self, ied, reference, fc):
+        """Top level attribute names of a data object under one FC, in type order"""
+        ld_name, _, rest = reference.partition('/')
+        ln_name, _, do_name = rest.partition('.')
+        ln_type = self.ieds.get(ied, {}).get(ld_name, {}).get(ln_name)
+        names = []
+        for type_do, da_name, da_fc, _ in self.ln_types.get(ln_type, ()):
+            if type_do == do_name and da_fc == fc:
+                name = da_name.split('.', 1)[0]
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def dataset_definitions(self, ied):
+        """
+        Datasets of an IED in the format of the handler's 'datasets' config,
+        with data object members expanded to their attribute names
+        """
+        definitions = []
+        for reference, members in self.datasets.get(ied, {}).items():
+            entries = []
+            for member in members:
+                base, _, fc = member[:-1].partition('[')
+                attributes = self.member_attributes(ied, base, fc) if base.count('.') == 1 else []
+                entries.append({"reference": member, "attributes": attributes} if attributes else member)
+            definitions.append({"reference": reference, "members": entries})
+        return definitions
+
+    def server_model(self, ied=None):
+        """Model summary in the shape returned by IEC61850Handler.get_server_model"""
+        model = {
+            "logical_devices": [],
+            "logical_nodes": [],
+            "data_objects": [],
+            "data_attributes": [],
+            "datasets": [],
+            "report_control_blocks": []
+        }
+        seen_objects = set()
+        for ied_name, devices in self._select(ied):
+            for ld_name, nodes in devices.items():
+                model["logical_devices"].append(ld_name)
+                for ln_name in nodes:
+                    model["logical_nodes"].append(f"{ld_name}/{ln_name}")
+            for tag in self.data_attributes(ied_name):
+                object_ref = f"{tag['logical_device']}/{tag['logical_node']}.{tag['data_object']}"
+                if object_ref not in seen_objects:
+                    seen_objects.add(object_ref)
+                    model["data_objects"].append(object_ref)
+                model["data_attributes"].append(tag)
+            model["datasets"].extend(self.dataset_definitions(ied_name))
+            model["report_control_blocks"].extend(self.report_controls.get(ied_name, []))
+        return model
+
+
+class _TypeTemplates:
+    """DataTypeTemplates as collected during parsing, expanded afterwards"""
+
+    def __init__(self):
+        self.ln_types = {}   # id -> [(do name, do type)]
+        self.do_types = {}   # id -> [(name, is_sdo, fc, basic type, type)]
+        self.da_types = {}   # id -> [(name, basic type, type)]
+
+    def expand(self, used):
+        expanded = {}
+        for ln_type in used:
+            attributes = []
+            for do_name, do_type in self.ln_types.get(ln_type, ()):
+                self._expand_do(attributes, do_name, do_type, 0)
+            expanded[ln_type] = attributes
+        return expanded
+
+    def _expand_do(self, out, do_name, do_type, depth):
+        if depth > 8:
+            raise SCLError(f"Recursive DOType {do_type}")
+        for name, is_sdo, fc, basic_type, type_id in self.do_types.get(do_type, ()):
+            if is_sdo:
+                self._expand_do(out, f"{do_name}.{name}", type_id, depth + 1)
+            elif basic_type == 'Struct':
+                self._expand_da(out, do_name, name, fc, type_id, depth + 1)
+            else:
+                out.append([do_name, name, fc, basic_type])
+
+    def _expand_da(self, out, do_name, da_name, fc, da_type, depth):
+        if depth > 16:
+            raise SCLError(f"Recursive DAType {da_type}")
+        for name, basic_type, type_id in self.da_types.get(da_type, ()):
+            if basic_type == 'Struct':
+                self._expand_da(out, do_name, f"{da_name}.{name}", fc, type_id, depth + 1)
+            else:
+                out.append([do_name, f"{da_name}.{name}", fc, basic_type])
+
+
+def parse_scl(source):
+    """
+    Parse an SCL file incrementally
+
+    Args:
+        source (str or file): Path or binary file object
+
+    Returns:
+        SCLModel
+    """
+    model = SCLModel()
+    templates = _TypeTemplates()
+    used_types = set()
+    stack = []
+    ied = ld_name = ld_inst = ln_name = None
+    dataset = None
+    template = None
+    connected_ied = None
+    address_type = None
+
+    try:
+        for event, element in ET.iterparse(source, events=('start', 'end')):
+            tag = _local(element.tag)
+            if event == 'end':
+                stack.pop()
+                if tag == 'IED':
+                    ied = None
+                elif tag == 'LDevice':
+                    ld_name = None
+                elif tag in ('LN', 'LN0'):
+                    ln_name = None
+                elif tag == 'DataSet':
+                    dataset = None
+                elif tag in ('LNodeType', 'DOType', 'DAType'):
+                    template = None
+                elif tag == 'P' and address_type == 'IP' and connected_ied and element.text:
+                    model.addresses.setdefault(connected_ied, element.text.strip())
+                elif tag == 'ConnectedAP':
+                    connected_ied = None
+                # Attributes were taken at the start event; drop the subtree
+                element.clear()
+                if stack:
+                    stack[-1].clear()
+                continue
+
+            stack.append(element)
+            attrib = element.attrib
+            if tag == 'IED':
+                ied = attrib.get('name')
+                model.ieds.setdefault(ied, {})
+            elif tag == 'LDevice' and ied:
+                ld_inst = attrib.get('inst', '')
+                ld_name = attrib.get('ldName') or f"{ied}{ld_inst}"
+                model.ieds[ied].setdefault(ld_name, {})
+            elif tag in ('LN', 'LN0') and ld_name:
+                if tag == 'LN0':
+                    ln_name = 'LLN0'
+                else:
+                    ln_name = f"{attrib.get('prefix', '')}{attrib.get('lnClass', '')}{attrib.get('inst', '')}"
+                ln_type = attrib.get('lnType')
+                model.ieds[ied][ld_name][ln_name] = ln_type
+                used_types.add(ln_type)
+            elif tag == 'DataSet' and ln_name:
+                dataset = f"{ld_name}/{ln_name}.{attrib.get('name')}"
+                model.datasets.setdefault(ied, {})[dataset] = []
+            elif tag == 'FCDA' and dataset:
+                member_ld = attrib.get('ldInst')
+                member_ld = f"{ied}{member_ld}" if member_ld is not None else ld_name
+                member_ln = f"{attrib.get('prefix', '')}{attrib.get('lnClass', '')}{attrib.get('lnInst', '')}"
+                reference = f"{member_ld}/{member_ln}.{attrib.get('doName')}"
+                if attrib.get('daName'):
+                    reference += f".{attrib['daName']}"
+                model.datasets[ied][dataset].append(f"{reference}[{attrib.get('fc')}]")
+            elif tag == 'ReportControl' and ln_name:
+                buffered = attrib.get('buffered', 'false') == 'true'
+                name = attrib.get('name')
+                if attrib.get('indexed', 'true') == 'true':
+                    name += '01'
+                model.report_controls.setdefault(ied, []).append({
+                    "reference": f"{ld_name}/{ln_name}.{'BR' if buffered else 'RP'}.{name}",
+                    "dataset": f"{ld_name}/{ln_name}.{attrib['datSet']}" if attrib.get('datSet') else None,
+                    "buffered": buffered,
+                    "rpt_id": attrib.get('rptID'),
+                    "conf_rev": int(attrib.get('confRev', 0))
+                })
+            elif tag == 'LNodeType':
+                template = templates.ln_types.setdefault(attrib.get('id'), [])
+            elif tag == 'DOType':
+                template = templates.do_types.setdefault(attrib.get('id'), [])
+            elif tag == 'DAType':
+                template = templates.da_types.setdefault(attrib.get('id'), [])
+            elif template is not None and tag == 'DO':
+                template.append((attrib.get('name'), attrib.get('type')))
+            elif template is not None and tag in ('DA', 'SDO'):
+                template.append((attrib.get('name'), tag == 'SDO', attrib.get('fc'),
+                                 attrib.get('bType'), attrib.get('type')))
+            elif template is not None and tag == 'BDA':
+                template.append((attrib.get('name'), attrib.get('bType'), attrib.get('type')))
+            elif tag == 'ConnectedAP':
+                connected_ied = attrib.get('iedName')
+            elif tag == 'Address':
+                address_type = None
+            elif tag == 'P':
+                address_type = attrib.get('type')
+    except ET.ParseError as e:
+        raise SCLError(f"Invalid SCL file: {str(e)}")
+
+    model.ln_types = templates.expand(used_types - {None})
+    return model
+
+
+def load_scl(path, index_path=None):
+    """
+    Load an SCL model, reusing the on-disk index when it is still current
+
+    Args:
+        path (str): SCL file
+        index_path (str): Index file, '<path>.idx.json' by default
+
+    Returns:
+        SCLModel
+    """
+    index_path = index_path or f"{path}.idx.json"
+    stat = os.stat(path)
+    key = [stat.st_size, stat.st_mtime_ns]
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") == INDEX_VERSION and data.get("source") == key:
+            return SCLModel.from_dict(data)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    model = parse_scl(path)
+    data = model.to_dict()
+    data["source"] = key
+    try:
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+    except OSError:
+        pass
+    return model
@@ -0,0 +1,268 @@
+"""
+BER encoding and MMS Data values for SCADA Data Gateway
+
+Decoding works on offsets into a bytes-like object (usually a memoryview of
+the receive buffer) instead of slicing, and the common MMS Data types with
+short-form lengths are decoded inline without going through the generic
+TLV reader.
+"""
+
+import struct
+
+from .iec61850_data import (
+    BitString, DataAccessError, Unsigned, UtcTime,
+    binary_time_to_epoch, epoch_to_utc_time, utc_time_to_epoch,
+)
+
+# MMS Data tags (context specific)
+DATA_ARRAY = 0xA1
+DATA_STRUCTURE = 0xA2
+DATA_BOOLEAN = 0x83
+DATA_BIT_STRING = 0x84
+DATA_INTEGER = 0x85
+DATA_UNSIGNED = 0x86
+DATA_FLOAT = 0x87
+DATA_OCTET_STRING = 0x89
+DATA_VISIBLE_STRING = 0x8A
+DATA_BINARY_TIME = 0x8C
+DATA_MMS_STRING = 0x90
+DATA_UTC_TIME = 0x91
+ACCESS_FAILURE = 0x80
+
+TAG_INTEGER = 0x02
+TAG_BIT_STRING = 0x03
+TAG_OID = 0x06
+TAG_EXTERNAL = 0x28
+TAG_SEQUENCE = 0x30
+TAG_SET = 0x31
+TAG_VISIBLE_STRING = 0x1A
+
+_FLOAT = struct.Struct('>f')
+_DOUBLE = struct.Struct('>d')
+
+
+class BERError(ValueError):
+    """Raised on malformed or truncated BER data"""
+
+
+# Decoding
+
+def read_tlv(data, offset, limit=None):
+    """
+    Read one TLV header
+
+    Returns:
+        tuple: (tag, content start, content end)
+    """
+    limit = len(data) if limit is None else limit
+    if offset + 2 > limit:
+        raise BERError("Truncated TLV")
+    tag = data[offset]
+    offset += 1
+    if tag & 0x1F == 0x1F:
+        # High tag number form: fold the continuation octets into the tag
+        while True:
+            if offset >= limit:
+                raise BERError("Truncated tag")
+            octet = data[offset]
+            offset += 1
+            tag = (tag << 8) | octet
+            if not octet & 0x80:
+                break
+    length = data[offset]
+    offset += 1
+    if length & 0x80:
+        count = length & 0x7F
+        if count == 0 or count > 4:
+            raise BERError("Unsupported length form")
+        if offset + count > limit:
+            raise BERError("Truncated length")
+        length = int.from_bytes(data[offset:offset + count], 'big')
+        offset += count
+    end = offset + length
+    if end > limit:
+        raise BERError("Truncated content")
+    return tag, offset, end
+
+
+def children(data, start, end):
+    """Iterate over (tag, content start, content end) of the TLVs in a range"""
+    while start < end:
+        tag, content, stop = read_tlv(data, start, end)
+        yield tag, content, stop
+        start = stop
+
+
+def child_map(data, start, end):
+    """First TLV per tag in a range: {tag: (content start, content end)}"""
+    found = {}
+    for tag, content, stop in children(data, start, end):
+        found.setdefault(tag, (content, stop))
+    return found
+
+
+def decode_unsigned(data, start, end):
+    return int.from_bytes(data[start:end], 'big')
+
+
+def decode_integer(data, start, end):
+    return int.from_bytes(data[start:end], 'big', signed=True)
+
+
+def decode_string(data, start, end):
+    return bytes(data[start:end]).decode('utf-8', 'replace')
+
+
+def decode_oid(data, start, end):
+    octets = bytes(data[start:end])
+    if not octets:
+        return ''
+    parts = [min(octets[0] // 40, 2)]
+    parts.append(octets[0] - parts[0] * 40)
+    value = 0
+    for octet in octets[1:]:
+        value = (value << 7) | (octet & 0x7F)
+        if not octet & 0x80:
+            parts.append(value)
+            value = 0
+    return '.'.join(str(part) for part in parts)
+
+
+def decode_data(data, offset, limit):
+    """
+    Decode one MMS Data (or AccessResult) value
+
+    Returns:
+        tuple: (value, offset after the value); failures are DataAccessError
+    """
+    tag = data[offset]
+    length = data[offset + 1]
+    if length < 0x80 and tag & 0x1F != 0x1F:
+        start = offset + 2
+        end = start + length
+        if end > limit:
+            raise BERError("Truncated data")
+    else:
+        tag, start, end = read_tlv(data, offset, limit)
+
+    # Most frequent types first
+    if tag == DATA_FLOAT:
+        if data[start] == 8 and end - start == 5:
+            return _FLOAT.unpack_from(data, start + 1)[0], end
+        if end - start == 9:
+            return _DOUBLE.unpack_from(data, start + 1)[0], end
+        raise BERError("Unsupported floating point format")
+    if tag == DATA_BOOLEAN:
+        return data[start] != 0, end
+    if tag == DATA_BIT_STRING:
+        return BitString(data[start + 1:end], (end - start - 1) * 8 - data[start]), end
+    if tag == DATA_INTEGER:
+        return int.from_bytes(data[start:end], 'big', signed=True), end
+    if tag == DATA_UNSIGNED:
+        return int.from_bytes(data[start:end], 'big'), end
+    if tag == DATA_UTC_TIME:
+        return utc_time_to_epoch(data[start:end]), end
+    if tag == DATA_STRUCTURE or tag == DATA_ARRAY:
+        items = []
+        position = start
+        while position < end:
+            item, position = decode_data(data, position, end)
+            items.append(item)
+        return items, end
+    if tag == DATA_VISIBLE_STRING or tag == DATA_MMS_STRING:
+        return decode_string(data, start, end), end
+    if tag == DATA_OCTET_STRING:
+        return bytes(data[start:end]), end
+    if tag == DATA_BINARY_TIME:
+        return binary_time_to_epoch(data[start:end]), end
+    if tag == ACCESS_FAILURE:
+        return DataAccessError(decode_unsigned(data, start, end)), end
+    raise BERError(f"Unsupported MMS data tag 0x{tag:02X}")
+
+
+def decode_data_list(data, start, end):
+    """Decode consecutive Data/AccessResult values"""
+    values = []
+    append = values.append
+    while start < end:
+        value, start = decode_data(data, start, end)
+        append(value)
+    return values
+
+
+# Encoding
+
+def encode_length(length):
+    if length < 0x80:
+        return bytes((length,))
+    octets = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes((0x80 | len(octets),)) + octets
+
+
+def tlv(tag, content=b''):
+    """Encode one TLV; tag may be a multi-octet value"""
+    if tag > 0xFF:
+        head = tag.to_bytes((tag.bit_length() + 7) // 8, 'big')
+    else:
+        head = bytes((tag,))
+    return head + encode_length(len(content)) + content
+
+
+def encode_integer_content(value):
+    return value.to_bytes(max(1, (value.bit_length() + 8) // 8), 'big', signed=True)
+
+
+def encode_unsigned_content(value):
+    # Leading zero octet when the top bit is set, as for a non-negative INTEGER
+    return value.to_bytes(value.bit_length() // 8 + 1, 'big')
+
+
+def encode_integer(value, tag=TAG_INTEGER):
+    return tlv(tag, encode_integer_content(value))
+
+
+def encode_oid_content(oid):
+    parts = [int(part) for part in oid.split('.')]
+    octets = bytearray((parts[0] * 40 + parts[1],))
+    for part in parts[2:]:
+        chunk = [part & 0x7F]
+        part >>= 7
+        while part:
+            chunk.append(0x80 | (part & 0x7F))
+            part >>= 7
+        octets.extend(reversed(chunk))
+    return bytes(octets)
+
+
+def encode_oid(oid):
+    return tlv(TAG_OID, encode_oid_content(oid))
+
+
+def encode_bit_string_content(bits):
+    unused = (8 - bits.length % 8) % 8
+    return bytes((unused,)) + bits.data[:(bits.length + 7) // 8]
+
+
+def encode_data(value):
+    """Encode a Python value as MMS Data (see iec61850_data for type markers)"""
+    if isinstance(value, bool):
+        return bytes((DATA_BOOLEAN, 1, 0xFF if value else 0x00))
+    if isinstance(value, Unsigned):
+        return tlv(DATA_UNSIGNED, encode_unsigned_content(value))
+    if isinstance(value, int):
+        return tlv(DATA_INTEGER, encode_integer_content(value))
+    if isinstance(value, UtcTime):
+        return tlv(DATA_UTC_TIME, epoch_to_utc_time(value))
+    if isinstance(value, float):
+        return tlv(DATA_FLOAT, b'\x08' + _FLOAT.pack(value))
+    if isinstance(value, BitString):
+        return tlv(DATA_BIT_STRING, encode_bit_string_content(value))
+    if isinstance(value, str):
+        return tlv(DATA_VISIBLE_STRING, value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return tlv(DATA_OCTET_STRING, bytes(value))
+    if isinstance(value, DataAccessError):
+        return tlv(ACCESS_FAILURE, encode_unsigned_content(value.code))
+    if isinstance(value, (list, tuple)):
+        return tlv(DATA_STRUCTURE, b''.join(encode_data(item) for item in value))
+    raise TypeError(f"Cannot encode {type(value).__name__} as MMS data")
@@ -1,11 +1,22 @@
 from pymodbus.client import ModbusTcpClient
-from .base_handler import BaseProtocolHandler, ConnectionStatus
+from .base_handler import BaseProtocolHandler, ConnectionStatus, DataBatch, ERROR_READ_FAILED, QUALITY_GOOD, now_ms
 
 class ModbusHandler(BaseProtocolHandler):
     def __init__(self):
         super().__init__()
         self.client = None
 
+    def parse_tag(self, text):
+        """"holding:100" or "100" (a holding register), "holding:100:2" for two registers"""
+        kind, _, rest = text.strip().partition(':')
+        if not rest:
+            kind, rest = 'holding', kind
+        address, _, count = rest.partition(':')
+        try:
+            return {"type": kind, "address": int(address, 0), "count": int(count or 1)}
+        except ValueError:
+            raise ValueError(f"Invalid Modbus tag {text!r}: expected [type:]address[:count]") from None
+
     def get_config_template(self):
         return {
             "host": "",
@@ -36,6 +47,9 @@ class ModbusHandler(BaseProtocolHandler):
             await self.client.close()
         self.status = ConnectionStatus.DISCONNECTED
 
+    async def check_connection(self):
+        return self.status == ConnectionStatus.CONNECTED and self.client is not None and self.client.is_connected()
+
     async def read_data(self, tags):
         if not self.client or not self.client.is_connected():
             raise ConnectionError("Not connected")
@@ -51,6 +65,24 @@ class ModbusHandler(BaseProtocolHandler):
                 results.append(result.registers if not result.isError() else None)
         return results
 
+    async def read_batch(self, tags, batch=None):
+        if not self.client or not self.client.is_connected():
+            raise ConnectionError("Not connected")
+
+        batch = (batch or DataBatch()).reset(tags)
+        for index, tag in enumerate(tags):
+            if tag["type"] == "holding":
+                result = await self.client.read_holding_registers(
+                    tag["address"],
+                    tag["count"],
+                    slave=self.config["unit"]
+                )
+                if result.isError():
+                    batch.fail(index, ERROR_READ_FAILED, now_ms())
+                else:
+                    batch.set(index, result.registers, QUALITY_GOOD, now_ms())
+        return batch
+
     async def write_data(self, tags, values):
         if not self.client or not self.client.is_connected():
             raise ConnectionError("Not connected")
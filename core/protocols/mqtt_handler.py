@@ -1,3 +1,4 @@
+import asyncio
 import paho.mqtt.client as mqtt
 from .base_handler import BaseProtocolHandler, ConnectionStatus
 
@@ -7,6 +8,10 @@ class MQTTHandler(BaseProtocolHandler):
         self.client = None
         self.subscriptions = {}
 
+    def parse_tag(self, text):
+        """The topic"""
+        return {"topic": text}
+
     def get_config_template(self):
         return {
             "broker": "",
@@ -35,7 +40,10 @@ class MQTTHandler(BaseProtocolHandler):
             self.client.on_message = self._on_message
             self.client.on_disconnect = self._on_disconnect
 
-            self.client.connect(
+            # paho connects with a blocking socket (DNS, TCP and TLS handshake)
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                self.client.connect,
                 config["broker"],
                 config["port"],
                 config["keep_alive"]
@@ -49,7 +57,8 @@ class MQTTHandler(BaseProtocolHandler):
 
     async def disconnect(self):
         if self.client:
-            self.client.loop_stop()
+            # loop_stop joins the network thread
+            await asyncio.get_running_loop().run_in_executor(None, self.client.loop_stop)
             self.client.disconnect()
         self.status = ConnectionStatus.DISCONNECTED
 
@@ -0,0 +1,269 @@
+"""
+OPC DA address space index for SCADA Data Gateway
+Dot-separated tag names kept in a trie for browsing large servers
+
+Reaching a branch costs one dictionary lookup per level, and every node
+counts the tags below it, so paginated enumeration skips whole subtrees
+instead of walking past them. The index can be saved to disk and loaded
+on the next start instead of rebrowsing the server.
+"""
+
+import json
+import os
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+
+INDEX_VERSION = 1
+WILDCARDS = frozenset('*?[')
+
+
+class _Node:
+    __slots__ = ('children', 'leaf', 'count', 'names')
+
+    def __init__(self):
+        self.children = {}
+        self.leaf = False
+        self.count = 0      # tags in this subtree, this node included
+        self.names = None   # sorted child names, rebuilt after changes
+
+    def sorted_names(self):
+        if self.names is None:
+            self.names = sorted(self.children)
+        return self.names
+
+
+class TagIndex:
+    """
+    Hierarchical index of tag names
+
+    A name may be both a tag and a branch (e.g. 'Pump1' and 'Pump1.Speed').
+    Enumeration is in sorted order so offsets are stable between pages.
+    """
+
+    def __init__(self, separator='.'):
+        self.separator = separator
+        self.root = _Node()
+
+    def __len__(self):
+        return self.root.count
+
+    def __contains__(self, tag):
+        node = self._find(tag)
+        return node is not None and node.leaf
+
+    def _find(self, path):
+        node = self.root
+        if not path:
+            return node
+        for name in path.split(self.separator):
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def _join(self, path, name):
+        return f"{path}{self.separator}{name}" if path else name
+
+    # Updates
+
+    def add(self, tag):
+        """Add a tag; returns False if it was already indexed"""
+        node = self.root
+        path = [node]
+        for name in tag.split(self.separator):
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = _Node()
+                node.names = None
+            node = child
+            path.append(node)
+        if node.leaf:
+            return False
+        node.leaf = True
+        for step in path:
+            step.count += 1
+        return True
+
+    def update(self, tags):
+        """Add several tags; returns how many were new"""
+        add = self.add
+        return sum(1 for tag in tags if add(tag))
+
+    def remove(self, tag):
+        """Remove a tag and any branches left empty; returns False if not indexed"""
+        names = tag.split(self.separator)
+        path = [self.root]
+        for name in names:
+            node = path[-1].children.get(name)
+            if node is None:
+                return False
+            path.append(node)
+        if not path[-1].leaf:
+            return False
+        path[-1].leaf = False
+        for step in path:
+            step.count -= 1
+        for depth in range(len(names), 0, -1):
+            if path[depth].count:
+                break
+            parent = path[depth - 1]
+            del parent.children[names[depth - 1]]
+            parent.names = None
+        return True
+
+    def clear(self):
+        self.root = _Node()
+
+    # Browsing
+
+    def count(self, path=""):
+        """Number of tags at or below a path"""
+        node = self._find(path)
+        return node.count if node is not None else 0
+
+    def branches(self, path=""):
+        """Names of the child branches of a path"""
+        node = self._find(path)
+        if node is None:
+            return []
+        return [name for name in node.sorted_names() if node.children[name].children]
+
+    def leaves(self, path="", offset=0, limit=None):
+        """Fully qualified tags directly under a path, one page at a time"""
+        node = self._find(path)
+        if node is None:
+            return []
+        results = []
+        for name in node.sorted_names():
+            if not node.children[name].leaf:
+                continue
+            if offset:
+                offset -= 1
+                continue
+            if limit is not None and len(results) >= limit:
+                break
+            results.append(self._join(path, name))
+        return results
+
+    def browse(self, path="", offset=0, limit=None):
+        """Every tag at or below a path (flat browse), one page at a time"""
+        node = self._find(path)
+        if node is None:
+            return []
+        results = []
+        self._collect(node, path, offset, limit, results)
+        return results
+
+    def prefix(self, text, offset=0, limit=None):
+        """Every tag whose name starts with text, one page at a time"""
+        path, separator, partial = text.rpartition(self.separator)
+        if not separator:
+            path, partial = "", text
+        node = self._find(path)
+        if node is None:
+            return []
+        results = []
+        if not partial:
+            if separator:
+                # 'Area.' matches everything below Area but not Area itself
+                offset += node.leaf
+            self._collect(node, path, offset, limit, results)
+            return results
+        names = node.sorted_names()
+        for position in range(bisect_left(names, partial), len(names)):
+            name = names[position]
+            if not name.startswith(partial) or (limit is not None and len(results) >= limit):
+                break
+            child = node.children[name]
+            if offset >= child.count:
+                offset -= child.count
+                continue
+            self._collect(child, self._join(path, name), offset, limit, results)
+            offset = 0
+        return results
+
+    def _collect(self, node, path, offset, limit, results):
+        """Append the tags of a subtree, skipping offset tags without visiting them"""
+        if node.leaf:
+            if offset:
+                offset -= 1
+            elif limit is None or len(results) < limit:
+                results.append(path)
+        for name in node.sorted_names():
+            if limit is not None and len(results) >= limit:
+                return
+            child = node.children[name]
+            if offset >= child.count:
+                offset -= child.count
+                continue
+            self._collect(child, self._join(path, name), offset, limit, results)
+            offset = 0
+
+    def search(self, pattern, limit=None):
+        """
+        Tags matching a wildcard pattern
+
+        Each dot-separated segment is matched with fnmatch rules (*, ?, [...])
+        within one level; a '**' segment matches any number of levels.
+        """
+        results = []
+        self._search(self.root, "", pattern.split(self.separator), 0, limit, results)
+        return results
+
+    def _search(self, node, path, segments, position, limit, results):
+        if limit is not None and len(results) >= limit:
+            return
+        if position == len(segments):
+            if node.leaf:
+                results.append(path)
+            return
+        segment = segments[position]
+        if segment == '**':
+            # Zero levels, then one more level with '**' still pending
+            self._search(node, path, segments, position + 1, limit, results)
+            for name in node.sorted_names():
+                self._search(node.children[name], self._join(path, name), segments, position, limit, results)
+            return
+        if WILDCARDS.isdisjoint(segment):
+            child = node.children.get(segment)
+            if child is not None:
+                self._search(child, self._join(path, segment), segments, position + 1, limit, results)
+            return
+        for name in node.sorted_names():
+            if fnmatchcase(name, segment):
+                self._search(node.children[name], self._join(path, name), segments, position + 1, limit, results)
+
+    # Snapshot
+
+    def save(self, path):
+        """Write the index to disk (atomically replaced)"""
+        data = {"version": INDEX_VERSION, "separator": self.separator, "tree": self._dump(self.root)}
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save(); raises ValueError on a foreign file"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported tag index version in {path}")
+        index = cls(data.get("separator", '.'))
+        index.root = cls._restore(data["tree"])
+        return index
+
+    def _dump(self, node):
+        return [1 if node.leaf else 0, {name: self._dump(child) for name, child in node.children.items()}]
+
+    @classmethod
+    def _restore(cls, entry):
+        node = _Node()
+        node.leaf = bool(entry[0])
+        node.count = node.leaf
+        for name, child_entry in entry[1].items():
+            child = cls._restore(child_entry)
+            node.children[name] = child
+            node.count += child.count
+        return node
@@ -0,0 +1,244 @@
+"""
+OPC DA group engine for SCADA Data Gateway
+Groups with their own update rate, active flag and percent deadband that
+report only changed items, like OPC DA asynchronous subscriptions
+
+Value updates only mark items dirty in the groups that hold them; each
+group evaluates its dirty items once per update period, so the work done
+is proportional to how much changes, not to how many items are subscribed.
+"""
+
+import asyncio
+import logging
+
+from .base_handler import now_ms, timestamp_iso
+
+QUALITY_GOOD = 'GOOD'
+
+
+class OPCDAItem:
+    """One item of a group with the last value reported to the client"""
+
+    __slots__ = ('tag', 'eu_low', 'eu_high', 'value', 'quality', 'timestamp',
+                 'sent_value', 'sent_quality')
+
+    def __init__(self, tag, eu_low=None, eu_high=None):
+        self.tag = tag
+        self.eu_low = eu_low
+        self.eu_high = eu_high
+        self.value = None
+        self.quality = None
+        self.timestamp = None
+        self.sent_value = None
+        self.sent_quality = None
+
+    @classmethod
+    def from_config(cls, entry):
+        """Build from a tag name or a dict with tag, eu_low and eu_high"""
+        if isinstance(entry, str):
+            return cls(entry)
+        return cls(entry['tag'], entry.get('eu_low'), entry.get('eu_high'))
+
+    def exceeds_deadband(self, deadband):
+        """True when the current value must be reported under a percent deadband"""
+        if self.quality != self.sent_quality or self.sent_value is None:
+            return True
+        value = self.value
+        if not deadband or isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or self.eu_low is None or self.eu_high is None:
+            return value != self.sent_value
+        return abs(value - self.sent_value) > deadband / 100.0 * abs(self.eu_high - self.eu_low)
+
+    def as_update(self, group):
+        self.sent_value = self.value
+        self.sent_quality = self.quality
+        return {
+            'tag': self.tag,
+            'group': group,
+            'value': self.value,
+            'quality': self.quality,
+            'timestamp': timestamp_iso(self.timestamp)
+        }
+
+
+class OPCDAGroup:
+    """A named set of items reported together at the group's update rate"""
+
+    def __init__(self, engine, name, update_rate=1000, active=True, deadband=0.0):
+        self.engine = engine
+        self.name = name
+        self.update_rate = update_rate
+        self.active = active
+        self.deadband = deadband
+        self.items = {}
+        self.dirty = set()
+        self.timer = None
+        self.next_tick = None
+        self.updates_sent = 0
+
+    def add_items(self, entries):
+        for entry in entries:
+            item = OPCDAItem.from_config(entry)
+            if item.tag in self.items:
+                continue
+            current = self.engine.values.get(item.tag)
+            if current is not None:
+                item.value, item.quality, item.timestamp = current
+                self.dirty.add(item)
+            self.items[item.tag] = item
+            self.engine.index.setdefault(item.tag, []).append((self, item))
+
+    def remove_items(self, tags):
+        for tag in tags:
+            item = self.items.pop(tag, None)
+            if item is None:
+                continue
+            self.dirty.discard(item)
+            members = self.engine.index.get(tag, [])
+            members[:] = [member for member in members if member[1] is not item]
+            if not members:
+                self.engine.index.pop(tag, None)
+
+    def set_active(self, active):
+        """Activate or deactivate; activation reports every item once (OPC DA semantics)"""
+        if active == self.active:
+            return
+        self.active = active
+        if active:
+            for item in self.items.values():
+                item.sent_value = item.sent_quality = None
+            self.dirty.update(self.items.values())
+            self._schedule()
+        else:
+            self._cancel()
+
+    def set_update_rate(self, update_rate):
+        self.update_rate = update_rate
+        if self.timer is not None:
+            self._cancel()
+            self._schedule()
+
+    def _schedule(self):
+        if self.timer is not None or not self.active or not self.engine.running:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        period = self.update_rate / 1000.0
+        # Stay on the original grid unless we fell more than a period behind
+        next_tick = (self.next_tick or now) + period
+        if next_tick < now:
+            next_tick = now + period
+        self.next_tick = next_tick
+        self.timer = loop.call_at(next_tick, self._tick)
+
+    def _cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.next_tick = None
+
+    def _tick(self):
+        self.timer = None
+        self.scan()
+        self._schedule()
+
+    def scan(self):
+        """Report dirty items that pass the deadband; returns the updates"""
+        if not self.dirty:
+            return []
+        dirty, self.dirty = self.dirty, set()
+        deadband = self.deadband
+        updates = [item.as_update(self.name) for item in dirty if item.exceeds_deadband(deadband)]
+        if updates:
+            self.updates_sent += len(updates)
+            self.engine.dispatch(self, updates)
+        return updates
+
+    def refresh(self):
+        """Report every item with its current value, ignoring the deadband (Refresh2)"""
+        updates = [item.as_update(self.name) for item in self.items.values() if item.quality is not None]
+        self.dirty.clear()
+        if updates:
+            self.engine.dispatch(self, updates)
+        return updates
+
+    def get_status(self):
+        return {
+            "name": self.name,
+            "active": self.active,
+            "update_rate": self.update_rate,
+            "deadband": self.deadband,
+            "items": len(self.items),
+            "pending": len(self.dirty),
+            "updates_sent": self.updates_sent
+        }
+
+
+class OPCDAGroupEngine:
+    """
+    Holds the current value of every tag and the groups subscribed to them
+
+    `update()` is the single entry point for new values, whether they come
+    from a server, a simulation or a write; `callback(group, updates)` is
+    called with the changed items of a group once per update period.
+    """
+
+    def __init__(self, callback=None):
+        self.logger = logging.getLogger('SCADA_Gateway.OPCDA')
+        self.callback = callback
+        self.groups = {}
+        self.index = {}
+        self.values = {}
+        self.running = False
+
+    def add_group(self, name, update_rate=1000, active=True, deadband=0.0, items=()):
+        if name in self.groups:
+            raise ValueError(f"Group {name} already exists")
+        group = OPCDAGroup(self, name, update_rate, active, deadband)
+        self.groups[name] = group
+        group.add_items(items)
+        group._schedule()
+        return group
+
+    def remove_group(self, name):
+        group = self.groups.pop(name)
+        group._cancel()
+        group.remove_items(list(group.items))
+
+    def update(self, tag, value, quality=QUALITY_GOOD, timestamp=None):
+        """Store a new value (timestamp in epoch ms) and mark it dirty in every group holding the tag"""
+        timestamp = timestamp or now_ms()
+        self.values[tag] = (value, quality, timestamp)
+        for group, item in self.index.get(tag, ()):
+            item.value = value
+            item.quality = quality
+            item.timestamp = timestamp
+            if group.active:
+                group.dirty.add(item)
+
+    def update_many(self, updates, quality=QUALITY_GOOD):
+        """Apply {tag: value} with one timestamp"""
+        timestamp = now_ms()
+        for tag, value in updates.items():
+            self.update(tag, value, quality, timestamp)
+
+    def start(self):
+        self.running = True
+        for group in self.groups.values():
+            group._schedule()
+
+    def stop(self):
+        self.running = False
+        for group in self.groups.values():
+            group._cancel()
+
+    def dispatch(self, group, updates):
+        if self.callback is None:
+            return
+        try:
+            self.callback(group.name, updates)
+        except Exception as e:
+            self.logger.error(f"Group {group.name} callback error: {str(e)}")
+
+    def get_status(self):
+        return [group.get_status() for group in self.groups.values()]
@@ -1,12 +1,24 @@
 """
 OPC DA Protocol Handler for SCADA Data Gateway (Simulation Mode)
 This is a simulated version since OpenOPC/DCOM is difficult to set up on Windows
+
+Configured groups are served by an OPCDAGroupEngine: the simulated server
+changes a random subset of its items every update_rate and each group
+reports the changed items that pass its deadband to the data callbacks.
+Browsing goes through a TagIndex of every tag seen, which can be kept in
+'tag_index_file' between runs.
 """
 
+import asyncio
 import logging
-from datetime import datetime
+import os
 import random
-from .base_handler import BaseProtocolHandler, ConnectionStatus
+from .base_handler import (
+    BaseProtocolHandler, ConnectionStatus, DataBatch, QUALITY_CODES, QUALITY_UNCERTAIN,
+    now_ms, timestamp_iso
+)
+from .opcda_browse import TagIndex
+from .opcda_groups import OPCDAGroupEngine
 
 class OPCDAHandler(BaseProtocolHandler):
     def __init__(self):
@@ -16,8 +28,17 @@ class OPCDAHandler(BaseProtocolHandler):
         self.connected = False
         self.server_name = None
         self.sim_data = {}
+        self.sim_tags = []
+        self.eu_ranges = {}
+        self.engine = OPCDAGroupEngine(self._on_group_data)
+        self.tag_index = TagIndex()
+        self.sim_task = None
         self.status = ConnectionStatus.DISCONNECTED
 
+    def parse_tag(self, text):
+        """Tags are item names"""
+        return text
+
     def get_config_template(self):
         """Return configuration template for OPC DA connection"""
         return {
@@ -25,11 +46,15 @@ class OPCDAHandler(BaseProtocolHandler):
             "host": "localhost",
             "update_rate": 1000,
             "deadband": 0.0,
+            "simulation_change_ratio": 0.05,
+            "tag_index_file": "",
             "groups": [
                 {
                     "name": "Group1",
                     "update_rate": 1000,
                     "active": True,
+                    "deadband": 0.0,
+                    # Tag names, or {"tag", "eu_low", "eu_high"} for percent deadband
                     "items": []
                 }
             ]
@@ -49,12 +74,33 @@ class OPCDAHandler(BaseProtocolHandler):
             self.server_name = config['server_name']
             
             # Simulate connection delay
-            import asyncio
             await asyncio.sleep(0.5)
+
+            index_file = config.get('tag_index_file')
+            if index_file and os.path.exists(index_file) and not len(self.tag_index):
+                try:
+                    loop = asyncio.get_running_loop()
+                    self.tag_index = await loop.run_in_executor(None, TagIndex.load, index_file)
+                    self.logger.info(f"Loaded {len(self.tag_index)} tags from {index_file}")
+                except (OSError, ValueError, KeyError) as e:
+                    self.logger.warning(f"Ignoring tag index {index_file}: {str(e)}")
             
             self.connected = True
             self.status = ConnectionStatus.CONNECTED
             self._init_sim_data()
+            for group in config.get('groups', []):
+                if group.get('name') not in self.engine.groups:
+                    self.add_group(
+                        group['name'],
+                        group.get('update_rate', config.get('update_rate', 1000)),
+                        group.get('active', True),
+                        group.get('deadband', config.get('deadband', 0.0)),
+                        group.get('items', [])
+                    )
+            for group in self.engine.groups.values():
+                self._add_sim_items(group.items.values())
+            self.engine.start()
+            self.sim_task = asyncio.get_running_loop().create_task(self._simulation_loop())
             
             self.logger.info("[SIMULATION] Successfully connected to OPC DA server")
             
@@ -70,7 +116,13 @@ class OPCDAHandler(BaseProtocolHandler):
                 self.logger.info("[SIMULATION] Disconnecting from OPC DA server")
                 self.connected = False
                 self.status = ConnectionStatus.DISCONNECTED
+                self.engine.stop()
+                if self.sim_task is not None:
+                    self.sim_task.cancel()
+                    self.sim_task = None
                 self.sim_data.clear()
+                self.sim_tags.clear()
+                await self.save_tag_index()
         except Exception as e:
             self.logger.error(f"[SIMULATION] Disconnect error: {str(e)}")
             raise
@@ -78,6 +130,9 @@ class OPCDAHandler(BaseProtocolHandler):
     async def read_data(self, tags):
         """
         Simulate reading data from OPC DA server
+
+        Values come from the server cache (as OPC DA cache reads do); tags
+        not known yet are added to the simulation.
         
         Args:
             tags (list): List of tag names to read
@@ -89,21 +144,40 @@ class OPCDAHandler(BaseProtocolHandler):
             raise ConnectionError("Not connected to OPC DA server")
 
         results = []
+        debug = self.logger.isEnabledFor(logging.DEBUG)
         try:
             for tag in tags:
-                value = self._get_simulated_value(tag)
+                self._get_simulated_value(tag)
+                value, quality, timestamp = self.engine.values[tag]
                 results.append({
                     'value': value,
-                    'quality': 'GOOD',
-                    'timestamp': datetime.utcnow().isoformat()
+                    'quality': quality,
+                    'timestamp': timestamp_iso(timestamp)
                 })
-                self.logger.debug(f"[SIMULATION] Read tag {tag}: {value}")
+                if debug:
+                    self.logger.debug("[SIMULATION] Read tag %s: %s", tag, value)
         except Exception as e:
             self.logger.error(f"[SIMULATION] Read error: {str(e)}")
             raise
 
         return results
 
+    async def read_batch(self, tags, batch=None):
+        """Read tags from the server cache straight into a DataBatch"""
+        if not self.connected:
+            raise ConnectionError("Not connected to OPC DA server")
+
+        batch = (batch or DataBatch()).reset(tags)
+        values = self.engine.values
+        for index, tag in enumerate(tags):
+            current = values.get(tag)
+            if current is None:
+                self._get_simulated_value(tag)
+                current = values[tag]
+            value, quality, timestamp = current
+            batch.set(index, value, QUALITY_CODES.get(quality, QUALITY_UNCERTAIN), timestamp)
+        return batch
+
     async def write_data(self, tags, values):
         """
         Simulate writing data to OPC DA server
@@ -119,58 +193,160 @@ class OPCDAHandler(BaseProtocolHandler):
             raise ConnectionError("Not connected to OPC DA server")
 
         results = []
+        debug = self.logger.isEnabledFor(logging.DEBUG)
         try:
             for tag, value in zip(tags, values):
-                self.sim_data[tag] = value
+                self._set_value(tag, value)
                 results.append(True)
-                self.logger.debug(f"[SIMULATION] Write tag {tag}: {value}")
+                if debug:
+                    self.logger.debug("[SIMULATION] Write tag %s: %s", tag, value)
         except Exception as e:
             self.logger.error(f"[SIMULATION] Write error: {str(e)}")
             raise
 
         return results
 
-    async def browse_tags(self, path=""):
+    async def browse_tags(self, path="", offset=0, limit=None):
         """
-        Simulate browsing OPC DA server tags
+        Browse OPC DA server tags by name prefix
         
         Args:
-            path (str): Path to browse from
+            path (str): Tag name prefix, e.g. 'Device1.' or 'Dev'
+            offset (int): Number of matching tags to skip
+            limit (int): Maximum number of tags to return
             
         Returns:
-            list: List of simulated tags
+            list: Matching tags in sorted order
         """
-        sample_tags = [
-            "System.Temperature",
-            "System.Pressure",
-            "System.Flow",
-            "Process.Status",
-            "Process.Mode",
-            "Process.Setpoint",
-            "Device1.Status",
-            "Device1.Temperature",
-            "Device2.Status",
-            "Device2.Temperature"
-        ]
-        
-        if path:
-            return [tag for tag in sample_tags if tag.startswith(path)]
-        return sample_tags
+        return self.tag_index.prefix(path, offset, limit)
+
+    async def browse_branches(self, path=""):
+        """Return the child branch names of a branch ('' for the root)"""
+        return self.tag_index.branches(path)
+
+    async def browse_leaves(self, path="", offset=0, limit=None):
+        """Return one page of the tags directly under a branch"""
+        return self.tag_index.leaves(path, offset, limit)
+
+    async def search_tags(self, pattern, limit=None):
+        """Return tags matching a wildcard pattern such as 'Area*.Pump?.Speed' or '**.Status'"""
+        return self.tag_index.search(pattern, limit)
+
+    async def save_tag_index(self):
+        """Write the tag index to 'tag_index_file' when one is configured"""
+        index_file = self.config.get('tag_index_file')
+        if not index_file:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.tag_index.save, index_file)
+        except OSError as e:
+            self.logger.error(f"Failed to save tag index {index_file}: {str(e)}")
+
+    # Groups
+
+    def add_group(self, name, update_rate=1000, active=True, deadband=0.0, items=()):
+        """
+        Add a group reporting its changed items every update_rate ms
+
+        Args:
+            name (str): Group name
+            update_rate (int): Update rate in milliseconds
+            active (bool): Whether the group reports at all
+            deadband (float): Percent of the item's EU range a value must move
+            items (list): Tag names or {"tag", "eu_low", "eu_high"} dicts
+        """
+        group = self.engine.add_group(name, update_rate, active, deadband, items)
+        if self.connected:
+            self._add_sim_items(group.items.values())
+        return group
+
+    def remove_group(self, name):
+        self.engine.remove_group(name)
+
+    def set_group_active(self, name, active):
+        self.engine.groups[name].set_active(active)
+
+    def set_group_update_rate(self, name, update_rate):
+        self.engine.groups[name].set_update_rate(update_rate)
+
+    async def refresh_group(self, name):
+        """Publish every item of a group with its current value (OPC DA Refresh)"""
+        if not self.connected:
+            raise ConnectionError("Not connected to OPC DA server")
+        return self.engine.groups[name].refresh()
+
+    def _on_group_data(self, group, updates):
+        self.logger.debug("[SIMULATION] Group %s reported %d changed items", group, len(updates))
+        self._publish_data(updates)
+
+    # Simulation
 
     def _init_sim_data(self):
         """Initialize simulation data with random values"""
-        self.sim_data = {
-            "System.Temperature": random.uniform(20, 30),
-            "System.Pressure": random.uniform(1, 5),
-            "System.Flow": random.uniform(10, 50),
-            "Process.Status": random.choice([0, 1]),
-            "Process.Mode": random.choice(["Auto", "Manual"]),
-            "Process.Setpoint": random.uniform(0, 100),
-            "Device1.Status": random.choice([0, 1]),
-            "Device1.Temperature": random.uniform(20, 30),
-            "Device2.Status": random.choice([0, 1]),
-            "Device2.Temperature": random.uniform(20, 30)
-        }
+        self.sim_data = {}
+        self.sim_tags = []
+        for tag, value in (
+            ("System.Temperature", random.uniform(20, 30)),
+            ("System.Pressure", random.uniform(1, 5)),
+            ("System.Flow", random.uniform(10, 50)),
+            ("Process.Status", random.choice([0, 1])),
+            ("Process.Mode", random.choice(["Auto", "Manual"])),
+            ("Process.Setpoint", random.uniform(0, 100)),
+            ("Device1.Status", random.choice([0, 1])),
+            ("Device1.Temperature", random.uniform(20, 30)),
+            ("Device2.Status", random.choice([0, 1])),
+            ("Device2.Temperature", random.uniform(20, 30))
+        ):
+            self._set_value(tag, value)
+
+    def _add_sim_items(self, items):
+        """Make sure every group item exists in the simulated server"""
+        for item in items:
+            if item.eu_low is not None and item.eu_high is not None:
+                self.eu_ranges[item.tag] = (item.eu_low, item.eu_high)
+            self._get_simulated_value(item.tag)
+
+    def _set_value(self, tag, value, quality='GOOD'):
+        """Update the server value table and notify the groups holding the tag"""
+        if tag not in self.sim_data:
+            self.sim_tags.append(tag)
+            self.tag_index.add(tag)
+        self.sim_data[tag] = value
+        self.engine.update(tag, value, quality)
+
+    def _simulate_changes(self):
+        """Change a random subset of tags, as a live server would between updates"""
+        ratio = self.config.get('simulation_change_ratio', 0.05)
+        count = min(len(self.sim_tags), int(len(self.sim_tags) * ratio))
+        if not count:
+            return
+        timestamp = now_ms()
+        for tag in random.sample(self.sim_tags, count):
+            value = self.sim_data[tag]
+            if isinstance(value, float):
+                low, high = self.eu_ranges.get(tag, (None, None))
+                if low is None:
+                    value += random.uniform(-0.1, 0.1)
+                else:
+                    value = min(max(value + random.uniform(-0.01, 0.01) * (high - low), low), high)
+            elif isinstance(value, int) and "Status" in tag:
+                value = 1 - value
+            else:
+                continue
+            self.sim_data[tag] = value
+            self.engine.update(tag, value, 'GOOD', timestamp)
+
+    async def _simulation_loop(self):
+        """Drive the simulated server at the configured server update rate"""
+        period = self.config.get('update_rate', 1000) / 1000.0
+        try:
+            while self.connected:
+                await asyncio.sleep(period)
+                self._simulate_changes()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.logger.error(f"[SIMULATION] Simulation error: {str(e)}")
 
     def _get_simulated_value(self, tag):
         """
@@ -183,20 +359,19 @@ class OPCDAHandler(BaseProtocolHandler):
             value: Simulated value based on tag type
         """
         if tag not in self.sim_data:
-            if "Status" in tag:
-                self.sim_data[tag] = random.choice([0, 1])
+            if tag in self.eu_ranges:
+                value = random.uniform(*self.eu_ranges[tag])
+            elif "Status" in tag:
+                value = random.choice([0, 1])
             elif "Temperature" in tag:
-                self.sim_data[tag] = random.uniform(20, 30)
+                value = random.uniform(20, 30)
             elif "Pressure" in tag:
-                self.sim_data[tag] = random.uniform(1, 5)
+                value = random.uniform(1, 5)
             elif "Flow" in tag:
-                self.sim_data[tag] = random.uniform(10, 50)
+                value = random.uniform(10, 50)
             else:
-                self.sim_data[tag] = random.uniform(0, 100)
-
-        # Add some random variation to analog values
-        if isinstance(self.sim_data[tag], float):
-            self.sim_data[tag] += random.uniform(-0.1, 0.1)
+                value = random.uniform(0, 100)
+            self._set_value(tag, value)
 
         return self.sim_data[tag]
 
@@ -208,14 +383,6 @@ class OPCDAHandler(BaseProtocolHandler):
             "mode": "SIMULATION",
             "server": self.server_name,
             "tags_count": len(self.sim_data),
-            "last_update": datetime.utcnow().isoformat()
-        }
-
-    def __del__(self):
-        """Cleanup when object is destroyed"""
-        try:
-            if self.connected:
-                import asyncio
-                asyncio.run(self.disconnect())
-        except:
-            pass
\ No newline at end of file
+            "groups": self.engine.get_status(),
+            **self.activity_status()
+        }
\ No newline at end of file
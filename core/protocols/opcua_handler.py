@@ -6,7 +6,6 @@ Uses asyncua for OPC UA communication
 import logging
 from datetime import datetime
 import random
-import asyncio
 from asyncua import Client, Server, ua
 from .base_handler import BaseProtocolHandler, ConnectionStatus
 
@@ -24,6 +23,10 @@ class OPCUAHandler(BaseProtocolHandler):
         self.subscription = None
         self.monitored_items = {}
 
+    def parse_tag(self, text):
+        """Tags are node IDs"""
+        return text
+
     def get_config_template(self):
         """Return configuration template for OPC UA connection"""
         return {
@@ -197,7 +200,7 @@ class OPCUAHandler(BaseProtocolHandler):
                     'quality': 'GOOD',
                     'timestamp': datetime.utcnow().isoformat()
                 })
-                self.logger.debug(f"Read node {node_id}: {value}")
+                self.logger.debug("Read node %s: %s", node_id, value)
                 
         except Exception as e:
             self.logger.error(f"Read error: {str(e)}")
@@ -231,7 +234,7 @@ class OPCUAHandler(BaseProtocolHandler):
                         await self.nodes[node_id].write_value(value)
                 
                 results.append(True)
-                self.logger.debug(f"Write node {node_id}: {value}")
+                self.logger.debug("Write node %s: %s", node_id, value)
                 
         except Exception as e:
             self.logger.error(f"Write error: {str(e)}")
@@ -317,30 +320,32 @@ class OPCUAHandler(BaseProtocolHandler):
                 "policy": self.config.get('security_policy') if hasattr(self, 'config') else None
             },
             "nodes_count": len(self.nodes),
-            "last_update": datetime.utcnow().isoformat()
+            **self.activity_status()
         }
 
-    def __del__(self):
-        """Cleanup when object is destroyed"""
-        try:
-            if self.connected:
-                asyncio.run(self.disconnect())
-        except:
-            pass
+    async def restore_subscriptions(self):
+        """Monitor the previously monitored nodes again on the new subscription"""
+        if self.mode != 'client' or not self.subscription or not self.monitored_items:
+            return
+        nodes = [self.client.get_node(node_id) for node_id in self.monitored_items]
+        await self.subscription.subscribe_data_change(nodes)
 
     # Subscription callback methods
     async def datachange_notification(self, node, val, data):
         """Callback for data changes"""
         node_id = str(node.nodeid)
-        self.logger.debug(f"Data change notification - Node: {node_id}, Value: {val}")
+        self.logger.debug("Data change notification - Node: %s, Value: %s", node_id, val)
         if node_id in self.monitored_items:
             callback = self.monitored_items[node_id]
             await callback(node_id, val, data)
 
     async def event_notification(self, event):
         """Callback for events"""
-        self.logger.debug(f"Event notification: {event}")
+        self.logger.debug("Event notification: %s", event)
 
     async def status_change_notification(self, status):
         """Callback for connection status changes"""
-        self.logger.debug(f"Status change notification: {status}")
+        self.logger.debug("Status change notification: %s", status)
+        if self.connected and not status.Status.is_good():
+            self.logger.error(f"OPC UA subscription status: {status}")
+            self.status = ConnectionStatus.ERROR
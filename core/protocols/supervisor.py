@@ -0,0 +1,224 @@
+"""
+Connection supervisor for SCADA Data Gateway
+Keeps one handler connected: connects, watches its status, reconnects with
+jittered exponential backoff and restores subscriptions after a reconnect
+
+Handlers report a lost link by setting their status to ERROR or
+DISCONNECTED; the supervisor is woken by the status callback, so recovery
+starts immediately instead of at the next health check.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from enum import Enum
+
+from .base_handler import ConnectionStatus
+
+DEFAULT_RECONNECT = {
+    "initial_delay_s": 1.0,
+    "max_delay_s": 60.0,
+    "multiplier": 2.0,
+    "jitter": 0.5,
+    "health_check_interval_s": 5.0
+}
+
+
+class SupervisorState(Enum):
+    STOPPED = "Stopped"
+    CONNECTING = "Connecting"
+    CONNECTED = "Connected"
+    BACKOFF = "Waiting to reconnect"
+    STOPPING = "Stopping"
+
+
+class BackoffPolicy:
+    """Exponential backoff where each delay is reduced by a random fraction up to jitter"""
+
+    def __init__(self, initial_delay_s=1.0, max_delay_s=60.0, multiplier=2.0, jitter=0.5, **_):
+        self.initial_delay = initial_delay_s
+        self.max_delay = max_delay_s
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    @classmethod
+    def from_config(cls, config=None):
+        return cls(**{**DEFAULT_RECONNECT, **(config or {})})
+
+    def delay(self, attempt):
+        """Delay before reconnect attempt number attempt (1 for the first retry)"""
+        delay = min(self.max_delay, self.initial_delay * self.multiplier ** (attempt - 1))
+        return delay * (1.0 - self.jitter * random.random())
+
+
+class ConnectionSupervisor:
+    """
+    Owns the connect/disconnect lifecycle of one protocol handler
+
+    Args:
+        handler (BaseProtocolHandler): Handler to supervise
+        config (dict): Connection configuration passed to handler.connect
+        name (str): Connection name used in logs
+        reconnect (dict): Reconnect settings (see DEFAULT_RECONNECT)
+        metrics (ConnectionMetrics): Where connect attempts are recorded
+    """
+
+    def __init__(self, handler, config, name=None, reconnect=None, metrics=None):
+        self.logger = logging.getLogger('SCADA_Gateway.Supervisor')
+        self.handler = handler
+        self.config = config
+        self.name = name or type(handler).__name__
+        reconnect = {**DEFAULT_RECONNECT, **(reconnect or {})}
+        self.policy = BackoffPolicy.from_config(reconnect)
+        self.health_interval = reconnect["health_check_interval_s"]
+        self.state = SupervisorState.STOPPED
+        self.task = None
+        self.attempt = 0
+        self.connects = 0
+        self.last_error = None
+        self.loop = None
+        self.link_down = None
+        self.connected = None
+        self.metrics = metrics
+
+    def start(self):
+        """Start supervising; returns the supervisor task"""
+        if self.task is None or self.task.done():
+            self.loop = asyncio.get_running_loop()
+            self.link_down = asyncio.Event()
+            self.connected = asyncio.Event()
+            self.handler.add_status_callback(self._status_changed)
+            self.task = self.loop.create_task(self._run())
+        return self.task
+
+    async def stop(self):
+        """Stop reconnecting, then disconnect the handler"""
+        if self.task is None:
+            return
+        self.state = SupervisorState.STOPPING
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        self.connected.clear()
+        self.handler.remove_status_callback(self._status_changed)
+        try:
+            await self.handler.disconnect()
+        except Exception as e:
+            self.logger.error(f"{self.name}: disconnect error: {str(e)}")
+        self.state = SupervisorState.STOPPED
+        self.logger.info(f"{self.name}: stopped")
+
+    async def wait_connected(self, timeout=None):
+        """Wait until the handler is connected"""
+        await asyncio.wait_for(self.connected.wait(), timeout)
+
+    def _status_changed(self, status):
+        # Handlers may change status from other threads (paho-mqtt)
+        if status in (ConnectionStatus.ERROR, ConnectionStatus.DISCONNECTED) and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.link_down.set)
+
+    async def _run(self):
+        while True:
+            self.state = SupervisorState.CONNECTING
+            self.link_down.clear()
+            started = time.perf_counter()
+            try:
+                await self.handler.connect(self.config)
+                if self.handler.status != ConnectionStatus.CONNECTED:
+                    raise ConnectionError(f"status is {self.handler.status.value} after connect")
+                if self.connects:
+                    await self.handler.restore_subscriptions()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                if self.metrics is not None:
+                    self.metrics.observe('connect', time.perf_counter() - started, error=e)
+                await self._release()
+                await self._backoff()
+                continue
+            if self.metrics is not None:
+                self.metrics.observe('connect', time.perf_counter() - started)
+
+            self.connects += 1
+            self.attempt = 0
+            self.last_error = None
+            self.state = SupervisorState.CONNECTED
+            self.connected.set()
+            self.logger.info(f"{self.name}: connected")
+
+            await self._watch()
+            self.connected.clear()
+            self.logger.warning(f"{self.name}: connection lost, reconnecting")
+            await self._release()
+            await self._backoff()
+
+    async def _watch(self):
+        """Return when the link is down, by status callback or health check"""
+        while True:
+            try:
+                await asyncio.wait_for(self.link_down.wait(), self.health_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.link_down.clear()
+            if not await self.handler.check_connection():
+                return
+
+    async def _release(self):
+        """Free what a failed or lost connection still holds before the next attempt"""
+        try:
+            await self.handler.disconnect()
+        except Exception as e:
+            self.logger.debug(f"{self.name}: cleanup after failure: {str(e)}")
+
+    async def _backoff(self):
+        self.attempt += 1
+        delay = self.policy.delay(self.attempt)
+        self.state = SupervisorState.BACKOFF
+        self.logger.warning(
+            f"{self.name}: attempt {self.attempt} failed ({self.last_error or 'link down'}), "
+            f"retrying in {delay:.1f}s"
+        )
+        await asyncio.sleep(delay)
+
+    def get_status(self):
+        return {
+            "name": self.name,
+            "state": self.state.value,
+            "attempt": self.attempt,
+            "connects": self.connects,
+            "last_error": self.last_error
+        }
+
+
+class SupervisorGroup:
+    """The supervisors of all connections, started together and stopped in reverse order"""
+
+    def __init__(self, reconnect=None):
+        self.reconnect = reconnect
+        self.supervisors = {}
+
+    def add(self, name, handler, config):
+        if name in self.supervisors:
+            raise ValueError(f"Connection {name} is already supervised")
+        supervisor = ConnectionSupervisor(handler, config, name, self.reconnect)
+        self.supervisors[name] = supervisor
+        return supervisor
+
+    def start(self):
+        for supervisor in self.supervisors.values():
+            supervisor.start()
+
+    async def remove(self, name):
+        await self.supervisors.pop(name).stop()
+
+    async def stop(self):
+        for name in reversed(list(self.supervisors)):
+            await self.supervisors[name].stop()
+
+    def get_status(self):
+        return [supervisor.get_status() for supervisor in self.supervisors.values()]
@@ -0,0 +1,436 @@
+"""
+Headless runtime for SCADA Data Gateway
+Runs connections, mappings and the scan loop on a plain asyncio event loop
+(uvloop when installed), without Qt
+
+    python -m core.runtime
+    python main.py --headless
+
+Connections and mappings are loaded from the files named in the "runtime"
+settings section (relative paths are relative to the config directory).
+The GUI attaches to a runtime instead of owning the gateway state.
+
+With "mode": "sharded" the connections run in worker processes instead
+(core.sharding): they scan the mapped sources and the scan loop polls the
+changed values. The sources, and the points IEC 104 server connections
+serve, are fixed when the runtime starts, so mapping changes take effect
+after a restart.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+from config import CONFIG_PATH, load_config
+from .connections import ConnectionManager
+from .data_mapping import DataMapping
+from .logging_setup import setup_logging
+from .metrics import MetricsServer
+from .security import SecurityManager
+from .sharding import ShardedRuntime, tag_key
+from .protocols.base_handler import ConnectionStatus, DataBatch
+from .protocols.iec104_server import points_from_mapping
+
+MODE_SINGLE = "single"
+MODE_SHARDED = "sharded"
+
+DEFAULT_RUNTIME = {
+    "connections_file": "connections.json",
+    "mappings_file": "mappings.json",
+    "scan_interval_ms": 1000,
+    "use_uvloop": True,
+    "mode": MODE_SINGLE
+}
+
+_NOT_WRITTEN = object()
+
+# Protocol whose server mode serves the mapped destinations (see _serve_mappings)
+IEC104_PROTOCOL = "IEC 60870-5-104"
+
+# Read/write failures of one connection are logged as warnings at most this often
+FAILURE_LOG_INTERVAL_S = 60.0
+
+
+def config_file(path):
+    """Resolve a settings file name relative to the config directory"""
+    return path if os.path.isabs(path) else os.path.join(os.path.dirname(CONFIG_PATH), path)
+
+
+def install_uvloop():
+    """Use uvloop for new event loops if it is installed; returns whether it is"""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+class GatewayRuntime:
+    """
+    The gateway without a user interface
+
+    Args:
+        settings (dict): Application settings (load_config() by default)
+        connection_manager (ConnectionManager): Existing manager to run
+        data_mapping (DataMapping): Existing mappings to run
+        security_manager (SecurityManager): Key for the passwords in the
+                                            connections file
+    """
+
+    def __init__(self, settings=None, connection_manager=None, data_mapping=None, security_manager=None):
+        self.logger = logging.getLogger('SCADA_Gateway.Runtime')
+        self.settings = settings if settings is not None else load_config()
+        self.config = {**DEFAULT_RUNTIME, **self.settings.get('runtime', {})}
+        self.connection_manager = connection_manager or ConnectionManager(self.settings, security=security_manager)
+        self.data_mapping = data_mapping or DataMapping()
+        self.scan_interval = self.config["scan_interval_ms"] / 1000.0
+        self.mode = self.config["mode"]
+        if self.mode not in (MODE_SINGLE, MODE_SHARDED):
+            raise ValueError(f"Unknown runtime mode: {self.mode}")
+        self.sharded = None
+        self.shard_sources = []  # [((source connection_id, tag_key), mapping)] scanned by the workers
+        self.shard_values = {}  # (connection_id, tag_key) -> last value polled from the workers
+        self.shard_batch = DataBatch()
+        self.scan_task = None
+        self.stopped = None
+        self.last_written = {}
+        self.batches = {}  # source connection_id -> DataBatch reused by the next scan
+        self.served = {}  # IEC 104 server connection_id -> DataMapping version its points come from
+        self.failures_logged = {}  # (connection_id, operation) -> [last warning time, suppressed]
+        self.scans = 0
+        self.overruns = 0
+        self.last_scan_ms = 0.0
+        metrics = self.connection_manager.metrics
+        self.scan_latency = metrics.histogram('scada_scan_seconds', "Scan duration").labels()
+        self.scan_overruns = metrics.counter('scada_scan_overruns_total', "Scans that missed their deadline").labels()
+        metrics.gauge('scada_mappings', "Configured mappings").labels().set_function(
+            lambda: len(self.data_mapping.mappings)
+        )
+        self.metrics_server = MetricsServer.from_settings(metrics, self.settings)
+
+    # Configuration
+
+    def load(self):
+        """Load the connections and mappings files, where they exist"""
+        connections_file = config_file(self.config["connections_file"])
+        if os.path.exists(connections_file):
+            self.connection_manager.load_from_file(connections_file)
+        mappings_file = config_file(self.config["mappings_file"])
+        if os.path.exists(mappings_file):
+            self.data_mapping.load_from_file(mappings_file)
+        self.logger.info(
+            f"Loaded {len(self.connection_manager)} connections and {len(self.data_mapping.mappings)} mappings"
+        )
+
+    def save(self):
+        """Write the connections and mappings back to the files load() reads"""
+        self.connection_manager.save_to_file(config_file(self.config["connections_file"]))
+        self.data_mapping.save_to_file(config_file(self.config["mappings_file"]))
+        self.logger.info(
+            f"Saved {len(self.connection_manager)} connections and {len(self.data_mapping.mappings)} mappings"
+        )
+
+    # Lifecycle
+
+    async def start(self):
+        """Start every connection, the scan loop and the metrics endpoint"""
+        self.stopped = asyncio.Event()
+        if self.metrics_server is not None and self.metrics_server.server is None:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                self.logger.warning(f"Metrics endpoint not available: {str(e)}")
+        if self.mode == MODE_SHARDED:
+            if self.sharded is None:
+                self._start_shards()
+        else:
+            self._serve_mappings()
+            self.connection_manager.start_all()
+        if self.scan_task is None:
+            self.scan_task = asyncio.get_running_loop().create_task(self._scan_loop())
+
+    async def stop(self):
+        if self.scan_task is not None:
+            self.scan_task.cancel()
+            try:
+                await self.scan_task
+            except asyncio.CancelledError:
+                pass
+            self.scan_task = None
+        if self.sharded is not None:
+            await self._stop_shards()
+        else:
+            await self.connection_manager.stop_all()
+        self.last_written.clear()
+        self.batches.clear()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+
+    def request_stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+    async def run(self):
+        """Run until request_stop()"""
+        await self.start()
+        try:
+            await self.stopped.wait()
+        finally:
+            await self.stop()
+
+    # Shard workers
+
+    def _start_shards(self):
+        """Start the connections in shard workers, each scanning the tags the mappings read from it"""
+        manager = self.connection_manager
+        scans = {}
+        self.shard_sources = []
+        for mapping in self._active_mappings():
+            source = mapping["source"]
+            tag = self._handler_tag(source)
+            if tag is None:
+                continue
+            key = tag_key(tag)
+            scans.setdefault(source.connection_id, {})[key] = tag
+            self.shard_sources.append(((source.connection_id, key), mapping))
+        entries = []
+        for connection in manager:
+            entry = {
+                **connection.to_dict(),
+                "scan": {
+                    "interval_ms": self.config["scan_interval_ms"],
+                    "tags": list(scans.get(connection.id, {}).values())
+                }
+            }
+            if self._serves_mappings(connection):
+                entry["points"] = points_from_mapping(self.data_mapping, connection_id=connection.id)
+            entries.append(entry)
+        self.sharded = ShardedRuntime.from_settings(entries, self.settings)
+        self.sharded.start()
+
+    async def _stop_shards(self):
+        sharded, self.sharded = self.sharded, None
+        await asyncio.get_running_loop().run_in_executor(None, sharded.stop)
+        for connection in self.connection_manager:
+            connection.handler.status = ConnectionStatus.DISCONNECTED
+        self.shard_sources = []
+        self.shard_values.clear()
+
+    # Served points
+
+    @staticmethod
+    def _serves_mappings(connection):
+        return connection.protocol == IEC104_PROTOCOL and connection.config.get("mode") == "server"
+
+    def _serve_mappings(self):
+        """Declare the mapped destinations of IEC 104 server connections, again after the mappings change"""
+        version = self.data_mapping.version
+        for connection in self.connection_manager:
+            if self._serves_mappings(connection) and self.served.get(connection.id) != version:
+                connection.handler.load_mapping(self.data_mapping, connection.id)
+                self.served[connection.id] = version
+
+    # Scan loop
+
+    async def _scan_loop(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            started = loop.time()
+            try:
+                await self.scan()
+            except Exception as e:
+                self.logger.error(f"Scan error: {str(e)}")
+            now = loop.time()
+            self.last_scan_ms = (now - started) * 1000
+            self.scan_latency.observe(now - started)
+            self.scans += 1
+            deadline += self.scan_interval
+            if deadline < now:
+                # Overrun: skip the missed scans instead of running them back to back
+                self.overruns += 1
+                self.scan_overruns.inc()
+                deadline += (int((now - deadline) / self.scan_interval) + 1) * self.scan_interval
+            await asyncio.sleep(deadline - now)
+
+    def _active_mappings(self):
+        """Enabled mappings whose connections both exist"""
+        manager = self.connection_manager
+        return [
+            mapping for mapping in self.data_mapping.mappings
+            if mapping["enabled"] and mapping["source"].connection_id in manager
+            and mapping["destination"].connection_id in manager
+        ]
+
+    async def scan(self):
+        """Read every mapped source once and write changed values to their destinations"""
+        if self.sharded is not None:
+            self._scan_shards()
+            return
+        self._serve_mappings()
+        manager = self.connection_manager
+        sources = {}
+        for mapping in self._active_mappings():
+            source = mapping["source"]
+            tag = self._handler_tag(source)
+            if tag is not None:
+                source_mappings, tags = sources.setdefault(source.connection_id, ([], []))
+                source_mappings.append(mapping)
+                tags.append(tag)
+
+        # Sources are read concurrently, one read per connection
+        connected = [
+            connection_id for connection_id in sources
+            if manager.get(connection_id).status == ConnectionStatus.CONNECTED
+        ]
+        results = await asyncio.gather(
+            *(self._read(connection_id, sources[connection_id][1]) for connection_id in connected)
+        )
+
+        writes = {}
+        for connection_id, batch in zip(connected, results):
+            if batch is None:
+                continue
+            self.batches[connection_id] = batch
+            for mapping, value in zip(sources[connection_id][0], batch.values):
+                self._queue_write(writes, mapping, value)
+
+        await asyncio.gather(*(
+            self._write(connection_id, *entry) for connection_id, entry in writes.items()
+            if manager.get(connection_id).status == ConnectionStatus.CONNECTED
+        ))
+
+    def _scan_shards(self):
+        """Apply what the shard workers reported and send changed values to the workers owning the destinations"""
+        sharded = self.sharded
+        batch = sharded.poll(self.shard_batch)
+        self.shard_values.update(zip(batch.tags, batch.values))
+        # The local handlers do not run; they show the status of their worker's connection
+        manager = self.connection_manager
+        for connection_id, status in sharded.take_statuses():
+            if connection_id in manager:
+                manager.get(connection_id).handler.status = ConnectionStatus(status)
+        for connection_id, keys, error in sharded.take_failed_writes():
+            self._log_failure(connection_id, "write", error)
+            for key in keys:
+                self.last_written.pop(key, None)
+
+        writes = {}
+        for source_key, mapping in self.shard_sources:
+            self._queue_write(writes, mapping, self.shard_values.get(source_key))
+        for connection_id, (tags, values, keys) in writes.items():
+            sharded.write(connection_id, tags, values, keys)
+            # Taken back if the worker reports the write failed
+            self.last_written.update(zip(keys, values))
+
+    def _queue_write(self, writes, mapping, value):
+        """Add value to writes[destination connection_id] unless it is what was last written there"""
+        destination = mapping["destination"]
+        key = (destination.connection_id, json.dumps(destination.tag, sort_keys=True))
+        if value is None or self.last_written.get(key, _NOT_WRITTEN) == value:
+            return
+        tag = self._handler_tag(destination)
+        if tag is None:
+            return
+        tags, values, keys = writes.setdefault(destination.connection_id, ([], [], []))
+        tags.append(tag)
+        values.append(value)
+        keys.append(key)
+
+    def _handler_tag(self, point):
+        """The point's tag in its handler's format; None (logged) if it cannot be parsed"""
+        try:
+            return self.connection_manager.get(point.connection_id).handler.normalize_tag(point.tag)
+        except (ValueError, KeyError, TypeError) as e:
+            self._log_failure(point.connection_id, "tag", e)
+            return None
+
+    def _log_failure(self, connection_id, operation, error):
+        """Warn about a failing connection, but at most once per FAILURE_LOG_INTERVAL_S"""
+        now = time.monotonic()
+        entry = self.failures_logged.setdefault((connection_id, operation), [None, 0])
+        if entry[0] is not None and now - entry[0] < FAILURE_LOG_INTERVAL_S:
+            entry[1] += 1
+            self.logger.debug("%s: %s failed: %s", connection_id, operation, error)
+            return
+        suppressed = f" ({entry[1]} more failures since the last warning)" if entry[1] else ""
+        self.logger.warning(f"{connection_id}: {operation} failed: {str(error)}{suppressed}")
+        entry[0], entry[1] = now, 0
+
+    async def _read(self, connection_id, tags):
+        # Taken out while in use, so a scan started meanwhile does not share it
+        batch = self.batches.pop(connection_id, None)
+        try:
+            return await self.connection_manager.read_batch(connection_id, tags, batch)
+        except Exception as e:
+            self._log_failure(connection_id, "read", e)
+            return None
+
+    async def _write(self, connection_id, tags, values, keys):
+        try:
+            results = await self.connection_manager.write(connection_id, tags, values)
+        except Exception as e:
+            self._log_failure(connection_id, "write", e)
+            return
+        for key, value, ok in zip(keys, values, results or [True] * len(keys)):
+            if ok:
+                self.last_written[key] = value
+
+    def get_status(self):
+        return {
+            "mode": self.mode,
+            "connections": self.connection_manager.get_status(),
+            "shards": self.sharded.get_status() if self.sharded is not None else None,
+            "mappings": len(self.data_mapping.mappings),
+            "scans": self.scans,
+            "overruns": self.overruns,
+            "last_scan_ms": round(self.last_scan_ms, 3),
+            "scan_latency": self.scan_latency.summary(),
+            "metrics_url": f"http://{self.metrics_server.host}:{self.metrics_server.port}/metrics"
+            if self.metrics_server is not None and self.metrics_server.server is not None else None
+        }
+
+
+def main(argv=None):
+    """Headless entry point"""
+    parser = argparse.ArgumentParser(description="SCADA Data Gateway (headless)")
+    parser.add_argument('--headless', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--no-uvloop', action='store_true', help="use the default asyncio event loop")
+    args = parser.parse_args(argv)
+
+    settings = load_config()
+    logging_pipeline = setup_logging(settings, console=True)
+    security_manager = SecurityManager(settings)
+    runtime = GatewayRuntime(settings, security_manager=security_manager)
+    if runtime.config["use_uvloop"] and not args.no_uvloop and install_uvloop():
+        runtime.logger.info("Using uvloop")
+    runtime.load()
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, runtime.request_stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C still raises KeyboardInterrupt
+                pass
+        await runtime.run()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        security_manager.close()
+        logging_pipeline.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
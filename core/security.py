@@ -1,19 +1,174 @@
+import asyncio
+import base64
 import hashlib
+import hmac
+import logging
+import threading
+import time
 import jwt
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from cryptography.fernet import Fernet
+import io
 import os
 
+from config import CONFIG_PATH
+from .encryption import (
+    DEFAULT_CHUNK_SIZE, EncryptedReader, EncryptedWriter, decrypt_stream, derive_key, encrypt_stream, load_key
+)
+
+# Bit of each permission in the role masks
+PERMISSIONS = ('read', 'write', 'configure', 'manage_users')
+
+# Verified tokens remembered by SecurityManager.verify_token
+TOKEN_CACHE_SIZE = 1024
+
+DEFAULT_SECURITY = {
+    "enable_encryption": True,
+    # Master key file (relative to the config directory); None for a key per process
+    "key_file": None,
+    "token_expiry_hours": 8,
+    "max_login_attempts": 3,
+    "max_source_attempts": 10,
+    "lockout_minutes": 15,
+    "hash_workers": 2
+}
+
+# Password hashes queued per hash worker before further logins are refused
+MAX_PENDING_PER_WORKER = 16
+
+
+def token_digest(token) -> bytes:
+    """Cache key of a token; the token itself is not kept"""
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).digest()
+
+
+class LoginAttempts:
+    """
+    Failed logins per key (user name or source address) with lockout
+
+    max_attempts failures within the window lock the key for the rest of
+    the window. A login reserves an attempt before its password is hashed
+    and settles it afterwards, so concurrent logins count against the limit
+    as well: failures plus logins in progress never exceed max_attempts.
+    Forgotten keys are pruned once more than max_keys are tracked, so
+    guessing many user names cannot grow it without bound.
+    """
+
+    def __init__(self, max_attempts: int, window_s: float, max_keys: int = 10000):
+        self.max_attempts = max_attempts
+        self.window = window_s
+        self.max_keys = max_keys
+        self.failures = {}  # key -> [failures, window start, logins in progress]
+        self.lock = threading.Lock()
+
+    def locked_for(self, key) -> float:
+        """Seconds until key may try again; 0 if it may now"""
+        with self.lock:
+            entry = self.failures.get(key)
+            if entry is None:
+                return 0.0
+            remaining = entry[1] + self.window - time.monotonic()
+            if remaining <= 0:
+                if not entry[2]:
+                    del self.failures[key]
+                return 0.0
+            return remaining if entry[0] >= self.max_attempts else 0.0
+
+    def reserve(self, key) -> bool:
+        """Start a login for key; False if its failures and logins in progress use up the limit"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self._entry(key, now)
+            if entry[0] + entry[2] >= self.max_attempts:
+                return False
+            entry[2] += 1
+            return True
+
+    def release(self, key):
+        """End a reserved login without counting it"""
+        with self.lock:
+            entry = self.failures.get(key)
+            if entry is not None and entry[2]:
+                entry[2] -= 1
+
+    def failed(self, key) -> bool:
+        """End a reserved login as a failure; returns whether key is now locked"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self._entry(key, now)
+            if entry[2]:
+                entry[2] -= 1
+            entry[0] += 1
+            return entry[0] >= self.max_attempts
+
+    def succeeded(self, key):
+        """End a reserved login as a success, which forgives earlier failures"""
+        with self.lock:
+            entry = self.failures.get(key)
+            if entry is None:
+                return
+            if entry[2] > 1:
+                entry[0], entry[2] = 0, entry[2] - 1
+            else:
+                del self.failures[key]
+
+    def _entry(self, key, now):
+        entry = self.failures.get(key)
+        if entry is None:
+            if len(self.failures) >= self.max_keys:
+                self._prune(now)
+            entry = self.failures[key] = [0, now, 0]
+        elif entry[1] + self.window <= now:
+            # Window over: failures are forgotten, logins in progress still count
+            entry[0], entry[1] = 0, now
+        return entry
+
+    def _prune(self, now):
+        for key, (_, started, pending) in list(self.failures.items()):
+            if started + self.window <= now and not pending:
+                del self.failures[key]
+
+
 class SecurityManager:
-    def __init__(self):
-        self.secret_key = os.getenv('SECRET_KEY', Fernet.generate_key())
+    def __init__(self, settings: dict = None, token_cache_size: int = TOKEN_CACHE_SIZE):
+        self.logger = logging.getLogger('SCADA_Gateway.Security')
+        self.config = {**DEFAULT_SECURITY, **(settings or {}).get('security', {})}
+        self.secret_key = os.getenv('SECRET_KEY') or self._load_secret_key()
         self.cipher_suite = Fernet(self.secret_key)
+        self.stream_key = derive_key(self.secret_key, b'stream master')
+        self.secret_cipher = Fernet(base64.urlsafe_b64encode(derive_key(self.secret_key, b'config secrets')))
         self.users = {}
         self.roles = {
             'admin': ['read', 'write', 'configure', 'manage_users'],
             'operator': ['read', 'write'],
             'viewer': ['read']
         }
+        self.permission_bits = {permission: 1 << bit for bit, permission in enumerate(PERMISSIONS)}
+        self.role_masks = {}
+        self.compile_roles()
+
+        # Verified tokens: digest -> (expiry, payload), least recently used first.
+        # A hit skips the HMAC and JSON work of jwt.decode.
+        self.token_cache = OrderedDict()
+        self.token_cache_size = token_cache_size
+        self.token_lock = threading.Lock()
+        # Revoked token digests until their expiry, and per user token generations:
+        # tokens carry the generation they were issued in, revoke_user() starts a new one
+        self.revoked_tokens = {}
+        self.token_generations = {}
+
+        # Login attempts are limited per user name and per source address
+        lockout = self.config["lockout_minutes"] * 60
+        self.user_attempts = LoginAttempts(self.config["max_login_attempts"], lockout)
+        self.source_attempts = LoginAttempts(self.config["max_source_attempts"], lockout)
+        # PBKDF2 runs in a few threads (hashlib releases the GIL), never on the event loop
+        self.hash_executor = None
+        self.pending_hashes = 0
+        self.dummy_salt = os.urandom(16)
 
     def create_user(self, username: str, password: str, role: str):
         if role not in self.roles:
@@ -28,32 +183,189 @@ class SecurityManager:
             'role': role
         }
 
-    def authenticate(self, username: str, password: str) -> str:
-        if username not in self.users:
+    def authenticate(self, username: str, password: str, source: str = None) -> str:
+        if not self._reserve_login(username, source):
             return None
+        user = self.users.get(username)
+        try:
+            password_hash = self._hash_password(password, user['salt'] if user else self.dummy_salt)
+        except BaseException:
+            self._release_login(username, source)
+            raise
+        return self._login_result(username, source, user, password_hash)
 
-        user = self.users[username]
-        password_hash = self._hash_password(password, user['salt'])
-        
-        if password_hash != user['password_hash']:
+    async def authenticate_async(self, username: str, password: str, source: str = None) -> str:
+        """
+        authenticate() without blocking the event loop
+
+        The password is hashed in the bounded hash executor. Logins beyond
+        what it can queue are refused instead of piling up behind a burst.
+        """
+        if self.hash_executor is None:
+            self.hash_executor = ThreadPoolExecutor(self.config["hash_workers"], thread_name_prefix='password-hash')
+        if self.pending_hashes >= self.config["hash_workers"] * MAX_PENDING_PER_WORKER:
+            self.logger.warning("Login refused: too many logins in progress")
+            return None
+        if not self._reserve_login(username, source):
+            return None
+        user = self.users.get(username)
+        self.pending_hashes += 1
+        try:
+            password_hash = await asyncio.get_running_loop().run_in_executor(
+                self.hash_executor, self._hash_password, password, user['salt'] if user else self.dummy_salt
+            )
+        except BaseException:
+            self._release_login(username, source)
+            raise
+        finally:
+            self.pending_hashes -= 1
+        return self._login_result(username, source, user, password_hash)
+
+    def _reserve_login(self, username, source) -> bool:
+        """Count the login against the user and source limits before its password is hashed"""
+        if self.user_attempts.reserve(username):
+            if source is None or self.source_attempts.reserve(source):
+                return True
+            self.user_attempts.release(username)
+        self.logger.warning(f"Login refused for {username} from {source or 'local'}: too many attempts")
+        return False
+
+    def _release_login(self, username, source):
+        self.user_attempts.release(username)
+        if source is not None:
+            self.source_attempts.release(source)
+
+    def _login_result(self, username, source, user, password_hash) -> str:
+        # Unknown users cost a hash as well, so timing does not reveal which names exist
+        if user is None or not hmac.compare_digest(password_hash, user['password_hash']):
+            locked = self.user_attempts.failed(username)
+            if source is not None:
+                locked = self.source_attempts.failed(source) or locked
+            if locked:
+                self.logger.warning(f"Too many failed logins for {username} from {source or 'local'}; locked out")
             return None
 
+        self.user_attempts.succeeded(username)
+        if source is not None:
+            self.source_attempts.release(source)
         return self._generate_token(username, user['role'])
 
+    def close(self):
+        if self.hash_executor is not None:
+            self.hash_executor.shutdown(wait=False)
+            self.hash_executor = None
+
+    def compile_roles(self):
+        """Turn the role permission lists into bitmasks; call after changing self.roles"""
+        masks = {}
+        for role, permissions in self.roles.items():
+            mask = 0
+            for permission in permissions:
+                if permission not in self.permission_bits:
+                    self.permission_bits[permission] = 1 << len(self.permission_bits)
+                mask |= self.permission_bits[permission]
+            masks[role] = mask
+        self.role_masks = masks
+
     def verify_token(self, token: str) -> dict:
+        digest = token_digest(token)
+        now = time.time()
+        with self.token_lock:
+            entry = self.token_cache.get(digest)
+            if entry is not None:
+                if entry[0] > now:
+                    self.token_cache.move_to_end(digest)
+                    return entry[1]
+                del self.token_cache[digest]
+            if digest in self.revoked_tokens:
+                return None
+
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
-            return payload
         except jwt.InvalidTokenError:
             return None
+        with self.token_lock:
+            # Checked under the lock so a revocation during decode is not undone by caching
+            generation = self.token_generations.get(payload.get('username'), 0)
+            if digest in self.revoked_tokens or payload.get('gen', 0) < generation:
+                return None
+            self.token_cache[digest] = (payload.get('exp', now), payload)
+            while len(self.token_cache) > self.token_cache_size:
+                self.token_cache.popitem(last=False)
+        return payload
 
     def check_permission(self, token: str, required_permission: str) -> bool:
         payload = self.verify_token(token)
         if not payload:
             return False
 
-        role = payload['role']
-        return required_permission in self.roles[role]
+        return bool(self.role_masks.get(payload['role'], 0) & self.permission_bits.get(required_permission, 0))
+
+    def revoke_token(self, token: str):
+        """Reject a token from now on, even though it is still validly signed"""
+        digest = token_digest(token)
+        try:
+            expiry = jwt.decode(token, self.secret_key, algorithms=['HS256']).get('exp', 0)
+        except jwt.InvalidTokenError:
+            # Expired or not ours: nothing to reject
+            expiry = 0
+        with self.token_lock:
+            self.token_cache.pop(digest, None)
+            if expiry > time.time():
+                self.revoked_tokens[digest] = expiry
+            self._prune_revoked()
+
+    def revoke_user(self, username: str):
+        """Reject every token issued to a user so far (logout everywhere, role change)"""
+        with self.token_lock:
+            self.token_generations[username] = self.token_generations.get(username, 0) + 1
+            for digest, (_, payload) in list(self.token_cache.items()):
+                if payload.get('username') == username:
+                    del self.token_cache[digest]
+
+    def _prune_revoked(self):
+        now = time.time()
+        for digest, expiry in list(self.revoked_tokens.items()):
+            if expiry <= now:
+                del self.revoked_tokens[digest]
+
+    def _load_secret_key(self):
+        key_file = self.config["key_file"]
+        if not key_file:
+            return Fernet.generate_key()
+        if not os.path.isabs(key_file):
+            key_file = os.path.join(os.path.dirname(CONFIG_PATH), key_file)
+        return load_key(key_file)
+
+    def encrypt_stream(self, source, destination, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Encrypt binary file object source into destination in chunks; returns the plaintext size"""
+        return encrypt_stream(source, destination, self.stream_key, chunk_size)
+
+    def decrypt_stream(self, source, destination) -> int:
+        """Decrypt what encrypt_stream wrote; raises InvalidToken if it was altered or truncated"""
+        return decrypt_stream(source, destination, self.stream_key)
+
+    def open_encrypted(self, path: str, mode: str = 'rb', encoding: str = 'utf-8'):
+        """
+        Open an encrypted file like open(): 'rb', 'wb', 'r' or 'w'
+
+        Data is encrypted or decrypted chunk by chunk as it is written or
+        read, so memory use does not depend on the file size.
+        """
+        if mode not in ('rb', 'wb', 'r', 'w'):
+            raise ValueError(f"Unsupported mode: {mode}")
+        raw = open(path, mode[0] + 'b')
+        try:
+            if mode[0] == 'w':
+                stream = io.BufferedWriter(EncryptedWriter(raw, self.stream_key, closefd=True))
+            else:
+                stream = io.BufferedReader(EncryptedReader(raw, self.stream_key, closefd=True))
+        except Exception:
+            raw.close()
+            raise
+        if mode in ('r', 'w'):
+            return io.TextIOWrapper(stream, encoding=encoding)
+        return stream
 
     def encrypt_data(self, data: str) -> bytes:
         return self.cipher_suite.encrypt(data.encode())
@@ -61,6 +373,14 @@ class SecurityManager:
     def decrypt_data(self, encrypted_data: bytes) -> str:
         return self.cipher_suite.decrypt(encrypted_data).decode()
 
+    def encrypt_secret(self, text: str) -> str:
+        """A secret config value (a password) as text that is safe to store in a settings file"""
+        return self.secret_cipher.encrypt(text.encode()).decode('ascii')
+
+    def decrypt_secret(self, token: str) -> str:
+        """Inverse of encrypt_secret; raises InvalidToken for another key or altered text"""
+        return self.secret_cipher.decrypt(token.encode('ascii')).decode()
+
     def _hash_password(self, password: str, salt: bytes) -> bytes:
         return hashlib.pbkdf2_hmac(
             'sha256',
@@ -70,9 +390,13 @@ class SecurityManager:
         )
 
     def _generate_token(self, username: str, role: str) -> str:
+        now = datetime.utcnow()
         payload = {
             'username': username,
             'role': role,
-            'exp': datetime.utcnow() + timedelta(hours=8)
+            'iat': now,
+            'gen': self.token_generations.get(username, 0),
+            'exp': now + timedelta(hours=self.config["token_expiry_hours"])
         }
-        return jwt.encode(payload, self.secret_key, algorithm='HS256')
\ No newline at end of file
+        return jwt.encode(payload, self.secret_key, algorithm='HS256')
+
@@ -0,0 +1,503 @@
+"""
+Multi-process sharding for SCADA Data Gateway
+Connections are spread over worker processes that write into one shared
+memory current value table; the router process reads changes from it
+
+Layout:
+    value table  one 24 byte slot per point: sequence, quality, kind,
+                 value (float64 or int64) and timestamp (epoch ms).
+                 Every worker owns a contiguous range of slots, so slots
+                 have exactly one writer. Writers use a sequence lock (odd
+                 while writing) so the router never sees a torn slot.
+    change ring  one per worker: single producer / single consumer ring of
+                 changed slot indices. The worker only advances head, the
+                 router only advances tail, so no lock is needed. When the
+                 ring is full the worker sets the overflow flag and the
+                 router rescans that worker's slots by sequence number.
+
+New points (slot assignments) and values that are not numbers (strings,
+lists) go through a multiprocessing queue; they are rare compared to
+numeric changes, as are connection status changes and failed writes,
+which take the same way. Writes go the other way, through a command
+queue per worker, to the worker that owns the destination connection.
+
+GatewayRuntime runs in this mode with "mode": "sharded" in the
+"runtime" settings section.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import struct
+from multiprocessing import shared_memory
+
+from .protocols.base_handler import (
+    QUALITY_CODES, QUALITY_NAMES, QUALITY_UNCERTAIN, ConnectionStatus, DataBatch, now_ms, point_key, timestamp_ms
+)
+from .protocols.supervisor import SupervisorState
+
+SLOT = struct.Struct('<IBBxxdq')
+SLOT_INT = struct.Struct('<IBBxxqq')
+SEQUENCE = struct.Struct('<I')
+SLOT_SIZE = SLOT.size
+
+KIND_EMPTY = 0
+KIND_FLOAT = 1
+KIND_INT = 2
+KIND_BOOL = 3
+KIND_NONE = 4
+KIND_OBJECT = 5
+
+RING_HEADER = 64
+RING_HEAD = 0
+RING_TAIL = 8
+RING_OVERFLOW = 16
+COUNTER = struct.Struct('<Q')
+INDEX = struct.Struct('<I')
+
+
+def tag_key(tag):
+    """Key of a scanned tag in the value table: the tag itself, or its JSON for dict tags"""
+    return tag if isinstance(tag, str) else json.dumps(tag, sort_keys=True)
+
+
+def _kind(value):
+    if value is None:
+        return KIND_NONE, 0.0
+    if isinstance(value, bool):
+        return KIND_BOOL, int(value)
+    if isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        return KIND_INT, value
+    if isinstance(value, float):
+        return KIND_FLOAT, value
+    return KIND_OBJECT, math.nan
+
+
+class _ShardWriter:
+    """Worker side: assigns slots and writes values into the shared table"""
+
+    def __init__(self, table, ring, slot_base, slot_count, messages):
+        self.table = table.buf
+        self.ring = ring.buf
+        self.ring_mask = (len(ring.buf) - RING_HEADER) // INDEX.size - 1
+        self.slot_base = slot_base
+        self.slot_end = slot_base + slot_count
+        self.next_slot = slot_base
+        self.slots = {}
+        self.messages = messages
+        self.dropped = 0
+
+    def slot(self, connection_id, key):
+        slot = self.slots.get((connection_id, key))
+        if slot is None:
+            if self.next_slot >= self.slot_end:
+                return None
+            slot = self.slots[(connection_id, key)] = self.next_slot
+            self.next_slot += 1
+            self.messages.put(('slot', slot, connection_id, key))
+        return slot
+
+    def publish(self, connection_id, updates):
+        table = self.table
+        for update in updates:
+            key = point_key(update)
+            slot = self.slot(connection_id, key) if key is not None else None
+            if slot is None:
+                self.dropped += 1
+                continue
+            value = update.get('value')
+            kind, stored = _kind(value)
+            quality = QUALITY_CODES.get(str(update.get('quality', 'GOOD')).split(',', 1)[0], QUALITY_UNCERTAIN)
+            timestamp = update.get('timestamp')
+            timestamp = timestamp if isinstance(timestamp, int) else (timestamp_ms(timestamp) or now_ms())
+            offset = slot * SLOT_SIZE
+            sequence = SEQUENCE.unpack_from(table, offset)[0]
+            # Odd sequence while the slot is being written
+            SEQUENCE.pack_into(table, offset, (sequence + 1) & 0xFFFFFFFF)
+            packer = SLOT_INT if kind in (KIND_INT, KIND_BOOL) else SLOT
+            packer.pack_into(table, offset, (sequence + 1) & 0xFFFFFFFF, quality, kind, stored, timestamp)
+            SEQUENCE.pack_into(table, offset, (sequence + 2) & 0xFFFFFFFF)
+            if kind == KIND_OBJECT:
+                self.messages.put(('value', slot, value))
+            else:
+                self.notify(slot)
+
+    def notify(self, slot):
+        ring = self.ring
+        head = COUNTER.unpack_from(ring, RING_HEAD)[0]
+        tail = COUNTER.unpack_from(ring, RING_TAIL)[0]
+        if head - tail > self.ring_mask:
+            COUNTER.pack_into(ring, RING_OVERFLOW, 1)
+            return
+        INDEX.pack_into(ring, RING_HEADER + (head & self.ring_mask) * INDEX.size, slot)
+        COUNTER.pack_into(ring, RING_HEAD, head + 1)
+
+
+async def _scan(manager, connection_id, scan, writer):
+    """Poll the tags of a connection that does not push its values"""
+    interval = scan.get('interval_ms', 1000) / 1000.0
+    tags = scan.get('tags', [])
+    connection = manager.get(connection_id)
+    while True:
+        await asyncio.sleep(interval)
+        if connection.supervisor is None or connection.supervisor.state != SupervisorState.CONNECTED:
+            continue
+        try:
+            results = await manager.read(connection_id, tags)
+        except Exception as e:
+            logging.getLogger('SCADA_Gateway.Shard').debug(f"{connection_id}: scan failed: {str(e)}")
+            continue
+        updates = []
+        for tag, result in zip(tags, results):
+            update = dict(result) if isinstance(result, dict) else {'value': result}
+            # Published under the key the router knows the tag by (see tag_key)
+            update['tag'] = tag_key(tag)
+            updates.append(update)
+        writer.publish(connection_id, updates)
+
+
+async def _write(manager, messages, connection_id, tags, values, keys):
+    """Run a write sent by the router; failures go back so it writes the values again"""
+    connection = manager.get(connection_id)
+    if connection.status != ConnectionStatus.CONNECTED:
+        messages.put(('write_failed', connection_id, keys, "not connected"))
+        return
+    try:
+        results = await manager.write(connection_id, tags, values)
+    except Exception as e:
+        messages.put(('write_failed', connection_id, keys, str(e)))
+        return
+    failed = [key for key, ok in zip(keys, results or [True] * len(keys)) if not ok]
+    if failed:
+        messages.put(('write_failed', connection_id, failed, "rejected by the device"))
+
+
+async def _commands(manager, commands, messages):
+    """Run the router's commands until None arrives"""
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    while True:
+        command = await loop.run_in_executor(None, commands.get)
+        if command is None:
+            break
+        _, connection_id, tags, values, keys = command
+        task = loop.create_task(_write(manager, messages, connection_id, tags, values, keys))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+async def _worker_loop(connections, writer, stop_event, settings, commands):
+    from .connections import ConnectionManager
+
+    manager = ConnectionManager(settings)
+    loop = asyncio.get_running_loop()
+    tasks = []
+    for entry in connections:
+        connection = manager.add(entry["protocol"], entry.get("name"), entry.get("config"), entry["id"])
+        connection.handler.add_data_callback(
+            lambda updates, connection_id=connection.id: writer.publish(connection_id, updates)
+        )
+        connection.handler.add_status_callback(
+            lambda status, connection_id=connection.id: writer.messages.put(('status', connection_id, status.value))
+        )
+        if entry.get("points"):
+            # Points an IEC 104 server connection serves (ioa -> type)
+            connection.handler.serve_points(entry["points"])
+        manager.start(connection.id)
+        scan = entry.get("scan")
+        if scan and scan.get("tags"):
+            tasks.append(loop.create_task(_scan(manager, connection.id, scan, writer)))
+    command_task = loop.create_task(_commands(manager, commands, writer.messages))
+    await loop.run_in_executor(None, stop_event.wait)
+    # Wakes the command reader; writes already sent are finished first
+    commands.put(None)
+    await command_task
+    for task in tasks:
+        task.cancel()
+    await manager.stop_all()
+
+
+def _worker_main(index, connections, table_name, ring_name, slot_base, slot_count, messages, stop_event, settings,
+                 commands):
+    """Entry point of a worker process"""
+    table = shared_memory.SharedMemory(table_name)
+    ring = shared_memory.SharedMemory(ring_name)
+    writer = _ShardWriter(table, ring, slot_base, slot_count, messages)
+    try:
+        asyncio.run(_worker_loop(connections, writer, stop_event, settings, commands))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Views into the segments must go before the segments can close
+        writer.table = writer.ring = None
+        table.close()
+        ring.close()
+
+
+class ShardedRuntime:
+    """
+    Runs connections in worker processes and collects their changes
+
+    Args:
+        connections (list): Connection dicts (id, protocol, name, config and
+                            an optional "scan": {"interval_ms", "tags"} for
+                            protocols that must be polled)
+        workers (int): Number of worker processes (CPU count by default)
+        settings (dict): Application settings handed to the workers
+        slots_per_worker (int): Points each worker can publish
+        ring_size (int): Change ring entries per worker (power of two)
+        poll_interval_ms (int): Router poll period of run()
+    """
+
+    def __init__(self, connections, workers=None, settings=None, slots_per_worker=65536, ring_size=16384,
+                 poll_interval_ms=10):
+        if ring_size & (ring_size - 1):
+            raise ValueError("ring_size must be a power of two")
+        self.logger = logging.getLogger('SCADA_Gateway.Shard')
+        self.connections = list(connections)
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.connections) or 1))
+        self.settings = settings or {}
+        self.slots_per_worker = slots_per_worker
+        self.ring_size = ring_size
+        self.poll_interval_ms = poll_interval_ms
+        self.context = multiprocessing.get_context('spawn')
+        self.table = None
+        self.rings = []
+        self.processes = []
+        self.messages = None
+        self.commands = []      # worker -> command queue (writes)
+        self.stop_event = None
+        self.points = {}        # slot -> (connection_id, key)
+        self.slot_index = {}    # (connection_id, key) -> slot
+        self.objects = {}       # slot -> last non-numeric value
+        self.sequences = None   # slot -> last sequence seen by the router
+        self.changed_objects = set()
+        self.unregistered = set()  # changed slots whose registration has not arrived yet
+        self.statuses = {}      # connection_id -> ConnectionStatus value reported since the last take
+        self.failed_writes = []  # (connection_id, keys, error) reported since the last take
+        self.assignment = {}
+
+    @classmethod
+    def from_settings(cls, connections, settings):
+        """Runtime configured by an optional "sharding" settings section (workers 0 means one per CPU)"""
+        sharding = settings.get('sharding', {})
+        return cls(
+            connections,
+            sharding.get('workers') or None,
+            settings,
+            sharding.get('slots_per_worker', 65536),
+            sharding.get('ring_size', 16384),
+            sharding.get('poll_interval_ms', 10)
+        )
+
+    def assign(self):
+        """Spread connections over workers round robin; returns [[connection, ...], ...]"""
+        shards = [[] for _ in range(self.workers)]
+        for position, connection in enumerate(self.connections):
+            shards[position % self.workers].append(connection)
+        return shards
+
+    def start(self):
+        slot_total = self.workers * self.slots_per_worker
+        self.table = shared_memory.SharedMemory(create=True, size=slot_total * SLOT_SIZE)
+        self.table.buf[:] = bytes(len(self.table.buf))
+        self.sequences = [0] * slot_total
+        self.messages = self.context.Queue()
+        self.stop_event = self.context.Event()
+        for index, shard in enumerate(self.assign()):
+            ring = shared_memory.SharedMemory(create=True, size=RING_HEADER + self.ring_size * INDEX.size)
+            ring.buf[:RING_HEADER] = bytes(RING_HEADER)
+            self.rings.append(ring)
+            commands = self.context.Queue()
+            self.commands.append(commands)
+            for connection in shard:
+                self.assignment[connection["id"]] = index
+            process = self.context.Process(
+                target=_worker_main,
+                args=(index, shard, self.table.name, ring.name, index * self.slots_per_worker,
+                      self.slots_per_worker, self.messages, self.stop_event, self.settings, commands),
+                name=f"gateway-shard-{index}",
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        self.logger.info(f"Started {self.workers} shard workers for {len(self.connections)} connections")
+
+    def stop(self, timeout=10.0):
+        """Stop the workers (they disconnect in order) and release shared memory"""
+        if self.stop_event is not None:
+            self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                self.logger.warning(f"{process.name} did not stop, terminating")
+                process.terminate()
+                process.join()
+        self.processes = []
+        if self.messages is not None:
+            self.messages.close()
+            self.messages.join_thread()
+            self.messages = None
+        for commands in self.commands:
+            # Commands of a worker that is gone are not delivered
+            commands.cancel_join_thread()
+            commands.close()
+        self.commands = []
+        for segment in self.rings + ([self.table] if self.table else []):
+            segment.close()
+            segment.unlink()
+        self.rings = []
+        self.table = None
+
+    # Reading
+
+    def _drain_messages(self):
+        while True:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                return
+            kind = message[0]
+            if kind == 'slot':
+                _, slot, connection_id, key = message
+                self.points[slot] = (connection_id, key)
+                self.slot_index[(connection_id, key)] = slot
+            elif kind == 'value':
+                _, slot, value = message
+                self.objects[slot] = value
+                self.changed_objects.add(slot)
+            elif kind == 'status':
+                _, connection_id, status = message
+                self.statuses[connection_id] = status
+            elif kind == 'write_failed':
+                self.failed_writes.append(message[1:])
+
+    def _read_slot(self, slot):
+        """Consistent (sequence, quality, kind, value, timestamp) of a slot, or None while being written"""
+        buffer = self.table.buf
+        offset = slot * SLOT_SIZE
+        for _ in range(100):
+            sequence, quality, kind, value, timestamp = SLOT.unpack_from(buffer, offset)
+            if sequence & 1:
+                continue
+            if kind in (KIND_INT, KIND_BOOL):
+                value = SLOT_INT.unpack_from(buffer, offset)[3]
+                value = bool(value) if kind == KIND_BOOL else value
+            elif kind == KIND_NONE:
+                value = None
+            elif kind == KIND_OBJECT:
+                value = self.objects.get(slot)
+            if SEQUENCE.unpack_from(buffer, offset)[0] == sequence:
+                return sequence, quality, kind, value, timestamp
+        return None
+
+    def _changed_slots(self, worker):
+        ring = self.rings[worker].buf
+        mask = self.ring_size - 1
+        head = COUNTER.unpack_from(ring, RING_HEAD)[0]
+        tail = COUNTER.unpack_from(ring, RING_TAIL)[0]
+        slots = {INDEX.unpack_from(ring, RING_HEADER + (position & mask) * INDEX.size)[0]
+                 for position in range(tail, head)}
+        COUNTER.pack_into(ring, RING_TAIL, head)
+        if COUNTER.unpack_from(ring, RING_OVERFLOW)[0]:
+            # Changes were dropped: compare every slot of the worker
+            COUNTER.pack_into(ring, RING_OVERFLOW, 0)
+            base = worker * self.slots_per_worker
+            buffer = self.table.buf
+            for slot in range(base, base + self.slots_per_worker):
+                sequence = SEQUENCE.unpack_from(buffer, slot * SLOT_SIZE)[0]
+                if sequence and sequence != self.sequences[slot]:
+                    slots.add(slot)
+        return slots
+
+    def poll(self, batch=None):
+        """
+        Collect the points changed since the last poll
+
+        Returns:
+            DataBatch: tags are (connection_id, key) tuples
+        """
+        slots = set()
+        for worker in range(len(self.rings)):
+            slots |= self._changed_slots(worker)
+        # Registrations come by queue and can trail their first ring entry:
+        # drain after the rings, and retry slots still unknown on the next poll
+        self._drain_messages()
+        slots |= self.changed_objects
+        slots |= self.unregistered
+        self.changed_objects.clear()
+        points = self.points
+        self.unregistered = {slot for slot in slots if slot not in points}
+        rows = []
+        for slot in slots:
+            if slot not in points:
+                continue
+            state = self._read_slot(slot)
+            if state is None:
+                # Still being written: report it on the next poll
+                self.changed_objects.add(slot)
+                continue
+            rows.append((slot, state))
+        batch = (batch or DataBatch()).reset([points[slot] for slot, _ in rows])
+        for index, (slot, (sequence, quality, _, value, timestamp)) in enumerate(rows):
+            self.sequences[slot] = sequence
+            batch.set(index, value, quality, timestamp)
+        return batch
+
+    def read(self, connection_id, key):
+        """Current value of one point as a result dictionary, or None if never published"""
+        self._drain_messages()
+        slot = self.slot_index.get((connection_id, str(key)))
+        state = self._read_slot(slot) if slot is not None else None
+        if state is None:
+            return None
+        _, quality, _, value, timestamp = state
+        return {'value': value, 'quality': QUALITY_NAMES[quality], 'timestamp': timestamp}
+
+    def take_statuses(self):
+        """Connection status changes since the last call: [(connection_id, ConnectionStatus value)]"""
+        statuses, self.statuses = self.statuses, {}
+        return list(statuses.items())
+
+    def take_failed_writes(self):
+        """Writes the workers could not make since the last call: [(connection_id, keys, error)]"""
+        failed, self.failed_writes = self.failed_writes, []
+        return failed
+
+    # Writing
+
+    def write(self, connection_id, tags, values, keys=None):
+        """
+        Have the worker owning connection_id write values to tags
+
+        Writes are not awaited. Those that fail come back from
+        take_failed_writes() with the keys given here (tags by default).
+        """
+        keys = list(keys) if keys is not None else [tag_key(tag) for tag in tags]
+        self.commands[self.assignment[connection_id]].put(('write', connection_id, list(tags), list(values), keys))
+
+    async def run(self, callback):
+        """Poll forever, handing every non-empty DataBatch to callback"""
+        batch = DataBatch()
+        interval = self.poll_interval_ms / 1000.0
+        while True:
+            self.poll(batch)
+            if len(batch):
+                callback(batch)
+            await asyncio.sleep(interval)
+
+    def get_status(self):
+        return {
+            "workers": [
+                {"name": process.name, "pid": process.pid, "alive": process.is_alive()}
+                for process in self.processes
+            ],
+            "connections": dict(self.assignment),
+            "points": len(self.points)
+        }
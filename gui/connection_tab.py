@@ -1,11 +1,76 @@
-from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableWidget, 
-                           QTableWidgetItem, QPushButton, QHBoxLayout)
-from PyQt5.QtCore import Qt
+import asyncio
+import json
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableWidget,
+                           QTableWidgetItem, QPushButton, QHBoxLayout,
+                           QDialog, QFormLayout, QComboBox, QLineEdit,
+                           QPlainTextEdit, QMessageBox, QAbstractItemView)
+from PyQt5.QtCore import Qt, QTimer
+
+class ConnectionDialog(QDialog):
+    def __init__(self, connection_manager, connection=None, parent=None):
+        super().__init__(parent)
+        self.connection_manager = connection_manager
+        self.connection = connection
+        self.config = None
+        self.init_ui()
+
+    def init_ui(self):
+        self.setWindowTitle("Edit Connection" if self.connection else "Add Connection")
+        layout = QFormLayout(self)
+
+        # Protocol selection (fixed once the connection exists)
+        self.protocol = QComboBox()
+        self.protocol.addItems(self.connection_manager.protocols())
+        if self.connection:
+            self.protocol.setCurrentText(self.connection.protocol)
+            self.protocol.setEnabled(False)
+        layout.addRow("Protocol:", self.protocol)
+
+        self.name = QLineEdit(self.connection.name if self.connection else "")
+        layout.addRow("Name:", self.name)
+
+        # Protocol specific configuration as JSON, prefilled from the template
+        self.config_edit = QPlainTextEdit()
+        self.config_edit.setMinimumSize(420, 300)
+        layout.addRow("Configuration:", self.config_edit)
+        if self.connection:
+            self.config_edit.setPlainText(json.dumps(self.connection.config, indent=2))
+        else:
+            self.load_template(self.protocol.currentText())
+            self.protocol.currentTextChanged.connect(self.load_template)
+
+        # Buttons
+        button_box = QHBoxLayout()
+        ok_button = QPushButton("OK")
+        cancel_button = QPushButton("Cancel")
+
+        ok_button.clicked.connect(self.accept)
+        cancel_button.clicked.connect(self.reject)
+
+        button_box.addWidget(ok_button)
+        button_box.addWidget(cancel_button)
+        layout.addRow(button_box)
+
+    def load_template(self, protocol):
+        if protocol:
+            template = self.connection_manager.config_template(protocol)
+            self.config_edit.setPlainText(json.dumps(template, indent=2))
+
+    def accept(self):
+        try:
+            self.config = json.loads(self.config_edit.toPlainText())
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Configuration", f"Configuration is not valid JSON: {str(e)}")
+            return
+        super().accept()
 
 class ConnectionTab(QWidget):
-    def __init__(self, protocols, parent=None):
+    COLUMNS = ["ID", "Protocol", "Name", "Status", "Address", "Port"]
+
+    def __init__(self, connection_manager, parent=None):
         super().__init__(parent)
-        self.protocols = protocols
+        self.connection_manager = connection_manager
+        self.tasks = set()
         self.init_ui()
 
     def init_ui(self):
@@ -16,18 +81,22 @@ class ConnectionTab(QWidget):
         add_btn = QPushButton("Add Connection")
         edit_btn = QPushButton("Edit Connection")
         delete_btn = QPushButton("Delete Connection")
+        connect_btn = QPushButton("Connect")
+        disconnect_btn = QPushButton("Disconnect")
 
         button_layout.addWidget(add_btn)
         button_layout.addWidget(edit_btn)
         button_layout.addWidget(delete_btn)
+        button_layout.addWidget(connect_btn)
+        button_layout.addWidget(disconnect_btn)
         button_layout.addStretch()
 
         # Connection table
         self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels([
-            "Protocol", "Name", "Status", "Address", "Port"
-        ])
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
 
         # Add layouts to main layout
         layout.addLayout(button_layout)
@@ -37,15 +106,94 @@ class ConnectionTab(QWidget):
         add_btn.clicked.connect(self.add_connection)
         edit_btn.clicked.connect(self.edit_connection)
         delete_btn.clicked.connect(self.delete_connection)
+        connect_btn.clicked.connect(self.connect_selected)
+        disconnect_btn.clicked.connect(self.disconnect_selected)
+
+        # Keep the status column current
+        refresh_rate = self.connection_manager.settings.get('gui', {}).get('refresh_rate_ms', 1000)
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.refresh_status)
+        self.status_timer.start(refresh_rate)
+
+        self.refresh_table()
+
+    def selected_connection(self):
+        row = self.table.currentRow()
+        if row < 0:
+            return None
+        return self.connection_manager.get(self.table.item(row, 0).text())
 
     def add_connection(self):
-        # TODO: Implement add connection dialog
-        pass
+        dialog = ConnectionDialog(self.connection_manager, parent=self)
+        if dialog.exec_():
+            try:
+                self.connection_manager.add(
+                    dialog.protocol.currentText(), dialog.name.text() or None, dialog.config
+                )
+            except ValueError as e:
+                QMessageBox.warning(self, "Add Connection", str(e))
+            self.refresh_table()
 
     def edit_connection(self):
-        # TODO: Implement edit connection dialog
-        pass
+        connection = self.selected_connection()
+        if connection is None:
+            return
+        dialog = ConnectionDialog(self.connection_manager, connection, parent=self)
+        if dialog.exec_():
+            try:
+                self.connection_manager.configure(connection.id, dialog.name.text() or None, dialog.config)
+            except ValueError as e:
+                QMessageBox.warning(self, "Edit Connection", str(e))
+            self.refresh_table()
 
     def delete_connection(self):
-        # TODO: Implement delete connection functionality
-        pass
\ No newline at end of file
+        connection = self.selected_connection()
+        if connection is None:
+            return
+        try:
+            self.connection_manager.delete(connection.id)
+        except ValueError as e:
+            QMessageBox.warning(self, "Delete Connection", str(e))
+        self.refresh_table()
+
+    def connect_selected(self):
+        """Start the selected connection; it connects in the background on the asyncio loop"""
+        connection = self.selected_connection()
+        if connection is not None:
+            self.connection_manager.start(connection.id)
+
+    def disconnect_selected(self):
+        connection = self.selected_connection()
+        if connection is not None:
+            self.run_async(self.connection_manager.stop(connection.id), "Disconnect")
+
+    def run_async(self, coroutine, title):
+        """Run a coroutine on the asyncio loop without blocking the GUI; errors are shown when it ends"""
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(lambda task: self._task_done(task, title))
+
+    def _task_done(self, task, title):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            QMessageBox.warning(self, title, str(task.exception()))
+        self.refresh_status()
+
+    def refresh_table(self):
+        connections = list(self.connection_manager)
+        self.table.setRowCount(len(connections))
+        for row, connection in enumerate(connections):
+            host, port = connection.address
+            for column, text in enumerate((
+                connection.id, connection.protocol, connection.name,
+                connection.status.value, str(host or ""), "" if port is None else str(port)
+            )):
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+    def refresh_status(self):
+        for row, connection in enumerate(self.connection_manager):
+            if row >= self.table.rowCount():
+                break
+            item = self.table.item(row, 3)
+            if item is not None and item.text() != connection.status.value:
+                item.setText(connection.status.value)
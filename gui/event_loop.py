@@ -0,0 +1,202 @@
+"""
+Qt/asyncio integration for the SCADA Data Gateway GUI
+Qt and asyncio share the GUI thread: Qt owns the wait and asyncio callbacks
+run from Qt events, so handler coroutines and GUI events interleave
+
+The asyncio loop never blocks in select(). Every registered file descriptor
+gets a QSocketNotifier and a single-shot precise QTimer is armed for the
+next ready or scheduled callback, so nothing is polled. A callback that
+blocks still freezes the window: blocking calls (paho connect, PBKDF2)
+belong in loop.run_in_executor. LatencyProbe measures the result.
+"""
+
+import asyncio
+import math
+import selectors
+import sys
+import threading
+import time
+from asyncio import events
+from collections import deque
+
+from PyQt5.QtCore import QEventLoop, QObject, QSocketNotifier, Qt, QTimer
+
+_NOTIFIER_TYPES = ((selectors.EVENT_READ, QSocketNotifier.Read), (selectors.EVENT_WRITE, QSocketNotifier.Write))
+
+
+class _QtSelector(selectors.DefaultSelector):
+    """Selector that never blocks and wakes the loop through QSocketNotifiers"""
+
+    def __init__(self, wakeup):
+        super().__init__()
+        self.wakeup = wakeup
+        self.notifiers = {}  # fd -> [read notifier, write notifier]
+
+    def register(self, fileobj, events, data=None):
+        key = super().register(fileobj, events, data)
+        self._watch(key)
+        return key
+
+    def modify(self, fileobj, events, data=None):
+        key = super().modify(fileobj, events, data)
+        self._watch(key)
+        return key
+
+    def unregister(self, fileobj):
+        key = super().unregister(fileobj)
+        for notifier in self.notifiers.pop(key.fd, ()):
+            if notifier is not None:
+                notifier.setEnabled(False)
+        return key
+
+    def _watch(self, key):
+        notifiers = self.notifiers.setdefault(key.fd, [None, None])
+        for index, (event, notifier_type) in enumerate(_NOTIFIER_TYPES):
+            wanted = bool(key.events & event)
+            if wanted and notifiers[index] is None:
+                notifier = QSocketNotifier(key.fd, notifier_type)
+                notifier.activated.connect(self.wakeup)
+                notifiers[index] = notifier
+            elif not wanted and notifiers[index] is not None:
+                notifiers[index].setEnabled(False)
+                notifiers[index] = None
+
+    def select(self, timeout=None):
+        # Qt does the waiting; only collect what is ready now
+        return super().select(0)
+
+    def close(self):
+        for notifiers in self.notifiers.values():
+            for notifier in notifiers:
+                if notifier is not None:
+                    notifier.setEnabled(False)
+        self.notifiers.clear()
+        super().close()
+
+
+class QtEventLoop(asyncio.SelectorEventLoop):
+    """
+    asyncio event loop running inside the Qt event loop
+
+    Needs a QCoreApplication/QApplication. run_forever() runs a QEventLoop,
+    so run_until_complete() can be used before or after the main window is
+    shown, e.g. to disconnect everything after the last window closed.
+    """
+
+    def __init__(self):
+        self._processing = False
+        self._qt_loop = None
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self._process)
+        super().__init__(_QtSelector(self._wakeup))
+
+    def _wakeup(self, *args):
+        # Inside _process the timer is re-armed afterwards anyway
+        if not self._processing and self._qt_loop is not None:
+            self._timer.start(0)
+
+    def _process(self):
+        if self._processing:
+            # Re-entered from a nested Qt event loop (a modal dialog opened by a callback)
+            return
+        self._processing = True
+        try:
+            self._run_once()
+        finally:
+            self._processing = False
+        if self._stopping:
+            self._qt_loop.quit()
+            return
+        if self._ready:
+            self._timer.start(0)
+        elif self._scheduled:
+            delay = self._scheduled[0].when() - self.time()
+            self._timer.start(max(0, math.ceil(delay * 1000)))
+
+    def call_soon(self, callback, *args, context=None):
+        handle = super().call_soon(callback, *args, context=context)
+        self._wakeup()
+        return handle
+
+    def call_at(self, when, callback, *args, context=None):
+        handle = super().call_at(when, callback, *args, context=context)
+        self._wakeup()
+        return handle
+
+    def stop(self):
+        super().stop()
+        self._wakeup()
+
+    def run_forever(self):
+        self._check_closed()
+        self._check_running()
+        self._set_coroutine_origin_tracking(self._debug)
+        old_agen_hooks = sys.get_asyncgen_hooks()
+        self._thread_id = threading.get_ident()
+        sys.set_asyncgen_hooks(firstiter=self._asyncgen_firstiter_hook, finalizer=self._asyncgen_finalizer_hook)
+        events._set_running_loop(self)
+        self._qt_loop = QEventLoop()
+        try:
+            self._timer.start(0)
+            self._qt_loop.exec_()
+        finally:
+            self._stopping = False
+            self._timer.stop()
+            self._qt_loop = None
+            self._thread_id = None
+            events._set_running_loop(None)
+            self._set_coroutine_origin_tracking(False)
+            sys.set_asyncgen_hooks(*old_agen_hooks)
+
+
+class LatencyProbe(QObject):
+    """
+    Measures GUI responsiveness as the lateness of a periodic Qt timer
+
+    A timer that fires late means user input waited just as long, so the
+    percentiles are what an operator feels under load.
+
+    Args:
+        interval_ms (int): Probe period
+        samples (int): Number of recent measurements kept
+    """
+
+    def __init__(self, interval_ms=50, samples=1200, parent=None):
+        super().__init__(parent)
+        self.interval = interval_ms / 1000.0
+        self.lags = deque(maxlen=samples)
+        self.last = None
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self._tick)
+        self.timer.setInterval(interval_ms)
+
+    def start(self):
+        self.last = time.perf_counter()
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def reset(self):
+        self.lags.clear()
+        self.last = time.perf_counter()
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.lags.append(max(0.0, (now - self.last - self.interval) * 1000))
+        self.last = now
+
+    def stats(self):
+        """Lag percentiles in milliseconds"""
+        lags = sorted(self.lags)
+        if not lags:
+            return {"samples": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(lags),
+            "p50_ms": round(lags[len(lags) // 2], 2),
+            "p99_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 2),
+            "max_ms": round(lags[-1], 2)
+        }
@@ -1,23 +1,57 @@
-from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTextEdit, 
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QPlainTextEdit,
                            QHBoxLayout, QPushButton, QComboBox,
                            QLabel, QFileDialog)
 from PyQt5.QtCore import Qt, QTimer
+from collections import deque
 import logging
 import datetime
+from core.metrics import RateMeter
 
-class QTextEditLogger(logging.Handler):
-    def __init__(self, parent):
+class RingBufferHandler(logging.Handler):
+    """
+    Logging handler that only queues records, from any thread
+
+    emit() appends the unformatted record to a bounded queue (deque appends
+    are thread safe) and returns; the GUI drains the queue on a timer.
+    Records below the handler level are dropped by logging before emit,
+    so they are never formatted. The last capacity records are kept for
+    redisplay and export.
+    """
+
+    def __init__(self, capacity=10000):
         super().__init__()
-        self.widget = QTextEdit(parent)
-        self.widget.setReadOnly(True)
+        self.incoming = deque(maxlen=capacity)
+        self.records = deque(maxlen=capacity)
+        self.received = 0
 
     def emit(self, record):
-        msg = self.format(record)
-        self.widget.append(msg)
+        self.received += 1
+        self.incoming.append(record)
+
+    def drain(self):
+        """Move queued records into the ring buffer (GUI thread); returns them"""
+        batch = []
+        incoming = self.incoming
+        while incoming:
+            batch.append(incoming.popleft())
+        self.records.extend(batch)
+        return batch
+
+    def clear(self):
+        self.incoming.clear()
+        self.records.clear()
 
 class LogsTab(QWidget):
-    def __init__(self, parent=None):
+    FLUSH_INTERVAL_MS = 200
+    # A flood shows only its newest lines; the rest stay in the ring buffer for export
+    MAX_LINES_PER_FLUSH = 2000
+
+    def __init__(self, settings=None, connection_manager=None, security_manager=None, parent=None):
         super().__init__(parent)
+        self.settings = settings or {}
+        self.connection_manager = connection_manager
+        self.security_manager = security_manager
+        self.value_rate = RateMeter()
         self.init_ui()
         self.setup_logger()
 
@@ -48,26 +82,56 @@ class LogsTab(QWidget):
         controls_layout.addWidget(export_btn)
         controls_layout.addStretch()
 
-        # Log display
-        self.log_widget = QTextEditLogger(self)
-        self.log_widget.widget.setLineWrapMode(QTextEdit.NoWrap)
+        # Log display, bounded to the ring buffer size
+        capacity = self.settings.get('gui', {}).get('log_buffer_lines', 10000)
+        self.log_handler = RingBufferHandler(capacity)
+        self.log_view = QPlainTextEdit(self)
+        self.log_view.setReadOnly(True)
+        self.log_view.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.log_view.setMaximumBlockCount(capacity)
 
         # Add all to main layout
         layout.addLayout(controls_layout)
-        layout.addWidget(self.log_widget.widget)
+        layout.addWidget(self.log_view)
 
     def setup_logger(self):
         self.logger = logging.getLogger('SCADA_Gateway')
-        self.logger.setLevel(logging.INFO)
-        
+        # Start at the configured level (application.log_level), INFO if none
+        if self.logger.level == logging.NOTSET:
+            self.logger.setLevel(logging.INFO)
+        self.log_handler.setLevel(self.logger.level)
+        self.level_combo.setCurrentText(logging.getLevelName(self.logger.level))
+
         # Add our custom handler
-        self.log_widget.setFormatter(
+        self.log_handler.setFormatter(
             logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         )
-        self.logger.addHandler(self.log_widget)
+        self.logger.addHandler(self.log_handler)
+
+        # Append queued records in batches
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.flush_logs)
+        self.flush_timer.start(self.FLUSH_INTERVAL_MS)
 
         # Start periodic logging of statistics
-        self.start_stats_logging()
+        if self.connection_manager is not None:
+            self.start_stats_logging()
+
+    def flush_logs(self):
+        batch = self.log_handler.drain()
+        if batch:
+            self.append_records(batch)
+
+    def append_records(self, records):
+        """Format and append records at or above the selected level in one block"""
+        level = self.log_handler.level
+        records = [record for record in records if record.levelno >= level]
+        skipped = len(records) - self.MAX_LINES_PER_FLUSH
+        lines = [self.log_handler.format(record) for record in records[-self.MAX_LINES_PER_FLUSH:]]
+        if skipped > 0:
+            lines.insert(0, f"... {skipped} records not shown (included in export)")
+        if lines:
+            self.log_view.appendPlainText('\n'.join(lines))
 
     def start_stats_logging(self):
         self.stats_timer = QTimer(self)
@@ -75,22 +139,48 @@ class LogsTab(QWidget):
         self.stats_timer.start(5000)  # Log every 5 seconds
 
     def log_statistics(self):
-        # TODO: Implement actual statistics gathering
-        self.logger.info("Active connections: 5, Data points: 1250, Transfer rate: 100 pts/sec")
+        stats = self.connection_manager.statistics()
+        rate = self.value_rate.update(stats["values"])
+        self.logger.info(
+            "Active connections: %d/%d, Values: %d, Transfer rate: %.0f values/sec, "
+            "Read latency p50 %.1f ms, p99 %.1f ms, Errors: %d",
+            stats["connected"], stats["connections"], stats["values"], rate,
+            stats["read_p50_ms"], stats["read_p99_ms"], stats["errors"]
+        )
 
     def change_log_level(self, level):
-        self.logger.setLevel(getattr(logging, level))
+        level = getattr(logging, level)
+        self.logger.setLevel(level)
+        self.log_handler.setLevel(level)
+        # Redisplay what the ring buffer holds at the new level
+        self.log_view.clear()
+        self.log_handler.drain()
+        self.append_records(list(self.log_handler.records))
 
     def clear_logs(self):
-        self.log_widget.widget.clear()
+        self.log_handler.clear()
+        self.log_view.clear()
 
     def export_logs(self):
-        filename, _ = QFileDialog.getSaveFileName(
+        file_types = "Text Files (*.txt)"
+        if self.security_manager is not None:
+            file_types += ";;Encrypted Files (*.enc)"
+        filename, file_type = QFileDialog.getSaveFileName(
             self,
             "Export Logs",
             f"scada_logs_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-            "Text Files (*.txt)"
+            file_types
         )
         if filename:
-            with open(filename, 'w') as f:
-                f.write(self.log_widget.widget.toPlainText())
\ No newline at end of file
+            self.flush_logs()
+            level = self.log_handler.level
+            if file_type.startswith("Encrypted"):
+                # Encrypted chunk by chunk as it is written
+                output = self.security_manager.open_encrypted(filename, 'w')
+            else:
+                output = open(filename, 'w')
+            with output as f:
+                for record in list(self.log_handler.records):
+                    if record.levelno >= level:
+                        f.write(self.log_handler.format(record))
+                        f.write('\n')
@@ -1,13 +1,21 @@
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtGui import QKeySequence
 from PyQt5.QtWidgets import (QMainWindow, QTabWidget, QWidget, 
-                           QVBoxLayout, QStatusBar)
+                           QVBoxLayout, QStatusBar, QAction, QMessageBox)
 from .connection_tab import ConnectionTab
+from .event_loop import LatencyProbe
 from .mapping_tab import MappingTab
+from .monitor_tab import MonitorTab
 from .logs_tab import LogsTab
+from core.metrics import RateMeter
 
 class MainWindow(QMainWindow):
-    def __init__(self, protocols, security_manager, parent=None):
+    closed = pyqtSignal()
+
+    def __init__(self, runtime, security_manager, parent=None):
         super().__init__(parent)
-        self.protocols = protocols
+        self.runtime = runtime
+        self.connection_manager = runtime.connection_manager
         self.security_manager = security_manager
         self.init_ui()
 
@@ -24,12 +32,14 @@ class MainWindow(QMainWindow):
         tabs = QTabWidget()
         
         # Add tabs
-        self.connection_tab = ConnectionTab(self.protocols)
-        self.mapping_tab = MappingTab(self.protocols)
-        self.logs_tab = LogsTab()
+        self.connection_tab = ConnectionTab(self.connection_manager)
+        self.mapping_tab = MappingTab(self.connection_manager, self.runtime.data_mapping)
+        self.monitor_tab = MonitorTab(self.connection_manager)
+        self.logs_tab = LogsTab(self.connection_manager.settings, self.connection_manager, self.security_manager)
 
         tabs.addTab(self.connection_tab, "Connections")
         tabs.addTab(self.mapping_tab, "Mappings")
+        tabs.addTab(self.monitor_tab, "Live Values")
         tabs.addTab(self.logs_tab, "Logs")
 
         layout.addWidget(tabs)
@@ -39,15 +49,48 @@ class MainWindow(QMainWindow):
         self.setStatusBar(self.status_bar)
         self.status_bar.showMessage("Ready")
 
+        # Connections, throughput, read latency and how late the GUI reacts (see LatencyProbe)
+        self.value_rate = RateMeter()
+        self.latency_probe = LatencyProbe(parent=self)
+        self.latency_probe.start()
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.update_status)
+        self.status_timer.start(self.connection_manager.settings.get('gui', {}).get('refresh_rate_ms', 1000))
+
         # Set up menu bar
         self.setup_menu()
 
+    def update_status(self):
+        stats = self.connection_manager.statistics()
+        latency = self.latency_probe.stats()
+        self.status_bar.showMessage(
+            f"{stats['connected']}/{stats['connections']} connected | "
+            f"{self.value_rate.update(stats['values']):.0f} values/s, read p99 {stats['read_p99_ms']:.1f} ms | "
+            f"UI latency p50 {latency['p50_ms']:.1f} ms, p99 {latency['p99_ms']:.1f} ms"
+        )
+
+    def save(self):
+        """Save connections and mappings (they are saved on exit as well)"""
+        try:
+            self.runtime.save()
+        except OSError as e:
+            QMessageBox.warning(self, "Save", f"Saving failed: {str(e)}")
+            return
+        self.status_bar.showMessage("Connections and mappings saved", 3000)
+
+    def closeEvent(self, event):
+        super().closeEvent(event)
+        self.closed.emit()
+
     def setup_menu(self):
         menubar = self.menuBar()
         
         # File menu
         file_menu = menubar.addMenu('&File')
-        # Add menu actions here
+        save_action = QAction('&Save', self)
+        save_action.setShortcut(QKeySequence.Save)
+        save_action.triggered.connect(self.save)
+        file_menu.addAction(save_action)
         
         # Settings menu
         settings_menu = menubar.addMenu('&Settings')
@@ -1,32 +1,41 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, 
-                           QTableWidget, QTableWidgetItem, QPushButton,
-                           QComboBox, QDialog, QLabel, QLineEdit, QFormLayout)
-from PyQt5.QtCore import Qt
+                           QTableView, QPushButton, QHeaderView,
+                           QComboBox, QDialog, QLabel, QLineEdit, QFormLayout,
+                           QMessageBox, QAbstractItemView)
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
 from core.data_mapping import DataMapping, DataPoint
 
 class MappingDialog(QDialog):
-    def __init__(self, protocols, parent=None):
+    def __init__(self, connection_manager, parent=None):
         super().__init__(parent)
-        self.protocols = protocols
+        self.connection_manager = connection_manager
         self.init_ui()
 
+    def connection_combo(self):
+        combo = QComboBox()
+        for connection in self.connection_manager:
+            combo.addItem(f"{connection.name} ({connection.protocol})", connection.id)
+        return combo
+
+    def selected_connection(self, combo):
+        connection_id = combo.currentData()
+        return self.connection_manager.get(connection_id) if connection_id else None
+
     def init_ui(self):
         self.setWindowTitle("Add Data Mapping")
         layout = QFormLayout(self)
 
-        # Source protocol selection
-        self.source_protocol = QComboBox()
-        self.source_protocol.addItems(self.protocols.keys())
-        layout.addRow("Source Protocol:", self.source_protocol)
+        # Source connection selection
+        self.source_connection = self.connection_combo()
+        layout.addRow("Source Connection:", self.source_connection)
 
         # Source tag configuration
         self.source_tag = QLineEdit()
         layout.addRow("Source Tag:", self.source_tag)
 
-        # Destination protocol selection
-        self.dest_protocol = QComboBox()
-        self.dest_protocol.addItems(self.protocols.keys())
-        layout.addRow("Destination Protocol:", self.dest_protocol)
+        # Destination connection selection
+        self.dest_connection = self.connection_combo()
+        layout.addRow("Destination Connection:", self.dest_connection)
 
         # Destination tag configuration
         self.dest_tag = QLineEdit()
@@ -44,11 +53,153 @@ class MappingDialog(QDialog):
         button_box.addWidget(cancel_button)
         layout.addRow(button_box)
 
+class MappingTableModel(QAbstractTableModel):
+    """
+    Table model over a DataMapping
+
+    Rows are rendered when the view first asks for them and cached, so only
+    visible rows cost anything. Changes go through the model and are
+    signalled per row (insert/remove) or per cell (enable toggle). Sorting
+    reorders a row -> mapping permutation instead of the mappings.
+    """
+
+    COLUMNS = ["Source", "Destination", "Enabled", "Transformation", "Status"]
+    ENABLED_COLUMN = 2
+
+    def __init__(self, connection_manager, data_mapping, parent=None):
+        super().__init__(parent)
+        self.connection_manager = connection_manager
+        self.data_mapping = data_mapping
+        self.cache = [None] * len(data_mapping.mappings)  # by mapping index
+        self.order = list(range(len(data_mapping.mappings)))  # row -> mapping index
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.row_text(index.row())[index.column()]
+
+    def point_text(self, point):
+        """'<connection name>: <tag>', falling back to the protocol for mappings without a connection"""
+        label = point.protocol
+        if point.connection_id:
+            connection = self.connection_manager.connections.get(point.connection_id)
+            label = connection.name if connection else point.connection_id
+        return f"{label}: {point.tag.get('tag', '')}"
+
+    def mapping_text(self, position):
+        text = self.cache[position]
+        if text is None:
+            mapping = self.data_mapping.mappings[position]
+            text = self.cache[position] = (
+                self.point_text(mapping["source"]),
+                self.point_text(mapping["destination"]),
+                "Enabled" if mapping["enabled"] else "Disabled",
+                str(mapping["transformation"]),
+                "Active" if mapping["enabled"] else "Inactive"
+            )
+        return text
+
+    def row_text(self, row):
+        return self.mapping_text(self.order[row])
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        old_order = self.order
+        if column < 0:
+            self.order = list(range(len(old_order)))
+        else:
+            self.order = sorted(
+                old_order, key=lambda position: self.mapping_text(position)[column],
+                reverse=order == Qt.DescendingOrder
+            )
+        # Keep selections and the proxy's mapping pointing at the same mappings
+        new_rows = {position: row for row, position in enumerate(self.order)}
+        previous = self.persistentIndexList()
+        self.changePersistentIndexList(previous, [
+            self.index(new_rows[old_order[index.row()]], index.column()) for index in previous
+        ])
+        self.layoutChanged.emit()
+
+    # Changes
+
+    def add_mapping(self, source, destination):
+        row = len(self.order)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.data_mapping.add_mapping(source, destination)
+        self.cache.append(None)
+        self.order.append(len(self.cache) - 1)
+        self.endInsertRows()
+        return row
+
+    def remove_mapping(self, row):
+        if not 0 <= row < len(self.order):
+            return
+        position = self.order[row]
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.data_mapping.remove_mapping(position)
+        del self.cache[position]
+        del self.order[row]
+        self.order = [index - (index > position) for index in self.order]
+        self.endRemoveRows()
+
+    def toggle_mapping(self, row):
+        position = self.order[row]
+        mapping = self.data_mapping.mappings[position]
+        mapping["enabled"] = not mapping["enabled"]
+        self.cache[position] = None
+        self.dataChanged.emit(self.index(row, self.ENABLED_COLUMN), self.index(row, len(self.COLUMNS) - 1))
+
+    def reload(self):
+        """Re-render everything, e.g. after loading mappings or renaming connections"""
+        self.beginResetModel()
+        self.cache = [None] * len(self.data_mapping.mappings)
+        self.order = list(range(len(self.cache)))
+        self.endResetModel()
+
+
+class MappingFilterModel(QSortFilterProxyModel):
+    """
+    Case-insensitive text filter over every column
+
+    Rows are matched against the model's cached row text in one call per
+    row, and sorting is delegated to the model's permutation sort; both
+    avoid a data() call per cell or comparison.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.needle = ""
+
+    def set_filter(self, text):
+        self.needle = text.lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.needle:
+            return True
+        needle = self.needle
+        return any(needle in text.lower() for text in self.sourceModel().row_text(source_row))
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
+
+
 class MappingTab(QWidget):
-    def __init__(self, protocols, parent=None):
+    def __init__(self, connection_manager, data_mapping=None, parent=None):
         super().__init__(parent)
-        self.protocols = protocols
-        self.mapping_manager = DataMapping()
+        self.connection_manager = connection_manager
+        self.mapping_manager = data_mapping if data_mapping is not None else DataMapping()
         self.init_ui()
 
     def init_ui(self):
@@ -60,19 +211,30 @@ class MappingTab(QWidget):
         edit_btn = QPushButton("Edit Mapping")
         delete_btn = QPushButton("Delete Mapping")
         enable_btn = QPushButton("Enable/Disable")
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter")
 
         button_layout.addWidget(add_btn)
         button_layout.addWidget(edit_btn)
         button_layout.addWidget(delete_btn)
         button_layout.addWidget(enable_btn)
         button_layout.addStretch()
+        button_layout.addWidget(self.filter_edit)
 
-        # Mapping table
-        self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels([
-            "Source", "Destination", "Enabled", "Transformation", "Status"
-        ])
+        # Mapping table: model over DataMapping, sorted and filtered by a proxy
+        self.model = MappingTableModel(self.connection_manager, self.mapping_manager, self)
+        self.proxy = MappingFilterModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        # Unsorted until a header is clicked (enabling sorting would sort by column 0)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        # Fixed row heights: the view never measures rows it does not show
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.horizontalHeader().setStretchLastSection(True)
 
         # Add layouts to main layout
         layout.addLayout(button_layout)
@@ -83,53 +245,51 @@ class MappingTab(QWidget):
         edit_btn.clicked.connect(self.edit_mapping)
         delete_btn.clicked.connect(self.delete_mapping)
         enable_btn.clicked.connect(self.toggle_mapping)
+        self.filter_edit.textChanged.connect(self.proxy.set_filter)
 
-        self.refresh_table()
+    def current_row(self):
+        """Model row of the selected mapping, or -1"""
+        index = self.table.currentIndex()
+        if not index.isValid():
+            return -1
+        return self.proxy.mapToSource(index).row()
 
     def add_mapping(self):
-        dialog = MappingDialog(self.protocols, self)
+        if not len(self.connection_manager):
+            QMessageBox.information(self, "Add Mapping", "Add the source and destination connections first")
+            return
+        dialog = MappingDialog(self.connection_manager, self)
         if dialog.exec_():
+            source_connection = dialog.selected_connection(dialog.source_connection)
+            dest_connection = dialog.selected_connection(dialog.dest_connection)
             source = DataPoint(
-                dialog.source_protocol.currentText(),
-                {"tag": dialog.source_tag.text()}
+                source_connection.protocol,
+                {"tag": dialog.source_tag.text()},
+                connection_id=source_connection.id
             )
             destination = DataPoint(
-                dialog.dest_protocol.currentText(),
-                {"tag": dialog.dest_tag.text()}
+                dest_connection.protocol,
+                {"tag": dialog.dest_tag.text()},
+                connection_id=dest_connection.id
             )
-            self.mapping_manager.add_mapping(source, destination)
-            self.refresh_table()
+            self.model.add_mapping(source, destination)
 
     def edit_mapping(self):
         # TODO: Implement edit mapping functionality
         pass
 
     def delete_mapping(self):
-        current_row = self.table.currentRow()
+        current_row = self.current_row()
         if current_row >= 0:
-            self.mapping_manager.remove_mapping(current_row)
-            self.refresh_table()
+            self.model.remove_mapping(current_row)
 
     def toggle_mapping(self):
-        current_row = self.table.currentRow()
+        current_row = self.current_row()
         if current_row >= 0:
-            mapping = self.mapping_manager.mappings[current_row]
-            mapping["enabled"] = not mapping["enabled"]
-            self.refresh_table()
+            self.model.toggle_mapping(current_row)
+
+    def point_text(self, point):
+        return self.model.point_text(point)
 
     def refresh_table(self):
-        self.table.setRowCount(len(self.mapping_manager.mappings))
-        for i, mapping in enumerate(self.mapping_manager.mappings):
-            self.table.setItem(i, 0, QTableWidgetItem(
-                f"{mapping['source'].protocol}: {mapping['source'].tag['tag']}"
-            ))
-            self.table.setItem(i, 1, QTableWidgetItem(
-                f"{mapping['destination'].protocol}: {mapping['destination'].tag['tag']}"
-            ))
-            self.table.setItem(i, 2, QTableWidgetItem(
-                "Enabled" if mapping["enabled"] else "Disabled"
-            ))
-            self.table.setItem(i, 3, QTableWidgetItem(
-                str(mapping["transformation"])
-            ))
-            self.table.setItem(i, 4, QTableWidgetItem("Active"))
\ No newline at end of file
+        self.model.reload()
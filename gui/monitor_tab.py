@@ -0,0 +1,174 @@
+import threading
+import time
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableView,
+                           QHeaderView, QLabel, QPushButton, QAbstractItemView)
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from core.protocols.base_handler import point_key, timestamp_iso
+
+# More separate dirty runs than this are sent as one dataChanged range
+MAX_CHANGED_RANGES = 32
+
+
+def changed_ranges(rows, limit=MAX_CHANGED_RANGES):
+    """Contiguous (first, last) runs of row numbers, merged into one if there are too many"""
+    if not rows:
+        return []
+    if len(rows) > limit * 64:
+        # Certainly too many runs to be worth finding; the view repaints visible rows only
+        return [(min(rows), max(rows))]
+    rows = sorted(rows)
+    runs = []
+    first = last = rows[0]
+    for row in rows[1:]:
+        if row == last + 1:
+            last = row
+            continue
+        runs.append((first, last))
+        first = last = row
+    runs.append((first, last))
+    if len(runs) > limit:
+        return [(rows[0], rows[-1])]
+    return runs
+
+
+class ValueTableModel(QAbstractTableModel):
+    """
+    Latest value of every point seen by the gateway
+
+    publish() may be called from any thread at any rate: it only records
+    the newest update per point in a pending dictionary. flush() runs on
+    the GUI thread once per frame, applies the pending updates and signals
+    them as a few dataChanged ranges, so GUI work is bounded by the number
+    of points, not by the update rate.
+    """
+
+    COLUMNS = ["Connection", "Tag", "Value", "Quality", "Timestamp"]
+    VALUE_COLUMN = 2
+    FIELDS = ('value', 'quality', 'timestamp')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.keys = []      # row -> (connection_id, tag)
+        self.rows = {}      # (connection_id, tag) -> row
+        self.values = []    # row -> latest update dictionary
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.received = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if column < self.VALUE_COLUMN:
+            return self.keys[row][column]
+        item = self.values[row].get(self.FIELDS[column - self.VALUE_COLUMN])
+        if column == len(self.COLUMNS) - 1 and isinstance(item, int):
+            item = timestamp_iso(item)
+        return "" if item is None else str(item)
+
+    def publish(self, connection_id, updates):
+        """Record updates (any thread); never waits for the GUI"""
+        with self.lock:
+            pending = self.pending
+            for update in updates:
+                key = point_key(update)
+                if key is not None:
+                    pending[(connection_id, key)] = update
+            self.received += len(updates)
+
+    def flush(self):
+        """Apply pending updates (GUI thread); returns how many points changed"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        existing = len(self.keys)
+        new_keys = [key for key in pending if key not in self.rows]
+        if new_keys:
+            self.beginInsertRows(QModelIndex(), existing, existing + len(new_keys) - 1)
+            for key in new_keys:
+                self.rows[key] = len(self.keys)
+                self.keys.append(key)
+                self.values.append(None)
+        rows, values = self.rows, self.values
+        changed = []
+        for key, update in pending.items():
+            row = rows[key]
+            values[row] = update
+            changed.append(row)
+        if new_keys:
+            self.endInsertRows()
+            changed = [row for row in changed if row < existing]
+        last_column = len(self.COLUMNS) - 1
+        for first, last in changed_ranges(changed):
+            self.dataChanged.emit(self.index(first, self.VALUE_COLUMN), self.index(last, last_column))
+        return len(pending)
+
+    def clear(self):
+        with self.lock:
+            self.pending = {}
+        self.beginResetModel()
+        self.keys, self.rows, self.values = [], {}, []
+        self.endResetModel()
+
+
+class MonitorTab(QWidget):
+    def __init__(self, connection_manager, parent=None):
+        super().__init__(parent)
+        self.connection_manager = connection_manager
+        self.model = ValueTableModel(self)
+        self.last_received = 0
+        self.last_flush = time.monotonic()
+        self.init_ui()
+        self.connection_manager.add_data_listener(self.model.publish)
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        # Summary and controls
+        top_layout = QHBoxLayout()
+        self.summary = QLabel()
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.setCheckable(True)
+        clear_btn = QPushButton("Clear")
+        top_layout.addWidget(self.summary)
+        top_layout.addStretch()
+        top_layout.addWidget(self.pause_btn)
+        top_layout.addWidget(clear_btn)
+
+        # Value table
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.horizontalHeader().setStretchLastSection(True)
+
+        layout.addLayout(top_layout)
+        layout.addWidget(self.table)
+
+        clear_btn.clicked.connect(self.model.clear)
+
+        # Repaint at most once per refresh period, whatever the update rate
+        refresh_rate = self.connection_manager.settings.get('gui', {}).get('refresh_rate_ms', 1000)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.flush)
+        self.refresh_timer.start(refresh_rate)
+
+    def flush(self):
+        if not self.pause_btn.isChecked():
+            self.model.flush()
+        now = time.monotonic()
+        rate = (self.model.received - self.last_received) / max(now - self.last_flush, 1e-3)
+        self.last_received, self.last_flush = self.model.received, now
+        self.summary.setText(f"{len(self.model.keys)} points, {rate:.0f} updates/s")
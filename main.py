@@ -1,20 +1,47 @@
+import asyncio
 import sys
-from PyQt5.QtWidgets import QApplication
-from gui.main_window import MainWindow
-from core.protocols import initialize_protocols
-from core.security import SecurityManager
+from config import load_config
+from core.logging_setup import setup_logging
+from core.runtime import GatewayRuntime, main as run_headless
 
 class ScadaGateway:
     def __init__(self):
+        # Qt is only imported for the GUI; the headless runtime never loads it
+        from PyQt5.QtWidgets import QApplication
+        from gui.event_loop import QtEventLoop
+        from gui.main_window import MainWindow
+        from core.security import SecurityManager
+
         self.app = QApplication(sys.argv)
-        self.security_manager = SecurityManager()
-        self.protocols = initialize_protocols()
-        self.main_window = MainWindow(self.protocols, self.security_manager)
+        self.loop = QtEventLoop()
+        asyncio.set_event_loop(self.loop)
+
+        self.settings = load_config()
+        self.security_manager = SecurityManager(self.settings)
+        self.logging = setup_logging(self.settings)
+        self.runtime = GatewayRuntime(self.settings, security_manager=self.security_manager)
+        self.runtime.load()
+        self.main_window = MainWindow(self.runtime, self.security_manager)
+        # Closing the window stops the asyncio loop; connections are then closed in order
+        self.main_window.closed.connect(self.loop.stop)
 
     def run(self):
         self.main_window.show()
-        return self.app.exec_()
+        self.loop.run_until_complete(self.runtime.start())
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.runtime.stop())
+        # Keep what was edited in the GUI for the next start (and the headless runtime)
+        try:
+            self.runtime.save()
+        except OSError as e:
+            self.runtime.logger.error(f"Saving connections and mappings failed: {str(e)}")
+        self.loop.close()
+        self.security_manager.close()
+        self.logging.stop()
+        return 0
 
 if __name__ == "__main__":
+    if "--headless" in sys.argv[1:]:
+        sys.exit(run_headless(sys.argv[1:]))
     gateway = ScadaGateway()
     sys.exit(gateway.run())
@@ -1,10 +1,60 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 from core.protocols import (
     ModbusHandler, OPCUAHandler, DNP3Handler,
-    IEC104Handler, IEC61850Handler, OPCDAHandler, MQTTHandler
+    IEC104Handler, IEC61850Handler, OPCDAHandler, MQTTHandler,
+    ProtocolRegistry, initialize_protocols
 )
-from core.protocols.base_handler import ConnectionStatus
+from core.connections import ConnectionManager, connect_config
+from core.logging_setup import setup_logging
+from core.metrics import Histogram, MetricsRegistry, MetricsServer
+from core.runtime import GatewayRuntime
+from core import security
+from core.security import SecurityManager
+from core.sharding import ShardedRuntime
+from core.data_mapping import DataMapping, DataPoint
+from core.protocols.base_handler import (
+    ConnectionStatus, DataBatch, ERROR_NO_DATA, ERROR_NONE, QUALITY_BAD, QUALITY_GOOD, QUALITY_UNKNOWN
+)
+from core.protocols.dnp3_events import DNP3EventBuffers
+from core.protocols.dnp3_link import LinkParser, TransportReassembler, crc16_dnp, encode_user_data
+from core.protocols.dnp3_tcp import DNP3Outstation
+from core.protocols.iec104_apci import IEC104Link, append_i_frame
+from core.protocols.iec61850_mms import MMSClient, MMSServer
+from core.protocols.opcda_browse import TagIndex
+from core.protocols.supervisor import BackoffPolicy, ConnectionSupervisor, SupervisorState
+from core.protocols.iec61850_scl import load_scl
+from core.protocols.iec61850_data import BitString, DataAccessError, OPT_DATA_SET_NAME, OPT_ENTRY_ID, UtcTime
+from core.protocols.iec104_asdu import (
+    ASDU, C_IC_NA_1, C_SC_NA_1, C_SE_NC_1, COT_ACTIVATION, COT_ACTIVATION_CON, COT_ACTIVATION_TERMINATION,
+    COT_INTERROGATED_BY_STATION, COT_SPONTANEOUS, M_IT_TB_1, M_ME_NC_1, M_SP_NA_1, M_SP_TB_1,
+    ASDUEncoder, decode_asdu, encode_asdu, pack_objects
+)
+
+class TestProtocolRegistry(unittest.TestCase):
+    def test_enabled_protocols_created_on_access(self):
+        protocols = initialize_protocols({"protocols": {"opcua": {"enabled": False}, "mqtt": {"enabled": False}}})
+        self.assertNotIn("OPC UA", protocols)
+        self.assertIn("Modbus", protocols)
+        self.assertEqual(protocols.loaded(), {})
+        self.assertIsInstance(protocols["OPC DA"], OPCDAHandler)
+        self.assertIs(protocols["OPC DA"], protocols["OPC DA"])
+        self.assertEqual(list(protocols.loaded()), ["OPC DA"])
+
+    def test_register_plugin(self):
+        registry = ProtocolRegistry()
+        registry.register("Sim DA", "core.protocols.opcda_handler:OPCDAHandler", "simda")
+        self.assertEqual(registry.enabled({"protocols": {"simda": {"enabled": False}}}), [])
+        self.assertIsInstance(registry.create("Sim DA"), OPCDAHandler)
+        with self.assertRaises(KeyError):
+            registry.create("Unknown")
+
 
 class TestModbusHandler(unittest.TestCase):
     def setUp(self):
@@ -71,5 +121,1367 @@ class TestMQTTHandler(unittest.TestCase):
         )
         self.assertTrue(result[0])
 
+class TestDNP3Handler(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.handler = DNP3Handler()
+        self.test_config = self.handler.get_config_template()
+        # Configs without a transport key, saved before TCP existed, keep simulating
+        del self.test_config["transport"]
+        self.test_config["master"]["simulation_change_ratio"] = 0.0
+
+    async def asyncTearDown(self):
+        await self.handler.disconnect()
+
+    async def test_event_poll_returns_only_changes(self):
+        await self.handler.connect(self.test_config)
+        self.assertEqual(await self.handler.read_data([], mode="events"), [])
+
+        await self.handler.write_data([{"id": 5, "type": "binary"}], [1 - self.handler.sim_data[5]])
+        events = await self.handler.read_data([], mode="events")
+        self.assertEqual([(e["id"], e["class"]) for e in events], [(5, 1)])
+        self.assertEqual(await self.handler.read_data([], mode="events"), [])
+
+    async def test_analog_deadband(self):
+        self.test_config["master"]["analog_deadband"] = 1.0
+        await self.handler.connect(self.test_config)
+        base = self.handler.sim_data[150]
+        await self.handler.write_data([{"id": 150}], [base + 0.5])
+        self.assertEqual(await self.handler.read_data([], mode="events"), [])
+        await self.handler.write_data([{"id": 150}], [base + 1.5])
+        events = await self.handler.read_data([], mode="events", classes=[2])
+        self.assertEqual(len(events), 1)
+
+    def test_overflow_kept_until_buffer_read(self):
+        events = DNP3EventBuffers(buffer_size=2)
+        for point_id in (1, 2):
+            events.update(point_id, 0.0)
+        for point_id, value in ((1, 1.0), (2, 1.0), (1, 2.0)):
+            events.update(point_id, value)
+        self.assertTrue(events.overflow[2])
+        # A filtered read leaves events queued, so the overflow is still reported
+        self.assertEqual([(e["id"], e["value"]) for e in events.drain(point_ids={1})], [(1, 2.0)])
+        self.assertTrue(events.overflow[2])
+        self.assertEqual([(e["id"], e["value"]) for e in events.drain()], [(2, 1.0)])
+        self.assertFalse(events.overflow[2])
+
+    async def test_integrity_poll_clears_events(self):
+        await self.handler.connect(self.test_config)
+        await self.handler.write_data([{"id": 250, "type": "counter"}], [5000])
+        image = await self.handler.read_data([{"id": 250}, {"id": 1}], mode="integrity")
+        self.assertEqual([p["id"] for p in image], [250, 1])
+        self.assertEqual(image[0]["value"], 5000)
+        self.assertEqual(await self.handler.read_data([], mode="events"), [])
+
+    async def test_unsolicited_push(self):
+        self.test_config["master"]["unsolicited"]["interval_ms"] = 10
+        await self.handler.connect(self.test_config)
+        received = []
+        self.handler.add_data_callback(received.extend)
+        self.handler.start_unsolicited()
+        await self.handler.write_data([{"id": 7, "type": "binary"}], [1 - self.handler.sim_data[7]])
+        await asyncio.sleep(0.05)
+        self.assertEqual([e["id"] for e in received], [7])
+
+class TestDNP3TCP(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.outstation = DNP3Outstation()
+        for index in range(10):
+            self.outstation.update('binary', index, index % 2)
+            self.outstation.update('analog', index, float(index))
+        self.outstation.update('counter', 0, 42)
+        port = await self.outstation.start('127.0.0.1', 0)
+
+        self.handler = DNP3Handler()
+        self.test_config = self.handler.get_config_template()
+        self.test_config["master"].update({"host": "127.0.0.1", "port": port, "timeout_ms": 1000})
+
+    async def asyncTearDown(self):
+        await self.handler.disconnect()
+        await self.outstation.stop()
+
+    async def test_static_read(self):
+        await self.handler.connect(self.test_config)
+        results = await self.handler.read_data([
+            {"id": 3, "type": "binary"},
+            {"id": 7, "type": "analog"},
+            {"id": 0, "type": "counter"}
+        ])
+        self.assertEqual([r["value"] for r in results], [1, 7.0, 42])
+        self.assertTrue(all(r["quality"] == "ONLINE" for r in results))
+
+    async def test_event_poll(self):
+        await self.handler.connect(self.test_config)
+        self.assertEqual(await self.handler.read_data([], mode="events"), [])
+        self.outstation.update('analog', 2, 12.5)
+        events = await self.handler.read_data([], mode="events")
+        self.assertEqual([(e["type"], e["id"], e["value"]) for e in events], [("analog", 2, 12.5)])
+        # Events of points not asked for are kept for a later read
+        self.outstation.update('analog', 3, 13.5)
+        self.outstation.update('binary', 4, 1)
+        events = await self.handler.read_data([{"id": 4, "type": "binary"}], mode="events")
+        self.assertEqual([(e["type"], e["id"]) for e in events], [("binary", 4)])
+        events = await self.handler.read_data([{"id": 3}], mode="events")
+        self.assertEqual([(e["type"], e["id"], e["value"]) for e in events], [("analog", 3, 13.5)])
+
+    async def test_direct_operate(self):
+        await self.handler.connect(self.test_config)
+        results = await self.handler.write_data(
+            [{"id": 4, "type": "binary"}, {"id": 5, "type": "analog"}], [1, 3.5]
+        )
+        self.assertEqual(results, [True, True])
+        self.assertEqual(self.outstation.events.values[('binary', 4)], 1)
+        self.assertEqual(self.outstation.events.values[('analog', 5)], 3.5)
+
+    async def test_unsolicited(self):
+        self.test_config["master"]["unsolicited"]["enabled"] = True
+        await self.handler.connect(self.test_config)
+        received = []
+        self.handler.add_data_callback(received.extend)
+        self.outstation.update('binary', 1, 0)
+        self.outstation.update('counter', 0, 43)
+        await asyncio.sleep(0.1)
+        self.assertEqual(sorted((u["type"], u["id"], u["value"]) for u in received),
+                         [("binary", 1, 0), ("counter", 0, 43)])
+        # Disconnecting disables unsolicited responses in the outstation first
+        session = next(iter(self.outstation.sessions))
+        await self.handler.disconnect()
+        self.assertEqual(session.unsolicited_classes, set())
+        self.assertIsNone(self.handler.unsolicited_task)
+
+    async def test_multi_fragment_response(self):
+        for index in range(2000):
+            self.outstation.update('analog', index, float(index))
+        await self.handler.connect(self.test_config)
+        results = await self.handler.read_data([{"id": 1999}])
+        self.assertEqual(results[0]["value"], 1999.0)
+
+    async def test_supervisor_reconnects_after_link_loss(self):
+        port = self.test_config["master"]["port"]
+        supervisor = ConnectionSupervisor(self.handler, self.test_config, "DNP3 test", {
+            "initial_delay_s": 0.05, "max_delay_s": 0.2, "jitter": 0.0
+        })
+        supervisor.start()
+        try:
+            await supervisor.wait_connected(2)
+            await self.outstation.stop()
+            await asyncio.sleep(0.1)
+            self.assertNotEqual(supervisor.state, SupervisorState.CONNECTED)
+            self.assertEqual(self.handler.status, ConnectionStatus.DISCONNECTED)
+
+            await self.outstation.start('127.0.0.1', port)
+            await supervisor.wait_connected(3)
+            self.assertEqual(supervisor.connects, 2)
+            results = await self.handler.read_data([{"id": 0, "type": "counter"}])
+            self.assertEqual(results[0]["value"], 42)
+        finally:
+            await supervisor.stop()
+        self.assertEqual(supervisor.state, SupervisorState.STOPPED)
+
+    def test_backoff_policy(self):
+        policy = BackoffPolicy(initial_delay_s=1.0, max_delay_s=10.0, multiplier=2.0, jitter=0.5)
+        for attempt, ceiling in ((1, 1.0), (3, 4.0), (10, 10.0)):
+            delay = policy.delay(attempt)
+            self.assertTrue(ceiling * 0.5 <= delay <= ceiling)
+
+
+class TestConnectionManager(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.outstations = []
+        self.manager = ConnectionManager({"application": {"max_connections": 3}})
+        for value in (11, 22):
+            outstation = DNP3Outstation()
+            outstation.update('counter', 0, value)
+            port = await outstation.start('127.0.0.1', 0)
+            self.outstations.append(outstation)
+            config = DNP3Handler().get_config_template()
+            config["master"].update({"host": "127.0.0.1", "port": port, "timeout_ms": 1000})
+            self.manager.add("DNP3", f"RTU {value}", config)
+
+    async def asyncTearDown(self):
+        await self.manager.stop_all()
+        for outstation in self.outstations:
+            await outstation.stop()
+
+    async def test_two_connections_same_protocol(self):
+        self.assertEqual([c.id for c in self.manager], ["dnp3-1", "dnp3-2"])
+        self.manager.start_all()
+        for connection in self.manager:
+            await connection.supervisor.wait_connected(2)
+        values = [(await self.manager.read(c.id, [{"id": 0, "type": "counter"}]))[0]["value"] for c in self.manager]
+        self.assertEqual(values, [11, 22])
+        self.assertEqual(self.manager.connected_count(), 2)
+        self.assertEqual(self.manager.get("dnp3-2").metrics.reads, 1)
+        with self.assertRaises(ValueError):
+            self.manager.delete("dnp3-1")
+
+    async def test_limit_and_persistence(self):
+        self.manager.add("OPC DA", "Historian")
+        with self.assertRaises(ValueError):
+            self.manager.add("OPC DA")
+        mapping = DataMapping()
+        mapping.add_mapping(DataPoint("DNP3", {"tag": "0"}, connection_id="dnp3-2"),
+                            DataPoint("OPC DA", {"tag": "Plant.Value"}, connection_id="opcda-1"))
+        with tempfile.TemporaryDirectory() as directory:
+            self.manager.save_to_file(os.path.join(directory, "connections.json"))
+            mapping.save_to_file(os.path.join(directory, "mappings.json"))
+            restored = ConnectionManager()
+            restored.load_from_file(os.path.join(directory, "connections.json"))
+            mapping.load_from_file(os.path.join(directory, "mappings.json"))
+        self.assertEqual([c.name for c in restored], ["RTU 11", "RTU 22", "Historian"])
+        self.assertEqual(len(mapping.for_connection("dnp3-2")), 1)
+        self.assertEqual(mapping.mappings[0]["destination"].connection_id, "opcda-1")
+
+    async def test_passwords_encrypted_in_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            security = SecurityManager({"security": {"key_file": os.path.join(directory, "secret.key")}})
+            manager = ConnectionManager(security=security)
+            config = manager.config_template("IEC 61850")
+            config["authentication"]["password"] = "hunter2"
+            manager.add("IEC 61850", "Bay 1", config)
+            path = os.path.join(directory, "connections.json")
+            manager.save_to_file(path)
+            with open(path) as f:
+                self.assertNotIn("hunter2", f.read())
+            # The key file is the same, so another manager (process) can read them
+            restored = ConnectionManager(security=SecurityManager({"security": {"key_file": security.config["key_file"]}}))
+            restored.load_from_file(path)
+            self.assertEqual(restored.get("iec61850-1").config["authentication"]["password"], "hunter2")
+            # Another key cannot: the password is not used to connect, and saved again as it was
+            other = ConnectionManager(security=SecurityManager())
+            with self.assertLogs('SCADA_Gateway', logging.ERROR):
+                other.load_from_file(path)
+            config = other.get("iec61850-1").config
+            self.assertEqual(connect_config(config)["authentication"]["password"], "")
+            other_path = os.path.join(directory, "other.json")
+            other.save_to_file(other_path)
+            with open(path) as f, open(other_path) as g:
+                original, resaved = json.load(f), json.load(g)
+            self.assertEqual(resaved[0]["config"]["authentication"], original[0]["config"]["authentication"])
+            self.assertEqual(sorted(os.listdir(directory)), ["connections.json", "other.json", "secret.key"])
+            # Without a key passwords are not written at all
+            restored.security = None
+            with self.assertLogs('SCADA_Gateway', logging.WARNING):
+                restored.save_to_file(path)
+            with open(path) as f:
+                saved = json.load(f)
+        self.assertEqual(saved[0]["config"]["authentication"]["password"], "")
+
+
+class TestGatewayRuntime(unittest.IsolatedAsyncioTestCase):
+    async def test_scan_copies_changed_values(self):
+        runtime = GatewayRuntime({"runtime": {"scan_interval_ms": 3600000}})
+        manager = runtime.connection_manager
+        config = {"server_name": "Sim", "host": "localhost", "update_rate": 3600000, "groups": []}
+        source = manager.add("OPC DA", "Source", dict(config))
+        destination = manager.add("OPC DA", "Destination", dict(config))
+        runtime.data_mapping.add_mapping(
+            DataPoint("OPC DA", {"tag": "Plant.Flow"}, connection_id=source.id),
+            DataPoint("OPC DA", {"tag": "Copy.Flow"}, connection_id=destination.id)
+        )
+        await runtime.start()
+        try:
+            await source.supervisor.wait_connected(5)
+            await destination.supervisor.wait_connected(5)
+            await source.handler.write_data(["Plant.Flow"], [42.5])
+            await runtime.scan()
+            result = await destination.handler.read_data(["Copy.Flow"])
+            self.assertEqual(result[0]["value"], 42.5)
+            self.assertEqual(destination.metrics.writes, 1)
+            batch = runtime.batches[source.id]
+            # Unchanged source values are not written again
+            await runtime.scan()
+            self.assertEqual(destination.metrics.writes, 1)
+            # Sources are read into one DataBatch per connection, reused every scan
+            self.assertIs(runtime.batches[source.id], batch)
+            self.assertGreaterEqual(runtime.scans, 1)
+        finally:
+            await runtime.stop()
+        self.assertIsNone(source.supervisor)
+
+    def test_save_writes_the_files_load_reads(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings = {"runtime": {"connections_file": os.path.join(directory, "connections.json"),
+                                    "mappings_file": os.path.join(directory, "mappings.json")},
+                        "metrics": {"http_enabled": False}}
+            runtime = GatewayRuntime(settings)
+            source = runtime.connection_manager.add("OPC DA", "Source")
+            destination = runtime.connection_manager.add("OPC DA", "Destination")
+            runtime.data_mapping.add_mapping(
+                DataPoint("OPC DA", {"tag": "Plant.Flow"}, connection_id=source.id),
+                DataPoint("OPC DA", {"tag": "Copy.Flow"}, connection_id=destination.id)
+            )
+            runtime.save()
+            restored = GatewayRuntime(settings)
+            restored.load()
+        self.assertEqual([c.name for c in restored.connection_manager], ["Source", "Destination"])
+        self.assertEqual(restored.data_mapping.mappings[0]["destination"].connection_id, destination.id)
+
+    async def test_dialog_tags_reach_dict_handlers(self):
+        # The mapping dialog stores {"tag": text} points for every protocol
+        outstation = DNP3Outstation()
+        outstation.update('counter', 0, 77)
+        port = await outstation.start('127.0.0.1', 0)
+        runtime = GatewayRuntime({"runtime": {"scan_interval_ms": 3600000}, "metrics": {"http_enabled": False}})
+        manager = runtime.connection_manager
+        config = DNP3Handler().get_config_template()
+        config["master"].update({"host": "127.0.0.1", "port": port, "timeout_ms": 1000})
+        source = manager.add("DNP3", "RTU", config)
+        destination = manager.add("OPC DA", "Historian", {"server_name": "Sim", "host": "localhost", "groups": []})
+        runtime.data_mapping.add_mapping(
+            DataPoint("DNP3", {"tag": "counter:0"}, connection_id=source.id),
+            DataPoint("OPC DA", {"tag": "Copy.Count"}, connection_id=destination.id)
+        )
+        runtime.data_mapping.add_mapping(
+            DataPoint("DNP3", {"tag": "counter:zero"}, connection_id=source.id),
+            DataPoint("OPC DA", {"tag": "Copy.Bad"}, connection_id=destination.id)
+        )
+        try:
+            with self.assertLogs('SCADA_Gateway.Runtime', logging.WARNING) as logs:
+                await runtime.start()
+                await source.supervisor.wait_connected(5)
+                await destination.supervisor.wait_connected(5)
+                await runtime.scan()
+                await runtime.scan()
+            result = await destination.handler.read_data(["Copy.Count"])
+            self.assertEqual(result[0]["value"], 77)
+        finally:
+            await runtime.stop()
+            await outstation.stop()
+        # The unparseable tag is reported once, not on every scan
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("counter:zero", logs.output[0])
+
+    async def test_iec104_server_serves_mapped_destinations(self):
+        runtime = GatewayRuntime({"runtime": {"scan_interval_ms": 3600000}, "metrics": {"http_enabled": False}})
+        manager = runtime.connection_manager
+        source = manager.add("OPC DA", "Source", {"server_name": "Sim", "host": "localhost", "groups": []})
+        config = IEC104Handler().get_config_template()
+        config.update({"mode": "server", "ip": "127.0.0.1", "port": 0})
+        server = manager.add("IEC 60870-5-104", "SCADA", config)
+        runtime.data_mapping.add_mapping(
+            DataPoint("OPC DA", {"tag": "Plant.Flow"}, connection_id=source.id),
+            DataPoint("IEC 60870-5-104", {"ioa": 30, "type": "float"}, connection_id=server.id)
+        )
+        try:
+            await runtime.start()
+            await server.supervisor.wait_connected(5)
+            self.assertIn(30, server.handler.server.points)
+            # Mappings added while running are served from the next scan
+            runtime.data_mapping.add_mapping(
+                DataPoint("OPC DA", {"tag": "Plant.Level"}, connection_id=source.id),
+                DataPoint("IEC 60870-5-104", {"ioa": 31, "type": "scaled"}, connection_id=server.id)
+            )
+            await runtime.scan()
+            self.assertEqual(server.handler.server.points[31][0], "scaled")
+            # and again after the server restarts
+            await manager.stop(server.id)
+            await manager.start(server.id).wait_connected(5)
+            self.assertEqual(set(server.handler.server.points), {30, 31})
+        finally:
+            await runtime.stop()
+
+    async def test_sharded_mode_routes_writes_to_workers(self):
+        source_outstation, destination_outstation = DNP3Outstation(), DNP3Outstation()
+        source_outstation.update('counter', 0, 77)
+        runtime = GatewayRuntime({
+            "runtime": {"scan_interval_ms": 50, "mode": "sharded"},
+            "sharding": {"workers": 2},
+            "metrics": {"http_enabled": False}
+        })
+        manager = runtime.connection_manager
+        connections = []
+        for name, outstation in (("RTU", source_outstation), ("Control", destination_outstation)):
+            config = DNP3Handler().get_config_template()
+            config["master"].update({"host": "127.0.0.1", "port": await outstation.start('127.0.0.1', 0)})
+            connections.append(manager.add("DNP3", name, config))
+        source, destination = connections
+        runtime.data_mapping.add_mapping(
+            DataPoint("DNP3", {"tag": "counter:0"}, connection_id=source.id),
+            DataPoint("DNP3", {"tag": "analog:5"}, connection_id=destination.id)
+        )
+        try:
+            await runtime.start()
+            self.assertEqual(runtime.sharded.assignment, {source.id: 0, destination.id: 1})
+            for _ in range(400):
+                if destination_outstation.events.values.get(('analog', 5)) == 77:
+                    break
+                await asyncio.sleep(0.05)
+            self.assertEqual(destination_outstation.events.values.get(('analog', 5)), 77)
+            # The local handlers do not connect but show their worker's status
+            self.assertIsNone(source.supervisor)
+            self.assertEqual(source.status, ConnectionStatus.CONNECTED)
+        finally:
+            await runtime.stop()
+            await source_outstation.stop()
+            await destination_outstation.stop()
+        self.assertIsNone(runtime.sharded)
+        self.assertEqual(destination.status, ConnectionStatus.DISCONNECTED)
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    def test_histogram_quantiles(self):
+        histogram = Histogram()
+        for millisecond in range(1, 1001):
+            histogram.observe(millisecond / 1000.0)
+        # Log-linear buckets: about 3% relative error, never under-reported
+        self.assertTrue(0.5 <= histogram.quantile(0.5) <= 0.5 * 1.04)
+        self.assertTrue(0.99 <= histogram.quantile(0.99) <= 0.99 * 1.04)
+        self.assertAlmostEqual(histogram.quantile(1.0), 1.0)
+        self.assertEqual(histogram.cumulative((0.0001, 10.0)), [0, 1000])
+
+    async def test_connection_metrics_exported(self):
+        manager = ConnectionManager(metrics=MetricsRegistry())
+        connection = manager.add("OPC DA", "Sim", {"server_name": "Sim", "host": "localhost", "groups": []})
+        manager.start(connection.id)
+        server = MetricsServer(manager.metrics, '127.0.0.1', 0)
+        await server.start()
+        try:
+            await connection.supervisor.wait_connected(5)
+            await manager.write(connection.id, ["Plant.Flow"], [1.5])
+            await manager.read(connection.id, ["Plant.Flow", "Plant.Level"])
+            with self.assertRaises(Exception):
+                await manager.read(connection.id, None)
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = (await reader.read()).decode()
+            writer.close()
+        finally:
+            await manager.stop_all()
+            await server.stop()
+        labels = 'connection="opcda-1",protocol="OPC DA"'
+        self.assertTrue(response.startswith("HTTP/1.1 200 OK"))
+        self.assertIn(f'scada_operations_total{{{labels},operation="read"}} 1', response)
+        self.assertIn(f'scada_operation_errors_total{{{labels},operation="read"}} 1', response)
+        self.assertIn(f'scada_values_total{{{labels},source="read"}} 2', response)
+        self.assertIn(f'scada_operation_seconds_count{{{labels},operation="connect"}} 1', response)
+        self.assertIn(f'scada_connection_up{{{labels}}} 1', response)
+        stats = manager.statistics()
+        self.assertEqual((stats["reads"], stats["writes"], stats["errors"], stats["values"]), (1, 1, 1, 2))
+        self.assertEqual(connection.handler.get_status()["metrics"]["reads"], 1)
+        manager.delete(connection.id)
+        self.assertNotIn('opcda-1', manager.metrics.to_prometheus())
+
+
+class TestSecurityManager(unittest.TestCase):
+    def setUp(self):
+        self.security = SecurityManager(token_cache_size=2)
+        with patch.object(SecurityManager, '_hash_password', lambda self, password, salt: password.encode() + salt):
+            self.security.create_user("op", "secret", "operator")
+            self.security.create_user("view", "secret", "viewer")
+            self.operator = self.security.authenticate("op", "secret")
+            self.viewer = self.security.authenticate("view", "secret")
+
+    def test_permissions_and_cache(self):
+        with patch.object(security.jwt, 'decode', wraps=security.jwt.decode) as decode:
+            self.assertTrue(self.security.check_permission(self.operator, "write"))
+            self.assertTrue(self.security.check_permission(self.operator, "read"))
+            self.assertFalse(self.security.check_permission(self.operator, "configure"))
+            self.assertFalse(self.security.check_permission(self.operator, "unknown"))
+            self.assertEqual(decode.call_count, 1)
+            self.assertFalse(self.security.check_permission(self.viewer, "write"))
+            self.assertFalse(self.security.check_permission("not.a.token", "read"))
+            # Bounded: a third token evicts the least recently used one
+            self.security.verify_token(self.security._generate_token("admin", "admin"))
+            self.assertEqual(len(self.security.token_cache), 2)
+            self.security.check_permission(self.operator, "read")
+            self.assertEqual(decode.call_count, 5)
+
+    def test_revocation(self):
+        self.assertIsNotNone(self.security.verify_token(self.operator))
+        self.security.revoke_token(self.operator)
+        self.assertIsNone(self.security.verify_token(self.operator))
+        self.assertFalse(self.security.check_permission(self.operator, "read"))
+        self.assertTrue(self.security.check_permission(self.viewer, "read"))
+        self.security.revoke_user("view")
+        self.assertFalse(self.security.check_permission(self.viewer, "read"))
+        # Logging in again right away (same second) gives a valid token
+        with patch.object(SecurityManager, '_hash_password', lambda self, password, salt: password.encode() + salt):
+            viewer = self.security.authenticate("view", "secret")
+        self.assertTrue(self.security.check_permission(viewer, "read"))
+        self.assertFalse(self.security.check_permission(self.viewer, "read"))
+
+
+class TestLoginLockout(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.security = SecurityManager({"security": {"max_login_attempts": 2, "max_source_attempts": 3}})
+        self.security.create_user("op", "secret", "operator")
+
+    def tearDown(self):
+        self.security.close()
+
+    async def test_async_login_does_not_block_loop(self):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+        names = ("op", "op2", "op3")
+        for name in names[1:]:
+            self.security.create_user(name, "secret", "operator")
+        task = asyncio.get_running_loop().create_task(ticker())
+        try:
+            tokens = await asyncio.gather(*(self.security.authenticate_async(name, "secret") for name in names))
+        finally:
+            task.cancel()
+        self.assertTrue(all(self.security.check_permission(token, "write") for token in tokens))
+        self.assertGreater(ticks, 3)
+
+    async def test_user_and_source_lockout(self):
+        self.assertIsNone(await self.security.authenticate_async("op", "wrong", "10.0.0.1"))
+        self.assertIsNone(await self.security.authenticate_async("op", "wrong", "10.0.0.2"))
+        # Locked: even the right password is refused, without hashing
+        with patch.object(SecurityManager, '_hash_password') as hash_password:
+            self.assertIsNone(await self.security.authenticate_async("op", "secret", "10.0.0.3"))
+            hash_password.assert_not_called()
+        # One source guessing several user names is locked out as well
+        for name in ("a", "b", "c"):
+            self.assertIsNone(self.security.authenticate(name, "guess", "10.0.0.9"))
+        self.security.create_user("d", "secret", "viewer")
+        self.assertIsNone(self.security.authenticate("d", "secret", "10.0.0.9"))
+        self.assertIsNotNone(self.security.authenticate("d", "secret", "10.0.0.8"))
+
+    async def test_concurrent_guesses_are_limited(self):
+        security = SecurityManager({"security": {"max_login_attempts": 3, "hash_workers": 4}})
+        security.create_user("op", "secret", "operator")
+        try:
+            # Guesses hashed in parallel all count before any of them fails
+            guesses = ["wrong%d" % number for number in range(30)] + ["secret"]
+            tokens = await asyncio.gather(*(security.authenticate_async("op", guess) for guess in guesses))
+            self.assertEqual(tokens, [None] * len(guesses))
+            self.assertGreater(security.user_attempts.locked_for("op"), 0)
+        finally:
+            security.close()
+
+
+class TestStreamingEncryption(unittest.TestCase):
+    def test_round_trip_and_tampering(self):
+        import io
+        from cryptography.fernet import InvalidToken
+        with tempfile.TemporaryDirectory() as directory:
+            settings = {"security": {"key_file": os.path.join(directory, "secret.key")}}
+            data = os.urandom(3 * 1024 + 7)
+            encrypted = io.BytesIO()
+            self.assertEqual(SecurityManager(settings).encrypt_stream(io.BytesIO(data), encrypted, chunk_size=1024), len(data))
+            # The key file persists: another manager (process) decrypts it
+            manager = SecurityManager(settings)
+            decrypted = io.BytesIO()
+            manager.decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted)
+            self.assertEqual(decrypted.getvalue(), data)
+
+            sealed = encrypted.getvalue()
+            tampered = bytearray(sealed)
+            tampered[-100] ^= 1
+            header, chunk = 25, 1024 + 16
+            for damaged in (bytes(tampered), sealed[:header + 2 * chunk],
+                            sealed[:header] + sealed[header + chunk:header + 2 * chunk] + sealed[header:header + chunk]):
+                with self.assertRaises(InvalidToken):
+                    manager.decrypt_stream(io.BytesIO(damaged), io.BytesIO())
+
+            path = os.path.join(directory, "export.enc")
+            with manager.open_encrypted(path, 'w') as f:
+                f.write("first line\nsecond line\n")
+            with manager.open_encrypted(path, 'r') as f:
+                self.assertEqual(f.readlines(), ["first line\n", "second line\n"])
+
+
+class TestQtEventLoop(unittest.TestCase):
+    def setUp(self):
+        try:
+            from PyQt5.QtCore import QCoreApplication
+            from gui.event_loop import QtEventLoop
+        except ImportError:
+            self.skipTest("PyQt5 is not installed")
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self.loop = QtEventLoop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_sockets_timers_and_executor(self):
+        async def echo(reader, writer):
+            writer.write(await reader.readline())
+            await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(echo, '127.0.0.1', 0)
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+            writer.write(b"ping\n")
+            line = await reader.readline()
+            started = self.loop.time()
+            await asyncio.sleep(0.05)
+            slept = self.loop.time() - started
+            threaded = await self.loop.run_in_executor(None, lambda: "done")
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return line, slept, threaded
+
+        line, slept, threaded = self.loop.run_until_complete(run())
+        self.assertEqual(line, b"ping\n")
+        self.assertGreaterEqual(slept, 0.045)
+        self.assertEqual(threaded, "done")
+        self.assertFalse(self.loop.is_running())
+
+
+class TestMappingTableModel(unittest.TestCase):
+    def setUp(self):
+        try:
+            from PyQt5.QtCore import QCoreApplication
+            from gui.mapping_tab import MappingFilterModel, MappingTableModel
+        except ImportError:
+            self.skipTest("PyQt5 is not installed")
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self.manager = ConnectionManager()
+        self.source = self.manager.add("OPC DA", "Plant")
+        self.mapping = DataMapping()
+        for name in ("Flow", "Level", "Alarm"):
+            self.mapping.add_mapping(
+                DataPoint("OPC DA", {"tag": name}, connection_id=self.source.id),
+                DataPoint("OPC DA", {"tag": f"Copy.{name}"}, connection_id=self.source.id)
+            )
+        self.model = MappingTableModel(self.manager, self.mapping)
+        self.proxy = MappingFilterModel()
+        self.proxy.setSourceModel(self.model)
+
+    def test_toggle_changes_one_row(self):
+        changes = []
+        self.model.dataChanged.connect(lambda first, last: changes.append((first.row(), last.row())))
+        self.model.toggle_mapping(1)
+        self.assertEqual(changes, [(1, 1)])
+        self.assertFalse(self.mapping.mappings[1]["enabled"])
+        self.assertEqual(self.model.index(1, 2).data(), "Disabled")
+        self.assertIsNone(self.model.cache[2])
+
+    def test_sort_filter_and_remove(self):
+        self.proxy.sort(0)
+        self.assertEqual([self.proxy.index(row, 0).data() for row in range(3)],
+                         ["Plant: Alarm", "Plant: Flow", "Plant: Level"])
+        self.proxy.set_filter("LEV")
+        self.assertEqual(self.proxy.rowCount(), 1)
+        row = self.proxy.mapToSource(self.proxy.index(0, 0)).row()
+        self.proxy.set_filter("")
+        self.model.remove_mapping(row)
+        self.assertEqual([m["source"].tag["tag"] for m in self.mapping.mappings], ["Flow", "Alarm"])
+        self.assertEqual([self.proxy.index(row, 0).data() for row in range(2)], ["Plant: Alarm", "Plant: Flow"])
+
+
+class TestValueTableModel(unittest.TestCase):
+    def setUp(self):
+        try:
+            from PyQt5.QtCore import QCoreApplication
+            from gui.monitor_tab import ValueTableModel, changed_ranges
+        except ImportError:
+            self.skipTest("PyQt5 is not installed")
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self.model = ValueTableModel()
+        self.changed_ranges = changed_ranges
+
+    def test_changed_ranges(self):
+        self.assertEqual(self.changed_ranges([5, 1, 2, 3, 7]), [(1, 3), (5, 5), (7, 7)])
+        self.assertEqual(self.changed_ranges(list(range(0, 200, 2)), limit=10), [(0, 198)])
+
+    def test_updates_coalesced_per_flush(self):
+        import threading
+        inserted, changed = [], []
+        self.model.rowsInserted.connect(lambda parent, first, last: inserted.append((first, last)))
+        self.model.dataChanged.connect(lambda first, last: changed.append((first.row(), last.row())))
+        self.model.publish("c1", [{'tag': f"T{i}", 'value': 0} for i in range(10)])
+        self.assertEqual(self.model.flush(), 10)
+        self.assertEqual(inserted, [(0, 9)])
+        self.assertEqual(changed, [])
+
+        # Many updates from another thread become one value per point and one range
+        def produce():
+            for value in range(1, 101):
+                self.model.publish("c1", [{'tag': f"T{i}", 'value': value} for i in range(3, 6)])
+        thread = threading.Thread(target=produce)
+        thread.start()
+        thread.join()
+        self.assertEqual(self.model.flush(), 3)
+        self.assertEqual(changed, [(3, 5)])
+        self.assertEqual(self.model.index(4, 2).data(), "100")
+        self.assertEqual(self.model.flush(), 0)
+
+
+class TestRingBufferHandler(unittest.TestCase):
+    def setUp(self):
+        try:
+            from gui.logs_tab import RingBufferHandler
+        except ImportError:
+            self.skipTest("PyQt5 is not installed")
+        self.handler = RingBufferHandler(capacity=100)
+        self.handler.setLevel(logging.INFO)
+        self.logger = logging.getLogger('SCADA_Gateway.TestRing')
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_bounded_and_filtered_before_formatting(self):
+        import threading
+        formatter = MagicMock()
+        self.handler.setFormatter(formatter)
+
+        def produce():
+            for number in range(500):
+                self.logger.debug("dropped %d", number)
+                self.logger.info("kept %d", number)
+        threads = [threading.Thread(target=produce) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batch = self.handler.drain()
+        self.assertEqual(len(batch), 100)
+        self.assertEqual(len(self.handler.records), 100)
+        self.assertTrue(all(record.levelno == logging.INFO for record in batch))
+        formatter.format.assert_not_called()
+        self.assertEqual(self.handler.drain(), [])
+
+
+class TestLoggingPipeline(unittest.TestCase):
+    def test_queued_rotating_file(self):
+        logger = logging.getLogger('SCADA_Gateway')
+        previous_level = logger.level
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "logs", "gateway.log")
+            pipeline = setup_logging({
+                "application": {"log_level": "INFO"},
+                "logging": {"file_path": path, "max_size_mb": 0.01, "backup_count": 2, "format": "%(levelname)s %(message)s"}
+            })
+            try:
+                values = [1]
+                logging.getLogger('SCADA_Gateway.Test').info("values %s", values)
+                # The message is fixed when logged, not when written
+                values.append(2)
+                logging.getLogger('SCADA_Gateway.Test').debug("not written %s", values)
+                for number in range(1500):
+                    logging.getLogger('SCADA_Gateway.Test').warning("record %d", number)
+            finally:
+                pipeline.stop()
+                logger.setLevel(previous_level)
+            self.assertEqual(sorted(os.listdir(os.path.dirname(path))), ["gateway.log", "gateway.log.1", "gateway.log.2"])
+            with open(path) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[-1], "WARNING record 1499")
+            self.assertTrue(all(len(line) < 40 for line in lines))
+            self.assertLessEqual(os.path.getsize(path), 0.01 * 1024 * 1024)
+            with open(path + ".2") as f:
+                self.assertEqual(f.readline(), "INFO values [1]\n")
+        self.assertNotIn(pipeline.queue_handler, logger.handlers)
+
+
+class TestShardedRuntime(unittest.TestCase):
+    def test_workers_publish_into_shared_table(self):
+        connections = [
+            {"id": f"opcda-{number}", "protocol": "OPC DA", "name": f"DA {number}",
+             "config": {"server_name": "Sim", "host": "localhost", "update_rate": 50, "simulation_change_ratio": 1.0,
+                        "groups": [{"name": "G", "update_rate": 50, "active": True, "deadband": 0.0,
+                                    "items": [f"S{number}.Tag{tag}" for tag in range(100)]}]}}
+            for number in range(2)
+        ]
+        # A tiny ring overflows and makes the router rescan by sequence number
+        runtime = ShardedRuntime(connections, workers=2, slots_per_worker=256, ring_size=16)
+        runtime.start()
+        try:
+            self.assertEqual(runtime.assignment, {"opcda-0": 0, "opcda-1": 1})
+            seen = set()
+            for _ in range(200):
+                seen.update(tag for tag, _, quality, _, _ in runtime.poll().rows() if quality == QUALITY_GOOD)
+                if len(seen) == 200:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(len(seen), 200)
+            self.assertIn(("opcda-1", "S1.Tag99"), seen)
+            result = runtime.read("opcda-0", "S0.Tag0")
+            self.assertEqual(result["quality"], "GOOD")
+            self.assertIsInstance(result["value"], float)
+        finally:
+            runtime.stop()
+        self.assertEqual(runtime.processes, [])
+
+    def test_change_before_registration_is_kept(self):
+        import queue
+        from core.sharding import _ShardWriter
+        runtime = ShardedRuntime([{"id": "opcda-0", "protocol": "OPC DA", "config": {}}], workers=1,
+                                 slots_per_worker=16, ring_size=16)
+        # Run the router side only: no worker process, a queue under test control
+        runtime.context = MagicMock()
+        runtime.context.Queue.return_value = queue.Queue()
+        runtime.start()
+        held = queue.Queue()
+        writer = _ShardWriter(runtime.table, runtime.rings[0], 0, 16, held)
+        try:
+            writer.publish("opcda-0", [{"tag": "A", "value": 1.5, "quality": "GOOD"}])
+            # The ring entry is there, the slot registration is still in transit
+            self.assertEqual(len(runtime.poll()), 0)
+            runtime.messages.put(held.get_nowait())
+            self.assertEqual([row[:2] for row in runtime.poll().rows()], [(("opcda-0", "A"), 1.5)])
+            self.assertEqual(len(runtime.poll()), 0)
+            # A slot caught mid-write is left out, not returned as an empty row, and comes next time
+            writer.publish("opcda-0", [{"tag": "A", "value": 2.5, "quality": "GOOD"}])
+            with patch.object(runtime, '_read_slot', return_value=None):
+                self.assertEqual(len(runtime.poll()), 0)
+            self.assertEqual([row[:2] for row in runtime.poll().rows()], [(("opcda-0", "A"), 2.5)])
+            self.assertEqual(len(runtime.poll()), 0)
+        finally:
+            writer.table = writer.ring = None
+            runtime.messages = None
+            runtime.commands = []
+            runtime.stop()
+
+
+class TestDNP3Link(unittest.TestCase):
+    def test_crc(self):
+        self.assertEqual(crc16_dnp(b"123456789"), 0xEA82)
+
+    def test_round_trip_segmented(self):
+        apdu = bytes(range(256)) * 3
+        out = bytearray()
+        encode_user_data(out, apdu, 1024, 1, master=True)
+        fragments = []
+        reassembler = TransportReassembler()
+
+        def on_frame(control, destination, source, payload):
+            fragment = reassembler.feed(payload)
+            if fragment is not None:
+                fragments.append(fragment)
+
+        parser = LinkParser(on_frame)
+        for offset in range(0, len(out), 7):
+            parser.feed(out[offset:offset + 7])
+        self.assertEqual(fragments, [apdu])
+        self.assertEqual(parser.crc_errors, 0)
+
+class _StationStandIn(IEC104Link):
+    """Controlled station answering interrogations and commands"""
+
+    stations = []
+
+    def __init__(self):
+        super().__init__(controlling=False)
+        self.commands = []
+        _StationStandIn.stations.append(self)
+
+    def asdu_received(self, data):
+        asdu = decode_asdu(data)
+        if asdu.type_id == C_IC_NA_1:
+            self.send_asdus([
+                encode_asdu(ASDU(asdu.type_id, COT_ACTIVATION_CON, 1, asdu.objects)),
+                encode_asdu(ASDU(M_ME_NC_1, COT_INTERROGATED_BY_STATION, 1,
+                                 [(100 + i, float(i), 0, None) for i in range(5)], sequence=True)),
+                encode_asdu(ASDU(asdu.type_id, COT_ACTIVATION_TERMINATION, 1, asdu.objects)),
+            ])
+        else:
+            self.commands.append(asdu)
+            self.send_asdu(encode_asdu(ASDU(asdu.type_id, COT_ACTIVATION_CON, 1, asdu.objects)))
+
+class TestDataBatch(unittest.TestCase):
+    def test_fill_from_results_and_reuse(self):
+        batch = DataBatch(["a", "b", "c", "d"])
+        batch.fill_from_results([
+            {'value': 1.5, 'quality': 'GOOD', 'timestamp': '2024-01-01T00:00:00.250000'},
+            {'value': None, 'quality': 'UNKNOWN', 'timestamp': None},
+            {'value': 0, 'quality': 'OFFLINE', 'timestamp': None},
+            [1, 2]
+        ])
+        self.assertEqual(batch.values[:4], [1.5, None, 0, [1, 2]])
+        self.assertEqual(list(batch.qualities[:4]), [QUALITY_GOOD, QUALITY_UNKNOWN, QUALITY_BAD, QUALITY_GOOD])
+        self.assertEqual(batch.timestamps[0], 1704067200250)
+        self.assertEqual(list(batch.errors[:4]), [ERROR_NONE, ERROR_NO_DATA, ERROR_NONE, ERROR_NONE])
+        self.assertEqual(batch.to_dicts()[0]['timestamp'], '2024-01-01T00:00:00.250000')
+
+        values = batch.values
+        batch.reset(["x"])
+        self.assertIs(batch.values, values)
+        self.assertEqual((len(batch), batch.values[0], batch.errors[0]), (1, None, ERROR_NO_DATA))
+
+
+class TestOPCDAGroups(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.handler = OPCDAHandler()
+        self.test_config = self.handler.get_config_template()
+        self.test_config["simulation_change_ratio"] = 0.0
+        self.test_config["groups"] = [{
+            "name": "Fast",
+            "update_rate": 10,
+            "active": True,
+            "deadband": 10.0,
+            "items": [{"tag": "Tank.Level", "eu_low": 0, "eu_high": 100}]
+                     + [f"Area.Item{i}" for i in range(1000)]
+        }]
+
+    async def asyncTearDown(self):
+        await self.handler.disconnect()
+
+    async def test_reports_only_changes_beyond_deadband(self):
+        await self.handler.connect(self.test_config)
+        await self.handler.write_data(["Tank.Level"], [0.0])
+        await asyncio.sleep(0.03)
+        received = []
+        self.handler.add_data_callback(received.extend)
+
+        await self.handler.write_data(["Tank.Level"], [50.0])
+        await asyncio.sleep(0.03)
+        await self.handler.write_data(["Tank.Level"], [55.0])
+        await asyncio.sleep(0.03)
+        await self.handler.write_data(["Tank.Level", "Area.Item7"], [61.0, 1.5])
+        await asyncio.sleep(0.03)
+        changes = [(u["tag"], u["value"]) for u in received]
+        self.assertEqual(changes[0], ("Tank.Level", 50.0))
+        self.assertEqual(sorted(changes[1:]), [("Area.Item7", 1.5), ("Tank.Level", 61.0)])
+        self.assertEqual((await self.handler.read_data(["Tank.Level"]))[0]["value"], 61.0)
+
+    async def test_inactive_group_and_refresh(self):
+        await self.handler.connect(self.test_config)
+        await asyncio.sleep(0.03)
+        received = []
+        self.handler.add_data_callback(received.extend)
+        self.handler.set_group_active("Fast", False)
+        await self.handler.write_data(["Area.Item1"], [2.0])
+        await asyncio.sleep(0.03)
+        self.assertEqual(received, [])
+
+        refreshed = await self.handler.refresh_group("Fast")
+        self.assertEqual(len(refreshed), 1001)
+        self.assertEqual(len(received), 1001)
+
+    async def test_read_batch_from_cache(self):
+        await self.handler.connect(self.test_config)
+        await self.handler.write_data(["Tank.Level"], [42.0])
+        batch = await self.handler.read_batch(["Tank.Level", "Area.Item3"])
+        self.assertEqual(batch.values[0], 42.0)
+        self.assertEqual(list(batch.qualities[:2]), [QUALITY_GOOD, QUALITY_GOOD])
+        self.assertEqual(list(batch.errors[:2]), [ERROR_NONE, ERROR_NONE])
+        self.assertEqual(batch.to_dicts(), await self.handler.read_data(["Tank.Level", "Area.Item3"]))
+
+    async def test_browse_index_follows_writes(self):
+        await self.handler.connect(self.test_config)
+        self.assertEqual(len(await self.handler.browse_tags("Area.Item99")), 11)
+        await self.handler.write_data(["Area.Sub.New"], [1.0])
+        self.assertEqual(await self.handler.browse_branches("Area"), ["Sub"])
+        self.assertEqual(await self.handler.search_tags("**.New"), ["Area.Sub.New"])
+
+
+class TestOPCDABrowse(unittest.TestCase):
+    def setUp(self):
+        self.index = TagIndex()
+        self.index.update(f"Area{a}.Pump{p}.{name}"
+                          for a in range(3) for p in range(10) for name in ("Speed", "Status"))
+        self.index.add("Area1")
+
+    def test_branches_leaves_and_pages(self):
+        self.assertEqual(self.index.branches(), ["Area0", "Area1", "Area2"])
+        self.assertEqual(self.index.leaves(), ["Area1"])
+        self.assertEqual(self.index.leaves("Area2.Pump3"), ["Area2.Pump3.Speed", "Area2.Pump3.Status"])
+        self.assertEqual(self.index.count("Area1"), 21)
+        pages = [self.index.browse("Area1", offset, 8) for offset in range(0, 21, 8)]
+        self.assertEqual(sum(pages, []), self.index.browse("Area1"))
+        self.assertEqual(pages[0][:2], ["Area1", "Area1.Pump0.Speed"])
+
+    def test_prefix_and_wildcard_search(self):
+        self.assertEqual(len(self.index.prefix("Area1.")), 20)
+        self.assertEqual(self.index.prefix("Area2.Pump", limit=3),
+                         ["Area2.Pump0.Speed", "Area2.Pump0.Status", "Area2.Pump1.Speed"])
+        self.assertEqual(self.index.prefix("Are", limit=2), ["Area0.Pump0.Speed", "Area0.Pump0.Status"])
+        self.assertEqual(self.index.prefix("Area0.Pump", offset=18), ["Area0.Pump9.Speed", "Area0.Pump9.Status"])
+        self.assertEqual(len(self.index.search("Area*.Pump?.Status")), 30)
+        self.assertEqual(self.index.search("**.Pump[12].Speed", limit=2), ["Area0.Pump1.Speed", "Area0.Pump2.Speed"])
+
+    def test_incremental_updates_and_snapshot(self):
+        self.assertFalse(self.index.add("Area0.Pump0.Speed"))
+        self.assertTrue(self.index.remove("Area2.Pump0.Speed"))
+        self.assertTrue(self.index.remove("Area2.Pump0.Status"))
+        self.assertNotIn("Pump0", self.index.branches("Area2"))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tags.json")
+            self.index.save(path)
+            loaded = TagIndex.load(path)
+        self.assertEqual(len(loaded), len(self.index))
+        self.assertEqual(loaded.browse(), self.index.browse())
+
+
+class TestIEC104Handler(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        _StationStandIn.stations = []
+        self.server = await asyncio.get_running_loop().create_server(_StationStandIn, '127.0.0.1', 0)
+        self.handler = IEC104Handler()
+        self.test_config = self.handler.get_config_template()
+        self.test_config.update({"ip": "127.0.0.1", "port": self.server.sockets[0].getsockname()[1]})
+
+    async def asyncTearDown(self):
+        await self.handler.disconnect()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def test_general_interrogation_on_connect(self):
+        await self.handler.connect(self.test_config)
+        self.assertEqual(self.handler.status, ConnectionStatus.CONNECTED)
+        results = await self.handler.read_data([{"ioa": 102}, {"ioa": 999}])
+        self.assertEqual(results[0]["value"], 2.0)
+        self.assertEqual(results[0]["quality"], "GOOD")
+        self.assertEqual(results[1]["quality"], "UNKNOWN")
+
+    async def test_spontaneous_data(self):
+        await self.handler.connect(self.test_config)
+        received = []
+        self.handler.add_data_callback(received.extend)
+        station = _StationStandIn.stations[0]
+        station.send_asdus([
+            encode_asdu(ASDU(M_SP_NA_1, COT_SPONTANEOUS, 1, [(i, i % 2, 0, None)]))
+            for i in range(40)
+        ])
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(received), 40)
+        self.assertTrue(all(update["cot"] == COT_SPONTANEOUS for update in received))
+        self.assertEqual((await self.handler.read_data([{"ioa": 39}]))[0]["value"], 1)
+
+    async def test_k_window_limits_outstanding_frames(self):
+        await self.handler.connect(self.test_config)
+        station = _StationStandIn.stations[0]
+        # Stop the master from acknowledging so the station window fills up
+        self.handler.connection.parameters["w"] = 1000
+        self.handler.connection.parameters["t2"] = 1000
+        available = station.window_available
+        station.send_asdus([
+            encode_asdu(ASDU(M_SP_NA_1, COT_SPONTANEOUS, 1, [(i, 1, 0, None)]))
+            for i in range(20)
+        ])
+        await asyncio.sleep(0.05)
+        self.assertEqual(station.window_available, 0)
+        self.assertEqual(len(station.pending), 20 - available)
+
+    async def test_frames_after_close_are_ignored(self):
+        station = _StationStandIn()
+        transport = MagicMock()
+        transport.is_closing.return_value = False
+        transport.close.side_effect = lambda: transport.is_closing.configure_mock(return_value=True)
+        station.connection_made(transport)
+        command = encode_asdu(ASDU(C_SC_NA_1, COT_ACTIVATION, 1, [(1, 1, 0, None)]))
+        data = bytearray()
+        # Acknowledges frames the station never sent
+        append_i_frame(data, command, 0, 5)
+        append_i_frame(data, command, 1, 0)
+        station.data_received(bytes(data))
+        transport.close.assert_called_once()
+        self.assertEqual((station.frames_received, station.commands), (1, []))
+        station.connection_lost(None)
+
+    async def test_command(self):
+        await self.handler.connect(self.test_config)
+        results = await self.handler.write_data([{"ioa": 7, "type": "single"}, {"ioa": 8}], [1, 12.5])
+        self.assertEqual(results, [True, True])
+        commands = _StationStandIn.stations[0].commands
+        self.assertEqual([(c.type_id, c.objects[0][1]) for c in commands], [(C_SC_NA_1, 1), (C_SE_NC_1, 12.5)])
+
+class TestIEC104Server(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = IEC104Handler()
+        server_config = self.server.get_config_template()
+        server_config.update({"mode": "server", "ip": "127.0.0.1", "port": 0})
+        await self.server.connect(server_config)
+        mapping = DataMapping()
+        for ioa in (10, 11, 12, 13, 20):
+            mapping.add_mapping(DataPoint("Modbus", {"address": ioa}),
+                                DataPoint("IEC 60870-5-104", {"ioa": ioa, "type": "float"}))
+        self.server.load_mapping(mapping)
+        await self.server.write_data([{"ioa": ioa} for ioa in (10, 11, 12, 13, 20)], [1.0, 2.0, 3.0, 4.0, 5.0])
+
+        port = self.server.server.server.sockets[0].getsockname()[1]
+        self.clients = []
+        for _ in range(2):
+            client = IEC104Handler()
+            config = client.get_config_template()
+            config.update({"ip": "127.0.0.1", "port": port})
+            await client.connect(config)
+            self.clients.append(client)
+
+    async def asyncTearDown(self):
+        for client in self.clients:
+            await client.disconnect()
+        await self.server.disconnect()
+
+    async def test_general_interrogation_from_table(self):
+        for client in self.clients:
+            values = await client.read_data([{"ioa": 12}, {"ioa": 20}])
+            self.assertEqual([v["value"] for v in values], [3.0, 5.0])
+
+    async def test_spontaneous_changes_to_all_masters(self):
+        received = [[], []]
+        for client, updates in zip(self.clients, received):
+            client.add_data_callback(updates.extend)
+        encoded = self.server.server.asdus_encoded
+        await self.server.write_data([{"ioa": 10}, {"ioa": 11}, {"ioa": 12}, {"ioa": 20}], [7.0, 8.0, 9.0, 6.0])
+        await asyncio.sleep(0.1)
+        for updates in received:
+            self.assertEqual(sorted((u["ioa"], u["value"]) for u in updates),
+                             [(10, 7.0), (11, 8.0), (12, 9.0), (20, 6.0)])
+            self.assertTrue(all(u["cot"] == COT_SPONTANEOUS for u in updates))
+        # One SQ=1 ASDU for 10-12 and one for 20, encoded once for both masters
+        self.assertEqual(self.server.server.asdus_encoded - encoded, 2)
+
+    async def test_overflow_drops_only_spontaneous_frames(self):
+        from core.protocols.iec104_server import IEC104Server, _IEC104ServerLink
+        server = IEC104Server(max_pending=3)
+        link = _IEC104ServerLink(server, {})  # no transport: everything stays queued
+        spontaneous = [encode_asdu(ASDU(M_ME_NC_1, COT_SPONTANEOUS, 1, [(ioa, 1.0, 0, None)])) for ioa in (1, 2)]
+        confirmation, termination = (encode_asdu(ASDU(C_IC_NA_1, cot, 1, [(0, 20, 0, None)]))
+                                     for cot in (COT_ACTIVATION_CON, COT_ACTIVATION_TERMINATION))
+        link.queue(spontaneous)
+        link.queue([confirmation, termination])
+        self.assertEqual(list(link.pending), [spontaneous[1], confirmation, termination])
+        self.assertEqual(link.dropped, 1)
+        link.queue([confirmation])
+        self.assertEqual(list(link.pending), [confirmation, termination, confirmation])
+        self.assertEqual(link.dropped, 2)
+        # Nothing spontaneous left to drop: confirmations are never discarded
+        link.queue([termination])
+        self.assertEqual(list(link.pending), [confirmation, termination, confirmation, termination])
+        self.assertEqual(link.dropped, 2)
+
+    async def test_pack_objects_uses_sequences(self):
+        objects = [(ioa, float(ioa), 0, None) for ioa in (1, 2, 3, 4, 9, 15)]
+        asdus = [decode_asdu(asdu) for asdu in pack_objects(M_ME_NC_1, COT_SPONTANEOUS, 1, objects)]
+        self.assertEqual([(a.sequence, [o[0] for o in a.objects]) for a in asdus],
+                         [(True, [1, 2, 3, 4]), (False, [9, 15])])
+
+class TestIEC104ASDU(unittest.TestCase):
+    def test_time_tagged_round_trip_from_memoryview(self):
+        stamp = 1767225600123  # 2026-01-01T00:00:00.123Z
+        encoder = ASDUEncoder()
+        frame = bytearray(b'\x68\x00\x00\x00\x00\x00')
+        frame += encoder.encode(M_SP_TB_1, COT_SPONTANEOUS, 7, [(5, 1, 0x80, stamp), (70000, 0, 0, stamp + 60000)])
+        asdu = decode_asdu(memoryview(frame)[6:])
+        self.assertEqual(asdu.common_address, 7)
+        self.assertEqual(asdu.objects, [(5, 1, 0x80, stamp), (70000, 0, 0, stamp + 60000)])
+
+    def test_counter_sequence(self):
+        stamp = 1767225600000
+        objects = [(100 + i, i * 1000, 0, stamp) for i in range(20)]
+        asdu = decode_asdu(ASDUEncoder().encode(M_IT_TB_1, COT_SPONTANEOUS, 1, objects, sequence=True))
+        self.assertTrue(asdu.sequence)
+        self.assertEqual(asdu.objects, objects)
+
+class _FakeMMSClient:
+    """Records MMS services; RCB writes are accepted except unknown entry IDs"""
+
+    def __init__(self, server):
+        self.server = server
+        self.on_report = None
+
+    async def read(self, references):
+        return [self.server["variables"].get(ref, DataAccessError(10, ref)) for ref in references]
+
+    async def read_dataset(self, reference):
+        self.server["dataset_reads"].append(reference)
+        return self.server["datasets"][reference]
+
+    async def read_dataset_directory(self, reference):
+        return list(self.server["directories"][reference])
+
+    async def define_dataset(self, reference, members):
+        self.server["directories"][reference] = members
+
+    async def write(self, references, values):
+        self.server["writes"].extend(zip(references, values))
+        return [DataAccessError(7, ref) if ref.endswith('EntryID') and value not in self.server["entries"] else True
+                for ref, value in zip(references, values)]
+
+    async def close(self):
+        pass
+
+class TestIEC61850Handler(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = {
+            "variables": {
+                "LD0/GGIO1.AnIn1.mag.f": 4.5,
+                "LD0/LLN0.BR.brcb01.RptID": "meas",
+                "LD0/LLN0.BR.brcb01.DatSet": "LD0/LLN0$Meas",
+                "LD0/LLN0.BR.brcb01.ConfRev": 1
+            },
+            "datasets": {"LD0/LLN0.Meas": [230.5, [True, BitString(b'\x00\x00', 13), 1767225600.0]]},
+            "directories": {"LD0/LLN0.Meas": ["LD0/MMXU1.PhV.mag.f[MX]", "LD0/XCBR1.Pos[ST]"]},
+            "entries": set(),
+            "dataset_reads": [],
+            "writes": []
+        }
+        self.handler = IEC61850Handler()
+        self.handler.client_factory = self._factory
+        self.config = self.handler.get_config_template()
+        self.config.update({
+            "host": "127.0.0.1",
+            "datasets": [{"reference": "LD0/LLN0.Meas", "members": [
+                "LD0/MMXU1.PhV.mag.f[MX]", {"reference": "LD0/XCBR1.Pos[ST]", "attributes": ["stVal", "q", "t"]}
+            ]}],
+            "report_control_blocks": ["LD0/LLN0.BR.brcb01"]
+        })
+        await self.handler.connect(self.config)
+
+    async def _factory(self, config):
+        return _FakeMMSClient(self.server)
+
+    def _report(self, entry_id, values):
+        options = BitString.from_bits(10, [OPT_DATA_SET_NAME, OPT_ENTRY_ID])
+        inclusion = BitString.from_bits(2, [i for i, value in enumerate(values) if value is not None])
+        return ["meas", options, "LD0/LLN0$Meas", entry_id, inclusion] + [v for v in values if v is not None]
+
+    async def test_reads_grouped_by_dataset(self):
+        tags = [
+            {"logical_device": "LD0", "logical_node": "XCBR1", "data_object": "Pos", "data_attribute": "stVal"},
+            {"logical_device": "LD0", "logical_node": "GGIO1", "data_object": "AnIn1", "data_attribute": "mag.f"},
+            {"logical_device": "LD0", "logical_node": "MMXU1", "data_object": "PhV", "data_attribute": "mag.f"},
+        ]
+        values = await self.handler.read_data(tags)
+        self.assertEqual([v["value"] for v in values], [True, 4.5, 230.5])
+        self.assertEqual(values[0]["quality"], "valid")
+        self.assertEqual(self.server["dataset_reads"], ["LD0/LLN0.Meas"])
+
+    async def test_buffered_report_resumes_after_reconnect(self):
+        writes = [ref for ref, _ in self.server["writes"]]
+        self.assertIn("LD0/LLN0.BR.brcb01.GI", writes)
+        updates = []
+        self.handler.add_data_callback(updates.extend)
+        self.handler.client.on_report(self._report(b'\x00' * 7 + b'\x05', [231.0, None]))
+        self.assertEqual([(u["reference"], u["value"]) for u in updates], [("LD0/MMXU1.PhV.mag.f", 231.0)])
+
+        self.server["entries"].add(b'\x00' * 7 + b'\x05')
+        self.server["writes"].clear()
+        await self.handler.disconnect()
+        await self.handler.connect(self.config)
+        writes = dict(self.server["writes"])
+        self.assertEqual(writes["LD0/LLN0.BR.brcb01.EntryID"], b'\x00' * 7 + b'\x05')
+        self.assertNotIn("LD0/LLN0.BR.brcb01.GI", writes)
+        self.assertTrue(self.handler.reports["LD0/LLN0.BR.brcb01"].resumed)
+
+class TestMMS(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = MMSServer()
+        self.server.set_value("LD0/MMXU1.PhV.mag.f[MX]", 230.5)
+        self.server.set_value("LD0/XCBR1.Pos[ST]", [2, BitString(b'\x00\x00', 13), UtcTime(1767225600.5)])
+        self.server.set_value("LD0/GGIO1.SPCSO1.ctlModel[CF]", 1)
+        self.server.add_dataset("LD0/LLN0.Meas", ["LD0/MMXU1.PhV.mag.f[MX]", "LD0/XCBR1.Pos[ST]"])
+        for name, value in (("RptID", "meas"), ("DatSet", "LD0/LLN0$Meas"), ("ConfRev", 1),
+                            ("OptFlds", BitString(b'\x00\x00', 10)), ("TrgOps", BitString(b'\x00', 6)),
+                            ("RptEna", False), ("GI", False), ("EntryID", b'\x00' * 8)):
+            self.server.set_value(f"LD0/LLN0.BR.brcb01.{name}", value)
+        self.port = await self.server.start(port=0)
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_client_services(self):
+        client = await MMSClient.open('127.0.0.1', self.port)
+        values = await client.read(["LD0/MMXU1.PhV.mag.f[MX]", "LD0/NONE1.Beh.stVal"])
+        self.assertEqual(values[0], 230.5)
+        self.assertIsInstance(values[1], DataAccessError)
+        self.assertEqual(await client.read_dataset_directory("LD0/LLN0.Meas"),
+                         ["LD0/MMXU1.PhV.mag.f[MX]", "LD0/XCBR1.Pos[ST]"])
+        self.assertEqual(await client.write(["LD0/GGIO1.SPCSO1.ctlModel[CF]"], [2]), [True])
+        # A read larger than one TPDU is segmented and reassembled
+        values = await client.read(["LD0/XCBR1.Pos[ST]"] * 200)
+        self.assertEqual(values[199][2], 1767225600.5)
+        await client.close()
+
+    async def test_handler_over_mms(self):
+        handler = IEC61850Handler()
+        config = handler.get_config_template()
+        config.update({"host": "127.0.0.1", "port": self.port, "report_control_blocks": ["LD0/LLN0.BR.brcb01"]})
+        config["datasets"] = [{"reference": "LD0/LLN0.Meas", "members": [
+            "LD0/MMXU1.PhV.mag.f[MX]", {"reference": "LD0/XCBR1.Pos[ST]", "attributes": ["stVal", "q", "t"]}
+        ]}]
+        await handler.connect(config)
+        self.assertTrue(self.server.variables[("LD0", "LLN0$BR$brcb01$RptEna")])
+        values = await handler.read_data([
+            {"logical_device": "LD0", "logical_node": "XCBR1", "data_object": "Pos", "data_attribute": "stVal"}
+        ])
+        self.assertEqual(values[0]["value"], 2)
+        self.assertEqual(values[0]["timestamp"], "2026-01-01T00:00:00.500000")
+
+        updates = []
+        handler.add_data_callback(updates.extend)
+        self.server.send_report(["meas", BitString.from_bits(10, [OPT_ENTRY_ID]), b'\x00' * 7 + b'\x01',
+                                 BitString.from_bits(2, [0]), 231.0])
+        await asyncio.sleep(0.05)
+        self.assertEqual([(u["reference"], u["value"]) for u in updates], [("LD0/MMXU1.PhV.mag.f", 231.0)])
+        self.assertEqual(handler.reports["LD0/LLN0.BR.brcb01"].entry_id, b'\x00' * 7 + b'\x01')
+
+        # Without an SCL file the model is read from the server, in several name lists
+        with patch('core.protocols.iec61850_mms.NAME_LIST_LIMIT', 4):
+            model = await handler.get_server_model()
+        self.assertEqual(model["logical_devices"], ["LD0"])
+        self.assertEqual(model["logical_nodes"], ["LD0/GGIO1", "LD0/LLN0", "LD0/MMXU1", "LD0/XCBR1"])
+        self.assertEqual(model["data_objects"], ["LD0/GGIO1.SPCSO1", "LD0/MMXU1.PhV", "LD0/XCBR1.Pos"])
+        self.assertIn({"logical_device": "LD0", "logical_node": "MMXU1", "data_object": "PhV",
+                       "data_attribute": "mag.f", "fc": "MX", "type": None}, model["data_attributes"])
+        self.assertEqual(model["datasets"], [{"reference": "LD0/LLN0.Meas",
+                                              "members": ["LD0/MMXU1.PhV.mag.f[MX]", "LD0/XCBR1.Pos[ST]"]}])
+        self.assertEqual(model["report_control_blocks"], [{
+            "reference": "LD0/LLN0.BR.brcb01", "dataset": "LD0/LLN0.Meas", "buffered": True, "rpt_id": "meas", "conf_rev": 1
+        }])
+        await handler.disconnect()
+
+SCD_SAMPLE = b'''<?xml version="1.0"?>
+<SCL xmlns="http://www.iec.ch/61850/2003/SCL">
+  <Communication><SubNetwork name="S1"><ConnectedAP iedName="BAY1" apName="AP1">
+    <Address><P type="IP">10.0.0.11</P></Address></ConnectedAP></SubNetwork></Communication>
+  <IED name="BAY1"><AccessPoint name="AP1"><Server><LDevice inst="LD0">
+    <LN0 lnClass="LLN0" inst="" lnType="LLN0_T">
+      <DataSet name="Status"><FCDA ldInst="LD0" lnClass="XCBR" lnInst="1" doName="Pos" fc="ST"/>
+        <FCDA ldInst="LD0" lnClass="MMXU" lnInst="1" doName="TotW" daName="mag.f" fc="MX"/></DataSet>
+      <ReportControl name="brcbStatus" datSet="Status" buffered="true" confRev="3"/>
+    </LN0>
+    <LN lnClass="XCBR" inst="1" lnType="XCBR_T"><DOI name="Pos"><DAI name="ctlModel"><Val>1</Val></DAI></DOI></LN>
+    <LN lnClass="MMXU" inst="1" lnType="MMXU_T"/>
+  </LDevice></Server></AccessPoint></IED>
+  <DataTypeTemplates>
+    <LNodeType id="LLN0_T" lnClass="LLN0"><DO name="Mod" type="INC_T"/></LNodeType>
+    <LNodeType id="XCBR_T" lnClass="XCBR"><DO name="Pos" type="DPC_T"/></LNodeType>
+    <LNodeType id="MMXU_T" lnClass="MMXU"><DO name="TotW" type="MV_T"/></LNodeType>
+    <DOType id="INC_T" cdc="INC"><DA name="stVal" fc="ST" bType="INT32"/></DOType>
+    <DOType id="DPC_T" cdc="DPC"><DA name="stVal" fc="ST" bType="Dbpos"/><DA name="q" fc="ST" bType="Quality"/>
+      <DA name="t" fc="ST" bType="Timestamp"/><DA name="ctlModel" fc="CF" bType="Enum"/></DOType>
+    <DOType id="MV_T" cdc="MV"><DA name="mag" fc="MX" bType="Struct" type="AV_T"/><DA name="q" fc="MX" bType="Quality"/></DOType>
+    <DAType id="AV_T"><BDA name="f" bType="FLOAT32"/></DAType>
+  </DataTypeTemplates>
+</SCL>'''
+
+class TestSCLImport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "station.scd")
+        with open(self.path, "wb") as f:
+            f.write(SCD_SAMPLE)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_model_from_scd(self):
+        model = load_scl(self.path)
+        self.assertEqual(model.addresses, {"BAY1": "10.0.0.11"})
+        summary = model.server_model("BAY1")
+        self.assertEqual(summary["logical_nodes"], ["BAY1LD0/LLN0", "BAY1LD0/XCBR1", "BAY1LD0/MMXU1"])
+        self.assertIn({"logical_device": "BAY1LD0", "logical_node": "MMXU1", "data_object": "TotW",
+                       "data_attribute": "mag.f", "fc": "MX", "type": "FLOAT32"}, summary["data_attributes"])
+        self.assertEqual(model.dataset_definitions("BAY1"), [{"reference": "BAY1LD0/LLN0.Status", "members": [
+            {"reference": "BAY1LD0/XCBR1.Pos[ST]", "attributes": ["stVal", "q", "t"]}, "BAY1LD0/MMXU1.TotW.mag.f[MX]"
+        ]}])
+        self.assertEqual(summary["report_control_blocks"][0]["reference"], "BAY1LD0/LLN0.BR.brcbStatus01")
+
+    def test_index_reused(self):
+        load_scl(self.path)
+        self.assertTrue(os.path.exists(self.path + ".idx.json"))
+        with patch('core.protocols.iec61850_scl.parse_scl') as parse:
+            model = load_scl(self.path)
+        parse.assert_not_called()
+        handler = IEC61850Handler()
+        handler.load_model(self.path)
+        self.assertEqual(asyncio.run(handler.get_server_model())["logical_devices"], ["BAY1LD0"])
+        self.assertIn("BAY1LD0/LLN0.Status", handler.datasets)
+        self.assertEqual(model.ied_names(), ["BAY1"])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file